@@ -0,0 +1,130 @@
+"""
+Benchmark of the resolution of the Cat-A calibration and systematics files of the runs of a night.
+
+Usage:
+------
+python dev/benchmarks/catB_calibration_index.py [--runs 200] [--periods 100] [--repeat 3]
+
+A Cat-B calibration table with `--periods` calibration periods and the
+Cat-A service tree of their calibration and ffactor systematics files are
+written in a temporary directory. The files of `--runs` runs spread over the
+periods are then resolved, as sequencer_catB_tailcuts does for the runs of a
+night with catA_calibrated input. The per-run path (read and parse the table,
+scan the periods and glob the directories for every run, a copy of the
+previous implementation) is compared with CatBCalibrationIndex resolving all
+the runs in one call, both with a new index and with one already used.
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from osa.scripts.sequencer_catB_tailcuts import (
+    CatBCalibrationIndex,
+    find_period_for_run,
+    parse_calibration_table,
+)
+
+FIRST_RUN = 10000
+RUNS_PER_PERIOD = 100
+# Files of the other calibration runs and logs in each Cat-A directory
+FILES_PER_DATE = 30
+
+
+def make_service_tree(base_dir: Path, n_periods: int) -> Path:
+    """Write the Cat-B table and the Cat-A service tree, returning the table file."""
+    lines = ["# period  calibration  ffactor  drs4"]
+    start = datetime(2022, 1, 1)
+    for period in range(n_periods):
+        calib_date = (start + timedelta(days=7 * period)).strftime("%Y%m%d")
+        since_run = FIRST_RUN + RUNS_PER_PERIOD * period
+        calibration_run = since_run - 5
+        lines.append(
+            f"since {calib_date} (r{since_run})  {calib_date} (r{calibration_run})  "
+            f"{calib_date} (r{calibration_run})  {calib_date} (r{calibration_run - 1})"
+        )
+
+        catA_dir = base_dir / "calibration" / calib_date / "pro"
+        catA_dir.mkdir(parents=True)
+        for i in range(FILES_PER_DATE):
+            run = calibration_run - FILES_PER_DATE // 2 + i
+            (catA_dir / f"calibration_filters_52.Run{run:05d}.0000.fits.gz").touch()
+            (catA_dir / f"log_calibration_filters_52.Run{run:05d}.0000.txt").touch()
+        systematics_dir = base_dir / "ffactor_systematics" / calib_date / "v0.3.1"
+        systematics_dir.mkdir(parents=True)
+        for i in range(FILES_PER_DATE):
+            (systematics_dir / f"scan_fit_{calib_date}.{i:04d}.h5").touch()
+
+    table_file = base_dir / "catB_calibration_table.txt"
+    table_file.write_text("\n".join(lines) + "\n")
+    return table_file
+
+
+def legacy_resolve(run_id: int, table_file: Path, base_dir: Path) -> tuple:
+    """Previous per-run resolution of the Cat-A calibration and systematics files."""
+    periods = parse_calibration_table(table_file.read_text())
+    period = find_period_for_run(run_id, periods)
+
+    path = base_dir / "calibration" / period["calib_date"] / "pro"
+    files = list(path.glob(f"*Run{period['calibration_run']:05d}*.fits*"))
+    if not files:
+        raise RuntimeError(f"No Cat-A file for run {period['calibration_run']} in {path}")
+    catA_file = str(sorted(files)[0])
+
+    path = base_dir / "ffactor_systematics" / period["ffactor_date"] / "v0.3.1"
+    files = list(path.glob("scan_fit*.h5"))
+    if not files:
+        raise RuntimeError(f"No systematics for date {period['ffactor_date']} in {path}")
+    return catA_file, str(sorted(files)[0])
+
+
+def best_time(function, repeat: int) -> tuple:
+    """Best time over `repeat` calls, and the result of the last one."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=200, help="Number of runs resolved")
+    parser.add_argument("--periods", type=int, default=100, help="Calibration periods")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best is kept")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = Path(tmp)
+        table_file = make_service_tree(base_dir, args.periods)
+
+        # The runs of the night spread over the last periods
+        last_run = FIRST_RUN + RUNS_PER_PERIOD * args.periods
+        run_ids = list(range(last_run - 2 * args.runs, last_run, 2))
+
+        legacy, legacy_files = best_time(
+            lambda: {run_id: legacy_resolve(run_id, table_file, base_dir) for run_id in run_ids},
+            args.repeat,
+        )
+        cold, cold_files = best_time(
+            lambda: CatBCalibrationIndex(table_file, base_dir).resolve_runs(run_ids), args.repeat
+        )
+        index = CatBCalibrationIndex(table_file, base_dir)
+        index.resolve_runs(run_ids)
+        warm, warm_files = best_time(lambda: index.resolve_runs(run_ids), args.repeat)
+
+    # All the paths resolve the same files
+    assert legacy_files == cold_files == warm_files
+
+    n_runs = len(run_ids)
+    print(f"{'per-run table and glob':>24}: {legacy:.4f} s ({1e3 * legacy / n_runs:.3f} ms/run)")
+    print(f"{'index, new':>24}: {cold:.4f} s ({1e3 * cold / n_runs:.3f} ms/run)")
+    print(f"{'index, already used':>24}: {warm:.4f} s ({1e3 * warm / n_runs:.3f} ms/run)")
+    print(f"{'speed-up':>24}: {legacy / cold:.1f}x (new), {legacy / warm:.1f}x (already used)")
+
+
+if __name__ == "__main__":
+    main()
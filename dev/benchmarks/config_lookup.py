@@ -0,0 +1,112 @@
+"""
+Microbenchmark of the resolution of the paths and production IDs of the runs of a night.
+
+Usage:
+------
+python dev/benchmarks/config_lookup.py [--runs 10000] [--repeat 3]
+
+For every run, the running_analysis directory, the DL1AB, DATACHECK, MUON
+and DL2 destination directories and the DL1 production ID are resolved, as
+done when building the jobs and closing the runs. The functions of osa.paths,
+which look them up in the typed settings of osa.configs.settings, are
+compared with a copy of their previous implementation, which interpolated
+the options of the configuration file and built the Path objects on every
+call. No directory is created (simulate mode).
+"""
+
+import argparse
+import time
+from datetime import datetime
+from pathlib import Path
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.paths import analysis_path, destination_dir, get_dl1_prod_id_and_config
+from osa.utils import utils
+
+
+def legacy_destination_dir(concept, dl1_prod_id=None, dl2_prod_id=None) -> Path:
+    nightdir = utils.date_to_dir(options.date)
+    if concept == "MUON":
+        return Path(cfg.get(options.tel_id, "DL1_DIR")) / nightdir / options.prod_id / "muons"
+    if concept == "DATACHECK":
+        return (
+            Path(cfg.get(options.tel_id, "DL1_DIR"))
+            / nightdir
+            / options.prod_id
+            / dl1_prod_id
+            / "datacheck"
+        )
+    if concept == "DL1AB":
+        return Path(cfg.get(options.tel_id, "DL1_DIR")) / nightdir / options.prod_id / dl1_prod_id
+    return (
+        (Path(cfg.get(options.tel_id, f"{concept}_DIR")) / nightdir)
+        / options.prod_id
+        / dl2_prod_id
+    )
+
+
+def legacy_run_paths(run_id):
+    if not options.prod_id:
+        options.prod_id = cfg.get("LST1", "PROD_ID")
+    directory = Path(cfg.get(options.tel_id, "ANALYSIS_DIR")) / "20240117" / options.prod_id
+    if not cfg.getboolean("lstchain", "apply_standard_dl1b_config"):
+        raise ValueError("The benchmark uses the standard dl1b config")
+    dl1b_config_file = Path(cfg.get("lstchain", "dl1b_config"))
+    dl1_prod_id = cfg.get("LST1", "DL1_PROD_ID")
+    return (
+        directory,
+        dl1b_config_file.resolve(),
+        legacy_destination_dir("DL1AB", dl1_prod_id=dl1_prod_id),
+        legacy_destination_dir("DATACHECK", dl1_prod_id=dl1_prod_id),
+        legacy_destination_dir("MUON"),
+        legacy_destination_dir("DL2", dl2_prod_id=f"{dl1_prod_id}/nsb_tuning_0.14"),
+    )
+
+
+def run_paths(run_id):
+    directory = analysis_path(options.tel_id)
+    dl1_prod_id, dl1b_config_file = get_dl1_prod_id_and_config(run_id)
+    return (
+        directory,
+        dl1b_config_file,
+        destination_dir("DL1AB", create_dir=False, dl1_prod_id=dl1_prod_id),
+        destination_dir("DATACHECK", create_dir=False, dl1_prod_id=dl1_prod_id),
+        destination_dir("MUON", create_dir=False),
+        destination_dir("DL2", create_dir=False, dl2_prod_id=f"{dl1_prod_id}/nsb_tuning_0.14"),
+    )
+
+
+def time_night(resolve, runs: int, repeat: int) -> float:
+    """Best time over `repeat` resolutions of the paths of `runs` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for run_id in range(runs):
+            resolve(run_id)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10000, help="Number of runs resolved")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best is kept")
+    args = parser.parse_args()
+
+    options.date = datetime(2024, 1, 17)
+    options.tel_id = "LST1"
+    options.simulate = True
+    cfg.set("lstchain", "apply_standard_dl1b_config", "True")
+    # Both implementations resolve the same paths
+    assert [str(p) for p in legacy_run_paths(1)] == [str(p) for p in run_paths(1)]
+
+    legacy = time_night(legacy_run_paths, args.runs, args.repeat)
+    typed = time_night(run_paths, args.runs, args.repeat)
+    print(f"{'per-call cfg lookups':>22}: {legacy:.3f} s ({1e6 * legacy / args.runs:.1f} us/run)")
+    print(f"{'typed settings':>22}: {typed:.3f} s ({1e6 * typed / args.runs:.1f} us/run)")
+    print(f"{'speed-up':>22}: {legacy / typed:.1f}x for {args.runs} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark of the wall time and bytes read per subrun by the DL1 steps run in subprocesses or fused.
+
+Usage:
+------
+python dev/benchmarks/fused_dl1.py [--subruns 3] [--step "lstchain_dl1ab --help" ...]
+
+A datasequence job runs r0_to_dl1, dl1ab and the DL1 datacheck of a subrun
+one after the other. Each subrun is processed here by a new process, as a
+job would, which either runs the steps with AnalysisStage (a new interpreter
+importing lstchain and ctapipe for every step) or with InProcessStage (the
+steps share the interpreter of the job, i.e. --fused-dl1).
+
+By default the steps only print their help, so that the difference measured
+is the start-up of the interpreters and the imports, which is the same for
+real data. The bytes read are the rchar of /proc/<pid>/io summed over the
+job and its subprocesses, so they include the files read from the page cache.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess as sp
+import sys
+import tempfile
+from pathlib import Path
+
+DEFAULT_STEPS = [
+    "lstchain_data_r0_to_dl1 --help",
+    "lstchain_dl1ab --help",
+    "lstchain_check_dl1 --help",
+]
+
+# Run a console script and append the bytes read by its process to a file
+IO_WRAPPER = """\
+import atexit
+import os
+import sys
+from importlib.metadata import entry_points
+
+
+def dump_io():
+    with open("/proc/self/io") as f:
+        rchar = int(f.readline().split()[1])
+    with open(os.environ["FUSED_DL1_IO_FILE"], "a") as f:
+        f.write(f"{rchar}\\n")
+
+
+atexit.register(dump_io)
+sys.argv = sys.argv[1:]
+(entry_point,) = entry_points(group="console_scripts", name=sys.argv[0])
+sys.exit(entry_point.load()())
+"""
+
+# Process a subrun as a datasequence job does, and print its wall time and bytes read
+JOB = """\
+import json
+import sys
+import time
+
+start = time.perf_counter()
+mode, directory, wrapper, steps = sys.argv[1], sys.argv[2], sys.argv[3], json.loads(sys.argv[4])
+# The configuration is read from the command line of the process when osa is imported
+sys.argv = ["datasequence"]
+from osa.configs import options
+from osa.workflow.stages import AnalysisStage, InProcessStage
+
+options.directory = directory
+options.tel_id = "LST1"
+for step in steps:
+    if mode == "fused":
+        stage = InProcessStage(run="01807.0000", command_args=step)
+    else:
+        stage = AnalysisStage(run="01807.0000", command_args=[sys.executable, wrapper, *step])
+    rc, output = stage._run()
+    if rc != 0:
+        sys.exit(f"{step[0]} failed: {output}")
+
+with open("/proc/self/io") as f:
+    rchar = int(f.readline().split()[1])
+print(json.dumps({"seconds": time.perf_counter() - start, "rchar": rchar}))
+"""
+
+
+def process_subrun(mode: str, steps: list, tmp_dir: Path) -> dict:
+    """Process a subrun in a new process and return its wall time and bytes read."""
+    wrapper = tmp_dir / "io_wrapper.py"
+    wrapper.write_text(IO_WRAPPER)
+    io_file = tmp_dir / "io.txt"
+    io_file.unlink(missing_ok=True)
+    result = sp.run(
+        [sys.executable, "-c", JOB, mode, str(tmp_dir), str(wrapper), json.dumps(steps)],
+        env=dict(os.environ, FUSED_DL1_IO_FILE=str(io_file), MPLBACKEND="Agg"),
+        stdout=sp.PIPE,
+        text=True,
+        check=True,
+    )
+    measurement = json.loads(result.stdout.splitlines()[-1])
+    if io_file.exists():
+        measurement["rchar"] += sum(int(line) for line in io_file.read_text().split())
+    return measurement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--subruns", type=int, default=3, help="Subruns processed in each mode")
+    parser.add_argument(
+        "--step",
+        action="append",
+        dest="steps",
+        help="Command of a DL1 step (repeat the option for each step)",
+    )
+    args = parser.parse_args()
+    steps = [shlex.split(step) for step in (args.steps or DEFAULT_STEPS)]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Let the page cache hold the modules before timing
+        process_subrun("subprocess", steps, Path(tmp))
+        for mode in ("subprocess", "fused"):
+            runs = [process_subrun(mode, steps, Path(tmp)) for _ in range(args.subruns)]
+            results[mode] = {
+                "seconds": sum(run["seconds"] for run in runs) / len(runs),
+                "MB": sum(run["rchar"] for run in runs) / len(runs) / 1e6,
+            }
+
+    for mode, result in results.items():
+        print(f"{mode:>10}: {result['seconds']:6.2f} s, {result['MB']:7.1f} MB read per subrun")
+    saved_seconds = results["subprocess"]["seconds"] - results["fused"]["seconds"]
+    saved_mb = results["subprocess"]["MB"] - results["fused"]["MB"]
+    print(f"{'saved':>10}: {saved_seconds:6.2f} s, {saved_mb:7.1f} MB read per subrun")
+
+
+if __name__ == "__main__":
+    main()
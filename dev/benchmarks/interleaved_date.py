@@ -0,0 +1,108 @@
+"""
+Benchmark of the interleaved retention planner over a synthetic year of nights.
+
+Usage:
+------
+python dev/benchmarks/interleaved_date.py [--nights 365] [--runs 20] [--subruns 10]
+
+A temporary tree with DL1/<date>/<version>/tailcut84/interleaved directories,
+their running_analysis counterparts with symlinks, and the RunSummary and
+RunCatalog files of every night is created, and the time spent by each step
+of the planner is reported.
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from osa.scripts.interleaved_date import (
+    find_interleaved,
+    plan_cleanup,
+    run_source_table,
+    write_plan,
+)
+
+SOURCES = ["Crab", "Mrk 421", "Mrk 501", "1ES 1959+650", "BL Lac"]
+
+
+def make_synthetic_year(base, last_night, nights, runs, subruns):
+    """Create the directories and files of `nights` nights ending at `last_night`."""
+    for summary_dir in ("RunSummary", "RunCatalog"):
+        (base / summary_dir).mkdir(parents=True, exist_ok=True)
+
+    run_id = 10000
+    for night in range(nights):
+        flat_date = (last_night - timedelta(days=night)).strftime("%Y%m%d")
+        dl1 = base / "DL1" / flat_date / "v0.10" / "tailcut84" / "interleaved"
+        link = base / "running_analysis" / flat_date / "v0.10" / "tailcut84" / "interleaved"
+        dl1.mkdir(parents=True)
+        link.mkdir(parents=True)
+
+        summary = []
+        catalog = ["run_id,source_name"]
+        for i in range(runs):
+            run_id += 1
+            summary.append(f"{run_id},{subruns},DATA")
+            # One night in three has no Crab run, so the whole directory is removed
+            source = SOURCES[0] if i == 0 and night % 3 else SOURCES[1 + i % 4]
+            catalog.append(f"{run_id},{source}")
+            for subrun in range(subruns):
+                name = f"interleaved_LST-1.Run{run_id:05d}.{subrun:04d}.h5"
+                (dl1 / name).write_bytes(b"\0" * 1024)
+                (link / name).symlink_to(dl1 / name)
+
+        (base / "RunSummary" / f"RunSummary_{flat_date}.ecsv").write_text("\n".join(summary) + "\n")
+        (base / "RunCatalog" / f"RunCatalog_{flat_date}.ecsv").write_text("\n".join(catalog) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nights", type=int, default=365)
+    parser.add_argument("--runs", type=int, default=20, help="DATA runs per night")
+    parser.add_argument("--subruns", type=int, default=10, help="Subruns per run")
+    args = parser.parse_args()
+
+    last_night = date(2026, 1, 31)
+    months = args.nights // 30 + 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        start = time.perf_counter()
+        make_synthetic_year(base, last_night, args.nights, args.runs, args.subruns)
+        print(f"Synthetic tree created in {time.perf_counter() - start:.1f} s")
+
+        dl1_dir, analysis_dir = str(base / "DL1"), str(base / "running_analysis")
+        timings = {}
+
+        start = time.perf_counter()
+        found_paths, found_dates = find_interleaved(last_night.strftime("%Y%m%d"), dl1_dir, months)
+        timings["find_interleaved"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sources = run_source_table(
+            found_dates, str(base / "RunSummary"), str(base / "RunCatalog")
+        )
+        timings["run_source_table"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        commands, reclaimed = plan_cleanup(
+            found_paths, found_dates, dl1_dir, analysis_dir, sources
+        )
+        timings["plan_cleanup"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_plan(base / "entries_rm.sh", commands, reclaimed)
+        timings["write_plan"] = time.perf_counter() - start
+
+    n_files = args.nights * args.runs * args.subruns
+    print(f"{len(found_paths)} nights, {n_files} interleaved files, {len(commands)} rm commands")
+    for step, seconds in timings.items():
+        print(f"{step:>18}: {seconds:.3f} s")
+    total = sum(timings.values())
+    print(f"{'total':>18}: {total:.3f} s ({len(found_paths) / total:.0f} nights/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of the start-up time of the sequence jobs with a temporary and a persistent numba cache.
+
+Usage:
+------
+python dev/benchmarks/numba_cache.py [--jobs 5] [--command "python -c 'import lstchain...'"]
+
+Every job used to compile the numba kernels of lstchain and ctapipe in a new
+temporary NUMBA_CACHE_DIR. The start-up of a job (by default, importing the
+lstchain modules used by datasequence, which compiles the kernels with
+explicit signatures) is timed a few times with a new temporary cache each
+time, and then with a persistent cache warmed up once with
+`prewarm_numba_cache`.
+"""
+
+import argparse
+import os
+import shlex
+import subprocess as sp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from osa.utils.jit_cache import prewarm_numba_cache
+
+STARTUP_COMMAND = (
+    f"{sys.executable} -c 'import lstchain.reco.r0_to_dl1, lstchain.reco.dl1_to_dl2, "
+    "lstchain.image.modifier'"
+)
+
+
+def run_job(command, numba_cache_dir) -> float:
+    """Run the job start-up command with the given NUMBA_CACHE_DIR and return its wall time."""
+    start = time.perf_counter()
+    sp.run(
+        shlex.split(command),
+        env=dict(os.environ, NUMBA_CACHE_DIR=str(numba_cache_dir)),
+        check=True,
+        stdout=sp.DEVNULL,
+        stderr=sp.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=5, help="Number of jobs timed in each mode")
+    parser.add_argument("--command", default=STARTUP_COMMAND, help="Start-up command of a job")
+    args = parser.parse_args()
+
+    # Let the page cache hold the modules, so that only the compilation is measured
+    with tempfile.TemporaryDirectory() as tmp:
+        run_job(args.command, tmp)
+
+    temporary = []
+    for _ in range(args.jobs):
+        with tempfile.TemporaryDirectory() as tmp:
+            temporary.append(run_job(args.command, tmp))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = Path(tmp) / "numba" / "key" / "machine"
+        start = time.perf_counter()
+        assert prewarm_numba_cache(cache_dir, command=args.command)
+        warm_up = time.perf_counter() - start
+        persistent = [run_job(args.command, cache_dir) for _ in range(args.jobs)]
+        n_functions = sum(1 for _ in cache_dir.rglob("*.nbi"))
+
+    mean_temporary = sum(temporary) / len(temporary)
+    mean_persistent = sum(persistent) / len(persistent)
+    print(f"{n_functions} numba functions cached, warm-up done once in {warm_up:.1f} s")
+    print(f"{'temporary cache':>18}: {mean_temporary:.2f} s per job")
+    print(f"{'persistent cache':>18}: {mean_persistent:.2f} s per job")
+    print(f"{'saved':>18}: {mean_temporary - mean_persistent:.2f} s per job")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark of the sequencer, autocloser and closer over synthetic nights of increasing size.
+
+Usage:
+------
+python dev/benchmarks/pipeline_throughput.py [--runs 10 100 1000] [--subruns 5] [--keep DIR]
+
+For each number of runs, a synthetic night (see synthetic_night.py) is
+created in a temporary directory with fake sbatch, sacct and squeue
+executables first in the PATH, and the sequencer, autocloser and closer are
+run on it one after the other, as the cron jobs do. The jobs submitted are
+left PENDING, so that the autocloser checks all the sequences but does not
+close the night (it exits with code 1), and the closer is run in test mode,
+as otherwise both would wait for the jobs submitted by the closer. The output
+of each script is written to BASE_DIR/<script>.log.
+
+Every script is run in its own process with an audit hook counting the
+subprocesses launched, the glob calls, the directory scans and the files
+opened, and the calls received by the fake scheduler are counted from its
+state file. If strace is available, the number of system calls is reported
+too. The wall time of each script is reported along with these counts, so
+that a regression in a hot path shows up as a jump of one of them.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from synthetic_night import (  # noqa: E402
+    install_fake_slurm,
+    make_night,
+    read_slurm_calls,
+    write_config,
+)
+
+DATE = datetime(2024, 1, 17)
+
+SCRIPTS = {
+    "sequencer": ["-d", f"{DATE:%Y-%m-%d}", "--no-gainsel", "LST1"],
+    "autocloser": ["-d", f"{DATE:%Y-%m-%d}", "--no-gainsel", "LST1"],
+    "closer": ["-y", "-t", "-d", f"{DATE:%Y-%m-%d}", "LST1"],
+}
+
+# Run a console script of lstosa counting some of the audit events it raises
+AUDIT_BOOTSTRAP = """\
+import atexit
+import json
+import os
+import sys
+from collections import Counter
+from importlib.metadata import entry_points
+
+COUNTED_EVENTS = {
+    "subprocess.Popen": "subprocesses",
+    "os.system": "subprocesses",
+    "os.posix_spawn": "subprocesses",
+    "glob.glob": "globs",
+    "os.scandir": "directory scans",
+    "os.listdir": "directory scans",
+    "open": "opens",
+}
+counts = Counter()
+
+
+def count_event(event, args):
+    if event in COUNTED_EVENTS:
+        counts[COUNTED_EVENTS[event]] += 1
+
+
+def dump_counts():
+    with open(os.environ["OSA_AUDIT_OUTPUT"], "w") as f:
+        json.dump(counts, f)
+
+
+sys.addaudithook(count_event)
+atexit.register(dump_counts)
+
+sys.argv = sys.argv[1:]
+(entry_point,) = entry_points(group="console_scripts", name=sys.argv[0])
+sys.exit(entry_point.load()())
+"""
+
+COLUMNS = [
+    "exit code",
+    "wall time [s]",
+    "subprocesses",
+    "slurm calls",
+    "globs",
+    "directory scans",
+    "opens",
+    "syscalls",
+]
+
+
+def count_syscalls(strace_output: Path) -> int:
+    """Total number of system calls in the summary written by strace -c."""
+    for line in strace_output.read_text().splitlines():
+        fields = line.split()
+        if fields and fields[-1] == "total":
+            return int(fields[3])
+    return 0
+
+
+def run_script(script, base, config_file, bin_dir, strace=False) -> dict:
+    """Run a script on the synthetic night and return its measurements."""
+    bootstrap = base / "audit_bootstrap.py"
+    bootstrap.write_text(AUDIT_BOOTSTRAP)
+    audit_output = base / f"{script}_audit.json"
+    env = dict(
+        os.environ,
+        PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        OSA_AUDIT_OUTPUT=str(audit_output),
+        MPLBACKEND="Agg",
+        FAKE_SLURM_JOB_STATE="PENDING",
+    )
+    command = [sys.executable, str(bootstrap), script, "-c", str(config_file), *SCRIPTS[script]]
+    strace_output = base / f"{script}_strace.txt"
+    if strace:
+        command = ["strace", "-f", "-c", "-o", str(strace_output), *command]
+
+    calls_before = len(read_slurm_calls(base))
+    start = time.perf_counter()
+    with open(base / f"{script}.log", "w") as log_file:
+        result = sp.run(command, cwd=base, env=env, stdout=log_file, stderr=sp.STDOUT)
+    wall_time = time.perf_counter() - start
+
+    counts = Counter(json.loads(audit_output.read_text())) if audit_output.exists() else Counter()
+    slurm_calls = Counter(call["command"] for call in read_slurm_calls(base)[calls_before:])
+    return {
+        "exit code": result.returncode,
+        "wall time [s]": f"{wall_time:.2f}",
+        "subprocesses": counts["subprocesses"],
+        "slurm calls": " ".join(f"{cmd}:{n}" for cmd, n in sorted(slurm_calls.items())) or 0,
+        "globs": counts["globs"],
+        "directory scans": counts["directory scans"],
+        "opens": counts["opens"],
+        "syscalls": count_syscalls(strace_output) if strace else "n/a",
+    }
+
+
+def benchmark_night(base, runs, subruns, strace) -> dict:
+    """Create a night of `runs` DATA runs and run the scripts on it."""
+    start = time.perf_counter()
+    night = make_night(base, DATE, runs, subruns)
+    config_file = write_config(base)
+    bin_dir = install_fake_slurm(base, night)
+    elapsed = time.perf_counter() - start
+    print(f"Night of {runs} runs x {subruns} subruns created in {elapsed:.1f} s")
+    return {script: run_script(script, base, config_file, bin_dir, strace) for script in SCRIPTS}
+
+
+def print_results(results):
+    header = f"{'runs':>6} {'script':>11} " + " ".join(f"{column:>15}" for column in COLUMNS)
+    print(header)
+    print("-" * len(header))
+    for runs, scripts in results.items():
+        for script, measurements in scripts.items():
+            values = " ".join(f"{str(measurements[column]):>15}" for column in COLUMNS)
+            print(f"{runs:>6} {script:>11} {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--subruns", type=int, default=5, help="Subruns per DATA run")
+    parser.add_argument("--keep", type=Path, help="Keep the synthetic nights in this directory")
+    parser.add_argument("--no-strace", action="store_true", help="Do not count the syscalls")
+    parser.add_argument("--json", type=Path, help="Also write the results to a JSON file")
+    args = parser.parse_args()
+
+    strace = not args.no_strace and shutil.which("strace") is not None
+    results = {}
+    for runs in args.runs:
+        if args.keep:
+            base = args.keep / f"night_{runs}_runs"
+            base.mkdir(parents=True)
+            results[runs] = benchmark_night(base, runs, args.subruns, strace)
+        else:
+            with tempfile.TemporaryDirectory(prefix="osa_night_") as tmp:
+                results[runs] = benchmark_night(Path(tmp), runs, args.subruns, strace)
+
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
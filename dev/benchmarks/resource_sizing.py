@@ -0,0 +1,114 @@
+"""
+Offline evaluation of the adaptive sizing of the memory and time limits of the jobs.
+
+Usage:
+------
+python dev/benchmarks/resource_sizing.py --sacct sacct_dump.csv --database osa.db
+python dev/benchmarks/resource_sizing.py --sacct sacct_dump.csv --features features.csv
+
+A stored sacct dump, written as by osa.job.run_sacct, e.g.
+
+    sacct -n --parsable2 --delimiter=, --units=G --starttime 2024-01-01 \\
+        -o JobID,JobName,CPUTime,CPUTimeRAW,Elapsed,TotalCPU,MaxRSS,State,ExitCode
+
+is joined with the features of the sequences of each job, read from the
+job_features table of the OSA database or from a CSV file with the columns
+jobname, date, job_type, source, nsb_level and subrun_size_gb. The completed
+jobs are then replayed night by night: the jobs of each night are sized with
+the model fitted on the previous nights (see osa.resources) and compared with
+the fixed MEMSIZE_DATA and WALLTIME limits of the configuration. The report
+gives the jobs that would have run out of memory or time, the memory reserved
+while the jobs run in GB hours and the fraction of it actually used.
+"""
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from osa.configs.config import cfg
+from osa.resources import SAMPLE_COLUMNS, evaluate_sizing, memory_to_gb, parse_sacct_records
+from osa.utils.utils import time_to_seconds
+
+FEATURE_COLUMNS = ["jobname", "date", "job_type", "source", "nsb_level", "subrun_size_gb"]
+
+
+def read_features(database: Path = None, features: Path = None) -> pd.DataFrame:
+    """Features of the sequences from the OSA database or a CSV file."""
+    if features is not None:
+        return pd.read_csv(features, dtype={"date": str})[FEATURE_COLUMNS]
+    with sqlite3.connect(database) as connection:
+        return pd.read_sql(f"SELECT {', '.join(FEATURE_COLUMNS)} FROM job_features", connection)
+
+
+def print_results(results: dict):
+    columns = ["jobs", "sized", "out_of_memory", "timeout", "reserved_gb_h", "efficiency"]
+    print(f"{'limits':>10} " + " ".join(f"{column:>14}" for column in columns))
+    for limits, result in results.items():
+        values = " ".join(
+            f"{result[column]:>14.2f}" if isinstance(result[column], float)
+            else f"{result[column]:>14}"
+            for column in columns
+        )
+        print(f"{limits:>10} {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sacct", type=Path, required=True, help="Stored sacct dump")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--database", type=Path, help="OSA database with the job features")
+    source.add_argument("--features", type=Path, help="CSV file with the job features")
+    parser.add_argument(
+        "--quantile",
+        type=float,
+        default=cfg.getfloat("SLURM", "RESOURCE_QUANTILE"),
+        help="Quantile of the memory and time used by the past jobs requested",
+    )
+    parser.add_argument(
+        "--margin",
+        type=float,
+        default=cfg.getfloat("SLURM", "RESOURCE_MARGIN"),
+        help="Safety factor applied to the quantiles",
+    )
+    parser.add_argument(
+        "--min-samples",
+        type=int,
+        default=cfg.getint("SLURM", "RESOURCE_MIN_SAMPLES"),
+        help="Minimum number of past jobs of a group of features to use it",
+    )
+    parser.add_argument(
+        "--mem",
+        default=cfg.get("SLURM", "MEMSIZE_DATA"),
+        help="Fixed memory limit compared with (e.g. 6GB)",
+    )
+    parser.add_argument(
+        "--time",
+        default=cfg.get("SLURM", "WALLTIME"),
+        help="Fixed time limit compared with (e.g. 1:15:00)",
+    )
+    args = parser.parse_args()
+
+    with open(args.sacct) as sacct_dump:
+        records = parse_sacct_records(sacct_dump)
+    features = read_features(args.database, args.features)
+    samples = records.merge(features, on="jobname")[SAMPLE_COLUMNS]
+    print(
+        f"{len(records)} jobs in the dump, {len(samples)} with features, "
+        f"{samples['date'].nunique()} nights"
+    )
+
+    results = evaluate_sizing(
+        samples,
+        default_mem_gb=memory_to_gb(args.mem.upper().removesuffix("B")),
+        default_time_s=time_to_seconds(args.time),
+        quantile=args.quantile,
+        margin=args.margin,
+        min_samples=args.min_samples,
+    )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
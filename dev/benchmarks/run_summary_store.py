@@ -0,0 +1,108 @@
+"""
+Benchmark of the run summary lookups done at the sequencer startup over a season of nights.
+
+Usage:
+------
+python dev/benchmarks/run_summary_store.py [--nights 180] [--runs 30]
+
+A temporary directory with the RunSummary files of a season is created, with
+calibration runs taken only every third night so that most nights look back
+for them. For every night, the DATA runs and the last DRS4 and PEDCALIB runs
+are looked up parsing the ECSV files with astropy, as done before the run
+summary store, and with the store, first empty and then already filled.
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from astropy.table import Table
+
+from osa.configs.config import cfg
+from osa.nightsummary.extract import get_data_runs, get_last_drs4, get_last_pedcalib
+from osa.nightsummary.nightsummary import run_summary_table
+
+
+def make_season(summary_dir, first_night, nights, runs):
+    """Write the RunSummary files of `nights` nights from `first_night` on."""
+    run_id = 10000
+    for night in range(nights):
+        date = first_night + timedelta(days=night)
+        rows = []
+        if night % 3 == 0:
+            for run_type in ("DRS4", "PEDCALIB"):
+                run_id += 1
+                rows.append((run_id, 5, run_type, 1663951379000000000))
+        for _ in range(runs):
+            run_id += 1
+            rows.append((run_id, 100, "DATA", 1663951379000000000))
+        table = Table(rows=rows, names=["run_id", "n_subruns", "run_type", "run_start"])
+        table.write(
+            summary_dir / f"RunSummary_{date:%Y%m%d}.ecsv",
+            format="ascii.ecsv",
+            delimiter=",",
+        )
+
+
+def legacy_last_run(run_type, date):
+    """Former lookback: parse the run summary of each previous night until the run is found."""
+    summary = run_summary_table(date)
+    n = 0
+    while not (summary["run_type"] == run_type).any() and n < 4:
+        date = date - timedelta(days=1)
+        summary = run_summary_table(date)
+        n += 1
+    return summary[summary["run_type"] == run_type]["run_id"].max()
+
+
+def legacy_startup(date):
+    summary = run_summary_table(date)
+    data_runs = summary[summary["run_type"] == "DATA"]["run_id"].tolist()
+    return data_runs, legacy_last_run("DRS4", date), legacy_last_run("PEDCALIB", date)
+
+
+def store_startup(date):
+    return get_data_runs(date), get_last_drs4(date), get_last_pedcalib(date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nights", type=int, default=180)
+    parser.add_argument("--runs", type=int, default=30, help="DATA runs per night")
+    args = parser.parse_args()
+
+    first_night = datetime(2024, 1, 1)
+    # The first nights are skipped so that every night has calibration runs to look back to
+    dates = [first_night + timedelta(days=night) for night in range(3, args.nights)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        summary_dir = Path(tmp) / "RunSummary"
+        summary_dir.mkdir()
+        cfg.set("LST1", "RUN_SUMMARY_DIR", str(summary_dir))
+        cfg.set("LST1", "RUN_SUMMARY_STORE", str(Path(tmp) / "run_summary.db"))
+        make_season(summary_dir, first_night, args.nights, args.runs)
+
+        timings = {}
+        start = time.perf_counter()
+        legacy = [legacy_startup(date) for date in dates]
+        timings["astropy ECSV parsing"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cold = [store_startup(date) for date in dates]
+        timings["store, first ingestion"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        warm = [store_startup(date) for date in dates]
+        timings["store, already ingested"] = time.perf_counter() - start
+
+    assert legacy == cold == warm
+
+    print(f"{len(dates)} nights with {args.runs} DATA runs each")
+    for step, seconds in timings.items():
+        print(f"{step:>24}: {seconds:.3f} s ({seconds / len(dates) * 1000:.1f} ms/night)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Generator of synthetic observation nights with a fake SLURM.
+
+Usage:
+------
+python dev/benchmarks/synthetic_night.py BASE_DIR [--date 2024-01-17] [--runs 100] [--subruns 10]
+
+The directory tree of a night is created in BASE_DIR, as the LST1 section of
+the configuration file expects it: RunSummary and RunCatalog files, R0 and
+R0G stub files for every subrun, Cat-A calibration files, tailcuts and
+pedestal finder products, RF model directories and, in the running_analysis
+directory, the history files and the DL1, muons, datacheck, interleaved and
+DL2 placeholders left by the datasequence jobs. A copy of the default
+configuration file pointing to BASE_DIR is written as BASE_DIR/sequencer.cfg.
+
+Fake `sbatch`, `sacct` and `squeue` executables are written in BASE_DIR/bin.
+They keep the jobs in a JSON state file (BASE_DIR/slurm_state.json, or the
+FAKE_SLURM_STATE environment variable) and log every call they receive, so
+that the number of scheduler calls of the scripts can be counted. The jobs of
+the sequences of the night are registered as COMPLETED, as if the night had
+been fully processed, and so are the submitted jobs unless the
+FAKE_SLURM_JOB_STATE environment variable sets another state.
+"""
+
+import argparse
+import configparser
+import json
+import os
+import stat
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from osa.configs.config import DEFAULT_CFG
+
+__all__ = ["make_night", "write_config", "install_fake_slurm", "read_slurm_calls"]
+
+# Names without spaces, as the autocloser splits the columns of the sequencer table on them
+SOURCES = ["Crab", "Mrk421", "Mrk501", "1ES1959+650", "BLLac"]
+
+# First run of the night: a DRS4 run followed by a PEDCALIB one, then the DATA runs
+FIRST_RUN = 10000
+
+RUN_SUMMARY_HEADER = """\
+# %ECSV 1.0
+# ---
+# datatype:
+# - {{name: run_id, datatype: int64}}
+# - {{name: n_subruns, datatype: int64}}
+# - {{name: run_type, datatype: string}}
+# - {{name: ucts_timestamp, datatype: int64}}
+# - {{name: run_start, datatype: int64}}
+# - {{name: dragon_reference_time, datatype: int64}}
+# - {{name: dragon_reference_module_id, datatype: int16}}
+# - {{name: dragon_reference_module_index, datatype: int16}}
+# - {{name: dragon_reference_counter, datatype: uint64}}
+# - {{name: dragon_reference_source, datatype: string}}
+# delimiter: ','
+# meta: !!omap
+# - {{date: '{date}'}}
+# - {{lstchain_version: 0.10.0}}
+# schema: astropy-2.0
+run_id,n_subruns,run_type,ucts_timestamp,run_start,dragon_reference_time,\
+dragon_reference_module_id,dragon_reference_module_index,dragon_reference_counter,\
+dragon_reference_source
+"""
+
+RUN_CATALOG_HEADER = """\
+# %ECSV 1.0
+# ---
+# datatype:
+# - {name: run_id, datatype: int32}
+# - {name: source_name, datatype: string}
+# - {name: source_ra, datatype: float64}
+# - {name: source_dec, datatype: float64}
+# delimiter: ','
+# schema: astropy-2.0
+run_id,source_name,source_ra,source_dec
+"""
+
+MERGED_SUMMARY_HEADER = """\
+# %ECSV 1.0
+# ---
+# datatype:
+# - {name: date, datatype: string}
+# - {name: run_id, datatype: int64}
+# - {name: run_type, datatype: string}
+# - {name: n_subruns, datatype: int64}
+# - {name: run_start, datatype: string}
+# - {name: ra, unit: deg, datatype: float64}
+# - {name: dec, unit: deg, datatype: float64}
+# - {name: alt, unit: rad, datatype: float64}
+# - {name: az, unit: rad, datatype: float64}
+# meta: !!omap
+# - __serialized_columns__:
+#     run_start:
+#       __class__: astropy.time.core.Time
+#       format: isot
+#       in_subfmt: '*'
+#       out_subfmt: '*'
+#       precision: 3
+#       scale: utc
+#       value: !astropy.table.SerializedColumn {name: run_start}
+# schema: astropy-2.0
+date run_id run_type n_subruns run_start ra dec alt az
+"""
+
+SOURCE_COORDINATES = {
+    "Crab": (83.633, 22.014),
+    "Mrk421": (166.114, 38.209),
+    "Mrk501": (253.468, 39.760),
+    "1ES1959+650": (299.999, 65.149),
+    "BLLac": (330.680, 42.278),
+}
+
+TAILCUTS_CONFIG = {
+    "tailcuts_clean_with_pedestal_threshold": {
+        "picture_thresh": 8,
+        "boundary_thresh": 4,
+        "sigma": 2.5,
+        "keep_isolated_pixels": False,
+        "min_number_picture_neighbors": 2,
+        "use_only_main_island": False,
+        "delta_time": 2,
+    },
+    "dynamic_cleaning": {"apply": True, "threshold": 267, "fraction_cleaning_intensity": 0.03},
+}
+
+TAILCUTS_LOG = """\
+Median of 95% quantile of pedestal charge: 5.416 p.e.
+
+Additional NSB rate (over dark MC): 0.2221 p.e./ns
+lstchain_find_tailcuts finished successfully!
+"""
+
+FAKE_SLURM = '''\
+#!{python}
+"""Fake {command} backed by a JSON state file, for benchmarks."""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+STATE = Path(os.environ.get("FAKE_SLURM_STATE", "{state}"))
+FORMAT = ["JobID", "JobName", "CPUTime", "CPUTimeRAW", "Elapsed", "TotalCPU", "MaxRSS", "State",
+          "ExitCode"]
+
+
+def option(args, *names):
+    for i, arg in enumerate(args):
+        for name in names:
+            if arg == name and i + 1 < len(args):
+                return args[i + 1]
+            if arg.startswith(name + "="):
+                return arg.split("=", 1)[1]
+    return None
+
+
+def sbatch(state, args):
+    script = next((arg for arg in reversed(args) if not arg.startswith("-")), None)
+    header = []
+    if script and Path(script).is_file():
+        with open(script) as f:
+            header = [line.split(None, 1)[1].strip() for line in f if line.startswith("#SBATCH")]
+    job_name = option(args, "--job-name", "-J") or option(header, "--job-name") or "sbatch"
+    array = option(args, "--array", "-a") or option(header, "--array")
+    state["next_id"] += 1
+    # Jobs finish as soon as they are submitted, unless another state is requested
+    job_state = os.environ.get("FAKE_SLURM_JOB_STATE", "COMPLETED")
+    job = {{"JobID": state["next_id"], "JobName": job_name, "State": job_state,
+           "ExitCode": "0:0", "array": array}}
+    state["jobs"].append(job)
+    return f"{{job['JobID']}}\\n"
+
+
+def job_rows(job):
+    elapsed = "00:01:00"
+    first, _, last = (job.get("array") or "").partition("-")
+    tasks = range(int(first), int(last or first) + 1) if first else [None]
+    for task in tasks:
+        job_id = str(job["JobID"]) if task is None else f"{{job['JobID']}}_{{task}}"
+        yield [job_id, job["JobName"], elapsed, "60", elapsed, elapsed, "", job["State"],
+               job["ExitCode"]]
+        yield [job_id + ".batch", "batch", elapsed, "60", elapsed, elapsed, "0.1G", job["State"],
+               job["ExitCode"]]
+
+
+def sacct(state, args):
+    columns = (option(args, "-o", "--format") or ",".join(FORMAT)).split(",")
+    delimiter = option(args, "--delimiter") or "|"
+    job_ids = option(args, "--jobs", "-j")
+    job_ids = None if job_ids is None else {{job_id.split("_")[0] for job_id in job_ids.split(",")}}
+    lines = []
+    for job in state["jobs"]:
+        if job_ids is not None and str(job["JobID"]) not in job_ids:
+            continue
+        for row in job_rows(job):
+            values = dict(zip(FORMAT, row))
+            lines.append(delimiter.join(values.get(column, "") for column in columns))
+    return "".join(line + "\\n" for line in lines)
+
+
+def squeue(state, args):
+    lines = ["JOBID;NAME;STATE;TIME"]
+    for job in state["jobs"]:
+        if job["State"] in ("PENDING", "RUNNING"):
+            lines.append(f"{{job['JobID']}};{{job['JobName']}};{{job['State']}};0:00")
+    return "".join(line + "\\n" for line in lines)
+
+
+def main():
+    state = json.loads(STATE.read_text())
+    state["calls"].append({{"command": "{command}", "args": sys.argv[1:], "time": time.time()}})
+    sys.stdout.write({command}(state, sys.argv[1:]))
+    tmp_state = STATE.with_suffix(".tmp")
+    tmp_state.write_text(json.dumps(state))
+    tmp_state.replace(STATE)
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def _touch(path: Path, content: str = None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if content is None:
+        path.touch()
+    else:
+        path.write_text(content)
+
+
+def night_runs(runs: int, subruns: int) -> list:
+    """Return the (run_id, n_subruns, run_type) of the runs of a night."""
+    night = [(FIRST_RUN, 5, "DRS4"), (FIRST_RUN + 1, 5, "PEDCALIB")]
+    night.extend((FIRST_RUN + 2 + i, subruns, "DATA") for i in range(runs))
+    return night
+
+
+def make_night(base: Path, date: datetime, runs: int, subruns: int, prod_id: str = "v0.1.0"):
+    """
+    Create the files of a synthetic night of `runs` DATA runs of `subruns` subruns each.
+
+    Returns
+    -------
+    list
+        (run_id, n_subruns, run_type) of the runs of the night.
+    """
+    base = Path(base)
+    flat_date = f"{date:%Y%m%d}"
+    start = int(date.replace(hour=21).timestamp() * 1e9)
+    monitoring = base / "monitoring"
+    analysis_dir = base / "running_analysis" / flat_date / prod_id
+    dl1ab_dir = analysis_dir / "tailcut84"
+    dl2_dir = dl1ab_dir / "nsb_tuning_0.14"
+    for directory in (analysis_dir / "log", dl2_dir, base / "DL1" / "datacheck_files"):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    runs_of_night = night_runs(runs, subruns)
+
+    summary_lines = []
+    merged_lines = []
+    catalog_lines = []
+    for i, (run_id, n_subruns, run_type) in enumerate(runs_of_night):
+        run_start = start + i * 1_200_000_000_000
+        summary_lines.append(
+            f"{run_id},{n_subruns},{run_type},{run_start},{run_start},{run_start},90,0,0,ucts"
+        )
+        iso_start = datetime.utcfromtimestamp(run_start / 1e9).isoformat(timespec="milliseconds")
+        merged_lines.append(
+            f"{date:%Y-%m-%d} {run_id} {run_type} {n_subruns} {iso_start} 83.6 22.0 1.2 3.1"
+        )
+        for subrun in range(n_subruns):
+            name = f"LST-1.1.Run{run_id:05d}.{subrun:04d}.fits.fz"
+            _touch(base / "R0" / flat_date / name)
+            _touch(base / "R0G" / flat_date / name)
+
+        if run_type != "DATA":
+            continue
+
+        source = SOURCES[i % len(SOURCES)]
+        catalog_lines.append(f"{run_id},{source},{','.join(map(str, SOURCE_COORDINATES[source]))}")
+        tailcuts_dir = base / "auxiliary" / "TailCuts"
+        _touch(tailcuts_dir / f"dl1ab_Run{run_id:05d}.json", json.dumps(TAILCUTS_CONFIG))
+        _touch(tailcuts_dir / f"log_find_tailcuts_Run{run_id:05d}.log", TAILCUTS_LOG)
+        pedestal_dir = base / "auxiliary" / "PedestalFinder" / flat_date
+        _touch(pedestal_dir / f"pedestal_ids_Run{run_id:05d}.0000.h5")
+        _touch(analysis_dir / f"catB_{run_id:05d}.closed")
+
+        for subrun in range(n_subruns):
+            run_str = f"Run{run_id:05d}.{subrun:04d}"
+            _touch(
+                analysis_dir / f"sequence_LST1_{run_id:05d}.{subrun:04d}.history",
+                f"{run_str} r0_to_dl1 v0.10.0 dl1_LST-1.{run_str}.h5 calibration.h5 0\n"
+                f"{run_str} lstchain_check_dl1 v0.10.0 datacheck_dl1_LST-1.{run_str}.h5 None 0\n",
+            )
+            for file in (
+                analysis_dir / f"dl1_LST-1.{run_str}.h5",
+                analysis_dir / f"muons_LST-1.{run_str}.fits",
+                analysis_dir / f"interleaved_LST-1.{run_str}.h5",
+                dl1ab_dir / f"dl1_LST-1.{run_str}.h5",
+                dl1ab_dir / f"datacheck_dl1_LST-1.{run_str}.h5",
+                dl2_dir / f"dl2_LST-1.{run_str}.h5",
+            ):
+                file.touch()
+
+    _touch(
+        monitoring / "RunSummary" / f"RunSummary_{flat_date}.ecsv",
+        RUN_SUMMARY_HEADER.format(date=f"{date:%Y-%m-%d}") + "\n".join(summary_lines) + "\n",
+    )
+    _touch(
+        monitoring / "RunCatalog" / f"RunCatalog_{flat_date}.ecsv",
+        RUN_CATALOG_HEADER + "\n".join(catalog_lines) + "\n",
+    )
+    _touch(
+        base / "OSA" / "Catalog" / "merged_RunSummary.ecsv",
+        MERGED_SUMMARY_HEADER + "\n".join(merged_lines) + "\n",
+    )
+    _touch(monitoring / "DrivePositioning" / f"DrivePosition_log_{flat_date}.txt")
+
+    # Calibration products, valid since some nights before
+    calib_date = f"{date - timedelta(days=30):%Y%m%d}"
+    cat_a = monitoring / "PixelCalibration" / "Cat-A"
+    drs4_run, pedcalib_run = FIRST_RUN, FIRST_RUN + 1
+    drs4_dir = cat_a / "drs4_baseline" / flat_date / "v0.1.1"
+    _touch(drs4_dir / f"drs4_pedestal.Run{drs4_run:05d}.0000.h5")
+    calibration_dir = cat_a / "calibration" / flat_date / "v0.1.1"
+    _touch(calibration_dir / f"calibration_filters_52.Run{pedcalib_run:05d}.0000.h5")
+    time_calibration_dir = cat_a / "drs4_time_sampling_from_FF" / calib_date / "pro"
+    _touch(time_calibration_dir / "time_calibration.Run01625.0000.h5")
+    _touch(
+        cat_a / "ffactor_systematics" / calib_date / "pro" / f"ffactor_systematics_{calib_date}.h5"
+    )
+    _touch(base / "OSA" / "GainSel" / flat_date / "GainSelFinished.txt")
+    return runs_of_night
+
+
+def write_config(base: Path, config_file: Path = None) -> Path:
+    """Write a copy of the default configuration file with BASE pointing to `base`."""
+    base = Path(base)
+    config_file = base / "sequencer.cfg" if config_file is None else Path(config_file)
+    config = configparser.ConfigParser(allow_no_value=True, interpolation=None)
+    config.optionxform = str
+    config.read(DEFAULT_CFG)
+    config.set("LST1", "BASE", str(base.resolve()))
+    config.set("database", "path", str(base.resolve() / "osa.db"))
+    # Keep the numba warm-up of the sequencer out of the measurements
+    config.set("CACHE", "NUMBA_CACHE_DIR", "")
+    with open(config_file, "w") as f:
+        config.write(f)
+
+    # The models directory is expected to have the configured MC production prefix
+    mc_prod = config.get("lstchain", "mc_prod")
+    models = base / "models" / "AllSky"
+    for model in ("nsb_tuning_0.00", "nsb_tuning_0.14/dec_2276", "nsb_tuning_0.14/dec_4822"):
+        (models / f"{mc_prod}{model}").mkdir(parents=True, exist_ok=True)
+    return config_file
+
+
+def install_fake_slurm(base: Path, runs: list = ()) -> Path:
+    """
+    Write fake sbatch, sacct and squeue executables in base/bin.
+
+    The jobs of the given runs are registered as COMPLETED in the state file.
+
+    Returns
+    -------
+    pathlib.Path
+        Directory of the executables, to be prepended to PATH.
+    """
+    base = Path(base)
+    bin_dir = base / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    state_file = base / "slurm_state.json"
+
+    jobs = []
+    for i, (run_id, n_subruns, run_type) in enumerate(runs):
+        if run_type == "DRS4":
+            continue
+        jobs.append(
+            {
+                "JobID": 1000 + i,
+                "JobName": f"LST1_{run_id:05d}",
+                "State": "COMPLETED",
+                "ExitCode": "0:0",
+                "array": f"0-{n_subruns - 1}" if run_type == "DATA" else None,
+            }
+        )
+    state = {"next_id": 1000 + len(jobs) + 1, "jobs": jobs, "calls": []}
+    state_file.write_text(json.dumps(state))
+
+    for command in ("sbatch", "sacct", "squeue"):
+        executable = bin_dir / command
+        executable.write_text(
+            FAKE_SLURM.format(python=sys.executable, command=command, state=state_file.resolve())
+        )
+        executable.chmod(executable.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+def read_slurm_calls(base: Path) -> list:
+    """Return the calls received by the fake SLURM executables."""
+    state_file = Path(os.environ.get("FAKE_SLURM_STATE", Path(base) / "slurm_state.json"))
+    return json.loads(state_file.read_text())["calls"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base", type=Path, help="Base directory of the synthetic night")
+    parser.add_argument("--date", type=datetime.fromisoformat, default=datetime(2024, 1, 17))
+    parser.add_argument("--runs", type=int, default=100, help="Number of DATA runs")
+    parser.add_argument("--subruns", type=int, default=10, help="Subruns per DATA run")
+    args = parser.parse_args()
+
+    runs = make_night(args.base, args.date, args.runs, args.subruns)
+    config_file = write_config(args.base)
+    bin_dir = install_fake_slurm(args.base, runs)
+    print(f"Night {args.date:%Y-%m-%d} with {len(runs)} runs created in {args.base}")
+    print(f"Run the scripts with: PATH={bin_dir}:$PATH <script> -c {config_file} ...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark of the known-error matching of the troubleshooting over a corpus of synthetic slurm logs.
+
+Usage:
+------
+python dev/benchmarks/troubleshooting_logs.py [--logs 500] [--size-mb 8] [--workers 8]
+
+A temporary directory with slurm error logs is created, each of them made of
+lstchain-like INFO lines followed, for most of them, by a traceback ending with
+one of the known errors of the sequencer troubleshooting. The logs are then
+matched with the former approach (read the whole log and run every pattern
+one after the other) and with the compiled signatures scanning the end of
+the logs in a thread pool, checking that both find the same errors.
+"""
+
+import argparse
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import osa.scripts
+
+# The troubleshooting handlers are run as scripts from their directory
+sys.path.insert(0, str(Path(osa.scripts.__file__).parent))
+
+import troubleshooting_sequencer  # noqa: E402
+import troubleshooting_utils as utils  # noqa: E402
+
+KNOWN_ERRORS = troubleshooting_sequencer.KNOWN_ERRORS
+
+ERROR_LINES = [
+    "tables.exceptions.NodeError: Table /dl1/monitoring/telescope/catB/calibration already exists",
+    "tables.exceptions.NoSuchNodeError: ... /pedestal",
+    "ValueError: x_new is above the interpolation range's maximum value",
+    "FileNotFoundError: [Errno 2] No such file or directory: 'datasequence'",
+    "lstcam_calib_onsite_create_drs4_pedestal_file: Output file exists already",
+    "OSError: [Errno 11] Unable to open file (error message = 'Resource temporarily unavailable')",
+]
+
+
+def make_corpus(log_dir, n_logs, size_mb, seed=0):
+    """Create the synthetic logs. Returns the path and the expected error of each log."""
+    rng = random.Random(seed)
+    line = "2024-01-17 01:23:45,678 INFO [lstchain.reco.r0_to_dl1] Processing event {}\n"
+    body = "".join(line.format(i) for i in range(size_mb * 1024 * 1024 // len(line)))
+    expected = {}
+
+    for i in range(n_logs):
+        log = log_dir / f"Run{10000 + i:05d}.{i % 100:04d}_{51712367 + i}.err"
+        # One log in five fails without any known error
+        error = rng.randrange(len(ERROR_LINES)) if i % 5 else None
+        traceback = "Traceback (most recent call last):\n" + "  File \"lstchain/io.py\", line 1\n" * 20
+        if error is not None:
+            traceback += ERROR_LINES[error] + "\n"
+        log.write_text(body + traceback)
+        expected[str(log)] = error
+    return expected
+
+
+def match_sequentially(log_paths):
+    """Former approach: read the whole log and try every pattern one after the other."""
+    results = {}
+    for log_path in log_paths:
+        content = utils.read_log(log_path)
+        results[log_path] = None
+        for pattern, details in KNOWN_ERRORS.items():
+            if re.search(pattern, content, re.IGNORECASE):
+                results[log_path] = details["error_id"]
+                break
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logs", type=int, default=500, help="Number of failed jobs")
+    parser.add_argument("--size-mb", type=int, default=8, help="Size of each log in MB")
+    parser.add_argument("--workers", type=int, default=8, help="Threads scanning the logs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        expected = make_corpus(Path(tmp), args.logs, args.size_mb)
+        log_paths = list(expected)
+        print(f"{args.logs} logs of {args.size_mb} MB created in {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        sequential = match_sequentially(log_paths)
+        t_sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        signatures = utils.compile_error_signatures(KNOWN_ERRORS)
+        scanned = utils.scan_logs(log_paths, signatures, max_workers=args.workers)
+        t_scanned = time.perf_counter() - start
+
+    error_ids = [details["error_id"] for details in KNOWN_ERRORS.values()]
+    for log_path, error in expected.items():
+        expected_id = None if error is None else error_ids[error]
+        found = scanned[log_path][0]["error_id"] if scanned[log_path] else None
+        assert sequential[log_path] == found == expected_id, log_path
+
+    print(f"{'sequential, whole logs':>28}: {t_sequential:.2f} s ({args.logs / t_sequential:.0f} logs/s)")
+    print(f"{'compiled, tails in threads':>28}: {t_scanned:.2f} s ({args.logs / t_scanned:.0f} logs/s)")
+    print(f"{'speed-up':>28}: {t_sequential / t_scanned:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 
 import configparser
 import logging
+import os
 import sys
 from pathlib import Path
 
@@ -12,12 +13,65 @@ from osa.utils.logging import myLogger
 
 log = myLogger(logging.getLogger(__name__))
 
-__all__ = ["read_config", "cfg", "DEFAULT_CFG"]
+__all__ = ["read_config", "cfg", "DEFAULT_CFG", "VersionedConfigParser"]
 
 
 DEFAULT_CFG = files("osa").joinpath("configs/sequencer.cfg")
 
 
+class VersionedConfigParser(configparser.ConfigParser):
+    """
+    ConfigParser counting its modifications.
+
+    The typed views of the configuration (see osa.configs.settings) are
+    rebuilt only when `version` changed since they were built.
+    """
+
+    version = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Modification times of the files read, to reload them when they change
+        self.source_mtimes = {}
+
+    def _modified(self):
+        self.version += 1
+
+    def read(self, filenames, encoding=None):
+        self._modified()
+        if isinstance(filenames, (str, bytes, os.PathLike)):
+            filenames = [filenames]
+        mtimes = {}
+        for filename in filenames:
+            try:
+                mtimes[os.fspath(filename)] = os.stat(filename).st_mtime_ns
+            except OSError:
+                continue
+        read_ok = super().read(filenames, encoding=encoding)
+        self.source_mtimes.update((f, mtimes[f]) for f in read_ok if f in mtimes)
+        return read_ok
+
+    def read_file(self, f, source=None):
+        self._modified()
+        super().read_file(f, source=source)
+
+    def read_dict(self, dictionary, source="<dict>"):
+        self._modified()
+        super().read_dict(dictionary, source=source)
+
+    def set(self, section, option, value=None):
+        self._modified()
+        super().set(section, option, value)
+
+    def remove_option(self, section, option):
+        self._modified()
+        return super().remove_option(section, option)
+
+    def remove_section(self, section):
+        self._modified()
+        return super().remove_section(section)
+
+
 def read_config():
     """
     Read cfg lstosa config file
@@ -40,7 +94,7 @@ def read_config():
     if not Path(file).exists():
         raise FileNotFoundError(f"Configuration file {file} not found.")
 
-    config = configparser.ConfigParser(allow_no_value=True)
+    config = VersionedConfigParser(allow_no_value=True)
     try:
         config.read(file)
     except configparser.Error as err:
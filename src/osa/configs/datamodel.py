@@ -38,6 +38,10 @@ class Sequence(RunObj):
         self.cputime = None
         self.walltime = None
         self.exit = None
+        # Run the DL1 steps in the process of the job (None: as configured)
+        self.fused_dl1 = None
+        # Memory and time limits of the jobs (None: those of the config)
+        self.resources = None
 
     def associate(self, r):
         for a in r.__dict__.keys():
@@ -71,3 +75,4 @@ class SequenceData(Sequence):
         self.datacheckstatus = None
         self.dl2status = None
         self.dl3status = None
+        self.catbstatus = None
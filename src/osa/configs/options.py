@@ -16,6 +16,7 @@ warning = None
 nocheck = None
 no_dl2 = None
 no_dl1ab = None
+fused_dl1 = False
 no_gainsel = None
 prod_id = None
 dl1_prod_id = None
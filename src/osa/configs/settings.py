@@ -0,0 +1,245 @@
+"""
+Typed view of the lstosa configuration, validated once when loaded.
+
+The hot paths building the directories and production IDs of every run
+look them up in the `Settings` returned by `get_settings`, whose `Path`
+objects and production IDs are computed once, instead of interpolating and
+parsing the options of the configuration file on every call. The settings
+are rebuilt whenever the configuration changes (`cfg.set` or a reload of
+the file), and all the missing options are reported at once when loaded.
+"""
+
+import configparser
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict
+
+from osa.configs.config import VersionedConfigParser, cfg
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "TelescopeSettings",
+    "LstchainSettings",
+    "Settings",
+    "REQUIRED_OPTIONS",
+    "load_settings",
+    "get_settings",
+    "reload_config_if_changed",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+# Options without which the processing of a night cannot complete
+REQUIRED_OPTIONS = {
+    "LST1": [
+        "BASE",
+        "R0_DIR",
+        "RUN_SUMMARY_DIR",
+        "DRIVE_DIR",
+        "PEDESTAL_FINDER_DIR",
+        "TAILCUTS_FINDER_DIR",
+        "ANALYSIS_DIR",
+        "CAT_A_CALIB_DIR",
+        "CAT_A_PEDESTAL_DIR",
+        "DL1_DIR",
+        "DL2_DIR",
+        "DL3_DIR",
+        "HIGH_LEVEL_DIR",
+        "CLOSER_DIR",
+        "MERGED_SUMMARY",
+        "DL1_PROD_ID",
+        "DL1_PROD_ID_PREFIX",
+    ],
+    "lstchain": [
+        "r0_to_dl1",
+        "dl1ab",
+        "check_dl1",
+        "dl1_to_dl2",
+        "dl1b_config",
+        "apply_standard_dl1b_config",
+        "store_image_dl1ab",
+        "apply_catB_calibration",
+        "max_tries",
+    ],
+    "SLURM": ["PARTITION_DATA", "MEMSIZE_DATA", "WALLTIME", "ACCOUNT"],
+    "LSTOSA": ["end_of_activity"],
+}
+
+
+@dataclass(frozen=True)
+class TelescopeSettings:
+    """Directories and production IDs of a telescope section (e.g. [LST1])."""
+
+    name: str
+    analysis_dir: Path
+    run_summary_dir: Path
+    tailcuts_finder_dir: Path
+    cat_a_calib_dir: Path
+    cat_a_pedestal_dir: Path
+    dl1_dir: Path
+    closer_dir: Path
+    calib_env: Path
+    prod_id: str
+    dl1_prod_id: str
+    dl1_prod_id_prefix: str
+    dl2_prod_id: str
+    directories: Dict[str, Path] = field(default_factory=dict)
+
+    def directory(self, option: str) -> Path:
+        """Path of a *_DIR option of the section."""
+        try:
+            return self.directories[option]
+        except KeyError:
+            raise configparser.NoOptionError(option, self.name) from None
+
+
+@dataclass(frozen=True)
+class LstchainSettings:
+    """Options of the [lstchain] section used for every run."""
+
+    dl1b_config: Path
+    apply_standard_dl1b_config: bool
+    store_image_dl1ab: bool
+    apply_catB_calibration: bool
+    max_tries: int
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Typed configuration, built from a given version of a VersionedConfigParser."""
+
+    version: int
+    lstchain: LstchainSettings
+    telescopes: Dict[str, TelescopeSettings]
+
+    def telescope(self, name: str) -> TelescopeSettings:
+        """Settings of a telescope section."""
+        try:
+            return self.telescopes[name]
+        except KeyError:
+            raise configparser.NoSectionError(name) from None
+
+
+def _default_prod_id() -> str:
+    from lstchain import __version__
+
+    return f"v{__version__}"
+
+
+def _telescope_settings(config, name: str) -> TelescopeSettings:
+    section = config[name]
+    directories = {
+        option.upper(): Path(section[option])
+        for option in section
+        if option.upper().endswith("_DIR") and section[option]
+    }
+    return TelescopeSettings(
+        name=name,
+        analysis_dir=directories["ANALYSIS_DIR"],
+        run_summary_dir=directories["RUN_SUMMARY_DIR"],
+        tailcuts_finder_dir=directories["TAILCUTS_FINDER_DIR"],
+        cat_a_calib_dir=directories["CAT_A_CALIB_DIR"],
+        cat_a_pedestal_dir=directories["CAT_A_PEDESTAL_DIR"],
+        dl1_dir=directories["DL1_DIR"],
+        closer_dir=directories["CLOSER_DIR"],
+        calib_env=Path(section.get("CALIB_ENV") or ""),
+        prod_id=section.get("PROD_ID") or _default_prod_id(),
+        dl1_prod_id=section["DL1_PROD_ID"],
+        dl1_prod_id_prefix=section["DL1_PROD_ID_PREFIX"],
+        dl2_prod_id=section.get("DL2_PROD_ID"),
+        directories=directories,
+    )
+
+
+def load_settings(config: VersionedConfigParser) -> Settings:
+    """
+    Validate a configuration and build its typed settings.
+
+    Raises
+    ------
+    ValueError
+        Listing all the required options missing or with a wrong type.
+    """
+    errors = [
+        f"[{section}] {option}"
+        for section, options in REQUIRED_OPTIONS.items()
+        for option in options
+        if not config.has_option(section, option)
+    ]
+    if errors:
+        raise ValueError(f"Missing options in the configuration: {', '.join(errors)}")
+
+    try:
+        lstchain = LstchainSettings(
+            dl1b_config=Path(config.get("lstchain", "dl1b_config")),
+            apply_standard_dl1b_config=config.getboolean("lstchain", "apply_standard_dl1b_config"),
+            store_image_dl1ab=config.getboolean("lstchain", "store_image_dl1ab"),
+            apply_catB_calibration=config.getboolean("lstchain", "apply_catB_calibration"),
+            max_tries=config.getint("lstchain", "max_tries"),
+        )
+        # Every section with an analysis directory is a telescope section
+        telescopes = {
+            name: _telescope_settings(config, name)
+            for name in config.sections()
+            if config.has_option(name, "ANALYSIS_DIR")
+        }
+    except KeyError as error:
+        # Directory or option of a telescope section missing or left empty
+        raise ValueError(f"Invalid configuration: missing option {error}") from error
+    except (ValueError, configparser.Error) as error:
+        raise ValueError(f"Invalid configuration: {error}") from error
+
+    return Settings(version=config.version, lstchain=lstchain, telescopes=telescopes)
+
+
+_settings = None
+
+
+def get_settings() -> Settings:
+    """Return the settings of the current version of the configuration."""
+    global _settings
+    if _settings is None or _settings.version != cfg.version:
+        _settings = load_settings(cfg)
+    return _settings
+
+
+def reload_config_if_changed(config: VersionedConfigParser = cfg) -> bool:
+    """
+    Re-read the configuration files if they were modified, for long-running processes.
+
+    The new configuration is validated first, and kept out if it is not valid.
+
+    Returns
+    -------
+    bool
+        True if the configuration was reloaded.
+    """
+    files = list(config.source_mtimes)
+    changed = []
+    for file in files:
+        try:
+            if os.stat(file).st_mtime_ns != config.source_mtimes[file]:
+                changed.append(file)
+        except OSError:
+            continue
+
+    if not changed:
+        return False
+
+    new_config = VersionedConfigParser(allow_no_value=True)
+    new_config.read(files)
+    try:
+        load_settings(new_config)
+    except ValueError as error:
+        log.error(f"Configuration {', '.join(changed)} not reloaded: {error}")
+        # Do not try again until the files are modified again
+        config.source_mtimes.update(new_config.source_mtimes)
+        return False
+
+    for section in config.sections():
+        config.remove_section(section)
+    config.read(files)
+    log.info(f"Configuration reloaded from {', '.join(changed)}")
+    return True
@@ -0,0 +1,92 @@
+import configparser
+import os
+from pathlib import Path
+
+import pytest
+
+from osa.configs.config import DEFAULT_CFG, VersionedConfigParser, cfg
+
+
+def read_default_config(path=DEFAULT_CFG):
+    config = VersionedConfigParser(allow_no_value=True)
+    config.read(path)
+    return config
+
+
+def test_load_settings():
+    from osa.configs.settings import load_settings
+
+    settings = load_settings(read_default_config())
+    telescope = settings.telescope("LST1")
+    assert telescope.analysis_dir == Path("test_osa/test_files0/running_analysis")
+    assert telescope.directory("DL2_DIR") == Path("test_osa/test_files0/DL2")
+    assert telescope.prod_id == "v0.1.0"
+    assert telescope.dl1_prod_id_prefix == "tailcut"
+    assert settings.lstchain.apply_standard_dl1b_config is False
+    assert settings.lstchain.max_tries == 3
+
+    with pytest.raises(configparser.NoOptionError):
+        telescope.directory("PEDESTAL_DIR")
+    with pytest.raises(configparser.NoSectionError):
+        settings.telescope("LST2")
+
+
+def test_load_settings_errors():
+    from osa.configs.settings import load_settings
+
+    config = read_default_config()
+    config.remove_option("LST1", "DL2_DIR")
+    config.remove_option("SLURM", "ACCOUNT")
+    # All the missing options are reported at once
+    with pytest.raises(ValueError, match=r"\[LST1\] DL2_DIR, \[SLURM\] ACCOUNT"):
+        load_settings(config)
+
+    config = read_default_config()
+    config.set("lstchain", "max_tries", "three")
+    with pytest.raises(ValueError, match="Invalid configuration"):
+        load_settings(config)
+
+
+def test_get_settings_follows_config():
+    from osa.configs.settings import get_settings
+
+    settings = get_settings()
+    assert get_settings() is settings
+
+    previous = cfg.get("LST1", "DL1_PROD_ID_PREFIX")
+    cfg.set("LST1", "DL1_PROD_ID_PREFIX", "tailcuts_")
+    try:
+        assert get_settings().telescope("LST1").dl1_prod_id_prefix == "tailcuts_"
+    finally:
+        cfg.set("LST1", "DL1_PROD_ID_PREFIX", previous)
+    assert get_settings().telescope("LST1").dl1_prod_id_prefix == previous
+
+
+def test_reload_config_if_changed(tmp_path):
+    from osa.configs.settings import reload_config_if_changed
+
+    config_file = tmp_path / "sequencer.cfg"
+    config_file.write_text(Path(DEFAULT_CFG).read_text())
+    config = read_default_config(config_file)
+    assert not reload_config_if_changed(config)
+
+    def modify(old, new, mtime_ns):
+        config_file.write_text(config_file.read_text().replace(old, new))
+        os.utime(config_file, ns=(mtime_ns, mtime_ns))
+
+    mtime_ns = config.source_mtimes[str(config_file)]
+    modify("PROD_ID: v0.1.0", "PROD_ID: v0.2.0", mtime_ns + 10**9)
+    assert reload_config_if_changed(config)
+    assert config.get("LST1", "PROD_ID") == "v0.2.0"
+    assert not reload_config_if_changed(config)
+
+    # An invalid configuration is not loaded
+    modify("DL2_DIR:", "DL2_DIRECTORY:", mtime_ns + 2 * 10**9)
+    assert not reload_config_if_changed(config)
+    assert config.get("LST1", "DL2_DIR") == "test_osa/test_files0/DL2"
+
+    # Neither is a configuration with a directory left empty
+    modify("DL2_DIRECTORY:", "DL2_DIR:", mtime_ns + 3 * 10**9)
+    modify("CLOSER_DIR: %(OSA_DIR)s/Closer", "CLOSER_DIR:", mtime_ns + 3 * 10**9)
+    assert not reload_config_if_changed(config)
+    assert config.get("LST1", "CLOSER_DIR").endswith("/Closer")
@@ -5,7 +5,6 @@ Based on Explore_DL2_data.ipynb from LST-1 analysis 2022 school.
 """
 
 import logging
-import subprocess
 from datetime import datetime
 from pathlib import Path
 from typing import MutableMapping, Any
@@ -38,7 +37,7 @@ __all__ = [
     "plot_theta2",
 ]
 
-from osa.webserver.utils import directory_in_webserver
+from osa.webserver.utils import datacheck_batch, publish
 
 log = myLogger(logging.getLogger(__name__))
 
@@ -215,11 +214,11 @@ def main(
     options.directory = analysis_path(options.tel_id)
     dl2_directory = Path(cfg.get("LST1", "DL2_DIR"))
     highlevel_directory = destination_dir("HIGH_LEVEL", create_dir=True)
-    host = cfg.get("WEBSERVER", "HOST")
     cuts = toml.load(SELECTION_CUTS_FILE)
 
     sources = get_source_list(date)
     log.info(f"Sources: {sources}")
+    pdf_files = []
 
     for source in sources:
         df = pd.DataFrame()
@@ -273,17 +272,16 @@ def main(
                 highlevel_dir=highlevel_directory,
                 cuts=cuts,
             )
-            if not simulate:
-                dest_directory = directory_in_webserver(
-                    host=host, datacheck_type="HIGH_LEVEL", date=flat_date, prod_id=options.prod_id
-                )
-                cmd = ["scp", pdf_file, f"{host}:{dest_directory}/."]
-                subprocess.run(cmd, capture_output=True, check=True)
+            pdf_files.append(pdf_file)
 
         except astropy.coordinates.name_resolve.NameResolveError:
             log.warning(f"Source {source} not found in the catalog. Skipping.")
             # TODO: get ra/dec from the TCU database instead
 
+    # The plots of all the sources are published to the webserver at once
+    if pdf_files:
+        publish(datacheck_batch(pdf_files, "HIGH_LEVEL", flat_date, options.prod_id))
+
 
 if __name__ == "__main__":
     main()
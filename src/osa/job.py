@@ -24,6 +24,7 @@ from osa.paths import (
     get_dl1_prod_id_and_config,
 )
 from osa.utils.iofile import write_to_file
+from osa.utils.jit_cache import numba_cache_base
 from osa.utils.logging import myLogger
 from osa.processing_plan import build_processing_plan
 from osa.utils.utils import (
@@ -45,7 +46,11 @@ __all__ = [
     "plot_job_statistics",
     "scheduler_env_variables",
     "set_cache_dirs",
+    "numba_cache_dir_setup",
+    "fused_dl1_for_source",
+    "fused_dl1_stages",
     "submit_jobs",
+    "submit_sequence_job",
     "check_history_level",
     "get_sacct_output",
     "get_squeue_output",
@@ -342,9 +347,13 @@ def scheduler_env_variables(sequence, scheduler="slurm"):
         log.warning("No other schedulers are currently supported")
         return None
 
+    # Limits sized from the accounting of the past jobs, if any (see osa.resources)
+    resources = sequence.resources
+    walltime = resources.time if resources else cfg.get("SLURM", "WALLTIME")
+
     sbatch_parameters = [
         f"--job-name={sequence.jobname}",
-        f"--time={cfg.get('SLURM', 'WALLTIME')}",
+        f"--time={walltime}",
         f"--chdir={options.directory}",
         f"--output=log/Run{sequence.run:05d}.%4a_jobid_%A.out",
         f"--error=log/Run{sequence.run:05d}.%4a_jobid_%A.err",
@@ -359,7 +368,10 @@ def scheduler_env_variables(sequence, scheduler="slurm"):
         sbatch_parameters.append(f"--array=0-{subruns}")
 
     sbatch_parameters.append(f"--partition={cfg.get('SLURM', f'PARTITION_{sequence.type}')}")
-    sbatch_parameters.append(f"--mem-per-cpu={cfg.get('SLURM', f'MEMSIZE_{sequence.type}')}")
+    if resources:
+        sbatch_parameters.append(f"--mem={resources.mem_gb}GB")
+    else:
+        sbatch_parameters.append(f"--mem-per-cpu={cfg.get('SLURM', f'MEMSIZE_{sequence.type}')}")
     sbatch_parameters.append(f"--account={cfg.get('SLURM', 'ACCOUNT')}")
 
     return ["#SBATCH " + line for line in sbatch_parameters]
@@ -414,6 +426,66 @@ def set_cache_dirs():
     return "\n".join(content)
 
 
+def numba_cache_dir_setup(persistent: bool = True):
+    """
+    Set the numba cache directory of a job.
+
+    The jobs share the persistent numba cache of the CPU architecture of
+    the node they run on if NUMBA_CACHE_DIR is configured. Otherwise, each
+    job compiles the numba kernels in a temporary directory.
+
+    Parameters
+    ----------
+    persistent: bool
+        Whether the job can use the persistent cache.
+
+    Returns
+    -------
+    content: str
+        Lines of the job setting NUMBA_CACHE_DIR.
+    indent: str
+        Indentation of the lines of the job that follow.
+    """
+    cache_base = numba_cache_base() if persistent else None
+
+    if cache_base is None:
+        content = "with tempfile.TemporaryDirectory() as tmpdirname:\n"
+        content += TAB + "os.environ['NUMBA_CACHE_DIR'] = tmpdirname\n"
+        return content, TAB
+
+    content = (
+        f"os.environ['NUMBA_CACHE_DIR'] = os.path.join('{cache_base}', os.uname().machine)\n"
+    )
+    return content, ""
+
+
+def fused_dl1_for_source(source_name: str) -> bool:
+    """
+    Whether the DL1 steps of the sequences of a source run in the process of their job.
+
+    The sources listed in the fused_dl1_sources option of the [lstchain] section
+    are fused, the others only if the fused_dl1_stages option is enabled.
+    """
+    sources = cfg.get("lstchain", "fused_dl1_sources", fallback="") or ""
+    if source_name is not None and source_name in {
+        source.strip() for source in sources.split(",") if source.strip()
+    }:
+        return True
+    return cfg.getboolean("lstchain", "fused_dl1_stages", fallback=False)
+
+
+def fused_dl1_stages(sequence) -> bool:
+    """
+    Whether the DL1 steps of a sequence run in the process of its job.
+
+    The `fused_dl1` attribute of the sequence, set when the sequences are built,
+    takes precedence. Otherwise it is decided from its source as in `fused_dl1_for_source`.
+    """
+    if sequence.fused_dl1 is not None:
+        return sequence.fused_dl1
+    return fused_dl1_for_source(sequence.source_name)
+
+
 def data_sequence_job_template(sequence):
     """
     This file contains instruction to be submitted to job scheduler.
@@ -446,6 +518,8 @@ def data_sequence_job_template(sequence):
         commandargs.extend(("--config", f"{Path(options.configfile).resolve()}"))
     if sequence.type == "DATA" and options.no_dl1ab:
         commandargs.append("--no-dl1ab")
+    if sequence.type == "DATA" and not options.no_dl1ab and fused_dl1_stages(sequence):
+        commandargs.append("--fused-dl1")
 
     commandargs.extend(
         (
@@ -487,22 +561,22 @@ def data_sequence_job_template(sequence):
 
     content += "\n"
 
-    content += "with tempfile.TemporaryDirectory() as tmpdirname:\n"
-    content += TAB + "os.environ['NUMBA_CACHE_DIR'] = tmpdirname\n"
+    numba_cache, indent = numba_cache_dir_setup()
+    content += numba_cache
 
-    content += TAB + "proc = subprocess.run([\n"
+    content += indent + "proc = subprocess.run([\n"
 
     for arg in commandargs:
-        content += TAB * 2 + f"'{arg}',\n"
+        content += indent + TAB + f"'{arg}',\n"
 
     if pedestal_ids_file_exists(sequence.run):
         pedestal_ids_file = get_pedestal_ids_file(sequence.run, flat_date)
-        content += TAB * 2 + f"f'--pedestal-ids-file={pedestal_ids_file}',\n"
+        content += indent + TAB + f"f'--pedestal-ids-file={pedestal_ids_file}',\n"
 
-    content += TAB * 2 + f"f'{sequence.run:05d}.{{subruns:04d}}',\n"
+    content += indent + TAB + f"f'{sequence.run:05d}.{{subruns:04d}}',\n"
 
-    content += TAB * 2 + f"'{options.tel_id}'\n"
-    content += TAB + "])\n"
+    content += indent + TAB + f"'{options.tel_id}'\n"
+    content += indent + "])\n"
     content += "\n"
     content += "sys.exit(proc.returncode)"
 
@@ -560,16 +634,19 @@ def calibration_sequence_job_template(sequence):
 
     content += "\n"
 
-    content += "with tempfile.TemporaryDirectory() as tmpdirname:\n"
-    content += TAB + "os.environ['NUMBA_CACHE_DIR'] = tmpdirname\n"
+    # The kernels compiled in the lstcam-env environment are not shared with the other jobs
+    numba_cache, indent = numba_cache_dir_setup(
+        persistent=not cfg.getboolean("lstchain", "use_lstcam_env_for_CatA_calib")
+    )
+    content += numba_cache
 
-    content += TAB + "proc = subprocess.run([\n"
+    content += indent + "proc = subprocess.run([\n"
 
     for arg in commandargs:
-        content += TAB * 2 + f"'{arg}',\n"
+        content += indent + TAB + f"'{arg}',\n"
 
-    content += TAB * 2 + f"'{options.tel_id}'\n"
-    content += TAB + "])\n"
+    content += indent + TAB + f"'{options.tel_id}'\n"
+    content += indent + "])\n"
     content += "\n"
     content += "sys.exit(proc.returncode)"
 
@@ -678,6 +755,47 @@ def submit_jobs(sequence_list, batch_command="sbatch"):
     return job_list
 
 
+def submit_sequence_job(
+    sequence, subrun: int = None, dependency: str = None, batch_command="sbatch"
+):
+    """
+    Submit the job of a single sequence, optionally restricted to one of its subruns.
+
+    Parameters
+    ----------
+    sequence
+        Sequence whose job script is submitted.
+    subrun: int, optional
+        Subrun processed, overriding the job array of the script.
+    dependency: str, optional
+        Job ID that has to finish successfully before the job starts.
+    batch_command: str
+        The batch command to submit the job (Default: sbatch)
+
+    Returns
+    -------
+    job_id: str
+        ID of the submitted job, None if it was not submitted.
+    """
+    commandargs = [batch_command, "--parsable", "--export=ALL,MPLBACKEND=Agg"]
+    if subrun is not None:
+        commandargs.append(f"--array={subrun}")
+    if dependency is not None:
+        commandargs.append(f"--dependency=afterok:{dependency}")
+    commandargs.append(str(sequence.script))
+    log.debug(stringify(commandargs))
+
+    if options.simulate or options.test:
+        log.debug("SIMULATE Launching scripts")
+        return None
+
+    try:
+        return sp.check_output(commandargs, universal_newlines=True, shell=False).split()[0]
+    except sp.CalledProcessError as error:
+        log.exception(error)
+        return None
+
+
 def run_squeue() -> StringIO:
     """Run squeue command to get the status of the jobs."""
     if shutil.which("squeue") is None:
@@ -718,8 +836,13 @@ def get_squeue_output(squeue_output: StringIO) -> pd.DataFrame:
     return df
 
 
-def run_sacct(job_id: str = None) -> StringIO:
-    """Run sacct to obtain the job information."""
+def run_sacct(job_id: str = None, starttime: datetime.date = None) -> StringIO:
+    """
+    Run sacct to obtain the job information.
+
+    The jobs are fetched from `starttime` if given, otherwise from
+    STARTTIME_DAYS_SACCT days ago, or by default since midnight.
+    """
     if shutil.which("sacct") is None:
         log.warning("No job info available since sacct command is not available")
         return StringIO()
@@ -738,7 +861,9 @@ def run_sacct(job_id: str = None) -> StringIO:
         sacct_cmd.append("--jobs")
         sacct_cmd.append(job_id)
 
-    if cfg.get("SLURM", "STARTTIME_DAYS_SACCT"):
+    if starttime is not None:
+        sacct_cmd.extend(["--starttime", starttime.strftime("%Y-%m-%d")])
+    elif cfg.get("SLURM", "STARTTIME_DAYS_SACCT"):
         days = int(cfg.get("SLURM", "STARTTIME_DAYS_SACCT"))
         start_date = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
         sacct_cmd.extend(["--starttime", start_date])
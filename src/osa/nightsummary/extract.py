@@ -5,11 +5,10 @@ import itertools
 import logging
 import sys
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 from typing import List
 
-import numpy as np
 from astropy.table import Table
 
 from osa.configs import options
@@ -19,10 +18,16 @@ from osa.configs.datamodel import (
     SequenceCalibration,
     SequenceData,
 )
-from osa.job import sequence_filenames
+from osa.job import fused_dl1_for_source, sequence_filenames
 from osa.nightsummary import database
 from osa.nightsummary.nightsummary import run_summary_table
-from osa.paths import sequence_calibration_files, get_run_date, get_dl1_prod_id_and_config, get_dl2_prod_id
+from osa.nightsummary.summary_store import (
+    data_runs,
+    latest_run,
+    open_summary_store,
+    run_info as summary_run_info,
+)
+from osa.paths import sequence_calibration_files, get_dl1_prod_id_and_config, get_dl2_prod_id
 from osa.utils.logging import myLogger
 from osa.utils.utils import date_to_iso, date_to_dir, get_RF_model
 
@@ -38,44 +43,30 @@ __all__ = [
 
 def get_data_runs(date: datetime):
     """Return the list of DATA runs to analyze based on the run summary table."""
-    summary = run_summary_table(date)
-    return summary[summary["run_type"] == "DATA"]["run_id"].tolist()
+    with open_summary_store() as store:
+        return data_runs(store, date)
+
+
+def _get_last_run(run_type: str, date: datetime) -> int:
+    """Return the run_id of the last run of a given type taken at or before the given date."""
+    with open_summary_store() as store:
+        last_run = latest_run(store, run_type, date)
+
+    if last_run is None:
+        log.warning(f"No {run_type} run found. Nothing to do. Exiting.")
+        sys.exit(0)
+
+    return last_run[0]
 
 
 def get_last_drs4(date: datetime) -> int:
     """Return run_id of the last DRS4 run for the given date to be used for data processing."""
-    summary = run_summary_table(date)
-    n_max = 4
-    n = 1
-    while (np.array(summary["run_type"] == "DRS4")).any() == False & n <= n_max:
-        date = date - timedelta(days=1)
-        summary = run_summary_table(date)
-        n += 1
-
-    try:
-        return summary[summary["run_type"] == "DRS4"]["run_id"].max()
-
-    except ValueError:
-        log.warning("No DRS4 run found. Nothing to do. Exiting.")
-        sys.exit(0)
+    return _get_last_run("DRS4", date)
 
 
 def get_last_pedcalib(date) -> int:
     """Return run_id of the last PEDCALIB run for the given date to be used for data processing."""
-    summary = run_summary_table(date)
-    n_max = 4
-    n = 1
-    while (np.array(summary["run_type"] == "PEDCALIB")).any() == False & n <= n_max:
-        date = date - timedelta(days=1)
-        summary = run_summary_table(date)
-        n += 1
-
-    try:
-        return summary[summary["run_type"] == "PEDCALIB"]["run_id"].max()
-
-    except ValueError:
-        log.warning("No PEDCALIB run found. Nothing to do. Exiting.")
-        sys.exit(0)
+    return _get_last_run("PEDCALIB", date)
 
 
 def extract_runs(summary_table):
@@ -95,35 +86,22 @@ def extract_runs(summary_table):
         required_drs4_run = get_last_drs4(options.date)
         required_pedcal_run = get_last_pedcalib(options.date)
 
-        if required_drs4_run not in summary_table["run_id"]:
-            drs4_date = get_run_date(required_drs4_run)
-            drs4_date_summary = run_summary_table(drs4_date)
-            run_info = drs4_date_summary.loc[required_drs4_run]
-
-            run = RunObj(
-                run=required_drs4_run,
-                run_str=f"{required_drs4_run:05d}",
-                type=run_info["run_type"],
-                night=date_to_iso(drs4_date),
-                subruns=run_info["n_subruns"],
-            )
-
-            run_list.append(run)
+        with open_summary_store() as store:
+            for required_run in (required_drs4_run, required_pedcal_run):
+                if required_run in summary_table["run_id"]:
+                    continue
 
-        if required_pedcal_run not in summary_table["run_id"]:
-            pedcal_date = get_run_date(required_pedcal_run)
-            pedcal_date_summary = run_summary_table(pedcal_date)
-            run_info = pedcal_date_summary.loc[required_pedcal_run]
+                run_info = summary_run_info(store, required_run)
 
-            run = RunObj(
-                run=required_pedcal_run,
-                run_str=f"{required_pedcal_run:05d}",
-                type=run_info["run_type"],
-                night=date_to_iso(pedcal_date),
-                subruns=run_info["n_subruns"],
-            )
+                run = RunObj(
+                    run=required_run,
+                    run_str=f"{required_run:05d}",
+                    type=run_info["run_type"],
+                    night=date_to_iso(run_info["night"]),
+                    subruns=run_info["n_subruns"],
+                )
 
-            run_list.append(run)
+                run_list.append(run)
 
     # Get information run-wise going through each row
     for run_id in summary_table["run_id"]:
@@ -288,6 +266,7 @@ def extract_sequences(date: datetime, run_obj_list: List[RunObj]) -> List:
                 )
                 sequence.dl1_prod_id = dl1_prod_id
                 sequence.dl1b_config = dl1b_config
+                sequence.fused_dl1 = fused_dl1_for_source(sequence.source_name)
 
             if (
                 not options.no_dl2
@@ -16,13 +16,15 @@ __all__ = ["produce_run_summary_file", "get_run_summary_file", "run_summary_tabl
 log = myLogger(logging.getLogger(__name__))
 
 
-def produce_run_summary_file(date) -> None:
+def produce_run_summary_file(date, overwrite: bool = False) -> None:
     """
     Produce the run summary using the lstchain script.
 
     Parameters
     ----------
     date : datetime.datetime
+    overwrite : bool
+        Produce it again if it already exists, e.g. with the runs taken since.
     """
     nightdir = date_to_dir(date)
     r0_dir = Path(cfg.get("LST1", "R0_DIR"))
@@ -34,6 +36,8 @@ def produce_run_summary_file(date) -> None:
         f"--r0-path={r0_dir}",
         f"--output-dir={run_summary_dir}",
     ]
+    if overwrite:
+        command.append("--overwrite")
 
     try:
         subprocess.run(command, check=True)
@@ -2,48 +2,84 @@
 
 import logging
 from pathlib import Path
+from typing import Tuple
 
 import click
 import numpy as np
-from astropy.coordinates import SkyCoord, name_resolve
 from astropy.table import Table
 
+from osa.nightsummary.source_resolver import resolve_sources
 from osa.utils.logging import myLogger
 
 log = myLogger(logging.getLogger(__name__))
 
 
+def update_coordinates(table: Table, coordinates: dict) -> int:
+    """
+    Set the coordinates of the runs of a RunCatalog table whose source is resolved.
+
+    Each unique source name is looked up once and the coordinates are
+    assigned to all the runs at once. The runs of unresolved sources keep
+    their coordinates.
+
+    Returns
+    -------
+    int
+        Number of runs whose coordinates were set.
+    """
+    names, inverse = np.unique(np.asarray(table["source_name"], dtype=str), return_inverse=True)
+    resolved = np.array([name in coordinates for name in names], dtype=bool)
+    ra = np.array([coordinates.get(name, (np.nan, np.nan))[0] for name in names], dtype=float)
+    dec = np.array([coordinates.get(name, (np.nan, np.nan))[1] for name in names], dtype=float)
+
+    mask = resolved[inverse]
+    table["source_ra"] = np.where(mask, ra[inverse], np.asarray(table["source_ra"], dtype=float))
+    table["source_dec"] = np.where(
+        mask, dec[inverse], np.asarray(table["source_dec"], dtype=float)
+    )
+    return int(mask.sum())
+
+
 @click.command()
-@click.argument("file", type=click.Path(exists=True))
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True))
 @click.option("--source", type=str)
 @click.option("--ra", type=float, help="Right Ascension in degrees")
 @click.option("--dec", type=float, help="Declination in degrees")
-def main(file: Path = None, source: str = None, ra: float = np.nan, dec: float = np.nan):
-    """Update the source coordinates in the RunCatalog ECSV files."""
+@click.option(
+    "--offline", is_flag=True, help="Do not resolve online the sources not found locally"
+)
+def main(
+    files: Tuple[Path] = (),
+    source: str = None,
+    ra: float = np.nan,
+    dec: float = np.nan,
+    offline: bool = False,
+):
+    """
+    Update the source coordinates in the RunCatalog ECSV files.
+
+    Several RunCatalog files can be given; each source is resolved only once
+    for all of them.
+    """
     log.setLevel(logging.INFO)
 
-    table = Table.read(file)
-    table.add_index("run_id")
-
-    for run in table:
-        source_name = run["source_name"]
-        try:
-            coords = SkyCoord.from_name(source_name)
-            run["source_ra"] = coords.ra.deg
-            run["source_dec"] = coords.dec.deg
-
-        except name_resolve.NameResolveError:
-            if source is None:
-                log.warning(
-                    f"Could not resolve coordinates for {source_name}. "
-                    "Add coordinates through the command line."
-                )
-            if source_name == source:
-                run["source_ra"] = ra
-                run["source_dec"] = dec
-
-    log.info(f"Updated coordinates in {file}")
-    table.write(file, format="ascii.ecsv", overwrite=True, delimiter=",")
+    tables = {file: Table.read(file) for file in files}
+    names = {str(name) for table in tables.values() for name in table["source_name"]}
+    coordinates = resolve_sources(names, online=not offline)
+
+    for name in sorted(names - coordinates.keys()):
+        if name == source:
+            coordinates[name] = (ra, dec)
+        elif source is None:
+            log.warning(
+                f"Could not resolve coordinates for {name}. "
+                "Add coordinates through the command line."
+            )
+
+    for file, table in tables.items():
+        n_runs = update_coordinates(table, coordinates)
+        table.write(file, format="ascii.ecsv", overwrite=True, delimiter=",")
+        log.info(f"Updated coordinates of {n_runs} runs in {file}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+"""
+Resolve the coordinates of the sources of the RunCatalog.
+
+A source name is looked up, in this order, in a curated table of sources
+with their aliases (SOURCE_ALIASES), in a persistent cache of the names
+already resolved online (SOURCE_COORDINATES_CACHE) and only then online with
+`astropy.coordinates.SkyCoord.from_name`. Names are compared ignoring case,
+spaces and underscores, so that e.g. "Mrk 421", "mrk421" and "Mrk_421"
+are the same source.
+"""
+
+import logging
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable
+
+from astropy.coordinates import SkyCoord, name_resolve
+from astropy.table import Table
+
+from osa.configs.config import cfg
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "normalize_source_name",
+    "load_source_table",
+    "open_coordinate_cache",
+    "resolve_source",
+    "resolve_sources",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+# Separator of the aliases of a source in the curated source table
+ALIAS_SEPARATOR = "|"
+
+
+def normalize_source_name(name: str) -> str:
+    """Key of a source name, ignoring case, spaces and underscores."""
+    return "".join(str(name).replace("_", " ").split()).casefold()
+
+
+def load_source_table(path: Path = None) -> dict:
+    """
+    Read the curated table of sources.
+
+    It is an ECSV file with the columns source_name, ra, dec (in degrees)
+    and aliases, the latter being the other names of the source separated
+    by "|".
+
+    Returns
+    -------
+    dict
+        (ra, dec) of each normalized source name and alias. Empty if the
+        table does not exist.
+    """
+    path = Path(cfg.get("LST1", "SOURCE_ALIASES")) if path is None else Path(path)
+
+    if not path.exists():
+        log.debug(f"No curated source table {path}")
+        return {}
+
+    table = Table.read(path, format="ascii.ecsv")
+    sources = {}
+    for row in table:
+        coordinates = (float(row["ra"]), float(row["dec"]))
+        names = [row["source_name"]]
+        if "aliases" in table.colnames and row["aliases"]:
+            names.extend(str(row["aliases"]).split(ALIAS_SEPARATOR))
+        for name in names:
+            if name.strip():
+                sources[normalize_source_name(name)] = coordinates
+    return sources
+
+
+@contextmanager
+def open_coordinate_cache(path: Path = None):
+    """Open the cache of the coordinates resolved online, creating it if needed."""
+    path = Path(cfg.get("LST1", "SOURCE_COORDINATES_CACHE")) if path is None else Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+
+    try:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS coordinates "
+            "(name TEXT PRIMARY KEY, source_name TEXT, ra REAL, dec REAL, resolved TEXT)"
+        )
+        yield connection
+    finally:
+        connection.commit()
+        connection.close()
+
+
+def resolve_source(name: str, sources: dict, connection, online: bool = True):
+    """
+    Resolve the coordinates of a source.
+
+    Parameters
+    ----------
+    name: str
+        Name of the source.
+    sources: dict
+        Curated source table, as returned by `load_source_table`.
+    connection: sqlite3.Connection
+        Connection to the coordinate cache.
+    online: bool
+        Whether the names neither in the source table nor in the cache
+        are resolved online.
+
+    Returns
+    -------
+    tuple or None
+        (ra, dec) in degrees, None if the source could not be resolved.
+    """
+    key = normalize_source_name(name)
+
+    if key in sources:
+        return sources[key]
+
+    cached = connection.execute("SELECT ra, dec FROM coordinates WHERE name = ?", (key,)).fetchone()
+    if cached is not None:
+        return cached
+
+    if not online:
+        return None
+
+    try:
+        coords = SkyCoord.from_name(name)
+    except name_resolve.NameResolveError:
+        return None
+
+    coordinates = (coords.ra.deg, coords.dec.deg)
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO coordinates VALUES (?, ?, ?, ?, ?)",
+            (key, name, *coordinates, datetime.now().isoformat(timespec="seconds")),
+        )
+    log.debug(f"Coordinates of {name} resolved online and cached")
+    return coordinates
+
+
+def resolve_sources(
+    names: Iterable[str],
+    online: bool = True,
+    source_table: Path = None,
+    cache: Path = None,
+) -> dict:
+    """
+    Resolve the coordinates of a list of sources, each of them only once.
+
+    Parameters
+    ----------
+    names: iterable of str
+        Source names, possibly repeated.
+    online: bool
+        Whether the names neither in the source table nor in the cache
+        are resolved online.
+    source_table: pathlib.Path, optional
+        Curated source table. By default, SOURCE_ALIASES.
+    cache: pathlib.Path, optional
+        Coordinate cache. By default, SOURCE_COORDINATES_CACHE.
+
+    Returns
+    -------
+    dict
+        (ra, dec) of each resolved name. Unresolved names are left out.
+    """
+    sources = load_source_table(source_table)
+    resolved_keys = {}
+    resolved = {}
+
+    with open_coordinate_cache(cache) as connection:
+        for name in dict.fromkeys(str(name) for name in names):
+            key = normalize_source_name(name)
+            if key not in resolved_keys:
+                resolved_keys[key] = resolve_source(name, sources, connection, online)
+            if resolved_keys[key] is not None:
+                resolved[name] = resolved_keys[key]
+
+    return resolved
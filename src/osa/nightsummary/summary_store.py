@@ -0,0 +1,205 @@
+"""
+Multi-night store of the run summaries.
+
+Each RunSummary_YYYYMMDD.ecsv file is ingested once into an sqlite database
+(RUN_SUMMARY_STORE), and again only if its modification time or size
+changed. The store answers the queries needed to build the sequences of a
+night (its DATA runs, the latest DRS4 or PEDCALIB run at or before it,
+the night and number of subruns of a run) with indexed queries, instead
+of parsing the ECSV files of the night and of the previous ones every time.
+"""
+
+import csv
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from osa.configs.config import cfg
+from osa.nightsummary.nightsummary import get_run_summary_file
+from osa.utils.logging import myLogger
+from osa.utils.utils import date_to_dir
+
+__all__ = [
+    "LOOKBACK_NIGHTS",
+    "open_summary_store",
+    "read_run_summary_rows",
+    "ingest_night",
+    "latest_run",
+    "data_runs",
+    "run_info",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+# Number of previous nights in which the calibration runs of a night are looked for
+LOOKBACK_NIGHTS = 4
+
+
+@contextmanager
+def open_summary_store(path: Path = None):
+    """Open the run summary store as a context manager, creating it if needed."""
+    path = Path(cfg.get("LST1", "RUN_SUMMARY_STORE")) if path is None else Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+
+    try:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS summary_files "
+            "(night TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS runs "
+            "(night TEXT, row INTEGER, run_id INTEGER, n_subruns INTEGER, run_type TEXT, "
+            "run_start INTEGER, PRIMARY KEY (night, run_id))"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS runs_type_night ON runs (run_type, night, run_id)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS runs_run_id ON runs (run_id)")
+        yield connection
+    finally:
+        connection.commit()
+        connection.close()
+
+
+def read_run_summary_rows(summary_file: Path) -> list:
+    """
+    Read the run_id, n_subruns, run_type and run_start of the runs of a run summary ECSV file.
+
+    The file is parsed as CSV, using the delimiter declared in its ECSV header,
+    which is much faster than building an astropy Table.
+    """
+    delimiter = " "
+    with open(summary_file, newline="") as file:
+        for line in file:
+            if not line.startswith("#"):
+                break
+            if line.startswith("# delimiter:"):
+                delimiter = line.split(":", 1)[1].strip().strip("'\"") or " "
+        else:
+            return []
+
+        header = next(csv.reader([line], delimiter=delimiter))
+        rows = []
+        for values in csv.reader(file, delimiter=delimiter):
+            if not values:
+                continue
+            row = dict(zip(header, values))
+            rows.append(
+                (
+                    int(row["run_id"]),
+                    int(row["n_subruns"]),
+                    row["run_type"],
+                    int(row["run_start"]) if row.get("run_start") else None,
+                )
+            )
+    return rows
+
+
+def ingest_night(connection, date: datetime) -> bool:
+    """
+    Ingest the run summary of a night if it changed since it was last ingested.
+
+    Returns
+    -------
+    bool
+        True if the run summary of the night exists.
+    """
+    night = date_to_dir(date)
+    summary_file = get_run_summary_file(date)
+
+    try:
+        stat = os.stat(summary_file)
+    except FileNotFoundError:
+        return False
+
+    ingested = connection.execute(
+        "SELECT mtime_ns, size FROM summary_files WHERE night = ?", (night,)
+    ).fetchone()
+    if ingested == (stat.st_mtime_ns, stat.st_size):
+        return True
+
+    log.debug(f"Ingesting {summary_file}")
+    rows = read_run_summary_rows(summary_file)
+    with connection:
+        connection.execute("DELETE FROM runs WHERE night = ?", (night,))
+        connection.executemany(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+            [(night, i, *row) for i, row in enumerate(rows)],
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO summary_files VALUES (?, ?, ?)",
+            (night, stat.st_mtime_ns, stat.st_size),
+        )
+    return True
+
+
+def latest_run(connection, run_type: str, date: datetime, lookback: int = LOOKBACK_NIGHTS):
+    """
+    Return the latest run of a given type taken at or before a night.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        Connection to the run summary store.
+    run_type: str
+        Type of run (DRS4, PEDCALIB...).
+    date: datetime.datetime
+        Night of the runs to analyze.
+    lookback: int
+        Number of previous nights in which the run is also looked for.
+
+    Returns
+    -------
+    tuple or None
+        (run_id, night as datetime) of the highest run of the most recent night
+        with a run of the given type, None if there is none.
+    """
+    nights = [date - timedelta(days=n) for n in range(lookback + 1)]
+    for night in nights:
+        ingest_night(connection, night)
+
+    row = connection.execute(
+        "SELECT run_id, night FROM runs WHERE run_type = ? AND night BETWEEN ? AND ? "
+        "ORDER BY night DESC, run_id DESC LIMIT 1",
+        (run_type, date_to_dir(nights[-1]), date_to_dir(date)),
+    ).fetchone()
+
+    if row is None:
+        return None
+    return row[0], datetime.strptime(row[1], "%Y%m%d")
+
+
+def data_runs(connection, date: datetime) -> list:
+    """Return the DATA runs of a night in the order of its run summary."""
+    ingest_night(connection, date)
+    return [
+        run_id
+        for (run_id,) in connection.execute(
+            "SELECT run_id FROM runs WHERE night = ? AND run_type = 'DATA' ORDER BY row",
+            (date_to_dir(date),),
+        )
+    ]
+
+
+def run_info(connection, run_id: int):
+    """
+    Return the night (as datetime), run type and number of subruns of an ingested run,
+    None if the run is not in the store.
+    """
+    row = connection.execute(
+        "SELECT night, run_type, n_subruns FROM runs WHERE run_id = ? ORDER BY night DESC",
+        (int(run_id),),
+    ).fetchone()
+
+    if row is None:
+        return None
+    night, run_type, n_subruns = row
+    return {
+        "night": datetime.strptime(night, "%Y%m%d"),
+        "run_type": run_type,
+        "n_subruns": n_subruns,
+    }
@@ -28,3 +28,61 @@ def test_source_coordinates(run_catalog):
     assert np.isclose(table[table["source_name"] == "Crab"]["source_dec"], crab_coords.dec.deg)
     assert np.isclose(table[table["source_name"] == "MadeUpSource"]["source_ra"], 31.22)
     assert np.isclose(table[table["source_name"] == "MadeUpSource"]["source_dec"], 52.95)
+
+
+def write_source_table(path):
+    table = Table(
+        rows=[("Crab", 83.633, 22.014, "Crab Nebula|M1"), ("Mrk 421", 166.114, 38.209, "")],
+        names=["source_name", "ra", "dec", "aliases"],
+    )
+    table.write(path, format="ascii.ecsv", delimiter=",")
+    return path
+
+
+def test_resolve_sources(tmp_path, monkeypatch):
+    from astropy.coordinates import name_resolve
+
+    from osa.nightsummary import source_resolver
+
+    source_table = write_source_table(tmp_path / "source_aliases.ecsv")
+    cache = tmp_path / "source_coordinates.db"
+    queries = []
+
+    def from_name(name):
+        queries.append(name)
+        if name == "MadeUpSource":
+            raise name_resolve.NameResolveError(name)
+        return SkyCoord(ra=10.5, dec=-20.25, unit="deg")
+
+    monkeypatch.setattr(source_resolver.SkyCoord, "from_name", from_name)
+
+    names = ["crab", "M1", "Mrk_421", "1ES 1959+650", "1es1959+650", "MadeUpSource", "crab"]
+    resolved = source_resolver.resolve_sources(names, source_table=source_table, cache=cache)
+    assert resolved == {
+        "crab": (83.633, 22.014),
+        "M1": (83.633, 22.014),
+        "Mrk_421": (166.114, 38.209),
+        "1ES 1959+650": (10.5, -20.25),
+        "1es1959+650": (10.5, -20.25),
+    }
+    # Only the sources not in the curated table are looked up online, once
+    assert queries == ["1ES 1959+650", "MadeUpSource"]
+
+    # Cached sources are not looked up online anymore, even offline
+    resolved = source_resolver.resolve_sources(
+        ["1ES_1959+650", "MadeUpSource"], online=False, source_table=source_table, cache=cache
+    )
+    assert resolved == {"1ES_1959+650": (10.5, -20.25)}
+    assert len(queries) == 2
+
+
+def test_update_coordinates():
+    from osa.nightsummary.set_source_coordinates import update_coordinates
+
+    table = Table(
+        rows=[(1, "Crab", 0.0, 0.0), (2, "Unknown", 1.0, 2.0), (3, "Crab", 0.0, 0.0)],
+        names=["run_id", "source_name", "source_ra", "source_dec"],
+    )
+    assert update_coordinates(table, {"Crab": (83.633, 22.014)}) == 2
+    np.testing.assert_allclose(table["source_ra"], [83.633, 1.0, 83.633])
+    np.testing.assert_allclose(table["source_dec"], [22.014, 2.0, 22.014])
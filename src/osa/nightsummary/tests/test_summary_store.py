@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+
+import pytest
+from astropy.table import Table
+
+from osa.configs.config import cfg
+
+
+@pytest.fixture
+def summary_dir(tmp_path):
+    previous = cfg.get("LST1", "RUN_SUMMARY_DIR")
+    cfg.set("LST1", "RUN_SUMMARY_DIR", str(tmp_path))
+    yield tmp_path
+    cfg.set("LST1", "RUN_SUMMARY_DIR", previous)
+
+
+def write_summary(summary_dir, night, runs, delimiter=","):
+    table = Table(
+        rows=[(run_id, n_subruns, run_type, 1663951379000000000) for run_id, n_subruns, run_type in runs],
+        names=["run_id", "n_subruns", "run_type", "run_start"],
+    )
+    summary_file = summary_dir / f"RunSummary_{night}.ecsv"
+    table.write(summary_file, format="ascii.ecsv", delimiter=delimiter, overwrite=True)
+    return summary_file
+
+
+def test_read_run_summary_rows(summary_dir):
+    from osa.nightsummary.summary_store import read_run_summary_rows
+
+    runs = [(9379, 21, "DATA"), (9380, 44, "DRS4")]
+    for delimiter in (",", " "):
+        summary_file = write_summary(summary_dir, "20220923", runs, delimiter)
+        rows = read_run_summary_rows(summary_file)
+        assert rows == [run + (1663951379000000000,) for run in runs]
+
+
+def test_summary_store(summary_dir, tmp_path):
+    from osa.nightsummary.summary_store import (
+        data_runs,
+        latest_run,
+        open_summary_store,
+        run_info,
+    )
+
+    write_summary(summary_dir, "20220920", [(9200, 10, "DRS4"), (9201, 10, "PEDCALIB")])
+    write_summary(summary_dir, "20220922", [(9257, 10, "DRS4"), (9258, 12, "PEDCALIB")])
+    summary_file = write_summary(summary_dir, "20220923", [(9381, 21, "DATA"), (9379, 5, "DATA"), (9380, 44, "DRS4")])
+
+    date = datetime(2022, 9, 23)
+    with open_summary_store(tmp_path / "store.db") as store:
+        assert data_runs(store, date) == [9381, 9379]
+        assert latest_run(store, "DRS4", date) == (9380, date)
+        assert latest_run(store, "PEDCALIB", date) == (9258, datetime(2022, 9, 22))
+        assert latest_run(store, "PEDCALIB", date, lookback=0) is None
+        assert run_info(store, 9258) == {
+            "night": datetime(2022, 9, 22),
+            "run_type": "PEDCALIB",
+            "n_subruns": 12,
+        }
+        assert run_info(store, 1) is None
+
+        # A run summary rewritten is ingested again
+        write_summary(summary_dir, "20220923", [(9382, 3, "PEDCALIB")])
+        stat = os.stat(summary_file)
+        os.utime(summary_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert data_runs(store, date) == []
+        assert latest_run(store, "PEDCALIB", date) == (9382, date)
@@ -1,11 +1,15 @@
 """Handle the paths of the analysis products."""
 
 import logging
+import os
 import re
+import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from fnmatch import fnmatchcase
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 import subprocess
 import time
 import json
@@ -16,6 +20,7 @@ from lstchain.onsite import (find_systematics_correction_file,
 from osa.configs import options
 from osa.configs.config import DEFAULT_CFG, cfg
 from osa.configs.datamodel import Sequence
+from osa.configs.settings import get_settings
 from osa.utils import utils
 from osa.utils.logging import myLogger
 
@@ -40,18 +45,44 @@ __all__ = [
     "DEFAULT_CFG",
     "create_source_directories",
     "analysis_path",
+    "reconcile_symlinks",
+    "wait_for_jobs",
+    "create_datacheck_symlinks",
+    "submit_runwise_datacheck_symlinks",
+    "create_longterm_symlink",
 ]
 
+# Final states of the SLURM jobs
+SLURM_FINISHED_STATES = {
+    "COMPLETED",
+    "FAILED",
+    "CANCELLED",
+    "TIMEOUT",
+    "OUT_OF_MEMORY",
+    "NODE_FAIL",
+    "PREEMPTED",
+    "BOOT_FAIL",
+    "DEADLINE",
+}
+
 
 DATACHECK_WEB_BASEDIR = Path(cfg.get("WEBSERVER", "DATACHECK"))
-CALIB_BASEDIR = Path(cfg.get("LST1", "CAT_A_CALIB_DIR"))
-DRS4_PEDESTAL_BASEDIR = Path(cfg.get("LST1", "CAT_A_PEDESTAL_DIR"))
+# Validate the configuration at start-up rather than in the middle of a night
+CALIB_BASEDIR = get_settings().telescope("LST1").cat_a_calib_dir
+DRS4_PEDESTAL_BASEDIR = get_settings().telescope("LST1").cat_a_pedestal_dir
 
 
-def analysis_path(tel) -> Path:
+def analysis_path(tel, simulate: bool = None) -> Path:
     """
     Path of the running_analysis directory for a certain date
 
+    Parameters
+    ----------
+    tel : str
+        Telescope ID.
+    simulate : bool, optional
+        Do not create the directory. By default, as given in the options.
+
     Returns
     -------
     directory : Path
@@ -60,9 +91,12 @@ def analysis_path(tel) -> Path:
     log.debug(f"Getting analysis path for telescope {tel}")
     flat_date = utils.date_to_dir(options.date)
     options.prod_id = utils.get_prod_id()
-    directory = Path(cfg.get(tel, "ANALYSIS_DIR")) / flat_date / options.prod_id
+    directory = get_settings().telescope(tel).analysis_dir.joinpath(flat_date, options.prod_id)
+
+    if simulate is None:
+        simulate = options.simulate
 
-    if not options.simulate:
+    if not simulate:
         directory.mkdir(parents=True, exist_ok=True)
     else:
         log.debug("SIMULATE the creation of the analysis directory.")
@@ -102,7 +136,7 @@ def get_drs4_pedestal_filename(run_id: int, prod_id: str) -> Path:
         return files[-1]  # Get the latest production among the major lstchain version
 
     date = utils.date_to_dir(get_run_date(run_id))
-    lstcam_env = Path(cfg.get("LST1", "CALIB_ENV"))
+    lstcam_env = get_settings().telescope("LST1").calib_env
     lstcam_calib_version = utils.get_lstcam_calib_version(lstcam_env)
     return (
         DRS4_PEDESTAL_BASEDIR
@@ -139,7 +173,7 @@ def get_calibration_filename(run_id: int, prod_id: str) -> Path:
     date = utils.date_to_dir(get_run_date(run_id))
     options.filters = utils.get_calib_filters(run_id)
 
-    lstcam_env = Path(cfg.get("LST1", "CALIB_ENV"))
+    lstcam_env = get_settings().telescope("LST1").calib_env
     lstcam_calib_version = utils.get_lstcam_calib_version(lstcam_env)
     return (
         CALIB_BASEDIR
@@ -294,46 +328,22 @@ def destination_dir(concept: str, create_dir: bool = True, dl1_prod_id: str = No
         Path to the directory
     """
     nightdir = utils.date_to_dir(options.date)
+    telescope = get_settings().telescope(options.tel_id)
 
     if concept == "MUON":
-        directory = Path(cfg.get(options.tel_id, "DL1_DIR")) / nightdir / options.prod_id / "muons"
+        directory = telescope.dl1_dir.joinpath(nightdir, options.prod_id, "muons")
     elif concept == "INTERLEAVED":
-        directory = (
-            Path(cfg.get(options.tel_id, "DL1_DIR")) / nightdir / options.prod_id / "interleaved"
-        )
+        directory = telescope.dl1_dir.joinpath(nightdir, options.prod_id, "interleaved")
     elif concept == "DATACHECK":
-        directory = (
-            Path(cfg.get(options.tel_id, "DL1_DIR"))
-            / nightdir
-            / options.prod_id
-            / dl1_prod_id
-            / "datacheck"
-        )
+        directory = telescope.dl1_dir.joinpath(nightdir, options.prod_id, dl1_prod_id, "datacheck")
     elif concept == "DL1AB":
-        directory = (
-            Path(cfg.get(options.tel_id, "DL1_DIR"))
-            / nightdir
-            / options.prod_id
-            / dl1_prod_id
-        )
+        directory = telescope.dl1_dir.joinpath(nightdir, options.prod_id, dl1_prod_id)
     elif concept in {"DL2", "DL3"}:
-        directory = (
-            (Path(cfg.get(options.tel_id, f"{concept}_DIR")) / nightdir)
-            / options.prod_id
-            / dl2_prod_id
-        ) 
-    elif concept in {"PEDESTAL", "CALIB", "TIMECALIB"}:
-        directory = (
-            Path(cfg.get(options.tel_id, f"{concept}_DIR"))
-            / nightdir
-            / options.prod_id
-        )
-    elif concept == "HIGH_LEVEL":
-        directory = (
-            Path(cfg.get(options.tel_id, f"{concept}_DIR"))
-            / nightdir
-            / options.prod_id
+        directory = telescope.directory(f"{concept}_DIR").joinpath(
+            nightdir, options.prod_id, dl2_prod_id
         )
+    elif concept in {"PEDESTAL", "CALIB", "TIMECALIB", "HIGH_LEVEL"}:
+        directory = telescope.directory(f"{concept}_DIR").joinpath(nightdir, options.prod_id)
     else:
         log.warning(f"Concept {concept} not known")
         directory = None
@@ -386,108 +396,314 @@ def is_job_completed(job_id: str):
     log.info(f"The maximum number of checks of job {job_id} was reached, job {job_id} did not finish succesfully yet.")
     return False
 
-def create_longterm_symlink(cherenkov_job_id: str = None):
-    """If the created longterm DL1 datacheck file corresponds to the latest 
-    version available, make symlink to it in the "all" common directory."""
 
-    if not cherenkov_job_id or is_job_completed(cherenkov_job_id):
-        nightdir = utils.date_to_dir(options.date)
-        longterm_dir = Path(cfg.get("LST1", "LONGTERM_DIR"))
-        output_dir = Path(cfg.get("LST1", "DATACHECK_DIR"))
+def wait_for_jobs(job_ids: List[str], poll_interval: int = 60, max_polls: int = 60) -> bool:
+    """
+    Wait for the given SLURM jobs to finish.
 
-        extensions = ["h5", "log", "html"]
+    Returns
+    -------
+    bool
+        True if all the jobs completed successfully.
+    """
+    if not job_ids:
+        return True
+    if shutil.which("sacct") is None:
+        log.warning("sacct is not available, the state of the jobs cannot be checked")
+        return False
+
+    for _ in range(max_polls):
+        sacct_cmd = ["sacct", "-n", "-X", "--parsable2", "--format=JobID,State"]
+        output = subprocess.run(
+            [*sacct_cmd, f"--jobs={','.join(job_ids)}"], capture_output=True, text=True
+        )
+        # e.g. "CANCELLED by 1234"
+        states = {
+            line.split("|")[0]: line.split("|")[1].split()[0]
+            for line in output.stdout.splitlines()
+            if "|" in line
+        }
+        if len(states) >= len(job_ids) and set(states.values()) <= SLURM_FINISHED_STATES:
+            return all(state == "COMPLETED" for state in states.values())
+        log.debug(f"Jobs {', '.join(job_ids)} not finished yet, checking again")
+        time.sleep(poll_interval)
+
+    log.warning(f"Jobs {', '.join(job_ids)} did not finish in time")
+    return False
 
-        for ext in extensions:
-            linked_longterm_file = output_dir / f"night_wise/DL1_datacheck_{nightdir}.{ext}"
-            all_longterm_files = longterm_dir.rglob(
-                f"v*/{nightdir}/DL1_datacheck_{nightdir}.{ext}"
-            )
 
+def _scan_files(directory: Path, match) -> List[os.DirEntry]:
+    """Entries of the files below a directory accepted by `match`, one scandir per directory."""
+    files = []
+    pending = [str(directory)]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif match(entry):
+                        files.append(entry)
+        except FileNotFoundError:
+            continue
+    return files
+
+
+def _replace_symlink(target: Path, link: Path) -> None:
+    """Atomically replace `link` (a stale link or a file) by a link to `target`."""
+    tmp_link = link.with_name(f".{link.name}.{os.getpid()}.tmp")
+    tmp_link.unlink(missing_ok=True)
+    os.symlink(target, tmp_link)
+    os.replace(tmp_link, link)
+
+
+def _apply_symlink(target: Path, link: Path, replace: bool) -> bool:
+    try:
+        if replace:
+            _replace_symlink(target, link)
+        else:
             try:
-                latest_version_file = get_latest_version_file(all_longterm_files)
-            except ValueError:
-                log.warning(f"No longterm file found for extension {ext}")
-                continue
+                os.symlink(target, link)
+            except FileExistsError:
+                _replace_symlink(target, link)
+    except OSError as error:
+        log.warning(f"Could not link {link} to {target}: {error}")
+        return False
+    return True
 
-            linked_longterm_file.unlink(missing_ok=True)
 
-            log.info("Creating symlink of the daily datacheck file in the common directory.")
-            linked_longterm_file.symlink_to(latest_version_file)
+def reconcile_symlinks(links: Dict[Path, Path], max_workers: int = 8) -> Dict[str, int]:
+    """
+    Make the links point to their targets, creating only the missing links
+    and replacing the stale ones.
 
-    else:
+    The existing links are read with one scandir per directory of links, and
+    the missing or stale ones are created in a thread pool. In simulate mode,
+    the links are only compared.
+
+    Parameters
+    ----------
+    links: dict
+        Target of each link.
+    max_workers: int
+        Number of links created at the same time.
+
+    Returns
+    -------
+    dict
+        Number of links created, updated (stale links or files replaced) and unchanged.
+    """
+    existing = {}
+    for directory in {link.parent for link in links}:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    existing[entry.path] = os.readlink(entry.path) if entry.is_symlink() else None
+        except FileNotFoundError:
+            if not options.simulate:
+                directory.mkdir(parents=True, exist_ok=True)
+
+    changes = []
+    unchanged = 0
+    for link, target in links.items():
+        current = existing.get(str(link), False)
+        if current == str(target):
+            unchanged += 1
+        else:
+            changes.append((target, link, current is not False))
+
+    created = sum(not replace for _, _, replace in changes)
+    counts = {"created": created, "updated": len(changes) - created, "unchanged": unchanged}
+    if changes and not options.simulate:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            done = list(executor.map(lambda change: _apply_symlink(*change), changes))
+        counts["created"] = sum(ok and not replace for ok, (*_, replace) in zip(done, changes))
+        counts["updated"] = sum(ok and replace for ok, (*_, replace) in zip(done, changes))
+        counts["failed"] = done.count(False)
+
+    return counts
+
+
+def _log_symlinks(concept: str, counts: Dict[str, int]) -> None:
+    log.info(
+        f"Symlinks of the {concept} files: {counts['created']} created, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+    )
+
+
+def create_longterm_symlink(cherenkov_job_id: str = None) -> Dict[str, int]:
+    """If the created longterm DL1 datacheck file corresponds to the latest
+    version available, make symlink to it in the "all" common directory."""
+
+    if cherenkov_job_id and not is_job_completed(cherenkov_job_id):
         log.warning(
             f"Job {cherenkov_job_id} (lstchain_cherenkov_transparency) did not finish successfully."
         )
+        return {"created": 0, "updated": 0, "unchanged": 0}
+
+    nightdir = utils.date_to_dir(options.date)
+    longterm_dir = Path(cfg.get("LST1", "LONGTERM_DIR"))
+    output_dir = Path(cfg.get("LST1", "DATACHECK_DIR"))
+
+    extensions = ["h5", "log", "html"]
+    filenames = {f"DL1_datacheck_{nightdir}.{ext}": ext for ext in extensions}
+
+    # Files of the night in each version directory (v*/<night>)
+    longterm_files = {ext: [] for ext in extensions}
+    try:
+        with os.scandir(longterm_dir) as version_dirs:
+            night_dirs = [
+                Path(entry.path) / nightdir
+                for entry in version_dirs
+                if entry.name.startswith("v") and entry.is_dir()
+            ]
+    except FileNotFoundError:
+        night_dirs = []
+    for night_dir in night_dirs:
+        try:
+            with os.scandir(night_dir) as entries:
+                for entry in entries:
+                    if entry.name in filenames:
+                        longterm_files[filenames[entry.name]].append(Path(entry.path))
+        except FileNotFoundError:
+            continue
+
+    links = {}
+    for ext in extensions:
+        try:
+            latest_version_file = get_latest_version_file(longterm_files[ext])
+        except ValueError:
+            log.warning(f"No longterm file found for extension {ext}")
+            continue
+        links[output_dir / f"night_wise/DL1_datacheck_{nightdir}.{ext}"] = latest_version_file
+
+    counts = reconcile_symlinks(links)
+    _log_symlinks("daily datacheck", counts)
+    return counts
+
+
+def create_runwise_datacheck_symlinks(parent_job_ids: List[str] = None) -> Optional[Dict[str, int]]:
+    """
+    Link the run-wise DL1 datacheck files (PDF and HDF5) of the night in the common
+    datacheck directory, once the jobs merging them (`parent_job_ids`) completed.
 
-def create_runwise_datacheck_symlinks(parent_job_ids: List[str]):
+    Returns None, without linking any file, if not all the jobs completed
+    successfully in time, so that partially merged files are not published.
+    """
+    poll_interval = cfg.getint("SLURM", "MERGE_POLL_INTERVAL", fallback=60)
+    timeout = cfg.getint("SLURM", "MERGE_WAIT_TIMEOUT", fallback=3600)
+    if not wait_for_jobs(parent_job_ids, poll_interval, max(1, timeout // poll_interval)):
+        log.warning(
+            "Not all the datacheck merging jobs completed, "
+            "the run-wise datacheck files are not linked"
+        )
+        return None
 
     nightdir = utils.date_to_dir(options.date)
     dl1_dir = Path(cfg.get("LST1", "DL1_DIR")) / nightdir / options.prod_id
     output_dir = Path(cfg.get("LST1", "DATACHECK_DIR")) / nightdir
+    datacheck_subdir = f"{os.sep}datacheck{os.sep}"
 
-    output_dir.mkdir(parents=True, exist_ok=True)
+    files = _scan_files(
+        dl1_dir,
+        lambda entry: entry.name.endswith((".pdf", ".h5")) and datacheck_subdir in entry.path,
+    )
+    counts = reconcile_symlinks({output_dir / file.name: Path(file.path) for file in files})
+    _log_symlinks("run-wise datacheck", counts)
+    return counts
 
-    log_dir = Path(options.directory) / "log"
-    log_dir.mkdir(parents=True, exist_ok=True)
 
-    wrap_cmd = f"""
-find {dl1_dir} \\( -name "*.pdf" -o -name "*.h5" \\) \
--path "*/datacheck/*" | while read f; do
-    ln -sfn "$f" {output_dir}/$(basename "$f")
-done
-"""
+def batch_cmd_runwise_datacheck_symlinks(parent_job_ids: List[str]) -> List[str]:
+    """
+    Build the sbatch command of the job linking the run-wise DL1 datacheck files
+    of the night in the common datacheck directory once the merging jobs completed.
+    """
+    nightdir = utils.date_to_dir(options.date)
+    dl1_dir = Path(cfg.get("LST1", "DL1_DIR")) / nightdir / options.prod_id
+    output_dir = Path(cfg.get("LST1", "DATACHECK_DIR")) / nightdir
+    log_dir = Path(options.directory) / "log"
 
-    sbatch_cmd = [
+    wrap_cmd = (
+        f"mkdir -p {output_dir} && "
+        f'find {dl1_dir} \\( -name "*.pdf" -o -name "*.h5" \\) -path "*/datacheck/*" '
+        f"-exec ln -sfn -t {output_dir} {{}} +"
+    )
+    return [
         "sbatch",
         "--parsable",
-        f"--dependency=afterok:{','.join(parent_job_ids)}",
-        "-o", f"{log_dir}/datacheck_symlink_%j.out",
-        "-e", f"{log_dir}/datacheck_symlink_%j.err",
+        f"--account={cfg.get('SLURM', 'ACCOUNT')}",
+        *([f"--dependency=afterok:{','.join(parent_job_ids)}"] if parent_job_ids else []),
+        "-o",
+        f"{log_dir}/datacheck_symlink_%j.out",
+        "-e",
+        f"{log_dir}/datacheck_symlink_%j.err",
         "--wrap",
         wrap_cmd,
     ]
 
-    job = subprocess.run(
-        sbatch_cmd,
-        encoding="utf-8",
-        capture_output=True,
-        text=True,
-        check=True,
-    )
 
-    job_id = job.stdout.strip()
+def submit_runwise_datacheck_symlinks(parent_job_ids: List[str]) -> Optional[str]:
+    """
+    Submit the job linking the run-wise DL1 datacheck files once the merging
+    jobs completed, for when they did not complete in time to be linked here.
 
-    log.info(f"Datacheck symlink job → {job_id}")
+    Returns
+    -------
+    str or None
+        Job ID, None if not submitted (simulate or test mode).
+    """
+    cmd = batch_cmd_runwise_datacheck_symlinks(parent_job_ids)
+    if options.simulate or options.test:
+        log.debug(f"Simulate launching of {utils.stringify(cmd)}")
+        return None
 
+    job = subprocess.run(cmd, encoding="utf-8", capture_output=True, text=True, check=True)
+    job_id = job.stdout.strip()
+    log.info(f"Run-wise datacheck files to be linked by job {job_id}")
     return job_id
 
 
-
-
-
-def create_muons_symlinks():
-
+def create_muons_symlinks() -> Dict[str, int]:
+    """Link the muon files of the night in the common datacheck directory."""
     nightdir = utils.date_to_dir(options.date)
-    muons_dir = destination_dir("MUON", create_dir=False)
-
+    muons_dir = destination_dir("MUON", create_dir=False).resolve()
     output_dir = Path(cfg.get("LST1", "DATACHECK_DIR")) / nightdir / "muons"
-    output_dir.mkdir(parents=True, exist_ok=True)
 
-    for input_file in muons_dir.rglob("muons_LST-1*.fits"):
-        output_file = output_dir / input_file.name
-        if not output_file.is_symlink():
-            output_file.symlink_to(input_file.resolve())
+    files = _scan_files(muons_dir, lambda entry: fnmatchcase(entry.name, "muons_LST-1*.fits"))
+    # The links point to the files themselves, not to other links
+    counts = reconcile_symlinks(
+        {
+            output_dir / file.name: Path(
+                os.path.realpath(file.path) if file.is_symlink() else file.path
+            )
+            for file in files
+        }
+    )
+    _log_symlinks("muon", counts)
+    return counts
 
 
-def create_datacheck_symlinks(parent_job_ids: List[str]):
+def create_datacheck_symlinks(parent_job_ids: List[str] = None) -> Optional[Dict[str, int]]:
+    """
+    Link the datacheck and muon files of the night in the common directory, once the
+    jobs merging the datacheck files completed.
 
+    Returns
+    -------
+    dict or None
+        Number of links created, updated and unchanged, or None if the merging
+        jobs did not complete and the run-wise datacheck files were not linked.
+    """
     log.info("Creating symlinks of the datacheck and muon files in the common directory.")
 
-    symlink_job_id = create_runwise_datacheck_symlinks(parent_job_ids)
+    muon_counts = create_muons_symlinks()
+    counts = create_runwise_datacheck_symlinks(parent_job_ids)
+    if counts is None:
+        return None
+    for concept, number in muon_counts.items():
+        counts[concept] = counts.get(concept, 0) + number
 
-    create_muons_symlinks()
-
-    return symlink_job_id
+    return counts
 
 
 def dl1_datacheck_longterm_file_exits() -> bool:
@@ -521,7 +737,7 @@ def get_dl1_prod_id(config_filename):
         
     picture_thresh = data["tailcuts_clean_with_pedestal_threshold"]["picture_thresh"]
     boundary_thresh = data["tailcuts_clean_with_pedestal_threshold"]["boundary_thresh"]
-    dl1_prod_id_prefix = cfg.get("LST1", "DL1_PROD_ID_PREFIX")
+    dl1_prod_id_prefix = get_settings().telescope("LST1").dl1_prod_id_prefix
 
     if boundary_thresh == 4:
         return f"{dl1_prod_id_prefix}{picture_thresh}{boundary_thresh}"
@@ -539,8 +755,9 @@ def get_dl2_nsb_prod_id(rf_model: Path) -> str:
     
 
 def get_dl1_prod_id_and_config(run_id: int) -> str:
-    if not cfg.getboolean("lstchain", "apply_standard_dl1b_config"):
-        tailcuts_finder_dir = Path(cfg.get(options.tel_id, "TAILCUTS_FINDER_DIR"))
+    settings = get_settings()
+    if not settings.lstchain.apply_standard_dl1b_config:
+        tailcuts_finder_dir = settings.telescope(options.tel_id).tailcuts_finder_dir
         dl1b_config_file = tailcuts_finder_dir / f"dl1ab_Run{run_id:05d}.json"
         if not dl1b_config_file.exists()  and not options.simulate:
             log.error(
@@ -552,8 +769,8 @@ def get_dl1_prod_id_and_config(run_id: int) -> str:
             dl1_prod_id = get_dl1_prod_id(dl1b_config_file)
             return dl1_prod_id, dl1b_config_file.resolve()
     else:
-        dl1b_config_file = Path(cfg.get("lstchain", "dl1b_config"))
-        dl1_prod_id = cfg.get("LST1", "DL1_PROD_ID")
+        dl1b_config_file = settings.lstchain.dl1b_config
+        dl1_prod_id = settings.telescope("LST1").dl1_prod_id
         return dl1_prod_id, dl1b_config_file.resolve()
     
 
@@ -564,15 +781,18 @@ def get_dl2_prod_id(run_id: int) -> str:
     return f"{dl1_prod_id}/{nsb_prod_id}"
 
 
+def dl1ab_config_files_exist(run_ids) -> bool:
+    """Return true if the dl1b config files of all the given runs were already created."""
+    tailcuts_finder_dir = Path(cfg.get(options.tel_id, "TAILCUTS_FINDER_DIR"))
+    return all(
+        (tailcuts_finder_dir / f"dl1ab_Run{run_id:05d}.json").exists() for run_id in run_ids
+    )
+
+
 def all_dl1ab_config_files_exist(date: str) -> bool:
     nightdir = date.replace("-","")
     run_summary_dir =  Path(cfg.get(options.tel_id, "RUN_SUMMARY_DIR"))
     run_summary_file = run_summary_dir / f"RunSummary_{nightdir}.ecsv"
     summary_table = Table.read(run_summary_file)
     data_runs = summary_table[summary_table["run_type"] == "DATA"]
-    for run_id in data_runs["run_id"]:
-        tailcuts_finder_dir = Path(cfg.get(options.tel_id, "TAILCUTS_FINDER_DIR"))
-        dl1b_config_file = tailcuts_finder_dir / f"dl1ab_Run{run_id:05d}.json"
-        if not dl1b_config_file.exists():
-            return False
-    return True
+    return dl1ab_config_files_exist(data_runs["run_id"])
@@ -2,7 +2,8 @@ import logging
 from datetime import datetime, timezone
 from fnmatch import fnmatchcase
 from glob import glob
-from os.path import basename, getsize, join
+from os import scandir
+from os.path import basename, join
 from pathlib import Path
 
 from osa.configs import config, options
@@ -71,32 +72,28 @@ def finished_assignments(sequence_list):
         if sequence_list is not None:
             for seq in sequence_list:
                 rawnum += seq.subruns
-        data_files = glob(
-            join(
-                rawdir,
-                f'*{cfg.get("PATTERN", "R0PREFIX")}*{cfg.get("PATTERN", "R0SUFFIX")}*',
-            )
-        )
-        disk_space = sum(getsize(d) for d in data_files)
+        raw_pattern = f'*{cfg.get("PATTERN", "R0PREFIX")}*{cfg.get("PATTERN", "R0SUFFIX")}*'
+        disk_space = 0
+        if rawdir.is_dir():
+            with scandir(rawdir) as entries:
+                disk_space = sum(
+                    entry.stat().st_size for entry in entries if fnmatchcase(entry.name, raw_pattern)
+                )
         disk_space_GB_f = float(disk_space) / (1000 * 1000 * 1000)
         disk_space_GB = int(round(disk_space_GB_f, 0))
 
     ana_files = glob(join(analysis_dir, "*" + cfg.get("PATTERN", "R0SUFFIX")))
-    file_no = {}
-    ana_set = set(ana_files)
+    patterns = {
+        concept: f"{cfg.get('PATTERN', f'{concept}PREFIX')}*" for concept in concept_set
+    }
+    file_no = dict.fromkeys(concept_set, 0)
 
-    for concept in concept_set:
-        pattern = f"{cfg.get('PATTERN', f'{concept}PREFIX')}*"
-        log.debug(f"Trying with {concept} and searching {pattern}")
-        file_no[concept] = 0
-        delete_set = set()
-        for a in ana_set:
-            ana_file = basename(a)
-            if pattern_found := fnmatchcase(ana_file, pattern):
-                log.debug(f"Was pattern {pattern} found in {ana_file}?: {pattern_found}")
+    # Each file is counted for the first concept whose pattern it matches
+    for ana_file in ana_files:
+        for concept, pattern in patterns.items():
+            if fnmatchcase(basename(ana_file), pattern):
                 file_no[concept] += 1
-                delete_set.add(a)
-        ana_set -= delete_set
+                break
 
     now_string = f"{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M')}"
 
@@ -124,6 +121,9 @@ def history(
     history_file: Path,
     input_file=None,
     config_file=None,
+    attempt: int = None,
+    duration: float = None,
+    error_class: str = None,
 ) -> None:
     """
     Appends a history line to the history file. A history line
@@ -145,9 +145,28 @@ def history(
         If needed, input file used for the lstchain executable
     config_file : str, optional
         Input card used for the lstchain executable.
+    attempt : int, optional
+        Number of the attempt of the stage.
+    duration : float, optional
+        Wall time of the attempt in seconds.
+    error_class : str, optional
+        Class of the error of a failed attempt (see osa.workflow.stages.classify_error).
+
+    Notes
+    -----
+    The attempt, duration and error class are written as key=value words
+    before the return code, which stays the last word of the line.
     """
     date_string = datetime.utcnow().isoformat(sep=" ", timespec="minutes")
+    attempt_info = ""
+    if attempt is not None:
+        attempt_info += f"attempt={attempt} "
+    if duration is not None:
+        attempt_info += f"time={duration:.1f}s "
+    if error_class is not None:
+        attempt_info += f"error={error_class} "
     string_to_write = (
-        f"{run} {stage} {prod_id} {date_string} " f"{input_file} {config_file} {return_code}\n"
+        f"{run} {stage} {prod_id} {date_string} "
+        f"{input_file} {config_file} {attempt_info}{return_code}\n"
     )
     append_to_file(history_file, string_to_write)
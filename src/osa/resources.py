@@ -0,0 +1,487 @@
+"""
+Size the memory and time limits of the jobs from the accounting of the past jobs.
+
+The sequencer records the features of every sequence in the OSA database (job
+type, source, NSB level and mean size of the R0 files of its subruns) and the
+closer records the MaxRSS and Elapsed time of every job of the night reported
+by sacct. A new sequence then requests the `quantile` of the memory and time
+used by the past completed jobs with the same features, times a safety margin,
+instead of the fixed MEMSIZE_* and WALLTIME of the [SLURM] section. If there
+are too few of them, coarser groups of features are used, down to the job type.
+"""
+
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from io import StringIO
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.job import FORMAT_SLURM, run_sacct
+from osa.osadb import open_database
+from osa.raw import get_raw_dir
+from osa.utils.logging import myLogger
+from osa.utils.utils import date_to_dir, get_nsb_level, time_to_seconds
+
+log = myLogger(logging.getLogger(__name__))
+
+__all__ = [
+    "GROUPINGS",
+    "SAMPLE_COLUMNS",
+    "ResourceRequest",
+    "ResourceModel",
+    "create_tables",
+    "memory_to_gb",
+    "size_bin",
+    "r0_subrun_sizes",
+    "sequence_features",
+    "record_features",
+    "parse_sacct_records",
+    "record_accounting",
+    "read_samples",
+    "size_job_resources",
+    "record_job_accounting",
+    "evaluate_sizing",
+]
+
+# Groups of features of the past jobs used to size a new one, from the finest to the coarsest
+GROUPINGS = [
+    ("job_type", "source", "nsb_level", "size_bin"),
+    ("job_type", "nsb_level", "size_bin"),
+    ("job_type", "size_bin"),
+    ("job_type",),
+]
+
+# sacct reports the memory in binary units: K is KiB, M is MiB, G is GiB and T is TiB
+MEMORY_UNITS = {unit: 1024**power / 1e9 for power, unit in enumerate("KMGT", start=1)}
+
+R0_FILE_PATTERN = re.compile(r"LST-1\.\d\.Run(\d{5})\.(\d{4})\.fits\.fz$")
+
+SAMPLE_COLUMNS = [
+    "job_id",
+    "jobname",
+    "date",
+    "job_type",
+    "source",
+    "nsb_level",
+    "subrun_size_gb",
+    "state",
+    "max_rss_gb",
+    "elapsed_s",
+]
+
+
+@dataclass(frozen=True)
+class ResourceRequest:
+    """Memory and time limits requested for the jobs of a sequence."""
+
+    mem_gb: int
+    time_s: int
+    n_samples: int
+    grouping: tuple
+
+    @property
+    def time(self) -> str:
+        """Time limit in the (D-)HH:MM:SS format of sbatch."""
+        days, seconds = divmod(self.time_s, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        time = f"{hours:d}:{seconds // 60:02d}:{seconds % 60:02d}"
+        return f"{days:d}-{time}" if days else time
+
+
+def create_tables(cursor) -> None:
+    """Create the job accounting tables in the OSA database if they do not exist."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS job_features
+        (jobname TEXT, date TEXT, job_type TEXT, source TEXT, nsb_level REAL,
+        subrun_size_gb REAL, PRIMARY KEY (jobname, date))"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS job_accounting
+        (job_id TEXT PRIMARY KEY, jobname TEXT, state TEXT, max_rss_gb REAL, elapsed_s INTEGER,
+        date TEXT)"""
+    )
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(job_accounting)")]
+    if "date" not in columns:
+        # Accounting recorded without the night of the jobs: the latest night of their jobname
+        cursor.execute("ALTER TABLE job_accounting ADD COLUMN date TEXT")
+        cursor.execute(
+            """UPDATE job_accounting SET date = (SELECT MAX(f.date) FROM job_features f
+            WHERE f.jobname = job_accounting.jobname)"""
+        )
+
+
+def memory_to_gb(value) -> float:
+    """Convert a memory reported by sacct (e.g. 3.01G or 850M, binary units) to GB, NaN if empty."""
+    if not isinstance(value, str) or not value:
+        return math.nan
+    unit = value[-1].upper()
+    if unit in MEMORY_UNITS:
+        return float(value[:-1]) * MEMORY_UNITS[unit]
+    # Bytes if no unit is given
+    return float(value) / 1e9
+
+
+def size_bin(subrun_size_gb) -> int:
+    """Bin of the size of the R0 files of a subrun (nearest GB), -1 if unknown."""
+    if subrun_size_gb is None or pd.isna(subrun_size_gb):
+        return -1
+    return int(round(subrun_size_gb))
+
+
+def _feature_key(job_type, source, nsb_level, subrun_size_gb) -> dict:
+    """Features of a job with the unknown values replaced, so that they can be grouped."""
+    return {
+        "job_type": job_type,
+        "source": source if isinstance(source, str) else "",
+        "nsb_level": -1.0 if nsb_level is None or pd.isna(nsb_level) else float(nsb_level),
+        "size_bin": size_bin(subrun_size_gb),
+    }
+
+
+def r0_subrun_sizes(raw_dir) -> Dict[int, float]:
+    """Mean size in GB of the R0 files of a subrun (all streams) for each run of a night."""
+    bytes_per_run = {}
+    subruns_per_run = {}
+    try:
+        with os.scandir(raw_dir) as entries:
+            for entry in entries:
+                match = R0_FILE_PATTERN.match(entry.name)
+                if match is None:
+                    continue
+                run_id = int(match.group(1))
+                bytes_per_run[run_id] = bytes_per_run.get(run_id, 0) + entry.stat().st_size
+                subruns_per_run.setdefault(run_id, set()).add(match.group(2))
+    except OSError as error:
+        log.warning(f"Size of the R0 files unknown: {error}")
+        return {}
+
+    return {
+        run_id: n_bytes / len(subruns_per_run[run_id]) / 1e9
+        for run_id, n_bytes in bytes_per_run.items()
+    }
+
+
+def sequence_features(sequence, subrun_sizes: Dict[int, float]) -> dict:
+    """Features of a sequence used to size its jobs."""
+    nsb_level = None
+    if sequence.type == "DATA":
+        try:
+            nsb_level = float(get_nsb_level(sequence.run))
+        except (OSError, ValueError, AttributeError, KeyError, IndexError):
+            log.debug(f"NSB level of run {sequence.run} unknown")
+    return {
+        "jobname": sequence.jobname,
+        "job_type": sequence.type,
+        "source": sequence.source_name,
+        "nsb_level": nsb_level,
+        "subrun_size_gb": subrun_sizes.get(sequence.run),
+    }
+
+
+def record_features(cursor, features: Iterable[dict], date: str) -> None:
+    """Store the features of the sequences of a night in the OSA database."""
+    create_tables(cursor)
+    cursor.executemany(
+        "INSERT OR REPLACE INTO job_features VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                feature["jobname"],
+                date,
+                feature["job_type"],
+                feature["source"],
+                feature["nsb_level"],
+                feature["subrun_size_gb"],
+            )
+            for feature in features
+        ],
+    )
+
+
+def parse_sacct_records(sacct_output: StringIO) -> pd.DataFrame:
+    """
+    Return the state, MaxRSS and Elapsed time of each job (or array task) in the
+    output of `osa.job.run_sacct`. The MaxRSS is the largest among the steps of the job.
+    """
+    columns = ["job_id", "jobname", "state", "max_rss_gb", "elapsed_s"]
+    try:
+        sacct = pd.read_csv(sacct_output, names=FORMAT_SLURM, dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=columns)
+
+    job_ids = sacct["JobID"].str.split(".").str[0]
+    max_rss = sacct["MaxRSS"].map(memory_to_gb).groupby(job_ids).max()
+    jobs = sacct[~sacct["JobID"].str.contains(".", regex=False)]
+    return pd.DataFrame(
+        {
+            "job_id": jobs["JobID"],
+            "jobname": jobs["JobName"],
+            # e.g. "CANCELLED by 1234"
+            "state": jobs["State"].str.split().str[0],
+            "max_rss_gb": jobs["JobID"].map(max_rss),
+            "elapsed_s": jobs["Elapsed"].map(time_to_seconds),
+        },
+        columns=columns,
+    ).reset_index(drop=True)
+
+
+def record_accounting(cursor, records: pd.DataFrame, date: str) -> None:
+    """
+    Store the accounting of the jobs (see `parse_sacct_records`) of a night in the
+    OSA database. The jobs already recorded keep the night they were first recorded for.
+    """
+    create_tables(cursor)
+    cursor.executemany(
+        """INSERT INTO job_accounting (job_id, jobname, state, max_rss_gb, elapsed_s, date)
+        VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (job_id) DO UPDATE SET state = excluded.state,
+        max_rss_gb = excluded.max_rss_gb, elapsed_s = excluded.elapsed_s""",
+        [
+            (
+                record.job_id,
+                record.jobname,
+                record.state,
+                None if pd.isna(record.max_rss_gb) else float(record.max_rss_gb),
+                int(record.elapsed_s),
+                date,
+            )
+            for record in records.itertuples()
+        ],
+    )
+
+
+def read_samples(cursor) -> pd.DataFrame:
+    """Accounting of the past jobs joined with the features of their sequences of the same night."""
+    create_tables(cursor)
+    cursor.execute(
+        """SELECT a.job_id, a.jobname, f.date, f.job_type, f.source, f.nsb_level,
+        f.subrun_size_gb, a.state, a.max_rss_gb, a.elapsed_s
+        FROM job_accounting a JOIN job_features f ON a.jobname = f.jobname AND a.date = f.date
+        ORDER BY f.date, a.job_id"""
+    )
+    return pd.DataFrame(cursor.fetchall(), columns=SAMPLE_COLUMNS)
+
+
+class ResourceModel:
+    """
+    Quantiles of the memory and time used by the past completed jobs for each group
+    of features (see GROUPINGS).
+
+    Parameters
+    ----------
+    samples: pd.DataFrame
+        Past jobs with the columns of `read_samples`.
+    quantile: float
+        Quantile of the memory and time used by the past jobs which is requested.
+    margin: float
+        Safety factor applied to the quantiles.
+    min_samples: int
+        Minimum number of past jobs of a group to use it.
+
+    Notes
+    -----
+    Only the completed jobs are used: the MaxRSS of a job killed by the out of
+    memory handler or the elapsed time of a timed out job are only lower limits.
+    """
+
+    def __init__(
+        self,
+        samples: pd.DataFrame,
+        quantile: float = 0.95,
+        margin: float = 1.2,
+        min_samples: int = 20,
+    ):
+        self.quantile = quantile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.n_samples = 0
+        self._quantiles = {grouping: {} for grouping in GROUPINGS}
+
+        samples = samples[samples["state"] == "COMPLETED"].dropna(
+            subset=["max_rss_gb", "elapsed_s"]
+        )
+        if samples.empty:
+            return
+        self.n_samples = len(samples)
+
+        keys = pd.DataFrame(
+            [
+                _feature_key(*row)
+                for row in samples[
+                    ["job_type", "source", "nsb_level", "subrun_size_gb"]
+                ].itertuples(index=False)
+            ],
+            index=samples.index,
+        )
+        samples = pd.concat([keys, samples[["max_rss_gb", "elapsed_s"]]], axis=1)
+        for grouping in GROUPINGS:
+            groups = samples.groupby(list(grouping))
+            table = groups[["max_rss_gb", "elapsed_s"]].quantile(quantile)
+            table["n"] = groups.size()
+            self._quantiles[grouping] = {
+                (key if isinstance(key, tuple) else (key,)): (row.max_rss_gb, row.elapsed_s, row.n)
+                for key, row in table[table["n"] >= min_samples].iterrows()
+            }
+
+    @classmethod
+    def from_database(cls, cursor, **kwargs) -> "ResourceModel":
+        """Model fitted on the past jobs recorded in the OSA database."""
+        return cls(read_samples(cursor), **kwargs)
+
+    def estimate(self, features: dict) -> Optional[ResourceRequest]:
+        """
+        Memory and time to request for a job with the given features, None if
+        there are not enough similar past jobs.
+        """
+        key = _feature_key(
+            features["job_type"],
+            features.get("source"),
+            features.get("nsb_level"),
+            features.get("subrun_size_gb"),
+        )
+        for grouping in GROUPINGS:
+            quantiles = self._quantiles[grouping].get(tuple(key[name] for name in grouping))
+            if quantiles is None:
+                continue
+            max_rss_gb, elapsed_s, n_samples = quantiles
+            return ResourceRequest(
+                mem_gb=max(1, math.ceil(max_rss_gb * self.margin)),
+                # Rounded up to minutes
+                time_s=max(60, 60 * math.ceil(elapsed_s * self.margin / 60)),
+                n_samples=int(n_samples),
+                grouping=grouping,
+            )
+        return None
+
+
+def _accounting_enabled() -> bool:
+    return not options.test and not options.simulate
+
+
+def _adaptive_resources_enabled() -> bool:
+    return cfg.getboolean("SLURM", "ADAPTIVE_RESOURCES", fallback=False)
+
+
+def _model_parameters() -> dict:
+    return {
+        "quantile": cfg.getfloat("SLURM", "RESOURCE_QUANTILE", fallback=0.95),
+        "margin": cfg.getfloat("SLURM", "RESOURCE_MARGIN", fallback=1.2),
+        "min_samples": cfg.getint("SLURM", "RESOURCE_MIN_SAMPLES", fallback=20),
+    }
+
+
+def size_job_resources(sequence_list) -> None:
+    """
+    Record the features of the sequences of the night and set the memory and time
+    limits of their jobs (`sequence.resources`) from the accounting of the past jobs.
+
+    The features are always recorded, so that the accounting is available once
+    ADAPTIVE_RESOURCES is enabled in the [SLURM] section. Until then, or if there
+    are not enough similar past jobs, the sequences keep the limits of the configuration.
+    """
+    if not _accounting_enabled():
+        return
+
+    subrun_sizes = r0_subrun_sizes(get_raw_dir(options.date))
+    features = [sequence_features(sequence, subrun_sizes) for sequence in sequence_list]
+
+    with open_database(cfg.get("database", "path")) as cursor:
+        if cursor is None:
+            return
+        record_features(cursor, features, date_to_dir(options.date))
+        if not _adaptive_resources_enabled():
+            return
+        model = ResourceModel.from_database(cursor, **_model_parameters())
+
+    for sequence, feature in zip(sequence_list, features):
+        sequence.resources = model.estimate(feature)
+        if sequence.resources is not None:
+            log.debug(
+                f"Requesting {sequence.resources.mem_gb} GB and {sequence.resources.time} "
+                f"for {sequence.jobname} ({sequence.resources.n_samples} past jobs)"
+            )
+
+
+def record_job_accounting() -> None:
+    """
+    Store the accounting of the jobs reported by sacct in the OSA database, including
+    the jobs of the night which started before midnight.
+    """
+    if not _accounting_enabled():
+        return
+
+    records = parse_sacct_records(run_sacct(starttime=options.date))
+    if records.empty:
+        return
+
+    with open_database(cfg.get("database", "path")) as cursor:
+        if cursor is not None:
+            record_accounting(cursor, records, date_to_dir(options.date))
+
+
+def evaluate_sizing(
+    samples: pd.DataFrame,
+    default_mem_gb: float,
+    default_time_s: int,
+    **model_kwargs,
+) -> dict:
+    """
+    Replay the past jobs night by night, sizing the jobs of each night with the
+    model fitted on the previous nights, and compare with the fixed limits.
+
+    Parameters
+    ----------
+    samples: pd.DataFrame
+        Past jobs with the columns of `read_samples`.
+    default_mem_gb: float
+        Fixed memory limit, also used when the model has no estimate.
+    default_time_s: int
+        Fixed time limit, also used when the model has no estimate.
+    model_kwargs
+        Parameters of the `ResourceModel`.
+
+    Returns
+    -------
+    dict
+        For the fixed and adaptive limits, the number of completed jobs
+        replayed, the jobs sized by the model, those that would have run out
+        of memory or time, the GB hours reserved while the jobs run and the
+        fraction of them actually used.
+    """
+    completed = samples[samples["state"] == "COMPLETED"].dropna(subset=["max_rss_gb", "elapsed_s"])
+    results = {
+        limits: {"jobs": 0, "sized": 0, "out_of_memory": 0, "timeout": 0, "reserved_gb_h": 0.0}
+        for limits in ("fixed", "adaptive")
+    }
+    used_gb_h = 0.0
+
+    for date in sorted(completed["date"].unique()):
+        model = ResourceModel(samples[samples["date"] < date], **model_kwargs)
+        for job in completed[completed["date"] == date].itertuples():
+            request = model.estimate(job._asdict())
+            sized = request is not None
+            hours = job.elapsed_s / 3600
+            used_gb_h += job.max_rss_gb * hours
+            for limits, mem_gb, time_s in (
+                ("fixed", default_mem_gb, default_time_s),
+                (
+                    "adaptive",
+                    request.mem_gb if sized else default_mem_gb,
+                    request.time_s if sized else default_time_s,
+                ),
+            ):
+                result = results[limits]
+                result["jobs"] += 1
+                result["sized"] += sized and limits == "adaptive"
+                result["out_of_memory"] += job.max_rss_gb > mem_gb
+                result["timeout"] += job.elapsed_s > time_s
+                result["reserved_gb_h"] += mem_gb * hours
+
+    for result in results.values():
+        reserved = result["reserved_gb_h"]
+        result["efficiency"] = used_gb_h / reserved if reserved else math.nan
+    return results
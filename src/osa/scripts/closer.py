@@ -16,6 +16,7 @@ from typing import Tuple, Iterable, List
 from osa import osadb
 from osa.configs import options
 from osa.configs.config import cfg
+from osa.configs.settings import reload_config_if_changed
 from osa.job import (
     are_all_jobs_correctly_finished, 
     save_job_information, 
@@ -28,9 +29,11 @@ from osa.paths import (
     destination_dir,
     create_datacheck_symlinks,
     create_longterm_symlink,
-    dl1_datacheck_longterm_file_exits
+    dl1_datacheck_longterm_file_exits,
+    submit_runwise_datacheck_symlinks,
 )
 from osa.raw import is_raw_data_available
+from osa.resources import record_job_accounting
 from osa.report import start
 from osa.utils.cliopts import closercliparsing
 from osa.utils.logging import myLogger
@@ -54,6 +57,7 @@ __all__ = [
     "is_finished_check",
     "extract_provenance",
     "merge_dl1_datacheck",
+    "submit_daily_datacheck",
     "set_closed_with_file",
     "merge_files",
     "daily_datacheck",
@@ -108,6 +112,7 @@ def main():
             sys.exit(-1)
 
         save_job_information()
+        record_job_accounting()
         post_process(sequencer_tuple)
 
 
@@ -185,29 +190,7 @@ def post_process(seq_tuple):
                 log.debug("Skipping datacheck/longterm jobs in test mode")
             else:
                 list_job_id = merge_dl1_datacheck(seq_list)
-
-                symlink_job_id = create_datacheck_symlinks(list_job_id)
-
-                log.info(f"Datacheck symlink job → {symlink_job_id}")
-
-                if symlink_job_id:
-                    deps = [symlink_job_id]
-                else:
-                    log.warning(
-                        "No symlink job created, falling back to merge job dependencies"
-                    )
-                    deps = list_job_id
-
-                longterm_job_id = daily_datacheck(
-                    daily_longterm_cmd(deps)
-                )
-
-                cherenkov_job_id = cherenkov_transparency(
-                    cherenkov_transparency_cmd(longterm_job_id)
-                )
-
-                if cfg.getboolean("lstchain", "create_longterm_symlink"):
-                    create_longterm_symlink(cherenkov_job_id)
+                submit_daily_datacheck(list_job_id)
 
         if not options.test:
             time.sleep(600)
@@ -222,6 +205,7 @@ def post_process(seq_tuple):
             "Checking again in 10 minutes..."
         )
         time.sleep(600)
+        reload_config_if_changed()
         n += 1
 
     if n > n_max:
@@ -238,6 +222,40 @@ def post_process(seq_tuple):
     return False
 
 
+def submit_daily_datacheck(merge_job_ids: List[str]):
+    """
+    Link the merged DL1 datacheck files and submit the daily longterm check,
+    the Cherenkov transparency and the longterm symlink jobs of the night.
+
+    The merging jobs are waited for and their outputs linked in this process.
+    If they did not all complete in time, the linking is left to a job depending
+    on them, so that the longterm check is still submitted before the day is closed.
+
+    Returns
+    -------
+    str or None
+        Job ID of the daily longterm check.
+    """
+    longterm_dependencies = merge_job_ids
+    if create_datacheck_symlinks(merge_job_ids) is None:
+        log.warning(
+            "DL1 datacheck merging jobs did not complete yet, "
+            "the run-wise datacheck files will be linked by a job once they do"
+        )
+        symlink_job_id = submit_runwise_datacheck_symlinks(merge_job_ids)
+        if symlink_job_id:
+            longterm_dependencies = [symlink_job_id]
+
+    longterm_job_id = daily_datacheck(daily_longterm_cmd(longterm_dependencies))
+
+    cherenkov_job_id = cherenkov_transparency(cherenkov_transparency_cmd(longterm_job_id))
+
+    if cfg.getboolean("lstchain", "create_longterm_symlink"):
+        create_longterm_symlink(cherenkov_job_id)
+
+    return longterm_job_id
+
+
 def dl1_to_dl2(sequence, dl1_merge_job_id) -> int:
     """
     It prepares and execute the dl1 to dl2 lstchain scripts that applies
@@ -602,8 +620,8 @@ def merge_muon_files(sequence_list):
             log.debug("Simulate launching scripts")
 
 
-def daily_longterm_cmd(parent_job_ids: List[str]) -> List[str]:
-    """Build the daily longterm command."""
+def daily_longterm_cmd(parent_job_ids: List[str] = None) -> List[str]:
+    """Build the daily longterm command, depending on the given jobs if any."""
     nightdir = date_to_dir(options.date)
     datacheck_dir = Path(cfg.get("LST1", "DATACHECK_DIR")) / nightdir
     muons_dir = destination_dir("MUON", create_dir=False)
@@ -619,7 +637,7 @@ def daily_longterm_cmd(parent_job_ids: List[str]) -> List[str]:
         options.directory,
         "-o",
         "log/longterm_daily_%j.log",
-        f"--dependency=afterok:{','.join(parent_job_ids)}",
+        *([f"--dependency=afterok:{','.join(parent_job_ids)}"] if parent_job_ids else []),
         "lstchain_longterm_dl1_check",
         f"--input-dir={datacheck_dir}",
         f"--output-file={longterm_output_file}",
@@ -16,7 +16,7 @@ from osa.paths import (
 from osa.utils.cliopts import copy_datacheck_parsing
 from osa.utils.logging import myLogger
 from osa.utils.utils import DATACHECK_FILE_PATTERNS, date_to_dir
-from osa.webserver.utils import copy_to_webserver
+from osa.webserver.utils import datacheck_batch, publish
 
 log = myLogger(logging.getLogger())
 
@@ -66,17 +66,22 @@ def main():
     nightdir = date_to_dir(options.date)
 
     all_files_are_copied = False
+    batch = {}
 
     for data_type, pattern in DATACHECK_FILE_PATTERNS.items():
         log.info(f"Looking for {pattern}")
         directory = datacheck_directory(data_type=data_type, date=nightdir)
         files = get_datacheck_files(pattern, directory, date=nightdir)
-        if len(files) != 0:
-            copy_to_webserver(files, data_type, nightdir, options.prod_id)
+        batch.update(datacheck_batch(files, data_type, nightdir, options.prod_id))
 
         # Check if all files are copied
         all_files_are_copied = are_files_copied(data_type, files)
 
+    # All the files are published at once, skipping those already in the webserver
+    if batch:
+        published = publish(batch)
+        log.info(f"{len(published)} of {len(batch)} files published to the webserver")
+
     if all_files_are_copied:
         log.info("All datacheck files copied. No more files are expected.")
     else:
@@ -8,7 +8,7 @@ from osa.processing_plan import build_processing_plan
 from osa.configs import options
 from osa.configs.config import cfg
 from osa.job import historylevel
-from osa.workflow.stages import AnalysisStage
+from osa.workflow.stages import AnalysisStage, InProcessStage
 from osa.provenance.capture import trace
 from osa.paths import get_catB_calibration_filename
 from osa.utils.cliopts import data_sequence_cli_parsing
@@ -21,6 +21,17 @@ __all__ = ["data_sequence", "r0_to_dl1", "dl1ab", "dl1_datacheck"]
 log = myLogger(logging.getLogger())
 
 
+def analysis_stage(run_str: str, cmd: list, config_file: str = None) -> AnalysisStage:
+    """
+    Stage running a step of the DL1 processing.
+
+    With --fused-dl1, the steps run one after the other in the process of the job,
+    sharing the imports of lstchain and ctapipe, instead of in a new interpreter each.
+    """
+    stage_class = InProcessStage if options.fused_dl1 else AnalysisStage
+    return stage_class(run=run_str, command_args=cmd, config_file=config_file)
+
+
 def data_sequence(
     drive_file: Path,
     run_summary: Path,
@@ -142,11 +153,7 @@ def r0_to_dl1(
     if options.simulate:
         return 0
 
-    analysis_step = AnalysisStage(
-        run=run_str,
-        command_args=cmd,
-        config_file=dl1a_config.name
-    )
+    analysis_step = analysis_stage(run_str, cmd, config_file=dl1a_config.name)
 
     analysis_step.execute()
     return analysis_step.rc
@@ -203,7 +210,7 @@ def dl1ab(run_str: str, dl1b_config: Path, dl1_prod_id: str) -> int:
     if options.simulate:
         return 0
 
-    analysis_step = AnalysisStage(run=run_str, command_args=cmd, config_file=dl1b_config.name)
+    analysis_step = analysis_stage(run_str, cmd, config_file=dl1b_config.name)
     analysis_step.execute()
     return analysis_step.rc
 
@@ -241,7 +248,7 @@ def dl1_datacheck(run_str: str, dl1_prod_id: str) -> int:
     if options.simulate:
         return 0
 
-    analysis_step = AnalysisStage(run=run_str, command_args=cmd)
+    analysis_step = analysis_stage(run_str, cmd)
     analysis_step.execute()
     return analysis_step.rc
 
@@ -0,0 +1,92 @@
+"""
+Account the disk usage of the OSA products in the OSA database and forecast
+when the quota will be reached.
+"""
+
+import logging
+from pathlib import Path
+
+import click
+
+from osa.configs.config import DEFAULT_CFG, cfg
+from osa.osadb import open_database
+from osa.storage import forecast_quota, read_snapshots, record_snapshot, update_storage_usage
+from osa.utils.logging import myLogger
+
+log = myLogger(logging.getLogger())
+
+TB = 1e12
+
+
+@click.command()
+@click.option("--since", help="Only scan the nights from this one on (YYYYMMDD)")
+@click.option("--no-scan", is_flag=True, help="Only forecast from the recorded disk usage")
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of nights scanned at the same time",
+)
+@click.option("--quota-tb", type=float, help="Quota in TB [default: QUOTA_TB of the config]")
+@click.option(
+    "--window-days",
+    type=int,
+    default=30,
+    show_default=True,
+    help="Number of days used to fit the growth rate",
+)
+@click.option(
+    "-c",
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    default=DEFAULT_CFG,
+    help="Path to the OSA config file.",
+)
+def main(
+    since: str = None,
+    no_scan: bool = False,
+    jobs: int = 8,
+    quota_tb: float = None,
+    window_days: int = 30,
+    config: Path = DEFAULT_CFG,
+):
+    """Record the disk usage per night, production and data level and forecast the quota."""
+    log.setLevel(logging.INFO)
+    database = cfg.get("database", "path")
+    quota_tb = quota_tb or cfg.getfloat("STORAGE", "QUOTA_TB")
+
+    with open_database(database) as cursor:
+        if cursor is None:
+            raise click.ClickException(f"Cannot record the disk usage without database {database}")
+
+        if not no_scan:
+            stats = update_storage_usage(cursor, since=since, max_workers=jobs)
+            log.info(
+                f"Scanned {stats['nights']} nights: {stats['listed']} of "
+                f"{stats['dirs']} directories changed since the last scan"
+            )
+            record_snapshot(cursor)
+
+        cursor.execute(
+            "SELECT concept, SUM(n_files), SUM(bytes) FROM storage_usage "
+            "GROUP BY concept ORDER BY SUM(bytes) DESC"
+        )
+        for concept, n_files, n_bytes in cursor.fetchall():
+            log.info(f"{concept:>12}: {n_bytes / TB:8.2f} TB in {n_files} files")
+
+        forecast = forecast_quota(read_snapshots(cursor), quota_tb * TB, window_days)
+
+    log.info(
+        f"Total: {forecast['bytes'] / TB:.2f} of {quota_tb:.0f} TB, "
+        f"growing {forecast['bytes_per_day'] / TB * 1000:.1f} GB/day"
+    )
+    if forecast["quota_date"] is not None:
+        log.info(f"The quota will be reached on {forecast['quota_date']:%Y-%m-%d}")
+    else:
+        log.info("The quota will not be reached at the current growth rate")
+
+
+if __name__ == "__main__":
+    main()
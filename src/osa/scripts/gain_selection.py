@@ -1,5 +1,6 @@
 """Script to run the gain selection over a list of dates."""
 import logging
+import os
 import re
 import glob
 import pandas as pd
@@ -16,7 +17,7 @@ from datetime import datetime
 from osa.scripts.reprocessing import get_list_of_dates, check_job_status_and_wait
 from osa.utils.utils import wait_for_daytime, date_to_dir, date_to_iso
 from osa.utils.logging import myLogger
-from osa.utils.iofile import append_to_file
+from osa.utils.iofile import append_to_file, read_last_line
 from osa.utils.cliopts import valid_date
 from osa.job import get_sacct_output, run_sacct, job_finished_in_timeout
 from osa.configs.config import cfg
@@ -28,6 +29,21 @@ log = myLogger(logging.getLogger(__name__))
 
 PATH = "PATH=/fefs/aswg/software/offline_dvr/bin:$PATH"
 
+HISTORY_FILE_PATTERN = re.compile(r"gain_selection_(\d{5})\.(\d{4})\.history")
+CLOSED_FILE_PATTERN = re.compile(r"gain_selection_(\d{5})\.closed")
+R0G_LOG_PATTERN = re.compile(r"r0_to_r0g_(\d{5})\.(\d{4})\.log")
+FF_WARNING = "FlatField(FF)-like events are not tagged as FF"
+GAINSEL_STATUS_COLUMNS = [
+    "run_id",
+    "n_subruns",
+    "history_files",
+    "pending",
+    "success",
+    "failed",
+    "ff_warnings",
+    "closed",
+]
+
 parser = argparse.ArgumentParser()
 parser.add_argument(
         "--check",                                                                                       
@@ -210,11 +226,12 @@ def launch_gainsel_for_data_run(
                     if not simulate:
                         update_history_file(run_id, subrun, log_dir, history_file)
 
-                    if history_file.read_text() == "":   # history_file is empty
+                    last_line = read_last_line(history_file)
+                    if last_line == "":   # history_file is empty
                         log.debug(f"Gain selection is still running for run {run_id:05d}.{subrun:04d}")
                         continue
                     else:
-                        gainsel_rc = history_file.read_text().splitlines()[-1][-1]
+                        gainsel_rc = last_line[-1]
                         if gainsel_rc == "1":
                             job_id = get_last_job_id(run_id, subrun, log_dir)
                             if job_finished_in_timeout(job_id) and not simulate:
@@ -366,9 +383,7 @@ def is_run_already_copied(date: datetime, run_id: int) -> bool:
 
 def is_closed(date: datetime, run_id: str) -> bool:
     """Check if run is already closed."""
-    base_dir = Path(cfg.get("LST1", "BASE"))
-    log_dir = base_dir / f"R0G/log/{date_to_dir(date)}"
-    closed_run_file = log_dir / f"gain_selection_{run_id:05d}.closed"
+    closed_run_file = gainsel_log_dir(date) / f"gain_selection_{run_id:05d}.closed"
     return closed_run_file.exists()
 
 
@@ -386,57 +401,161 @@ def GainSel_finished(date: datetime) -> bool:
     return flagfile.exists()
    
 
-def check_gainsel_jobs_runwise(date: datetime, run_id: int) -> bool:
-    """Search for failed jobs in the log directory."""
+def gainsel_log_dir(date: datetime) -> Path:
+    """Return the directory with the gain selection logs and history files of a given date."""
     base_dir = Path(cfg.get("LST1", "BASE"))
-    log_dir = base_dir / f"R0G/log/{date_to_dir(date)}"
-    history_files = list(log_dir.glob(f"gain_selection_{run_id:05d}.????.history"))
-    summary_table = run_summary_table(date)
-    n_subruns = summary_table[summary_table["run_id"] == run_id]["n_subruns"]
-    
-    if len(history_files) != n_subruns:
+    return base_dir / f"R0G/log/{date_to_dir(date)}"
+
+
+def find_ff_warnings(log_file: Path) -> list:
+    """Return the lines of a lstchain_r0_to_r0g log warning about FF-like events not tagged as FF."""
+    with open(log_file, errors="replace") as file:
+        return [line.rstrip() for line in file if FF_WARNING in line]
+
+
+def scan_gainsel_log_dir(log_dir: Path, scan_ff_warnings: bool = False) -> pd.DataFrame:
+    """
+    Scan once the gain selection log directory of a night and count, for each run,
+    the subruns whose gain selection is pending, finished successfully or failed.
+
+    Only the last line of the non-empty history files is read. The
+    lstchain_r0_to_r0g logs are only streamed looking for FF warnings if
+    `scan_ff_warnings` is True, otherwise the ff_warnings column is 0.
+
+    Parameters
+    ----------
+    log_dir: pathlib.Path
+        Directory with the gain selection history files and logs.
+    scan_ff_warnings: bool
+        Read the lstchain_r0_to_r0g logs and report their FF warnings.
+
+    Returns
+    -------
+    pd.DataFrame
+        Table with the run_id, history_files, pending, success, failed,
+        ff_warnings and closed columns.
+    """
+    runs = {}
+
+    def run_entry(run_id: int) -> dict:
+        return runs.setdefault(
+            run_id,
+            {
+                "run_id": run_id,
+                "history_files": 0,
+                "pending": 0,
+                "success": 0,
+                "failed": 0,
+                "ff_warnings": 0,
+                "closed": False,
+            },
+        )
+
+    if log_dir.is_dir():
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                if match := HISTORY_FILE_PATTERN.fullmatch(entry.name):
+                    run = run_entry(int(match.group(1)))
+                    run["history_files"] += 1
+                    if entry.stat().st_size == 0:
+                        run["pending"] += 1
+                        continue
+
+                    gainsel_rc = read_last_line(Path(entry.path))[-1:]
+                    if gainsel_rc == "1":
+                        log.debug(f"Gain selection failed for run {match.group(1)}.{match.group(2)}")
+                        run["failed"] += 1
+                    elif gainsel_rc == "0":
+                        run["success"] += 1
+
+                elif match := CLOSED_FILE_PATTERN.fullmatch(entry.name):
+                    run_entry(int(match.group(1)))["closed"] = True
+
+                elif scan_ff_warnings and (match := R0G_LOG_PATTERN.fullmatch(entry.name)):
+                    warnings = find_ff_warnings(Path(entry.path))
+                    for line in warnings:
+                        log.warning(f"Warning for run {match.group(1)}: {line}")
+                    run_entry(int(match.group(1)))["ff_warnings"] += len(warnings)
+
+    columns = [column for column in GAINSEL_STATUS_COLUMNS if column != "n_subruns"]
+    return pd.DataFrame(list(runs.values()), columns=columns)
+
+
+def gainsel_status(
+    date: datetime, summary_table: Table = None, scan_ff_warnings: bool = False
+) -> pd.DataFrame:
+    """
+    Return the gain selection status of each DATA run of a given date.
+
+    Parameters
+    ----------
+    date: datetime
+        Date of the start of the night.
+    summary_table: astropy.table.Table, optional
+        Run summary table of the night. It is read if not given.
+    scan_ff_warnings: bool
+        Read the lstchain_r0_to_r0g logs and report their FF warnings.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per DATA run with the columns listed in GAINSEL_STATUS_COLUMNS.
+    """
+    if summary_table is None:
+        summary_table = run_summary_table(date)
+
+    data_runs = summary_table[summary_table["run_type"] == "DATA"]
+    runs = pd.DataFrame(
+        {
+            "run_id": pd.Series(data_runs["run_id"], dtype="int64"),
+            "n_subruns": pd.Series(data_runs["n_subruns"], dtype="int64"),
+        }
+    )
+    scanned = scan_gainsel_log_dir(gainsel_log_dir(date), scan_ff_warnings)
+    status = runs.merge(scanned, on="run_id", how="left")
+
+    counts = ["history_files", "pending", "success", "failed", "ff_warnings"]
+    # Nullable dtypes, so that the runs without logs are filled without downcasting
+    status[counts] = status[counts].astype("Int64").fillna(0).astype(int)
+    status["closed"] = status["closed"].astype("boolean").fillna(False).astype(bool)
+    return status[GAINSEL_STATUS_COLUMNS]
+
+
+def check_gainsel_jobs_runwise(date: datetime, run_status) -> bool:
+    """
+    Check whether all the gain selection jobs of a run finished successfully and,
+    if so, create the corresponding .closed file.
+
+    Parameters
+    ----------
+    date: datetime
+        Date of the start of the night.
+    run_status: pd.Series or namedtuple
+        Row of the table returned by `gainsel_status`.
+    """
+    run_id = run_status.run_id
+
+    if run_status.history_files != run_status.n_subruns:
         log.debug(f"All history files of run {run_id} were not created yet")
         return False
 
-    failed_subruns = []
     log.info(f"Checking all history files of run {run_id}")
-    
-    for file in history_files:
-        match = re.search(f"gain_selection_{run_id:05d}.(\d+).history", str(file))
-        subrun = match.group(1)
-        if file.read_text() != "":
-            gainsel_rc = file.read_text().splitlines()[-1][-1]
-
-            if gainsel_rc == "1":
-                log.warning(f"Gain selection failed for run {run_id}.{subrun}")
-                failed_subruns.append(file)
-
-            elif gainsel_rc == "0":
-                log.debug(f"Gain selection finished successfully for run {run_id}.{subrun}")
-        else:
-            log.info(f"Gain selection is still running for run {run_id}.{subrun}")
-            return False
-            
-    if failed_subruns:
-        log.warning(f"{date_to_iso(date)}: Some gain selection jobs did not finish successfully for run {run_id}")
+
+    if run_status.pending > 0:
+        log.info(f"Gain selection is still running for {run_status.pending} subruns of run {run_id}")
         return False
-    else:
-        log.info(f"{date_to_iso(date)}: All jobs finished successfully for run {run_id}, creating the corresponding .closed file")
-        closed_run_file = log_dir / f"gain_selection_{run_id:05d}.closed"
-        closed_run_file.touch()
-        return True
 
+    if run_status.failed > 0:
+        log.warning(
+            f"{date_to_iso(date)}: {run_status.failed} gain selection jobs did not finish "
+            f"successfully for run {run_id}"
+        )
+        return False
 
-def check_warnings_in_logs(date: datetime, run_id: int):
-    """Look for warnings in the log files created by lstchain_r0_to_r0g."""
-    base_dir = Path(cfg.get("LST1", "BASE"))
-    log_dir = base_dir / f"R0G/log/{date_to_dir(date)}"
-    log_files = log_dir.glob(f"r0_to_r0g_{run_id:05d}.*.log")
-    for file in log_files:
-        content = file.read_text().splitlines()
-        for line in content:
-            if "FlatField(FF)-like events are not tagged as FF" in line:
-                log.warning(f"Warning for run {run_id}: {line}")
+    log.info(f"{date_to_iso(date)}: All jobs finished successfully for run {run_id}, creating the corresponding .closed file")
+    closed_run_file = gainsel_log_dir(date) / f"gain_selection_{run_id:05d}.closed"
+    closed_run_file.touch()
+    return True
 
 
 def check_failed_jobs(date: datetime):
@@ -448,16 +567,14 @@ def check_failed_jobs(date: datetime):
         log.warning(f"No runs are found in the run summary of {date_to_iso(date)}. Nothing to do. Exiting.")
         sys.exit(0)
         
-    data_runs = summary_table[summary_table["run_type"] == "DATA"]
     failed_runs = []
 
-    for run in data_runs:
-        run_id = run["run_id"]
-        check_warnings_in_logs(date, run_id)
-        if not is_closed(date, run_id):
-            if not check_gainsel_jobs_runwise(date, run_id):
-                log.warning(f"Gain selection did not finish successfully for run {run_id}.")
-                failed_runs.append(run)
+    status = gainsel_status(date, summary_table, scan_ff_warnings=True)
+    for run_status in status.itertuples(index=False):
+        if not run_status.closed:
+            if not check_gainsel_jobs_runwise(date, run_status):
+                log.warning(f"Gain selection did not finish successfully for run {run_status.run_id}.")
+                failed_runs.append(run_status.run_id)
 
     if failed_runs:
         log.warning(f"Gain selection did not finish successfully for {date_to_iso(date)}, cannot create the flag file.")
@@ -8,8 +8,8 @@ from astropy.table import Table
 
 from osa.configs import options
 from osa.configs.config import cfg
-from osa.nightsummary.nightsummary import run_summary_table
 from osa.paths import DEFAULT_CFG
+from osa.scripts.gain_selection import gainsel_status
 from osa.scripts.sequencer_webmaker import html_content
 from osa.utils.utils import date_to_dir, date_to_iso
 
@@ -37,50 +37,9 @@ common_parser.add_argument(
 )
 
 
-def check_gainsel_jobs_runwise(date: datetime, run_id: int) -> bool:
+def check_failed_jobs(date: datetime, summary_table: Table = None) -> pd.DataFrame:
     """Search for failed jobs in the log directory."""
-    base_dir = Path(cfg.get("LST1", "BASE"))
-    flat_date = date_to_dir(date)
-    log_dir = base_dir / f"R0G/log/{flat_date}"
-    history_files = log_dir.glob(f"gain_selection_{run_id:05d}.????.history")
-
-    success_subruns = 0
-    failed_subruns = 0
-    pending_subruns = 0
-
-    for file in history_files:
-        if file.read_text() != "":
-            gainsel_rc = file.read_text().splitlines()[-1][-1]
-
-            if gainsel_rc == "1":
-                failed_subruns += 1
-
-            elif gainsel_rc == "0":
-                success_subruns += 1
-
-        else:
-            pending_subruns += 1
-
-    return {"pending": pending_subruns, "success": success_subruns, "failed": failed_subruns}
-
-
-def check_failed_jobs(date: datetime) -> pd.DataFrame:
-    """Search for failed jobs in the log directory."""
-    summary_table = run_summary_table(date)
-    data_runs = summary_table[summary_table["run_type"] == "DATA"]
-
-    gainsel_status_dict = {}
-    for run in data_runs:
-        run_id = run["run_id"]
-        gainsel_job_status = check_gainsel_jobs_runwise(date, run_id)
-        gainsel_status_dict[run_id] = gainsel_job_status
-
-    gainsel_df = pd.DataFrame(gainsel_status_dict.values(), index=gainsel_status_dict.keys())
-    gainsel_df.reset_index(inplace=True)
-    gainsel_df.rename(columns={"index": "run_id"}, inplace=True)
-    summary_table = summary_table.to_pandas()
-
-    final_table = pd.merge(summary_table, gainsel_df, on="run_id")[
+    final_table = gainsel_status(date, summary_table)[
         [
             "run_id",
             "n_subruns",
@@ -88,7 +47,7 @@ def check_failed_jobs(date: datetime) -> pd.DataFrame:
             "success",
             "failed",
         ]
-    ]
+    ].copy()
 
     def determine_status(row):
         if row["failed"] > 0:
@@ -139,18 +98,20 @@ def main():
     gain_selection_web_directory.mkdir(parents=True, exist_ok=True)
     html_file = gain_selection_web_directory / f"osa_gainsel_status_{date}.html"
 
+    summary_table = Table.read(run_summary_file) if run_summary_file.is_file() else None
+
     # Create and save the HTML file
-    if not run_summary_file.is_file() or len(Table.read(run_summary_file)["run_id"]) == 0:
+    if summary_table is None or len(summary_table["run_id"]) == 0:
         content = "<p>No data found</p>"
         log.warning(f"No data found for date {date}, creating an empty HTML file.")
 
-    elif len(Table.read(run_summary_file)[Table.read(run_summary_file)["run_type"] == "DATA"]) == 0:
+    elif len(summary_table[summary_table["run_type"] == "DATA"]) == 0:
         content = "<p>Only calibration events were taken</p>"
         log.warning(f"No DATA runs for date {date}, creating an empty HTML file.")
 
     else:
         # Get the table with the gain selection check report in HTML format:
-        table_gain_selection_jobs = check_failed_jobs(options.date)
+        table_gain_selection_jobs = check_failed_jobs(options.date, summary_table)
         content = table_gain_selection_jobs.to_html(justify="left")
 
     html_file.write_text(html_content(content, "", date, "OSA Gain Selection"))
@@ -8,10 +8,11 @@ This script:
 - Preserves Crab runs
 - Removes interleaved data for non-Crab sources
 - Generates a bash script with rm commands (does NOT delete automatically) in OSA/interleaved_cleanup_sh
+- Reports the bytes that would be reclaimed per night and source
 
 Usage:
 ------
-python interleaved_date.py YYYYMMDD -c config.cfg
+python interleaved_date.py YYYYMMDD -c config.cfg [--max-months N]
 
 Example:
 --------
@@ -29,10 +30,12 @@ OSA_DIR=%(BASE)s/OSA
 """
 
 import os
+import re
 import sys
 import csv
-import glob
+import argparse
 import configparser
+from collections import defaultdict
 from pathlib import Path
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
@@ -43,8 +46,14 @@ __all__ = [
     "summary_dates",
     "info_dates",
     "find_interleaved",
+    "run_source_table",
+    "scan_interleaved_files",
+    "plan_cleanup",
+    "write_plan",
 ]
 
+INTERLEAVED_FILE = re.compile(r"interleaved_LST-1\.Run(\d{5})\.\d{4}\.h5")
+
 
 
 
@@ -91,8 +100,28 @@ def load_config(cfg_file):
 
 
 
-def find_interleaved(target_date_str, data_dir):
-    """Find interleaved directories within the last month."""
+def _scan_interleaved_dirs(path):
+    """
+    Yield the interleaved directories below path, without descending into them.
+
+    As with os.walk, symlinks to directories are not followed, but an
+    interleaved directory is yielded even if it is a symlink.
+    """
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return
+
+    for entry in entries:
+        if entry.name == "interleaved":
+            if entry.is_dir():
+                yield entry.path
+        elif entry.is_dir(follow_symlinks=False):
+            yield from _scan_interleaved_dirs(entry.path)
+
+
+def find_interleaved(target_date_str, data_dir, max_months=1):
+    """Find interleaved directories within the last `max_months` months."""
     try:
         target_date = datetime.strptime(target_date_str, "%Y%m%d").date()
     except ValueError:
@@ -105,27 +134,29 @@ def find_interleaved(target_date_str, data_dir):
     if not os.path.isdir(data_dir):
         return interleaved_paths, interleaved_dates
 
-    for date_dir in sorted(os.listdir(data_dir)):
-        date_path = os.path.join(data_dir, date_dir)
-
-        if not os.path.isdir(date_path):
-            continue
+    start_date = target_date - relativedelta(months=max_months)
 
-        if not (len(date_dir) == 8 and date_dir.isdigit()):
-            continue
+    with os.scandir(data_dir) as entries:
+        date_dirs = sorted(
+            (
+                entry for entry in entries
+                if entry.is_dir() and len(entry.name) == 8 and entry.name.isdigit()
+            ),
+            key=lambda entry: entry.name,
+        )
 
+    for date_entry in date_dirs:
         try:
-            date_obj = datetime.strptime(date_dir, "%Y%m%d").date()
+            date_obj = datetime.strptime(date_entry.name, "%Y%m%d").date()
         except ValueError:
             continue
 
-        if date_obj > target_date or date_obj < (target_date - relativedelta(months=1)):
+        if date_obj > target_date or date_obj < start_date:
             continue
 
-        for root, dirs, _ in os.walk(date_path):
-            if "interleaved" in dirs:
-                interleaved_paths.append(os.path.join(root, "interleaved"))
-                interleaved_dates.append(date_dir)
+        for path in sorted(_scan_interleaved_dirs(date_entry.path)):
+            interleaved_paths.append(path)
+            interleaved_dates.append(date_entry.name)
 
     return interleaved_paths, interleaved_dates
 
@@ -187,88 +218,176 @@ def info_dates(date, catalog_dir, runs_id):
     return entry
 
 
+def run_source_table(dates, summary_dir, catalog_dir):
+    """
+    Build the run -> source table of the DATA runs of the given nights,
+    reading each RunSummary and RunCatalog only once.
 
+    Returns
+    -------
+    dict
+        For each night, the source of each DATA run, None if the run
+        is not in the RunCatalog. Nights without runs are not included.
+    """
+    table = {}
+    for date in dict.fromkeys(dates):
+        summary = summary_dates(date, summary_dir)
+        if not summary["run_id"]:
+            continue
 
-if __name__ == "__main__":
+        data_runs = [
+            run_id for run_id, run_type in zip(summary["run_id"], summary["run_type"])
+            if run_type == "DATA"
+        ]
+        sources = dict.fromkeys(data_runs)
+
+        filepath = os.path.join(catalog_dir, f"RunCatalog_{date}.ecsv")
+        if os.path.isfile(filepath):
+            with open(filepath, "r") as f:
+                for row in csv.reader(f):
+                    if len(row) < 2 or row[0].startswith("#"):
+                        continue
+                    try:
+                        run_id = int(row[0])
+                    except ValueError:
+                        continue
+                    if run_id in sources:
+                        sources[run_id] = row[1]
+
+        table[date] = sources
+
+    return table
+
+
+def scan_interleaved_files(path):
+    """
+    List the interleaved files of a directory with a single scandir.
+
+    Returns
+    -------
+    dict
+        Total size in bytes of the files of each run. Symlinks count as 0 bytes.
+    """
+    sizes = defaultdict(int)
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                match = INTERLEAVED_FILE.fullmatch(entry.name)
+                if match:
+                    size = 0 if entry.is_symlink() else entry.stat().st_size
+                    sizes[int(match.group(1))] += size
+    except OSError:
+        pass
+    return dict(sizes)
+
+
+def plan_cleanup(found_paths, found_dates, dl1_dir, analysis_dir, sources):
+    """
+    Plan the removal of the interleaved files of the runs not pointing to the Crab.
+
+    Parameters
+    ----------
+    found_paths, found_dates: list
+        Interleaved directories and their nights, as returned by `find_interleaved`.
+    dl1_dir, analysis_dir: str
+        The interleaved directories of analysis_dir mirror those of dl1_dir.
+    sources: dict
+        Run -> source table of each night, as returned by `run_source_table`.
+
+    Returns
+    -------
+    commands: list
+        rm commands of the cleanup script.
+    reclaimed: dict
+        Bytes reclaimed per (night, source).
+    """
+    commands = []
+    reclaimed = defaultdict(int)
+
+    for path, date in zip(found_paths, found_dates):
+        night = sources.get(date)
+        if not night:
+            continue
 
-    if len(sys.argv) < 4:
-        print("Use: python interleaved_date.py YYYYMMDD -c config.cfg")
-        sys.exit(1)
+        crab = [run_id for run_id, source in night.items() if source and "crab" in source.lower()]
+        other_source = [
+            run_id for run_id, source in night.items() if source and "crab" not in source.lower()
+        ]
+        if not other_source:
+            continue
 
-    date_arg = sys.argv[1]
+        link_path = path.replace(dl1_dir, analysis_dir)
+        files = scan_interleaved_files(path)
+        links = scan_interleaved_files(link_path)
 
-    cfg_file = None
-    for i, arg in enumerate(sys.argv):
-        if arg == "-c":
-            if i + 1 >= len(sys.argv):
-                print("Config file not provided")
-                sys.exit(1)
-            cfg_file = sys.argv[i + 1]
-            break
+        if not crab and len(crab) + len(other_source) == len(night):
+            filename = "interleaved_LST-1.Run*.h5"
+            commands.append(f'rm -f -- "{link_path}"/{filename}\n')
+            commands.append(f'rm -rf -- "{path}"\n')
+            for run_id, size in files.items():
+                reclaimed[(date, night.get(run_id) or "unknown")] += size
 
-    if cfg_file is None:
-        print("Config file not provided")
-        sys.exit(1)
+        else:
+            for runid in other_source:
+                if runid in files or runid in links:
+                    filename = f"interleaved_LST-1.Run{runid:05d}.*.h5"
+                    commands.append(f'rm -f -- "{path}"/{filename}\n')
+                    commands.append(f'rm -f -- "{link_path}"/{filename}\n')
+                    reclaimed[(date, night[runid])] += files.get(runid, 0)
+
+    return commands, dict(reclaimed)
+
+
+def write_plan(recordfile, commands, reclaimed):
+    """Write the cleanup script in a single buffered write, with the space reclaimed as comments."""
+    report = [
+        f"# {date} {source}: {size / 1e9:.2f} GB\n"
+        for (date, source), size in sorted(reclaimed.items())
+    ]
+    total = sum(reclaimed.values())
+    report.append(f"# Total to be reclaimed: {total / 1e9:.2f} GB\n")
 
-    dl1_dir, summary_dir, catalog_dir, osa_dir, analysis_dir = load_config(cfg_file)
+    with open(recordfile, "w") as file:
+        file.write("".join(["#!/bin/bash\n", *commands, *report]))
+
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a script removing the interleaved DL1 files of non-Crab runs."
+    )
+    parser.add_argument("date", help="Last night of the window (YYYYMMDD)")
+    parser.add_argument("-c", "--config", required=True, help="Config file")
+    parser.add_argument(
+        "--max-months",
+        type=int,
+        default=1,
+        help="Number of months before the date to consider (default: 1)",
+    )
+    args = parser.parse_args()
+
+    dl1_dir, summary_dir, catalog_dir, osa_dir, analysis_dir = load_config(args.config)
     try:
-        datetime.strptime(date_arg, "%Y%m%d")
+        datetime.strptime(args.date, "%Y%m%d")
     except ValueError:
         print("Invalid format. Use YYYYMMDD")
         sys.exit(1)
 
     output_dir = os.path.join(osa_dir, "interleaved_cleanup_sh")
     os.makedirs(output_dir, exist_ok=True)
-    month = date_arg[:6]
+    month = args.date[:6]
     recordfile = os.path.join(output_dir, f"entries_rm_{month}.sh")
 
-    with open(recordfile, "w") as file:
-        file.write("#!/bin/bash\n")
-
-    found_paths, found_dates = find_interleaved(date_arg, dl1_dir)
-
-
-    new_paths = [
-        p.replace(dl1_dir, analysis_dir)
-        for p in found_paths
-    ]
-
-    for path, link_path, date in zip(found_paths, new_paths, found_dates):
-
-        summary = summary_dates(date, summary_dir)
-
-        if not summary["run_id"]:
-            continue
-
-        data_runs = [
-            run_id for run_id, run_type in zip(summary["run_id"], summary["run_type"])
-            if run_type == "DATA"
-        ]
-
-        entry = info_dates(date, catalog_dir, data_runs)
-
-        if not entry["other_source"]:
-            continue
+    found_paths, found_dates = find_interleaved(args.date, dl1_dir, args.max_months)
+    sources = run_source_table(found_dates, summary_dir, catalog_dir)
+    commands, reclaimed = plan_cleanup(found_paths, found_dates, dl1_dir, analysis_dir, sources)
+    total = write_plan(recordfile, commands, reclaimed)
 
-        found_dataruns = sorted(entry["crab"] + entry["other_source"])
+    for (date, source), size in sorted(reclaimed.items()):
+        print(f"{date} {source}: {size / 1e9:.2f} GB")
+    print(f"{len(commands)} rm commands written to {recordfile}, {total / 1e9:.2f} GB to be reclaimed")
 
-        if not entry["crab"] and len(found_dataruns) == len(data_runs):
 
-            filename = "interleaved_LST-1.Run*.h5"
-
-            with open(recordfile, "a") as file:
-                file.write(f'rm -f -- "{link_path}"/{filename}\n')
-                file.write(f'rm -rf -- "{path}"\n')
-
-        else:
-            for runid in entry["other_source"]:
-                run_str = f"{runid:05d}"
-                filename = f"interleaved_LST-1.Run{run_str}.*.h5"
-
-                filepath = os.path.join(path, filename)
-                link_filepath = os.path.join(link_path, filename)
-
-                if glob.glob(filepath) or glob.glob(link_filepath):
-                    with open(recordfile, "a") as file:
-                        file.write(f'rm -f -- "{path}"/{filename}\n')
-                        file.write(f'rm -f -- "{link_path}"/{filename}\n')
+if __name__ == "__main__":
+    main()
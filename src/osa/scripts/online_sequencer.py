@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""
+Online sequencer that submits the job of every subrun of the DATA runs as soon
+as its R0 files are closed, instead of waiting for the end of the night.
+
+The runs whose subruns were all submitted are recorded in the OSA database
+(see osa.streaming), so that the sequencer run afterward only reports them.
+"""
+
+import logging
+import time
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.nightsummary.nightsummary import get_run_summary_file
+from osa.paths import analysis_path
+from osa.raw import get_raw_dir
+from osa.report import start
+from osa.scripts.sequencer import report_sequences, update_job_info, update_sequence_status
+from osa.streaming import OnlineSequencer, latency_summary
+from osa.utils.cliopts import online_sequencer_cli_parsing
+from osa.utils.jit_cache import prewarm_numba_cache
+from osa.utils.logging import myLogger
+from osa.utils.utils import date_to_iso, gettag
+from osa.veto import get_closed_list, get_veto_list, record_sequence_states, sequence_state_index
+
+__all__ = ["online_process", "report_online_sequences"]
+
+log = myLogger(logging.getLogger())
+
+
+def main():
+    """Watch the R0 files of the night and submit the job of each subrun once written."""
+    opts = online_sequencer_cli_parsing()
+
+    if options.verbose:
+        log.setLevel(logging.DEBUG)
+    else:
+        log.setLevel(logging.INFO)
+
+    start(gettag())
+    online_process(opts.watcher, opts.idle_timeout)
+
+
+def online_process(watcher: str = None, idle_timeout: float = None) -> OnlineSequencer:
+    """
+    Submit the jobs of the subruns of the night as their R0 files are closed.
+
+    Parameters
+    ----------
+    watcher: str, optional
+        "inotify", "polling" or "auto". By default, WATCHER of the [ONLINE] section.
+    idle_timeout: float, optional
+        Seconds without new R0 files after which to stop. By default, IDLE_TIMEOUT
+        of the [ONLINE] section.
+    """
+    options.directory = analysis_path(options.tel_id)
+    options.log_directory = options.directory / "log"
+    if not options.simulate:
+        options.log_directory.mkdir(parents=True, exist_ok=True)
+
+    watcher = cfg.get("ONLINE", "WATCHER") if watcher is None else watcher
+    if idle_timeout is None:
+        idle_timeout = cfg.getfloat("ONLINE", "IDLE_TIMEOUT")
+    poll_interval = cfg.getfloat("ONLINE", "POLL_INTERVAL")
+
+    # The R0 directory of the night is created when the data taking starts
+    raw_dir = get_raw_dir(options.date)
+    waiting_since = time.time()
+    while not raw_dir.exists():
+        if time.time() - waiting_since >= idle_timeout:
+            log.warning(f"No R0 directory {raw_dir} for {date_to_iso(options.date)}")
+            return None
+        time.sleep(poll_interval)
+
+    if not options.test and not options.simulate:
+        # Compile the numba kernels once per night instead of in every job
+        prewarm_numba_cache()
+
+    sequencer = OnlineSequencer(
+        raw_dir,
+        get_run_summary_file(options.date),
+        poll_interval=poll_interval,
+        settle_time=cfg.getfloat("ONLINE", "SETTLE_TIME"),
+        n_streams=cfg.getint("ONLINE", "N_STREAMS"),
+        watcher=watcher,
+        summary_interval=cfg.getfloat("ONLINE", "SUMMARY_INTERVAL"),
+    )
+    log.info(f"Watching {raw_dir} with {type(sequencer.watcher).__name__}")
+    sequencer.run(idle_timeout)
+
+    report_online_sequences(sequencer)
+    return sequencer
+
+
+def report_online_sequences(sequencer: OnlineSequencer):
+    """Report the streamed sequences as the sequencer does, and the latency of their DL1."""
+    sequence_list = list(sequencer.sequences.values())
+    if sequencer.calibration is not None:
+        sequence_list.insert(0, sequencer.calibration)
+    if not sequence_list:
+        log.info("No DATA runs streamed")
+        return
+
+    update_job_info(sequence_list)
+    states = sequence_state_index()
+    get_veto_list(sequence_list, states)
+    get_closed_list(sequence_list, states)
+    record_sequence_states(states)
+    update_sequence_status(sequence_list)
+    report_sequences(sequence_list)
+
+    latency = latency_summary(sequencer.subruns.values())
+    if latency["n"]:
+        log.info(
+            f"DL1 of {latency['n']} of {len(sequencer.subruns)} subruns ready, latency from the "
+            f"closing of the R0 files: median {latency['median']:.0f} s, "
+            f"90% {latency['p90']:.0f} s, max {latency['max']:.0f} s"
+        )
+    else:
+        log.info(f"{len(sequencer.subruns)} subruns submitted, no DL1 file ready yet")
+
+
+if __name__ == "__main__":
+    main()
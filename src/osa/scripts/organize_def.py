@@ -3,7 +3,26 @@ import tarfile
 import argparse
 import configparser
 import datetime
+import gzip
+import io
+import os
 import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from osa.utils import logarchive
+
+# Size of the independent gzip members compressed in parallel
+CHUNK_SIZE = 4 * 1024 * 1024
+# Frames are closed at the first file boundary after this size
+FRAME_SIZE = 256 * 1024
+# Files up to this size are read ahead concurrently, larger ones are streamed
+SMALL_FILE_SIZE = 1024 * 1024
+# Number of small files read ahead at a time
+BATCH_SIZE = 256
+COMPRESS_LEVEL = 6
+DEFAULT_THREADS = min(8, os.cpu_count() or 1)
 
 
 def clean_path(raw_path, base):
@@ -77,10 +96,192 @@ def make_timestamp():
     return datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
 
 
+# =========================
+# COMPRESSION ENGINE
+# =========================
+class ParallelGzipWriter:
+    """
+    Write-only file object compressing the data in independent gzip members
+    (frames) with a pool of threads, in the same way as pigz. The concatenation
+    of the frames is a valid gzip file that tarfile and gunzip can read, and
+    the position of each frame is kept to build the index of the archive.
+    """
+
+    def __init__(self, fileobj, executor, threads, level=COMPRESS_LEVEL, chunk_size=CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.executor = executor
+        self.level = level
+        self.chunk_size = chunk_size
+        self.max_pending = 2 * threads
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.position = 0
+        self.frame_start = 0
+        self.compressed_position = 0
+        self.frames = []
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.chunk_size:
+            self._submit(bytes(self.buffer[: self.chunk_size]))
+            del self.buffer[: self.chunk_size]
+        return len(data)
+
+    def end_frame(self, min_size=0):
+        """Compress the buffered data as a frame if it holds at least min_size bytes."""
+        if self.buffer and len(self.buffer) >= min_size:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+
+    def _submit(self, chunk):
+        future = self.executor.submit(gzip.compress, chunk, self.level, mtime=0)
+        self.pending.append((self.frame_start, len(chunk), future))
+        self.frame_start += len(chunk)
+        # Write the frames in order, keeping a bounded number of chunks in memory
+        while len(self.pending) > self.max_pending:
+            self._write_frame()
+
+    def _write_frame(self):
+        start, size, future = self.pending.popleft()
+        compressed = future.result()
+        self.fileobj.write(compressed)
+        self.frames.append([start, size, self.compressed_position, len(compressed)])
+        self.compressed_position += len(compressed)
+
+    def close(self):
+        self.end_frame()
+        while self.pending:
+            self._write_frame()
+
+
+def _add_files(tar, writer, files, executor):
+    """
+    Add the files to the tar archive, reading the small ones ahead in
+    concurrent batches, and return the offset of the data of each member
+    in the uncompressed stream and its size.
+    """
+    members = {}
+    for start in range(0, len(files), BATCH_SIZE):
+        batch = files[start:start + BATCH_SIZE]
+        infos = [tar.gettarinfo(f, arcname=f.name) for f in batch]
+        small = [f for f, info in zip(batch, infos) if info.size <= SMALL_FILE_SIZE]
+        contents = dict(zip(small, executor.map(lambda f: f.read_bytes(), small)))
+
+        for f, info in zip(batch, infos):
+            if f in contents:
+                info.size = len(contents[f])
+                tar.addfile(info, io.BytesIO(contents[f]))
+            else:
+                with open(f, "rb") as handle:
+                    tar.addfile(info, handle)
+
+            padded_size = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            members[info.name] = [tar.offset - padded_size, info.size]
+            # Start frames at file boundaries, so that a log spans as few frames as possible
+            writer.end_frame(FRAME_SIZE)
+
+    return members
+
+
+def verify_archive(tar_path, expected):
+    """
+    Decompress the whole archive, so that the CRC of every gzip member is
+    checked, and compare its members with the expected names and sizes.
+    """
+    try:
+        with gzip.open(tar_path) as gz:
+            with tarfile.open(fileobj=gz, mode="r|") as tar:
+                members = {member.name: member.size for member in tar}
+            while gz.read(CHUNK_SIZE):
+                pass
+    except (OSError, EOFError, tarfile.TarError) as error:
+        print(f"[VERIFY] {tar_path.name} is corrupted: {error}")
+        return False
+
+    return members == expected
+
+
+def archive_files(files, tar_path, label, threads=DEFAULT_THREADS):
+    """
+    Stream the files into an indexed tar.gz archive compressed in parallel,
+    verify it and only then delete the original files.
+
+    Returns
+    -------
+    dict
+        Number of files, input and archive sizes in bytes and elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    part_path = tar_path.with_name(f"{tar_path.name}.part")
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        with open(part_path, "wb") as raw:
+            writer = ParallelGzipWriter(raw, executor, threads)
+            with tarfile.open(fileobj=writer, mode="w") as tar:
+                members = _add_files(tar, writer, files, executor)
+            writer.close()
+
+        expected = {f.name: f.stat().st_size for f in files}
+        indexed = {name: size for name, (_, size) in members.items()}
+        if indexed != expected or not verify_archive(part_path, expected):
+            part_path.unlink()
+            raise RuntimeError(f"[{label}] Verification of {tar_path.name} failed, files kept")
+
+        part_path.replace(tar_path)
+        logarchive.write_index(tar_path, writer.frames, members)
+        list(executor.map(pathlib.Path.unlink, files))
+
+    stats = {
+        "files": len(files),
+        "input_bytes": sum(expected.values()),
+        "archive_bytes": tar_path.stat().st_size,
+        "seconds": time.perf_counter() - start,
+    }
+    report_stats(label, stats)
+    return stats
+
+
+def report_stats(label, stats):
+    input_mb = stats["input_bytes"] / 1e6
+    archive_mb = stats["archive_bytes"] / 1e6
+    ratio = stats["input_bytes"] / stats["archive_bytes"] if stats["archive_bytes"] else 0
+    throughput = input_mb / stats["seconds"] if stats["seconds"] else float("inf")
+    print(
+        f"[{label}] {stats['files']} files, {input_mb:.1f} MB -> {archive_mb:.1f} MB "
+        f"(ratio {ratio:.1f}, {throughput:.1f} MB/s)"
+    )
+
+
+def archive_groups(groups, simulate, threads=DEFAULT_THREADS):
+    """
+    Archive concurrently several groups of files given as (label, files, tar_path)
+    and return whether there was any file to archive.
+    """
+    groups = [(label, files, tar_path) for label, files, tar_path in groups if files]
+
+    for label, files, tar_path in groups:
+        print(f"[COMPRESS] {label.lower()} → {tar_path.name}")
+
+    if not simulate and groups:
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(archive_files, files, tar_path, label, threads)
+                for label, files, tar_path in groups
+            ]
+            for future in futures:
+                future.result()
+
+    return bool(groups)
+
+
 # =========================
 # LOGS
 # =========================
-def compress_logs(base_path, simulate):
+def compress_logs(base_path, simulate, threads=DEFAULT_THREADS):
     log_path = base_path / "log"
 
     if not log_path.exists():
@@ -98,35 +299,17 @@ def compress_logs(base_path, simulate):
     print(f"[LOG] {len(err_files)} err files")
     print(f"[LOG] {len(out_files)} out files")
 
-    did_work = False
-
-    if err_files:
-        did_work = True
-        print(f"[COMPRESS] err → {err_tar.name}")
-        if not simulate:
-            with tarfile.open(err_tar, "w:gz") as tar:
-                for f in err_files:
-                    tar.add(f, arcname=f.name)
-            for f in err_files:
-                f.unlink()
-
-    if out_files:
-        did_work = True
-        print(f"[COMPRESS] out → {out_tar.name}")
-        if not simulate:
-            with tarfile.open(out_tar, "w:gz") as tar:
-                for f in out_files:
-                    tar.add(f, arcname=f.name)
-            for f in out_files:
-                f.unlink()
-
-    return did_work
+    return archive_groups(
+        [("ERR", err_files, err_tar), ("OUT", out_files, out_tar)],
+        simulate,
+        threads,
+    )
 
 
 # =========================
 # HISTORY
 # =========================
-def compress_history(base_path, simulate):
+def compress_history(base_path, simulate, threads=DEFAULT_THREADS):
     files = list(base_path.glob("*.history"))
 
     if not files:
@@ -137,17 +320,8 @@ def compress_history(base_path, simulate):
     tar_name = base_path / f"all_history_{timestamp}.tar.gz"
 
     print(f"[HISTORY] {len(files)} files")
-    print(f"[COMPRESS] history → {tar_name.name}")
-
-    if not simulate:
-        with tarfile.open(tar_name, "w:gz") as tar:
-            for f in files:
-                tar.add(f, arcname=f.name)
-
-        for f in files:
-            f.unlink()
 
-    return True
+    return archive_groups([("HISTORY", files, tar_name)], simulate, threads)
 
 
 # =========================
@@ -167,7 +341,7 @@ def _is_stable_gainsel_log(log_file):
     return modified_utc < today_utc
 
 
-def compress_gainsel(path, simulate):
+def compress_gainsel(path, simulate, threads=DEFAULT_THREADS):
     if not path.exists():
         raise RuntimeError("[GAINSEL] Path not found")
 
@@ -189,29 +363,11 @@ def compress_gainsel(path, simulate):
     print(f"[GAINSEL] {len(check_logs)} check logs")
     print(f"[GAINSEL] {len(normal_logs)} normal logs")
 
-    did_work = False
-
-    if check_logs:
-        did_work = True
-        print(f"[COMPRESS] check → {check_tar.name}")
-        if not simulate:
-            with tarfile.open(check_tar, "w:gz") as tar:
-                for f in check_logs:
-                    tar.add(f, arcname=f.name)
-            for f in check_logs:
-                f.unlink()
-
-    if normal_logs:
-        did_work = True
-        print(f"[COMPRESS] normal → {normal_tar.name}")
-        if not simulate:
-            with tarfile.open(normal_tar, "w:gz") as tar:
-                for f in normal_logs:
-                    tar.add(f, arcname=f.name)
-            for f in normal_logs:
-                f.unlink()
-
-    return did_work
+    return archive_groups(
+        [("CHECK", check_logs, check_tar), ("NORMAL", normal_logs, normal_tar)],
+        simulate,
+        threads,
+    )
 
 
 # =========================
@@ -224,6 +380,13 @@ def main():
     parser.add_argument("-s", "--simulate", action="store_true")
     parser.add_argument("--no-gainsel", action="store_true")
     parser.add_argument("--no-running", action="store_true")
+    parser.add_argument(
+        "-j",
+        "--threads",
+        type=int,
+        default=DEFAULT_THREADS,
+        help="Number of compression threads per archive",
+    )
 
     args = parser.parse_args()
 
@@ -245,7 +408,7 @@ def main():
 
     running_path, gainsel_path, prod_id = load_config(args.config)
 
-    did_any_work = False
+    tasks = []
 
     # RUNNING ANALYSIS
     if not args.no_running:
@@ -260,18 +423,22 @@ def main():
                 raise RuntimeError(f"Version path not found: {version_path}")
 
             print("\nRunning Analysis")
-
-            if compress_logs(version_path, args.simulate):
-                did_any_work = True
-
-            if compress_history(version_path, args.simulate):
-                did_any_work = True
+            tasks.append((compress_logs, version_path))
+            tasks.append((compress_history, version_path))
 
     # GAINSEL
     if not args.no_gainsel:
         print("\nGain Selection")
-        if compress_gainsel(gainsel_path, args.simulate):
-            did_any_work = True
+        tasks.append((compress_gainsel, gainsel_path))
+
+    # The different log categories are compressed concurrently
+    did_any_work = False
+    if tasks:
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = [
+                executor.submit(task, path, args.simulate, args.threads) for task, path in tasks
+            ]
+            did_any_work = any([future.result() for future in futures])
 
     # FINAL STATUS
     if not did_any_work:
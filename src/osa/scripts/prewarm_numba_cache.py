@@ -0,0 +1,61 @@
+"""
+Warm up the persistent numba cache shared by the sequence jobs.
+
+The kernels are compiled on the node running this command, so it should be
+run on a node with the same CPU architecture as those of the jobs.
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+import click
+
+from osa.configs.config import DEFAULT_CFG
+from osa.utils.jit_cache import (
+    is_cache_warm,
+    jit_cache_key,
+    numba_cache_dir,
+    prewarm_numba_cache,
+)
+from osa.utils.logging import myLogger
+
+log = myLogger(logging.getLogger())
+
+
+@click.command()
+@click.option("--force", is_flag=True, help="Warm up the cache even if it is already warm")
+@click.option("--command", help="Command compiling the kernels [default: NUMBA_WARMUP_COMMAND]")
+@click.option(
+    "-c",
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    default=DEFAULT_CFG,
+    help="Path to the OSA config file.",
+)
+@click.option("-v", "--verbose", is_flag=True, help="Turn on verbose mode")
+def main(
+    force: bool = False,
+    command: str = None,
+    config: Path = DEFAULT_CFG,
+    verbose: bool = False,
+):
+    """Warm up the persistent numba cache of the current lstchain and numba versions."""
+    log.setLevel(logging.DEBUG if verbose else logging.INFO)
+
+    cache_dir = numba_cache_dir()
+    if cache_dir is None:
+        log.warning("No NUMBA_CACHE_DIR in the [CACHE] section of the config, nothing to do")
+        return
+
+    log.info(f"numba cache of {jit_cache_key()}: {cache_dir}")
+    if is_cache_warm(cache_dir) and not force:
+        log.info("The cache is already warm")
+        return
+
+    if not prewarm_numba_cache(cache_dir, command=command, force=force):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,50 @@
-"""Script to reprocess all daily longterm files found under a given production."""
+"""Script to reprocess all daily longterm files found under a given production.
 
+The dates found in the configured LONGTERM_DIR are submitted as a single
+throttled SLURM job array. The status of each night is kept in a manifest
+file, so that relaunching the script only resubmits the nights which are
+missing or failed.
+"""
+
+import json
 import logging
+import shlex
 import subprocess as sp
+from datetime import datetime
 from pathlib import Path
 
 import click
 
+from osa.configs.config import DEFAULT_CFG, cfg
 from osa.utils.logging import myLogger
+from osa.utils.utils import stringify
 
-ANALYSIS_PATH = Path("/fefs/aswg/data/real")
-DATACHECK_PATH = ANALYSIS_PATH / "DL1/datacheck_files"
-LONGTERM_PATH = DATACHECK_PATH / "night_wise"
-
+__all__ = [
+    "longterm_cmd",
+    "batch_cmd_longterm_array",
+    "load_manifest",
+    "save_manifest",
+    "parse_array_states",
+    "parse_array_end_times",
+    "refresh_manifest",
+    "dates_to_submit",
+    "throughput",
+]
 
 log = myLogger(logging.getLogger())
 
+FAILED_STATES = {"FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL", "BOOT_FAIL"}
+
+
+def longterm_output_file(date: str, new_prod_id: str) -> Path:
+    """Return the path of the daily longterm file of a given date."""
+    longterm_dir = Path(cfg.get("LST1", "LONGTERM_DIR"))
+    return longterm_dir / new_prod_id / date / f"DL1_datacheck_{date}.h5"
 
-def run_longterm(date: str, prod_id: str, new_prod_id: str, log_dir: Path):
+
+def longterm_cmd(date: str, prod_id: str, new_prod_id: str) -> list:
     """
-    Run the longterm script for a given date.
+    Build the longterm command for a given date.
 
     Parameters
     ----------
@@ -28,46 +54,250 @@ def run_longterm(date: str, prod_id: str, new_prod_id: str, log_dir: Path):
         Production ID to reprocess.
     new_prod_id : str
         New production ID to reprocess.
-    log_dir : Path
-        Path to the directory where job logs will be stored.
     """
-    dl1_dir = DATACHECK_PATH / date
-    muons_dir = ANALYSIS_PATH / "DL1" / date / prod_id / "muons"
-    new_longterm_dir = LONGTERM_PATH / new_prod_id / date
-    longterm_output_file = new_longterm_dir / f"DL1_datacheck_{date}.h5"
-
-    log_file = log_dir / f"daily_check_{date}_%j.log"
+    datacheck_dir = Path(cfg.get("LST1", "DATACHECK_DIR")) / date
+    muons_dir = Path(cfg.get("LST1", "DL1_DIR")) / date / prod_id / "muons"
 
-    cmd = [
-        "sbatch",
-        "-o",
-        str(log_file),
+    return [
         "lstchain_longterm_dl1_check",
-        f"--input-dir={dl1_dir}",
-        f"--output-file={longterm_output_file}",
+        f"--input-dir={datacheck_dir}",
+        f"--output-file={longterm_output_file(date, new_prod_id)}",
         f"--muons-dir={muons_dir}",
         "--batch",
     ]
 
-    sp.run(cmd)
-    log.info(f"Executing {' '.join(cmd)}")
+
+def batch_cmd_longterm_array(task_file: Path, n_tasks: int, max_running: int, log_dir: Path):
+    """
+    Build the sbatch command to run the lines of the task file as a job array
+    with at most `max_running` tasks running at the same time.
+    """
+    return [
+        "sbatch",
+        "--parsable",
+        "--job-name=longterm_reprocessing",
+        f"--account={cfg.get('SLURM', 'ACCOUNT')}",
+        f"--array=0-{n_tasks - 1}%{max_running}",
+        "-o",
+        str(log_dir / "daily_check_%A_%a.log"),
+        "--wrap",
+        f'eval "$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {task_file})"',
+    ]
+
+
+def load_manifest(manifest_file: Path) -> dict:
+    """Load the reprocessing manifest, which maps each date to its processing status."""
+    if not manifest_file.exists():
+        return {}
+    return json.loads(manifest_file.read_text())
+
+
+def save_manifest(manifest_file: Path, manifest: dict) -> None:
+    """Atomically write the reprocessing manifest."""
+    tmp_file = manifest_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp_file.replace(manifest_file)
+
+
+def parse_array_states(sacct_output: str) -> dict:
+    """
+    Parse the sacct output (JobID|State) of job arrays.
+
+    Returns
+    -------
+    states: dict
+        State of each array task, keyed by its job ID (e.g. '1234_5').
+    """
+    states = {}
+    for line in sacct_output.splitlines():
+        try:
+            job_id, state = line.strip().split("|")[:2]
+        except ValueError:
+            continue
+        # Keep e.g. 'CANCELLED' from 'CANCELLED by 1234'
+        states[job_id] = state.split()[0] if state else state
+    return states
+
+
+def parse_array_end_times(sacct_output: str) -> dict:
+    """
+    Parse the sacct output (JobID|State|End) of job arrays.
+
+    Returns
+    -------
+    end_times: dict
+        End time of each finished array task in ISO format, keyed by its job ID.
+    """
+    end_times = {}
+    for line in sacct_output.splitlines():
+        try:
+            job_id, _, end = line.strip().split("|")[:3]
+            datetime.fromisoformat(end)
+        except ValueError:
+            # Not finished yet ('Unknown') or not a job line
+            continue
+        end_times[job_id] = end
+    return end_times
+
+
+def get_array_accounting(array_ids: set) -> str:
+    """Return the sacct output (JobID|State|End) of the tasks of the given job arrays."""
+    if not array_ids:
+        return ""
+
+    cmd = [
+        "sacct", "-n", "-X", "--parsable2", "-o", "JobID,State,End", "-j", ",".join(array_ids)
+    ]
+    try:
+        return sp.run(cmd, capture_output=True, text=True, check=True).stdout
+    except (sp.CalledProcessError, FileNotFoundError) as error:
+        log.warning(f"Could not get the state of the job arrays: {error}")
+        return ""
+
+
+def refresh_manifest(
+    manifest: dict, new_prod_id: str, states: dict = None, end_times: dict = None
+) -> dict:
+    """
+    Update the status of the submitted nights in the manifest.
+
+    A night is completed once its output file exists, and failed if its
+    array task finished in a failed state. The job states and end times are
+    queried from sacct unless they are given. The end time of a completed
+    night is that of its array task, or the modification time of its output
+    file if sacct does not report it.
+    """
+    submitted = {
+        date: entry for date, entry in manifest.items() if entry["status"] == "submitted"
+    }
+    if states is None:
+        output = get_array_accounting(
+            {entry["job_id"].split("_")[0] for entry in submitted.values()}
+        )
+        states = parse_array_states(output)
+        end_times = parse_array_end_times(output)
+    if end_times is None:
+        end_times = {}
+
+    for date, entry in submitted.items():
+        output_file = longterm_output_file(date, new_prod_id)
+        if output_file.exists():
+            entry["status"] = "completed"
+            entry["finished"] = end_times.get(entry["job_id"]) or datetime.fromtimestamp(
+                output_file.stat().st_mtime
+            ).isoformat(timespec="seconds")
+        elif states.get(entry["job_id"]) in FAILED_STATES:
+            entry["status"] = "failed"
+        elif states.get(entry["job_id"]) == "COMPLETED":
+            # The job finished but the output file was not produced
+            entry["status"] = "failed"
+
+    return manifest
+
+
+def dates_to_submit(dates: list, manifest: dict) -> list:
+    """Return the dates that were never submitted or whose processing failed."""
+    return [
+        date
+        for date in dates
+        if date not in manifest or manifest[date]["status"] == "failed"
+    ]
+
+
+def throughput(manifest: dict) -> tuple:
+    """
+    Return the number of completed nights and the throughput in nights per hour
+    since the first submission.
+    """
+    completed = [entry for entry in manifest.values() if entry["status"] == "completed"]
+    if not completed:
+        return 0, 0.0
+
+    start = min(datetime.fromisoformat(entry["submitted"]) for entry in manifest.values())
+    end = max(datetime.fromisoformat(entry["finished"]) for entry in completed)
+    hours = (end - start).total_seconds() / 3600
+    return len(completed), len(completed) / hours if hours > 0 else float("inf")
+
+
+def submit_array(
+    dates: list, prod_id: str, new_prod_id: str, log_dir: Path, max_running: int
+) -> str:
+    """Submit the longterm reprocessing of the given dates as a single job array."""
+    timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    task_file = log_dir / f"longterm_tasks_{timestamp}.txt"
+    task_file.write_text(
+        "\n".join(shlex.join(longterm_cmd(date, prod_id, new_prod_id)) for date in dates) + "\n"
+    )
+
+    for date in dates:
+        longterm_output_file(date, new_prod_id).parent.mkdir(parents=True, exist_ok=True)
+
+    cmd = batch_cmd_longterm_array(task_file, len(dates), max_running, log_dir)
+    log.info(f"Executing {stringify(cmd)}")
+    job = sp.run(cmd, capture_output=True, text=True, check=True)
+    return job.stdout.strip().split(";")[0]
 
 
 @click.command()
-@click.option("--prod-id", help="Production ID to reprocess")
-@click.option("--new-prod-id", help="New production ID")
-@click.option("--log-dir", type=click.Path(path_type=Path), help="Path to log directory")
-def main(prod_id: str = None, new_prod_id: str = None, log_dir: Path = None):
+@click.option("--prod-id", required=True, help="Production ID to reprocess")
+@click.option("--new-prod-id", required=True, help="New production ID")
+@click.option(
+    "--log-dir", type=click.Path(path_type=Path), required=True, help="Path to log directory"
+)
+@click.option(
+    "--max-running",
+    type=int,
+    default=20,
+    show_default=True,
+    help="Maximum number of nights processed at the same time",
+)
+@click.option("--status", is_flag=True, help="Only report the status of the reprocessing")
+@click.option(
+    "-c",
+    "--config",
+    type=click.Path(exists=True),
+    default=DEFAULT_CFG,
+    help="Path to the OSA config file.",
+)
+def main(
+    prod_id: str = None,
+    new_prod_id: str = None,
+    log_dir: Path = None,
+    max_running: int = 20,
+    status: bool = False,
+    config: Path = DEFAULT_CFG,
+):
     """
     Reprocess the daily check files for all existing dates found on a given production.
     """
     log_dir.mkdir(exist_ok=True, parents=True)
-    longterm_dir = LONGTERM_PATH / prod_id
+    longterm_dir = Path(cfg.get("LST1", "LONGTERM_DIR")) / prod_id
+
+    dates = sorted(path.name for path in longterm_dir.glob("20*") if path.is_dir())
+    manifest_file = log_dir / f"longterm_{new_prod_id}_manifest.json"
+    manifest = refresh_manifest(load_manifest(manifest_file), new_prod_id)
+
+    n_completed, rate = throughput(manifest)
+    n_failed = sum(entry["status"] == "failed" for entry in manifest.values())
+    log.info(
+        f"{n_completed}/{len(dates)} nights completed, {n_failed} failed "
+        f"({rate:.1f} nights/hour)"
+    )
+
+    pending_dates = dates_to_submit(dates, manifest)
 
-    list_of_processed_dates = longterm_dir.glob("20*")
+    if not status and pending_dates:
+        array_id = submit_array(pending_dates, prod_id, new_prod_id, log_dir, max_running)
+        submitted = datetime.now().isoformat(timespec="seconds")
+        for index, date in enumerate(pending_dates):
+            manifest[date] = {
+                "status": "submitted",
+                "job_id": f"{array_id}_{index}",
+                "submitted": submitted,
+            }
+        log.info(f"Submitted {len(pending_dates)} nights in job array {array_id}")
 
-    for date_directory in list_of_processed_dates:
-        run_longterm(date_directory.name, prod_id, new_prod_id, log_dir)
+    save_manifest(manifest_file, manifest)
 
 
 if __name__ == "__main__":
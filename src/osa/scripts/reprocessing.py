@@ -1,8 +1,16 @@
-"""Script to reprocess a list of dates without overwhelming the job system manager."""
+"""Script to reprocess a list of dates without overwhelming the job system manager.
 
+Dates are admitted for processing as long as the number of pending and running
+jobs in the queue stays below a target. The per-date scripts run concurrently in
+worker threads and the state of each date is kept in a manifest file, so that an
+interrupted reprocessing can be resumed.
+"""
+
+import json
 import logging
 import subprocess as sp
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import click
@@ -21,6 +29,131 @@ def number_of_pending_jobs():
     return output.count(b"\n")
 
 
+def number_of_queued_jobs(user: str = "lstanalyzer", squeue: str = "squeue") -> int:
+    """Return the number of pending and running jobs (array tasks expanded) of a user."""
+    cmd = [squeue, "-u", user, "-h", "-t", "pending,running", "-r", "-o", "%i"]
+    output = sp.check_output(cmd)
+    return output.count(b"\n")
+
+
+def load_manifest(manifest_file: Path) -> dict:
+    """Load the state of each date from the manifest file."""
+    if manifest_file is None or not manifest_file.exists():
+        return {}
+    return json.loads(manifest_file.read_text())
+
+
+def save_manifest(manifest_file: Path, manifest: dict) -> None:
+    """Atomically write the state of each date to the manifest file."""
+    if manifest_file is None:
+        return
+    tmp_file = manifest_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp_file.replace(manifest_file)
+
+
+def process_dates(
+    dates: list,
+    run_date,
+    manifest_file: Path = None,
+    max_jobs: int = 2500,
+    max_workers: int = 4,
+    poll_interval: float = 30,
+    max_poll_interval: float = 1800,
+    queued_jobs=number_of_queued_jobs,
+    daytime_only: bool = True,
+) -> dict:
+    """
+    Process a list of dates concurrently keeping the job queue below a target size.
+
+    A new date is admitted whenever a worker thread is free and the number of
+    pending and running jobs is below `max_jobs`. Otherwise, the queue is polled
+    again with an exponential backoff from `poll_interval` up to
+    `max_poll_interval` seconds. Dates already done according to the manifest
+    are skipped, so the processing can be resumed after an interruption.
+
+    Parameters
+    ----------
+    dates: list
+        Dates to process in YYYY-MM-DD format.
+    run_date: callable
+        Function processing a given date, returning its exit code.
+    manifest_file: pathlib.Path
+        File keeping the state of each date.
+    max_jobs: int
+        Target number of pending and running jobs in the queue.
+    max_workers: int
+        Maximum number of dates processed at the same time.
+    poll_interval, max_poll_interval: float
+        Initial and maximum time in seconds between queue checks.
+    queued_jobs: callable
+        Function returning the number of pending and running jobs.
+    daytime_only: bool
+        Only admit new dates during daytime.
+
+    Returns
+    -------
+    manifest: dict
+        State of each date.
+    """
+    manifest = load_manifest(manifest_file)
+    to_process = [date for date in dates if manifest.get(date, {}).get("status") != "done"]
+    log.info(f"{len(dates) - len(to_process)} dates already done, {len(to_process)} to process")
+
+    running = {}
+    interval = poll_interval
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while to_process or running:
+            admitted = False
+
+            if to_process and len(running) < max_workers:
+                if daytime_only:
+                    # Avoid running jobs while it is still night time
+                    wait_for_daytime()
+
+                n_jobs = queued_jobs()
+                if n_jobs < max_jobs:
+                    date = to_process.pop(0)
+                    log.info(f"Admitting {date} ({n_jobs} jobs in the queue)")
+                    running[executor.submit(run_date, date)] = date
+                    manifest[date] = {"status": "running", "start": time.time()}
+                    save_manifest(manifest_file, manifest)
+                    admitted = True
+                    interval = poll_interval
+                else:
+                    log.info(f"{n_jobs} jobs in the queue. Next check in {interval:.0f} s")
+
+            if admitted:
+                continue
+
+            if running:
+                done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(interval)
+                done = set()
+
+            if not done and to_process and len(running) < max_workers:
+                interval = min(2 * interval, max_poll_interval)
+
+            for future in done:
+                date = running.pop(future)
+                try:
+                    returncode = future.result()
+                except Exception as error:
+                    log.exception(f"Processing of {date} failed: {error}")
+                    returncode = -1
+
+                manifest[date].update(
+                    status="done" if returncode == 0 else "failed",
+                    returncode=returncode,
+                    end=time.time(),
+                )
+                save_manifest(manifest_file, manifest)
+
+    return manifest
+
+
 def run_script(
     script: str, 
     date, 
@@ -67,7 +200,7 @@ def run_script(
     cmd.append("LST1")
 
     log.info(f"\nRunning {' '.join(cmd)}")
-    sp.run(cmd)
+    return sp.run(cmd).returncode
 
 
 def check_job_status_and_wait(max_jobs=2500):
@@ -80,7 +213,7 @@ def check_job_status_and_wait(max_jobs=2500):
 def get_list_of_dates(dates_file):
     """Read the files with the dates to be processed and build a list of dates."""
     with open(dates_file, "r") as file:
-        list_of_dates = [line.strip() for line in file]
+        list_of_dates = [line.strip() for line in file if line.strip()]
     return list_of_dates
 
 
@@ -100,6 +233,28 @@ def get_list_of_dates(dates_file):
     default=DEFAULT_CFG,
     help="Path to the OSA config file.",
 )
+@click.option(
+    "--max-jobs",
+    type=int,
+    default=2500,
+    show_default=True,
+    help="Target number of pending and running jobs in the queue.",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of dates processed concurrently.",
+)
+@click.option(
+    "--manifest",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="File keeping the state of each date [default: <dates-file>.manifest.json].",
+)
+@click.option("--user", default="lstanalyzer", show_default=True, help="Owner of the jobs.")
 @click.argument(
     "script", type=click.Choice(["sequencer", "closer", "copy_datacheck", "autocloser", "sequencer_catB_tailcuts"])
 )
@@ -116,6 +271,10 @@ def main(
     force: bool = False,
     overwrite_tailcuts: bool = False,
     overwrite_catb: bool = False,
+    max_jobs: int = 2500,
+    workers: int = 4,
+    manifest: Path = None,
+    user: str = "lstanalyzer",
     ):
     """
     Loop over the dates listed in the input file and launch the script for each of them.
@@ -125,14 +284,11 @@ def main(
 
     list_of_dates = get_list_of_dates(dates_file)
 
-    # Check slurm queue status
-    check_job_status_and_wait()
+    if manifest is None:
+        manifest = Path(f"{dates_file}.manifest.json")
 
-    for date in list_of_dates:
-        # Avoid running jobs while it is still night time
-        wait_for_daytime()
-
-        run_script(
+    def run_date(date):
+        return run_script(
             script,
             date,
             config,
@@ -145,11 +301,19 @@ def main(
             overwrite_tailcuts,
             overwrite_catb,
         )
-        log.info("Waiting 1 minute to launch the process for the next date...\n")
-        time.sleep(60)
 
-        # Check slurm queue status and sleep for a while to avoid overwhelming the queue
-        check_job_status_and_wait()
+    states = process_dates(
+        list_of_dates,
+        run_date,
+        manifest_file=manifest,
+        max_jobs=max_jobs,
+        max_workers=workers,
+        queued_jobs=lambda: number_of_queued_jobs(user),
+    )
+
+    failed = sorted(date for date, state in states.items() if state["status"] == "failed")
+    if failed:
+        log.warning(f"Processing failed for dates: {', '.join(failed)}")
 
     log.info("Done! No more dates to process.")
 
@@ -11,10 +11,18 @@ import os
 from decimal import Decimal
 import datetime
 import re
+
+import pandas as pd
+
 from osa import osadb
 from osa.configs import options
 from osa.configs.config import cfg
-from osa.veto import get_closed_list, get_veto_list
+from osa.veto import (
+    get_closed_list,
+    get_veto_list,
+    record_sequence_states,
+    sequence_state_index,
+)
 from osa.processing_plan import build_processing_plan
 from osa.utils.logging import myLogger
 
@@ -41,7 +49,10 @@ from osa.nightsummary.extract import ( # noqa: E402
 from osa.nightsummary.nightsummary import run_summary_table # noqa: E402
 from osa.paths import analysis_path, destination_dir # noqa: E402
 from osa.report import start # noqa: E402
+from osa.resources import size_job_resources # noqa: E402
+from osa.streaming import get_streamed_runs # noqa: E402
 from osa.utils.cliopts import sequencer_cli_parsing # noqa: E402
+from osa.utils.jit_cache import prewarm_numba_cache # noqa: E402
 from osa.utils.utils import is_day_closed, gettag, date_to_iso # noqa: E402
 from osa.scripts.gain_selection import GainSel_finished # noqa: E402
 
@@ -52,6 +63,9 @@ __all__ = [
     "output_matrix",
     "check_catB_status",
     "report_sequences",
+    "sequences_status_matrix",
+    "sequences_status_table",
+    "get_sequencer_status",
     "update_job_info",
 ]
 
@@ -131,11 +145,14 @@ def single_process(telescope):
     # Build sequences
     sequence_list = build_sequences(options.date)
 
+    size_job_resources(sequence_list)
     prepare_jobs(sequence_list)
     update_job_info(sequence_list)
 
-    get_veto_list(sequence_list)
-    get_closed_list(sequence_list)
+    states = sequence_state_index()
+    get_veto_list(sequence_list, states)
+    get_closed_list(sequence_list, states)
+    record_sequence_states(states)
     update_sequence_status(sequence_list)
 
     sacct_output = run_sacct()
@@ -194,6 +211,9 @@ def single_process(telescope):
 
         return True
 
+    # Runs whose subruns were all submitted by the online sequencer
+    streamed = get_streamed_runs(options.date) if options.no_dl1ab else set()
+
     ready_sequences = []
 
     for seq in sequence_list:
@@ -205,6 +225,12 @@ def single_process(telescope):
         # SEQUENCER 1 (--no-dl1ab)
         if options.no_dl1ab:
 
+            if seq.run in streamed:
+                log.debug(
+                    f"Run {seq.run} skipped: already submitted by the online sequencer"
+                )
+                continue
+
             ready = True
 
         # SEQUENCER 2 (post Cat-B)
@@ -242,6 +268,9 @@ def single_process(telescope):
         )
 
     if not options.no_submit:
+        if ready_sequences and not options.test and not options.simulate:
+            # Compile the numba kernels once per night instead of in every job
+            prewarm_numba_cache()
         submit_jobs(ready_sequences)
 
     report_sequences(sequence_list)
@@ -371,9 +400,10 @@ def get_status_for_sequence(sequence, data_level) -> int:
     return len(files)
 
 
-def report_sequences(sequence_list):
+def sequences_status_matrix(sequence_list) -> list:
     """
-    Update the status report table shown by the sequencer.
+    Build the status report of the sequences as a matrix whose
+    first row is the header.
 
     Parameters
     ----------
@@ -429,10 +459,77 @@ def report_sequences(sequence_list):
             )
 
         matrix.append(row_list)
+    return matrix
+
+
+def sequences_status_table(sequence_list) -> pd.DataFrame:
+    """Return the status report of the sequences as a DataFrame."""
+    matrix = sequences_status_matrix(sequence_list)
+    return pd.DataFrame(matrix[1:], columns=matrix[0])
+
+
+def report_sequences(sequence_list):
+    """
+    Update the status report table shown by the sequencer.
+
+    Parameters
+    ----------
+    sequence_list: list
+        List of sequences of a given date
+    """
+    matrix = sequences_status_matrix(sequence_list)
     padding = int(cfg.get("OUTPUT", "PADDING"))
     output_matrix(matrix, padding)
 
 
+def get_sequencer_status(telescope, summary_table=None, simulate: bool = None) -> pd.DataFrame:
+    """
+    Return the status report of the sequences of the date set in the options
+    without creating, submitting or modifying anything.
+
+    This is the in-process equivalent of the table printed by ``sequencer -s``.
+    An empty DataFrame is returned if there is nothing to report.
+
+    Parameters
+    ----------
+    telescope: str
+    summary_table: astropy.table.Table, optional
+        Run summary table of the date, read if not given.
+    simulate: bool, optional
+        Neither create the analysis directory nor record the state of the sequences.
+        By default, as given in the options.
+    """
+    options.tel_id = telescope
+    options.directory = analysis_path(options.tel_id, simulate=simulate)
+    options.log_directory = options.directory / "log"
+
+    if summary_table is None:
+        summary_table = run_summary_table(options.date)
+
+    if len(summary_table) == 0:
+        log.warning("No runs found for this date. Nothing to do.")
+        return pd.DataFrame()
+
+    plan = build_processing_plan(options.input_state)
+    if (
+        plan.input_state == "legacy_raw"
+        and not options.no_gainsel
+        and not GainSel_finished(options.date)
+    ):
+        log.info(f"Gain selection not finished for {date_to_iso(options.date)}")
+        return pd.DataFrame()
+
+    sequence_list = build_sequences(options.date)
+    update_job_info(sequence_list)
+    states = sequence_state_index()
+    get_veto_list(sequence_list, states)
+    get_closed_list(sequence_list, states)
+    record_sequence_states(states, simulate=simulate)
+    update_sequence_status(sequence_list)
+
+    return sequences_status_table(sequence_list)
+
+
 def output_matrix(matrix: list, padding_space: int):
     """
     Build the status table shown by the sequencer.
@@ -1,5 +1,8 @@
+import fnmatch
 import glob
+import os
 import re
+from bisect import bisect_right
 from argparse import ArgumentParser
 import logging
 from pathlib import Path
@@ -25,19 +28,6 @@ log = myLogger(logging.getLogger())
 
 # calibration table
 
-def load_calibration_table():
-    table_file = Path(cfg.get(options.tel_id, "TABLE_CATB"))
-
-    if not table_file.exists():
-        raise FileNotFoundError(
-            f"Cat-B calibration table not found: {table_file}"
-        )
-
-    log.info(f"Using Cat-B calibration table: {table_file}")
-
-    return table_file.read_text()
-
-
 def parse_calibration_table(table_text):
     periods = []
 
@@ -86,49 +76,180 @@ def find_period_for_run(run_id, periods):
 
 # Paths
 
+# Default of CAT_A_SERVICE_DIR, if not given in the configuration
 BASE_SERVICE = Path(
     "/fefs/onsite/data/lst-pipe/LSTN-01/service/PixelCalibration/Cat-A"
 )
+CATA_VERSION = "pro"
+SYSTEMATICS_VERSION = "v0.3.1"
+CATA_RUN_PATTERN = re.compile(r".*Run(\d{5}).*\.fits.*")
 
 
-def find_catA_file(calib_date, calibration_run):
-    path = BASE_SERVICE / "calibration" / calib_date / "pro"
-    files = list(path.glob(f"*Run{calibration_run:05d}*.fits*"))
+def service_dir() -> Path:
+    """Directory of the Cat-A calibration and systematics files used by Cat-B."""
+    return Path(cfg.get(options.tel_id, "CAT_A_SERVICE_DIR", fallback=str(BASE_SERVICE)))
 
-    if not files:
-        raise RuntimeError(
-            f"No Cat-A file for run {calibration_run} in {path}"
+
+class CatBCalibrationIndex:
+    """
+    Resolve the Cat-A calibration and ffactor systematics files of the runs.
+
+    The calibration periods of TABLE_CATB are parsed once, and again only if the
+    modification time of the table changes, into a list sorted by first run
+    searched with bisect. The Cat-A calibration and systematics directories of
+    a date are scanned once into dicts keyed by (date, run) and by date, and
+    again only if a file is not found in them, in case it was produced since.
+
+    Parameters
+    ----------
+    table_file: pathlib.Path, optional
+        Cat-B calibration table. By default, TABLE_CATB of the configuration.
+    base_dir: pathlib.Path, optional
+        Cat-A service directory. By default, CAT_A_SERVICE_DIR of the configuration.
+    """
+
+    def __init__(self, table_file: Path = None, base_dir: Path = None):
+        if table_file is None:
+            table_file = cfg.get(options.tel_id, "TABLE_CATB")
+        self.table_file = Path(table_file)
+        self.base_dir = service_dir() if base_dir is None else Path(base_dir)
+        self._table_mtime = None
+        self._periods = []
+        self._since_runs = []
+        self._catA_files = {}
+        self._systematics_files = {}
+        self._scanned_catA_dates = set()
+        self._scanned_systematics_dates = set()
+
+    @property
+    def periods(self) -> list:
+        """Calibration periods of the table, sorted by their first run."""
+        try:
+            mtime = self.table_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cat-B calibration table not found: {self.table_file}"
+            ) from None
+
+        if mtime != self._table_mtime:
+            log.info(f"Using Cat-B calibration table: {self.table_file}")
+            periods = parse_calibration_table(self.table_file.read_text())
+            if not periods:
+                raise ValueError(f"No calibration periods in {self.table_file}")
+            self._periods = periods[::-1]
+            self._since_runs = [period["since_run"] for period in self._periods]
+            self._table_mtime = mtime
+
+        return self._periods
+
+    def period_for_run(self, run_id: int) -> dict:
+        """Last calibration period starting at or before the run."""
+        periods = self.periods
+        index = bisect_right(self._since_runs, run_id) - 1
+        if index < 0:
+            log.warning(
+                f"Run {run_id} prior to the first period in calibration table, using fallback"
+            )
+            index = 0
+        return periods[index]
+
+    def _scan_catA_date(self, calib_date: str):
+        self._scanned_catA_dates.add(calib_date)
+        path = self.base_dir / "calibration" / calib_date / CATA_VERSION
+        try:
+            names = sorted(os.listdir(path))
+        except FileNotFoundError:
+            return
+        # The first file in name order of each run, as the glob of each run did
+        for name in reversed(names):
+            if not name.startswith(".") and (match := CATA_RUN_PATTERN.fullmatch(name)):
+                self._catA_files[(calib_date, int(match.group(1)))] = str(path / name)
+
+    def _scan_systematics_date(self, calib_date: str):
+        self._scanned_systematics_dates.add(calib_date)
+        path = self.base_dir / "ffactor_systematics" / calib_date / SYSTEMATICS_VERSION
+        try:
+            names = sorted(fnmatch.filter(os.listdir(path), "scan_fit*.h5"))
+        except FileNotFoundError:
+            return
+        if names:
+            self._systematics_files[calib_date] = str(path / names[0])
+
+    def catA_file(self, calib_date: str, calibration_run: int) -> str:
+        """Cat-A calibration file of a calibration run taken on a date."""
+        key = (calib_date, calibration_run)
+        if key not in self._catA_files:
+            self._scan_catA_date(calib_date)
+        if key not in self._catA_files:
+            path = self.base_dir / "calibration" / calib_date / CATA_VERSION
+            raise RuntimeError(
+                f"No Cat-A file for run {calibration_run} in {path}"
+            )
+        return self._catA_files[key]
+
+    def systematics_file(self, calib_date: str) -> str:
+        """ffactor systematics file of a date."""
+        if calib_date not in self._systematics_files:
+            self._scan_systematics_date(calib_date)
+        if calib_date not in self._systematics_files:
+            path = self.base_dir / "ffactor_systematics" / calib_date / SYSTEMATICS_VERSION
+            raise RuntimeError(
+                f"No systematics for date {calib_date} in {path}"
+            )
+        return self._systematics_files[calib_date]
+
+    def resolve(self, run_id: int) -> tuple:
+        """Cat-A calibration and systematics files of a run."""
+        period = self.period_for_run(run_id)
+        return (
+            self.catA_file(period["calib_date"], period["calibration_run"]),
+            self.systematics_file(period["ffactor_date"]),
         )
 
-    return str(sorted(files)[0])
+    def resolve_runs(self, run_ids) -> dict:
+        """
+        Cat-A calibration and systematics files of several runs, e.g. those of a night.
 
+        The directories of every date needed are scanned once. The runs whose
+        files are not found are left out, with a warning.
+        """
+        periods = {run_id: self.period_for_run(run_id) for run_id in run_ids}
+        for period in periods.values():
+            if period["calib_date"] not in self._scanned_catA_dates:
+                self._scan_catA_date(period["calib_date"])
+            if period["ffactor_date"] not in self._scanned_systematics_dates:
+                self._scan_systematics_date(period["ffactor_date"])
 
-def find_systematics_file(calib_date):
-    path = BASE_SERVICE / "ffactor_systematics" / calib_date / "v0.3.1"
-    files = list(path.glob("scan_fit*.h5"))
+        files = {}
+        for run_id in periods:
+            try:
+                files[run_id] = self.resolve(run_id)
+            except RuntimeError as error:
+                log.warning(f"Run {run_id:05d}: {error}")
+        return files
 
-    if not files:
-        raise RuntimeError(
-            f"No systematics for date {calib_date} in {path}"
-        )
 
-    return str(sorted(files)[0])
+_calibration_indexes = {}
 
 
-def get_catA_and_systematics(run_id):
-    table_text = load_calibration_table()
-    periods = parse_calibration_table(table_text)
+def get_calibration_index() -> CatBCalibrationIndex:
+    """Cat-B calibration index of the table and service directory of the configuration."""
+    key = (cfg.get(options.tel_id, "TABLE_CATB"), service_dir())
+    if key not in _calibration_indexes:
+        _calibration_indexes[key] = CatBCalibrationIndex(*key)
+    return _calibration_indexes[key]
+
+
+def find_catA_file(calib_date, calibration_run):
+    return get_calibration_index().catA_file(calib_date, calibration_run)
 
-    period = find_period_for_run(run_id, periods)
 
-    calib_date = period["calib_date"]
-    calibration_run = period["calibration_run"]
-    ffactor_date = period["ffactor_date"]
+def find_systematics_file(calib_date):
+    return get_calibration_index().systematics_file(calib_date)
 
-    catA_file = find_catA_file(calib_date, calibration_run)
-    systematics_file = find_systematics_file(ffactor_date)
 
-    return catA_file, systematics_file
+def get_catA_and_systematics(run_id):
+    return get_calibration_index().resolve(run_id)
 
 
 parser = ArgumentParser(parents=[common_parser])
@@ -198,11 +319,14 @@ def get_catB_last_job_id(run_id: int) -> int:
         return job_id
 
 
-def launch_catB_calibration(run_id: int):
+def launch_catB_calibration(run_id: int, catA_and_systematics: tuple = None):
     """
     Launch the Cat-B calibration script for a given run if the Cat-B calibration
     file has not been created yet. If the Cat-B calibration script was launched
     before and it finished successfully, it creates a catB_{run}.closed file.
+
+    The Cat-A calibration and systematics files of the run, if already resolved,
+    are given by `catA_and_systematics` (only used for catA_calibrated input).
     """
     job_id = get_catB_last_job_id(run_id)
 
@@ -256,7 +380,9 @@ def launch_catB_calibration(run_id: int):
         input_state = getattr(options, "input_state", "legacy_raw")
 
         if input_state == "catA_calibrated":
-            catA_file, systematics_file = get_catA_and_systematics(run_id)
+            if catA_and_systematics is None:
+                catA_and_systematics = get_catA_and_systematics(run_id)
+            catA_file, systematics_file = catA_and_systematics
 
             log.info(f"[CatB] Using Cat-A file: {catA_file}")
             log.info(f"[CatB] Using systematics: {systematics_file}")
@@ -411,14 +537,36 @@ def main():
     run_summary_dir = Path(cfg.get(options.tel_id, "RUN_SUMMARY_DIR"))
     run_summary = Table.read(run_summary_dir / f"RunSummary_{date_to_dir(options.date)}.ecsv")
     data_runs = run_summary[run_summary["run_type"]=="DATA"]
-    for run_id in data_runs["run_id"]:
+
+    process_runs(data_runs["run_id"].tolist())
+
+
+def process_runs(run_ids: list):
+    """
+    Launch the Cat-B calibration and the tailcuts finder of the runs whose
+    r0_to_dl1 step finished.
+
+    For catA_calibrated input, the Cat-A files of all the runs are resolved at
+    once, only when the first Cat-B calibration is to be launched, so that the
+    calibration table is not needed on nights with nothing to launch.
+    """
+    catA_files = None
+
+    for run_id in run_ids:
         # first check if the dl1a files are produced
         if not r0_to_dl1_step_finished_for_run(run_id):
             log.info(f"The r0_to_dl1 step did not finish yet for run {run_id:05d}. Please try again later.")
         else:
             # launch catB calibration and tailcut finder in parallel
             if cfg.getboolean("lstchain", "apply_catB_calibration") and not catB_closed_file_exists(run_id):
-                launch_catB_calibration(run_id)
+                if options.input_state != "catA_calibrated":
+                    launch_catB_calibration(run_id)
+                else:
+                    if catA_files is None:
+                        catA_files = get_calibration_index().resolve_runs(run_ids)
+                    # Runs without Cat-A files were already reported by resolve_runs
+                    if run_id in catA_files:
+                        launch_catB_calibration(run_id, catA_files[run_id])
             if not cfg.getboolean("lstchain", "apply_standard_dl1b_config"):
                 if tailcuts_config_file_exists(run_id) and not options.overwrite_tailcuts:
                     log.debug(
@@ -427,6 +575,5 @@ def main():
                 else:
                     launch_tailcuts_finder(run_id)
 
-
 if __name__ == "__main__":
     main()
@@ -1,13 +1,14 @@
 """Produce the HTML file with the processing status from the sequencer report."""
 
 
+import hashlib
 import logging
-import subprocess as sp
+import re
 import sys
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from textwrap import dedent
-from typing import Iterable
 
 import pandas as pd
 
@@ -16,12 +17,28 @@ from osa.configs.config import cfg
 from osa.utils.cliopts import sequencer_webmaker_argparser
 from osa.utils.logging import myLogger
 from osa.utils.utils import is_day_closed, date_to_iso, date_to_dir
-from osa.paths import all_dl1ab_config_files_exist
+from osa.nightsummary.nightsummary import run_summary_table
+from osa.paths import dl1ab_config_files_exist
+from osa.scripts.sequencer import get_sequencer_status
 
 log = myLogger(logging.getLogger())
 
 
-def html_content(body: str, warnings: str, date: str, title: str) -> str:
+# Sentence of the HTML page with the time of its last update, up to the end of the paragraph
+LAST_UPDATED_PATTERN = re.compile(r"Last updated: [^<]*")
+
+
+def last_updated(elapsed: float = None) -> str:
+    """Sentence with the current time and the seconds spent computing the status, if given."""
+    time_update = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    if elapsed is None:
+        return f"Last updated: {time_update} UTC."
+    return f"Last updated: {time_update} UTC (status computed in {elapsed:.2f} s)."
+
+
+def html_content(
+    body: str, warnings: str, date: str, title: str, elapsed: float = None
+) -> str:
     """Build the HTML content.
 
     Parameters
@@ -32,13 +49,14 @@ def html_content(body: str, warnings: str, date: str, title: str) -> str:
         HTML block with warnings.
     date : str
         Date of the processing YYYY-MM-DD.
+    elapsed : float, optional
+        Seconds spent computing the status report.
 
     Returns
     -------
     str
         HTML content.
     """
-    time_update = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
     return dedent(
         f"""<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN"
@@ -51,102 +69,71 @@ def html_content(body: str, warnings: str, date: str, title: str) -> str:
          </head>
          <body>
          <h1>{title} processing status</h1>
-         <p>Processing data from: {date}. Last updated: {time_update} UTC.</p>
+         <p>Processing data from: {date}. {last_updated(elapsed)}</p>
          {warnings}
          {body}
          </body>
         </html>"""
     )
 
-def get_sequencer_output(
-    date: str,
-    config: str,
-    input_state: str,
-    test=False,
-    no_gainsel=False,
-) -> list:
-    """Call sequencer to get table with the sequencer status report.
+
+def status_to_html(status: pd.DataFrame) -> str:
+    """Build the html table with the sequencer status report."""
+    if status.empty:
+        return "<p>No data found</p>"
+    return status.to_html(index=False)
+
+
+def status_hash(status: pd.DataFrame, warnings: list) -> str:
+    """Return a hash of the content of the status report."""
+    content = status.to_csv(index=False) + "\n".join(warnings)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def is_status_unchanged(hash_file: Path, html_file: Path, new_hash: str) -> bool:
+    """Check whether the status report is the same as in the last update of the HTML file."""
+    return html_file.exists() and hash_file.exists() and hash_file.read_text() == new_hash
+
+
+def update_timestamp(html_file: Path, elapsed: float = None) -> None:
+    """Update the time of the last update of an HTML file, keeping its table."""
+    content = html_file.read_text(encoding="utf-8")
+    html_file.write_text(
+        LAST_UPDATED_PATTERN.sub(last_updated(elapsed), content, count=1), encoding="utf-8"
+    )
+
+
+def get_sequencer_status_in_process(summary_table, no_gainsel=False):
+    """Get the sequencer status report without spawning a sequencer process.
 
     Parameters
     ----------
-    date : str
-        Date of the processing YYYY-MM-DD.
-    config : str
-        OSA configuration file to use.
-    input_state : str
-        Input state passed to sequencer.
-    test : bool
+    summary_table : astropy.table.Table
+        Run summary table of the date.
+    no_gainsel : bool
 
     Returns
     -------
-    list
-        Lines of the sequencer output.
+    status : pd.DataFrame
+        Status report of the sequences.
+    warnings : list
+        Warnings to be displayed in the web page.
     """
-    log.info("Calling sequencer...")
-
-    commandargs = [
-        "sequencer",
-        "-c",
-        config,
-        "-s",
-        "-d",
-        date,
-        "--input-state",
-        input_state,
-        options.tel_id,
-    ]
-
-    if no_gainsel:
-        commandargs.insert(-1, "--no-gainsel")
-
-    if test:
-        commandargs.insert(-1, "-t")
-
-    if not all_dl1ab_config_files_exist(date):
-        commandargs.insert(-1, "--no-dl1ab")
-
-    try:
-        log.info(f"Using input_state={input_state}")
-        log.info(f"{commandargs}")
-
-        output = sp.run(
-            commandargs,
-            stdout=sp.PIPE,
-            stderr=sp.STDOUT,
-            encoding="utf-8",
-            check=True,
-        )
-
-    except sp.CalledProcessError as error:
-        log.error(f"Command {commandargs} failed, {error.returncode}")
-        sys.exit(1)
-
-    else:
-        return output.stdout.splitlines()
+    options.no_gainsel = no_gainsel
+    data_runs = summary_table[summary_table["run_type"] == "DATA"]["run_id"]
+    options.no_dl1ab = not dl1ab_config_files_exist(data_runs)
 
+    # Nothing is created or recorded while computing the status for the web page
+    status = get_sequencer_status(options.tel_id, summary_table=summary_table, simulate=True)
 
-def lines_to_matrix(lines: Iterable) -> list:
-    """Build the matrix from the sequencer output lines."""
-    matrix = []
     warnings = []
-    for line in lines:
-        l_fields = line.split()
-        if len(l_fields) == 19:
-            matrix.append(l_fields)
-        elif "No source information found in the database" in line:
-            warnings.append(line)
-    return matrix, warnings
-
-
-def matrix_to_html(matrix: list) -> str:
-    """Build the html table with the sequencer status report."""
-    log.info("Building the html table from sequencer output")
-    log.info(matrix)
-    log.info(len(matrix))
-    if len(matrix) < 2:
-        return "<p>No data found</p>"
-    df = pd.DataFrame(matrix[1:], columns=matrix[0])
-    return df.to_html(index=False)
+    if "Source" in status.columns:
+        runs_without_source = status[(status["Type"] == "DATA") & status["Source"].isna()]
+        warnings = [
+            f"No source information found in the database for run {run}"
+            for run in runs_without_source["Run"]
+        ]
+    return status, warnings
 
 
 def warnings_to_html(warnings: list) -> str:
@@ -188,46 +175,46 @@ def main():
         sys.exit(1)
 
     log.info(f"Using input_state={args.input_state}")
+    options.input_state = args.input_state
+    options.test = args.test
 
-    # Get the table with the sequencer status report:
-    lines = get_sequencer_output(
-        date,
-        args.config,
-        args.input_state,
-        test=args.test,
-        no_gainsel=args.no_gainsel,
-    )
-
-    log.info(f"{lines}")
-
-    # Build the html sequencer table that will be placed in the body
-    matrix, warnings = lines_to_matrix(lines)
-
-    html_table = matrix_to_html(matrix)
-    html_warnings = warnings_to_html(warnings)
+    t_start = time.perf_counter()
 
-    log.info(f"{html_table}")
-
-    # Save the HTML file
-    log.info("Saving the HTML file")
+    # Get the table with the sequencer status report:
+    summary_table = run_summary_table(options.date)
+    status, warnings = get_sequencer_status_in_process(summary_table, no_gainsel=args.no_gainsel)
 
     directory = Path(cfg.get("LST1", "SEQUENCER_WEB_DIR"))
     directory.mkdir(parents=True, exist_ok=True)
 
     html_file = directory / f"osa_status_{flat_date}.html"
+    hash_file = directory / f".osa_status_{flat_date}.sha256"
+    new_hash = status_hash(status, warnings)
+    elapsed = time.perf_counter() - t_start
 
-    log.info(f"{html_file}")
-
-    html_file.write_text(
-        html_content(
-            html_table,
-            html_warnings,
-            date,
-            "LST OSA Sequencer",
-        ),
-        encoding="utf-8",
-    )
+    if is_status_unchanged(hash_file, html_file, new_hash):
+        log.info(f"Status unchanged since last update, only the time of {html_file} updated")
+        update_timestamp(html_file, elapsed)
+    else:
+        # Build the html sequencer table that will be placed in the body
+        html_table = status_to_html(status)
+        html_warnings = warnings_to_html(warnings)
+
+        # Save the HTML file
+        log.info(f"Saving the HTML file {html_file}")
+        html_file.write_text(
+            html_content(
+                html_table,
+                html_warnings,
+                date,
+                "LST OSA Sequencer",
+                elapsed,
+            ),
+            encoding="utf-8",
+        )
+        hash_file.write_text(new_hash)
 
+    log.info(f"Sequencer status computed in {elapsed:.2f} s")
     log.info("Done")
 
 
@@ -0,0 +1,81 @@
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from astropy.table import Table
+
+
+@pytest.fixture
+def gainsel_logs(tmp_path):
+    log_dir = tmp_path / "log"
+    log_dir.mkdir()
+    # Run 1: two subruns finished, one relaunched after failing
+    (log_dir / "gain_selection_00001.0000.history").write_text(
+        "2024-01-01 10:00:00 | 00001.0000 gain_selection 1\n"
+        "2024-01-01 11:00:00 | 00001.0000 gain_selection 0\n"
+    )
+    (log_dir / "gain_selection_00001.0001.history").write_text(
+        "2024-01-01 10:00:00 | 00001.0001 gain_selection 0\n"
+    )
+    # Run 2: one subrun still running, one failed
+    (log_dir / "gain_selection_00002.0000.history").touch()
+    (log_dir / "gain_selection_00002.0001.history").write_text(
+        "2024-01-01 10:00:00 | 00002.0001 gain_selection 1\n"
+    )
+    (log_dir / "r0_to_r0g_00002.0001.log").write_text(
+        "INFO some line\n"
+        "WARNING FlatField(FF)-like events are not tagged as FF\n"
+        "INFO another line\n"
+    )
+    # Run 3: already closed
+    (log_dir / "gain_selection_00003.closed").touch()
+    (log_dir / "gain_selection_00003_0000_1234.log").touch()
+    return log_dir
+
+
+def test_scan_gainsel_log_dir(gainsel_logs):
+    from osa.scripts.gain_selection import scan_gainsel_log_dir
+
+    status = scan_gainsel_log_dir(gainsel_logs, scan_ff_warnings=True).set_index("run_id")
+    assert status.loc[1, "history_files"] == 2
+    assert status.loc[1, "success"] == 2
+    assert status.loc[1, "failed"] == 0
+    assert status.loc[2, "pending"] == 1
+    assert status.loc[2, "failed"] == 1
+    assert status.loc[2, "ff_warnings"] == 1
+    assert status.loc[3, "closed"]
+    assert not status.loc[1, "closed"]
+
+    # The r0_to_r0g logs are only read if asked, e.g. not by the web maker
+    with mock.patch("osa.scripts.gain_selection.find_ff_warnings") as find_ff_warnings:
+        status = scan_gainsel_log_dir(gainsel_logs).set_index("run_id")
+    find_ff_warnings.assert_not_called()
+    assert status.loc[2, "failed"] == 1
+    assert status.loc[2, "ff_warnings"] == 0
+
+    assert scan_gainsel_log_dir(gainsel_logs / "missing").empty
+
+
+def test_gainsel_status(gainsel_logs, monkeypatch):
+    from osa.scripts import gain_selection
+
+    monkeypatch.setattr(gain_selection, "gainsel_log_dir", lambda date: gainsel_logs)
+    summary_table = Table(
+        {
+            "run_id": [1, 2, 4, 5],
+            "n_subruns": [2, 2, 3, 1],
+            "run_type": ["DATA", "DATA", "DATA", "PEDCALIB"],
+        }
+    )
+    date = datetime(2024, 1, 1)
+    status = gain_selection.gainsel_status(date, summary_table)
+    assert list(status["run_id"]) == [1, 2, 4]
+    assert list(status["pending"]) == [0, 1, 0]
+    assert list(status["history_files"]) == [2, 2, 0]
+    assert not status["closed"].any()
+
+    rows = {row.run_id: row for row in status.itertuples(index=False)}
+    assert gain_selection.check_gainsel_jobs_runwise(date, rows[1])
+    assert (gainsel_logs / "gain_selection_00001.closed").exists()
+    assert not gain_selection.check_gainsel_jobs_runwise(date, rows[2])
+    assert not gain_selection.check_gainsel_jobs_runwise(date, rows[4])
@@ -196,7 +196,6 @@ def test_summary_and_info_integration(tmp_path):
 def test_main_execution(tmp_path, monkeypatch):
 
     import sys
-    import runpy
     from osa.scripts import interleaved_date
 
     cfg = tmp_path / "test.cfg"
@@ -221,12 +220,84 @@ ANALYSIS_DIR=%(BASE)s/running_analysis
         ["script", "20260220", "-c", str(cfg)]
     )
 
-    # NOTE: runpy.run_module executes the module in a fresh __main__ namespace,
-    # so patching osa.scripts.interleaved_date.find_interleaved here has no effect.
-
-    runpy.run_module(interleaved_date.__name__, run_name="__main__")
+    interleaved_date.main()
 
     recordfile = tmp_path / "OSA" / "interleaved_cleanup_sh" / "entries_rm_202602.sh"
 
     assert recordfile.exists()
     assert recordfile.read_text().startswith("#!/bin/bash")
+
+
+def _make_night(base, date, runs, sizes):
+    dl1 = base / "DL1" / date / "v0.10" / "tailcut84" / "interleaved"
+    link = base / "running_analysis" / date / "v0.10" / "tailcut84" / "interleaved"
+    dl1.mkdir(parents=True)
+    link.mkdir(parents=True)
+    for run_id in runs:
+        for subrun in range(2):
+            name = f"interleaved_LST-1.Run{run_id:05d}.{subrun:04d}.h5"
+            (dl1 / name).write_bytes(b"x" * sizes)
+            (link / name).symlink_to(dl1 / name)
+    return str(dl1), str(link)
+
+
+def test_plan_cleanup(tmp_path):
+    from osa.scripts.interleaved_date import (
+        plan_cleanup,
+        run_source_table,
+        write_plan,
+    )
+
+    summary_dir = tmp_path / "RunSummary"
+    catalog_dir = tmp_path / "RunCatalog"
+    summary_dir.mkdir()
+    catalog_dir.mkdir()
+
+    # Night with Crab: only the other source is removed
+    mixed, mixed_link = _make_night(tmp_path, "20260210", [1, 2], 100)
+    (summary_dir / "RunSummary_20260210.ecsv").write_text("1,x,DATA\n2,x,DATA\n3,x,PEDCALIB\n")
+    (catalog_dir / "RunCatalog_20260210.ecsv").write_text("run_id,source_name\n1,Crab\n2,Mrk 421\n")
+
+    # Night without Crab: the whole directory is removed
+    other, other_link = _make_night(tmp_path, "20260211", [4, 5], 10)
+    (summary_dir / "RunSummary_20260211.ecsv").write_text("4,x,DATA\n5,x,DATA\n")
+    (catalog_dir / "RunCatalog_20260211.ecsv").write_text("4,Mrk 421\n5,1ES 1959+650\n")
+
+    found_paths, found_dates = [mixed, other], ["20260210", "20260211"]
+    sources = run_source_table(found_dates, str(summary_dir), str(catalog_dir))
+    assert sources["20260210"] == {1: "Crab", 2: "Mrk 421"}
+
+    commands, reclaimed = plan_cleanup(
+        found_paths,
+        found_dates,
+        str(tmp_path / "DL1"),
+        str(tmp_path / "running_analysis"),
+        sources,
+    )
+
+    assert commands == [
+        f'rm -f -- "{mixed}"/interleaved_LST-1.Run00002.*.h5\n',
+        f'rm -f -- "{mixed_link}"/interleaved_LST-1.Run00002.*.h5\n',
+        f'rm -f -- "{other_link}"/interleaved_LST-1.Run*.h5\n',
+        f'rm -rf -- "{other}"\n',
+    ]
+    assert reclaimed == {
+        ("20260210", "Mrk 421"): 200,
+        ("20260211", "Mrk 421"): 20,
+        ("20260211", "1ES 1959+650"): 20,
+    }
+
+    recordfile = tmp_path / "entries_rm_202602.sh"
+    assert write_plan(recordfile, commands, reclaimed) == 240
+    content = recordfile.read_text()
+    assert content.startswith("#!/bin/bash\n")
+    assert content.count("rm -") == 4
+
+
+def test_find_interleaved_max_months(tmp_path):
+    base = tmp_path / "DL1"
+    (base / "20251201" / "v1" / "interleaved").mkdir(parents=True)
+    (base / "20260215" / "v1" / "interleaved").mkdir(parents=True)
+
+    assert find_interleaved("20260220", str(base))[1] == ["20260215"]
+    assert find_interleaved("20260220", str(base), max_months=3)[1] == ["20251201", "20260215"]
@@ -3,6 +3,7 @@ import os
 import subprocess as sp
 from pathlib import Path
 from textwrap import dedent
+from unittest import mock
 
 import pytest
 import yaml
@@ -406,6 +407,35 @@ def test_daily_longterm_cmd():
     assert cmd == expected_cmd
 
 
+def test_submit_daily_datacheck_merges_not_finished():
+    from osa.scripts.closer import submit_daily_datacheck
+
+    submitted = []
+
+    def sbatch(cmd, **kwargs):
+        submitted.append(cmd)
+        return sp.CompletedProcess(cmd, 0, stdout=f"{1000 + len(submitted)}\n")
+
+    with (
+        mock.patch("osa.paths.wait_for_jobs", return_value=False),
+        mock.patch("osa.paths.subprocess.run", side_effect=sbatch),
+        mock.patch("osa.scripts.closer.daily_datacheck", return_value="2000") as daily,
+        mock.patch("osa.scripts.closer.cherenkov_transparency") as cherenkov,
+        mock.patch("osa.scripts.closer.create_longterm_symlink"),
+        mock.patch.object(options, "test", False),
+        mock.patch.object(options, "simulate", False),
+    ):
+        assert submit_daily_datacheck(["12345", "54321"]) == "2000"
+
+    # The merged files are linked by a job once the merging jobs complete
+    assert len(submitted) == 1
+    assert "--dependency=afterok:12345,54321" in submitted[0]
+    assert submitted[0][-2] == "--wrap"
+    # and the daily longterm check is still submitted, after the links
+    assert "--dependency=afterok:1001" in daily.call_args.args[0]
+    cherenkov.assert_called_once()
+
+
 def test_observation_finished():
     """Check if observation is finished for `options.date=2020-01-17`."""
     from osa.scripts.closer import observation_finished
@@ -597,3 +627,42 @@ PROD_ID = v1
     assert not check_log.exists()
     assert not normal_log.exists()
 
+
+
+def test_sequencer_status_table(run_catalog, sequence_list, running_analysis_dir):
+    from osa.scripts.sequencer import sequences_status_table
+    from osa.scripts.sequencer_webmaker import (
+        html_content,
+        is_status_unchanged,
+        status_hash,
+        status_to_html,
+        update_timestamp,
+    )
+
+    status = sequences_status_table(sequence_list)
+    assert len(status) == len(sequence_list)
+    assert list(status["Run"]) == [sequence.run for sequence in sequence_list]
+    # Source names with spaces are kept in a single column
+    status.loc[status["Type"] == "DATA", "Source"] = "Crab Nebula"
+    assert "<td>Crab Nebula</td>" in status_to_html(status)
+
+    html_file = running_analysis_dir / "osa_status_test.html"
+    hash_file = running_analysis_dir / ".osa_status_test.sha256"
+    new_hash = status_hash(status, [])
+    assert not is_status_unchanged(hash_file, html_file, new_hash)
+    html_file.write_text(html_content(status_to_html(status), "", "2020-01-17", "Test"))
+    hash_file.write_text(new_hash)
+    assert is_status_unchanged(hash_file, html_file, status_hash(status.copy(), []))
+
+    # The table is kept, but the time of the last update is refreshed
+    html_file.write_text(
+        html_file.read_text().replace("Last updated: ", "Last updated: 2000-01-01 00:00:00 UTC. ")
+    )
+    update_timestamp(html_file, elapsed=1.234)
+    content = html_file.read_text()
+    assert "2000-01-01" not in content
+    assert "UTC (status computed in 1.23 s).</p>" in content
+    assert status_to_html(status) in content
+
+    status.loc[0, "State"] = "COMPLETED"
+    assert not is_status_unchanged(hash_file, html_file, status_hash(status, []))
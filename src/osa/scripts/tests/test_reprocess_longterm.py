@@ -0,0 +1,85 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from osa.configs.config import cfg
+from osa.scripts.reprocess_longterm import (
+    batch_cmd_longterm_array,
+    dates_to_submit,
+    load_manifest,
+    parse_array_end_times,
+    parse_array_states,
+    refresh_manifest,
+    save_manifest,
+    throughput,
+)
+
+
+def test_batch_cmd_longterm_array(tmp_path):
+    cmd = batch_cmd_longterm_array(tmp_path / "tasks.txt", 30, 5, tmp_path)
+    assert "--array=0-29%5" in cmd
+    assert cmd[-2] == "--wrap"
+
+
+def test_parse_array_states():
+    output = "1234_0|COMPLETED\n1234_1|CANCELLED by 0\n1234_[2-3%2]|PENDING\n"
+    assert parse_array_states(output) == {
+        "1234_0": "COMPLETED",
+        "1234_1": "CANCELLED",
+        "1234_[2-3%2]": "PENDING",
+    }
+
+
+def test_parse_array_end_times():
+    output = (
+        "1234_0|COMPLETED|2024-01-01T02:00:00\n"
+        "1234_1|RUNNING|Unknown\n"
+        "1234_[2-3%2]|PENDING|Unknown\n"
+    )
+    assert parse_array_end_times(output) == {"1234_0": "2024-01-01T02:00:00"}
+
+
+@pytest.fixture
+def longterm_dir(tmp_path):
+    longterm_dir = cfg.get("LST1", "LONGTERM_DIR", raw=True)
+    cfg.set("LST1", "LONGTERM_DIR", str(tmp_path / "night_wise"))
+    yield tmp_path / "night_wise"
+    cfg.set("LST1", "LONGTERM_DIR", longterm_dir)
+
+
+def test_manifest_resume(tmp_path, longterm_dir):
+    new_prod_id = "v0.2.0"
+    for date in ["20200117", "20200120"]:
+        output_dir = longterm_dir / new_prod_id / date
+        output_dir.mkdir(parents=True)
+        (output_dir / f"DL1_datacheck_{date}.h5").touch()
+    output_file = longterm_dir / new_prod_id / "20200120" / "DL1_datacheck_20200120.h5"
+    mtime = datetime(2024, 1, 1, 3).timestamp()
+    os.utime(output_file, (mtime, mtime))
+
+    manifest = {
+        date: {"status": "submitted", "job_id": f"99_{i}", "submitted": "2024-01-01T00:00:00"}
+        for i, date in enumerate(["20200117", "20200118", "20200119", "20200120"])
+    }
+    states = {"99_0": "COMPLETED", "99_1": "FAILED", "99_2": "RUNNING", "99_3": "COMPLETED"}
+    end_times = {"99_0": "2024-01-01T02:00:00", "99_1": "2024-01-01T01:00:00"}
+    manifest = refresh_manifest(manifest, new_prod_id, states=states, end_times=end_times)
+
+    assert manifest["20200117"]["status"] == "completed"
+    assert manifest["20200118"]["status"] == "failed"
+    assert manifest["20200119"]["status"] == "submitted"
+    # The end time of the task, or else the time the output file was written
+    assert manifest["20200117"]["finished"] == "2024-01-01T02:00:00"
+    assert manifest["20200120"]["finished"] == "2024-01-01T03:00:00"
+
+    dates = ["20200117", "20200118", "20200119", "20200120", "20200121"]
+    assert dates_to_submit(dates, manifest) == ["20200118", "20200121"]
+
+    manifest_file = tmp_path / "manifest.json"
+    save_manifest(manifest_file, manifest)
+    assert load_manifest(manifest_file) == manifest
+
+    n_completed, rate = throughput(manifest)
+    assert n_completed == 2
+    assert rate == pytest.approx(2 / 3)
@@ -0,0 +1,82 @@
+import json
+import threading
+from textwrap import dedent
+
+from osa.scripts.reprocessing import number_of_queued_jobs, process_dates
+
+
+def fake_squeue(tmp_path, queue_file):
+    """Executable mimicking squeue, printing one line per job listed in queue_file."""
+    squeue = tmp_path / "squeue"
+    squeue.write_text(
+        dedent(
+            f"""\
+            #!/bin/sh
+            cat {queue_file}
+            """
+        )
+    )
+    squeue.chmod(0o755)
+    return squeue
+
+
+def test_number_of_queued_jobs(tmp_path):
+    queue_file = tmp_path / "queue.txt"
+    queue_file.write_text("1\n2\n3\n")
+    squeue = fake_squeue(tmp_path, queue_file)
+    assert number_of_queued_jobs(squeue=str(squeue)) == 3
+
+
+def test_process_dates(tmp_path):
+    queue_file = tmp_path / "queue.txt"
+    # Queue initially full: no date can be admitted
+    queue_file.write_text("".join(f"{i}\n" for i in range(10)))
+    squeue = fake_squeue(tmp_path, queue_file)
+    manifest_file = tmp_path / "manifest.json"
+    manifest_file.write_text(json.dumps({"2020-01-15": {"status": "done"}}))
+
+    processed = []
+    lock = threading.Lock()
+    polls = []
+
+    def queued_jobs():
+        polls.append(1)
+        if len(polls) == 3:
+            # Free the queue after a few polls
+            queue_file.write_text("")
+        return number_of_queued_jobs(squeue=str(squeue))
+
+    def run_date(date):
+        with lock:
+            processed.append(date)
+        return 1 if date == "2020-01-18" else 0
+
+    dates = ["2020-01-15", "2020-01-16", "2020-01-17", "2020-01-18"]
+    manifest = process_dates(
+        dates,
+        run_date,
+        manifest_file=manifest_file,
+        max_jobs=5,
+        max_workers=2,
+        poll_interval=0.01,
+        max_poll_interval=0.05,
+        queued_jobs=queued_jobs,
+        daytime_only=False,
+    )
+
+    assert sorted(processed) == ["2020-01-16", "2020-01-17", "2020-01-18"]
+    assert manifest["2020-01-16"]["status"] == "done"
+    assert manifest["2020-01-18"]["status"] == "failed"
+    assert json.loads(manifest_file.read_text()) == manifest
+
+    # Resuming only reprocesses the failed date
+    processed.clear()
+    process_dates(
+        dates,
+        run_date,
+        manifest_file=manifest_file,
+        poll_interval=0.01,
+        queued_jobs=queued_jobs,
+        daytime_only=False,
+    )
+    assert processed == ["2020-01-18"]
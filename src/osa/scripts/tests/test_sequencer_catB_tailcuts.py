@@ -0,0 +1,137 @@
+import os
+from unittest import mock
+
+import pytest
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.scripts.sequencer_catB_tailcuts import (
+    CatBCalibrationIndex,
+    find_period_for_run,
+    parse_calibration_table,
+    process_runs,
+)
+
+CATB_TABLE = """\
+# period              calibration           ffactor               drs4
+since 20231001 (r15000)  20231001 (r14990)  20230920 (r14900)  20231001 (r14989)
+since 20231101 (r15500)  20231101 (r15490)  20231101 (r15490)  20231101 (r15489)
+since 20231201 (r16000)  20231130 (r15995)  20231101 (r15490)  20231130 (r15994)
+"""
+
+
+@pytest.fixture
+def service_dir(tmp_path):
+    base_dir = tmp_path / "Cat-A"
+    for calib_date, run in [("20231001", 14990), ("20231101", 15490), ("20231130", 15995)]:
+        directory = base_dir / "calibration" / calib_date / "pro"
+        directory.mkdir(parents=True)
+        (directory / f"calibration_filters_52.Run{run:05d}.0000.fits.gz").touch()
+        (directory / f"calibration_filters_52.Run{run - 1:05d}.0000.fits.gz").touch()
+        (directory / f"log_calibration_Run{run:05d}.txt").touch()
+    for ffactor_date in ["20230920", "20231101"]:
+        directory = base_dir / "ffactor_systematics" / ffactor_date / "v0.3.1"
+        directory.mkdir(parents=True)
+        (directory / f"scan_fit_{ffactor_date}.0000.h5").touch()
+        (directory / f"scan_fit_{ffactor_date}.0001.h5").touch()
+    return base_dir
+
+
+@pytest.fixture
+def table_file(tmp_path):
+    table_file = tmp_path / "catB_calibration_table.txt"
+    table_file.write_text(CATB_TABLE)
+    return table_file
+
+
+def test_catB_calibration_index(table_file, service_dir):
+    index = CatBCalibrationIndex(table_file, service_dir)
+    periods = parse_calibration_table(CATB_TABLE)
+
+    # Same periods as the linear scan, including the fallback before the first one
+    for run_id in [14000, 15000, 15499, 15500, 15999, 16000, 20000]:
+        assert index.period_for_run(run_id) == find_period_for_run(run_id, periods)
+
+    catA_dir = service_dir / "calibration" / "20231101" / "pro"
+    systematics_dir = service_dir / "ffactor_systematics" / "20231101" / "v0.3.1"
+    assert index.resolve(15600) == (
+        str(catA_dir / "calibration_filters_52.Run15490.0000.fits.gz"),
+        str(systematics_dir / "scan_fit_20231101.0000.h5"),
+    )
+    assert index.resolve(16000)[1] == index.resolve(15600)[1]
+
+
+def test_catB_calibration_index_reload(table_file, service_dir):
+    index = CatBCalibrationIndex(table_file, service_dir)
+    assert index.period_for_run(17000)["since_run"] == 16000
+
+    # A new period is added to the table
+    table_file.write_text(
+        CATB_TABLE + "since 20240101 (r17000)  20231101 (r15490)  20231101 (r15490)  "
+        "20231101 (r15489)\n"
+    )
+    stat = table_file.stat()
+    os.utime(table_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert index.period_for_run(17000)["since_run"] == 17000
+
+
+def test_catB_calibration_index_missing_files(table_file, service_dir):
+    index = CatBCalibrationIndex(table_file, service_dir)
+    catA_dir = service_dir / "calibration" / "20231130" / "pro"
+    catA_file = catA_dir / "calibration_filters_52.Run15995.0000.fits.gz"
+    catA_file.unlink()
+
+    with pytest.raises(RuntimeError, match="No Cat-A file for run 15995"):
+        index.resolve(16000)
+
+    # Runs of a night resolved at once, leaving out those without files
+    files = index.resolve_runs([15000, 15600, 16000])
+    assert sorted(files) == [15000, 15600]
+    assert files[15000][0].endswith("calibration_filters_52.Run14990.0000.fits.gz")
+
+    # The file is produced afterwards
+    catA_file.touch()
+    assert index.resolve(16000)[0] == str(catA_file)
+
+    with pytest.raises(FileNotFoundError):
+        CatBCalibrationIndex(table_file.with_name("missing.txt"), service_dir).resolve(16000)
+
+
+def test_process_runs_lazy_calibration_table(tmp_path, service_dir, monkeypatch):
+    monkeypatch.setattr(options, "input_state", "catA_calibrated")
+    monkeypatch.setattr(options, "tel_id", "LST1")
+    monkeypatch.setattr(options, "overwrite_tailcuts", False, raising=False)
+    table_catB = cfg.get("LST1", "TABLE_CATB", raw=True)
+    catA_service_dir = cfg.get("LST1", "CAT_A_SERVICE_DIR", raw=True)
+    catB = cfg.get("lstchain", "apply_catB_calibration")
+    cfg.set("LST1", "TABLE_CATB", str(tmp_path / "missing.txt"))
+    cfg.set("LST1", "CAT_A_SERVICE_DIR", str(service_dir))
+    cfg.set("lstchain", "apply_catB_calibration", "True")
+    module = "osa.scripts.sequencer_catB_tailcuts"
+    try:
+        with (
+            mock.patch(f"{module}.r0_to_dl1_step_finished_for_run", return_value=False),
+            mock.patch(f"{module}.launch_catB_calibration") as launch,
+        ):
+            # Nothing to launch: the missing calibration table is not read
+            process_runs([15600, 16000])
+            launch.assert_not_called()
+
+        with (
+            mock.patch(f"{module}.r0_to_dl1_step_finished_for_run", return_value=True),
+            mock.patch(f"{module}.catB_closed_file_exists", return_value=False),
+            mock.patch(f"{module}.tailcuts_config_file_exists", return_value=True),
+            mock.patch(f"{module}.launch_catB_calibration") as launch,
+        ):
+            with pytest.raises(FileNotFoundError, match="Cat-B calibration table not found"):
+                process_runs([15600, 16000])
+            launch.assert_not_called()
+
+            (tmp_path / "missing.txt").write_text(CATB_TABLE)
+            process_runs([15600, 16000])
+            assert [call.args[0] for call in launch.call_args_list] == [15600, 16000]
+            assert launch.call_args_list[0].args[1][0].endswith("Run15490.0000.fits.gz")
+    finally:
+        cfg.set("LST1", "TABLE_CATB", table_catB)
+        cfg.set("lstchain", "apply_catB_calibration", catB)
+        cfg.set("LST1", "CAT_A_SERVICE_DIR", catA_service_dir)
@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from osa.configs.config import cfg
+from osa.scripts import troubleshooting_utils as utils
+
+
+@pytest.fixture
+def troubleshooting_dir(tmp_path):
+    previous = cfg.get("LST1", "TROUBLESHOOTING_DIR")
+    cfg.set("LST1", "TROUBLESHOOTING_DIR", str(tmp_path))
+    yield tmp_path
+    cfg.set("LST1", "TROUBLESHOOTING_DIR", previous)
+
+
+def test_job_registry(troubleshooting_dir):
+    # Records of the former text files are imported when the registry is created
+    old_date = (datetime.now() - timedelta(days=2)).strftime("%Y%m%d")
+    (troubleshooting_dir / old_date).mkdir()
+    (troubleshooting_dir / old_date / f"{old_date}_processed.txt").write_text("100\n101\n")
+
+    assert utils.is_job_already_processed_or_skipped("100") == "PROCESSED"
+    assert utils.is_job_already_processed_or_skipped("200") is False
+
+    assert utils.save_processed_job_id(200)
+    assert utils.save_skipped_job_id("201")
+    assert utils.load_job_registry() == {
+        "100": "PROCESSED",
+        "101": "PROCESSED",
+        "200": "PROCESSED",
+        "201": "SKIPPED",
+    }
+
+    # Only the jobs of the nights older than the retention period are forgotten
+    assert utils.rotate_job_registry(keep_days=1) == 2
+    assert set(utils.load_job_registry()) == {"200", "201"}
+
+
+def test_parse_scontrol_jobs():
+    output = (
+        "JobId=51712367 JobName=LST1_01807 UserId=lstanalyzer(1) JobState=FAILED "
+        "Command=/fefs/sequence_LST1_01807.py WorkDir=/fefs "
+        "StdErr=/fefs/log/Run01807_51712367.err StdIn=/dev/null "
+        "StdOut=/fefs/log/Run01807_51712367.out\n"
+        "JobId=51712370 ArrayJobId=51712368 ArrayTaskId=2 JobName=gain_selection "
+        "JobState=FAILED Command=/fefs/gain_selection.sh 01807 "
+        "StdErr=/fefs/gainsel_01807_2.err StdOut=/fefs/gainsel_01807_2.out\n"
+        "JobId=51712400 JobName=other JobState=COMPLETED Command=/fefs/other.sh\n"
+    )
+    details = utils.parse_scontrol_jobs(output, ["51712367", "51712368_2"])
+
+    assert details == {
+        "51712367": {
+            "stdout": "/fefs/log/Run01807_51712367.out",
+            "stderr": "/fefs/log/Run01807_51712367.err",
+            "command": "/fefs/sequence_LST1_01807.py",
+        },
+        "51712368_2": {
+            "stdout": "/fefs/gainsel_01807_2.out",
+            "stderr": "/fefs/gainsel_01807_2.err",
+            "command": "/fefs/gain_selection.sh",
+        },
+    }
+    assert len(utils.parse_scontrol_jobs(output)) == 3
+
+
+KNOWN_ERRORS = {
+    r"Table .* already exists": {"tag": "Existing table", "error_id": 1},
+    "Resource temporarily unavailable": {"tag": "Resource unavailable", "error_id": 6},
+}
+
+
+def test_scan_log_tail(tmp_path):
+    signatures = utils.compile_error_signatures(KNOWN_ERRORS)
+    log = tmp_path / "Run01807_51712367.err"
+    lines = [f"INFO processing event {i}" for i in range(1000)]
+    lines[10] = "ERROR table /dl1/event already exists"
+    lines[990] = "OSError: RESOURCE TEMPORARILY UNAVAILABLE"
+    lines[995] = "OSError: Resource temporarily unavailable"
+    log.write_text("\n".join(lines) + "\n")
+
+    # Matches are given in the order of the known errors, not of the log
+    matches = utils.scan_log_tail(log, signatures)
+    assert [match["error_id"] for match in matches] == [1, 6]
+    assert matches[0]["line"] == 11
+    assert matches[0]["excerpt"] == lines[10]
+    assert matches[1]["line"] == 991
+    assert matches[1]["details"]["tag"] == "Resource unavailable"
+    content = log.read_bytes()
+    assert content[matches[1]["offset"]:].startswith(b"RESOURCE")
+
+    # The beginning of the log is not scanned
+    matches = utils.scan_log_tail(log, signatures, tail_bytes=2000)
+    assert [match["error_id"] for match in matches] == [6]
+    assert content[matches[0]["offset"]:].startswith(b"RESOURCE")
+
+    assert utils.scan_log_tail(tmp_path / "missing.err", signatures) is None
+
+
+def test_scan_logs(tmp_path):
+    signatures = utils.compile_error_signatures(KNOWN_ERRORS)
+    logs = []
+    for i in range(10):
+        log = tmp_path / f"job_{i}.err"
+        log.write_text("Traceback\nResource temporarily unavailable\n" if i % 2 else "all good\n")
+        logs.append(str(log))
+
+    results = utils.scan_logs(logs, signatures, max_workers=4)
+    assert [bool(results[log]) for log in logs] == [bool(i % 2) for i in range(10)]
+
+    # The results are reused by the handlers
+    (tmp_path / "job_1.err").write_text("all good\n")
+    assert utils.find_known_errors(logs[1], signatures)[0]["error_id"] == 6
+
+    # Until the next sweep
+    utils.clear_scanned_logs()
+    assert utils.find_known_errors(logs[1], signatures) == []
+
+
+def test_error_signatures_without_literal(tmp_path):
+    known_errors = {r"offset value: (32768|65536)": {"error_id": 4}, r"\d+ bad events": {"error_id": 7}}
+    signatures = utils.compile_error_signatures(known_errors)
+
+    log = tmp_path / "gain_selection_01807.0001.log"
+    log.write_text("start\n12 BAD events\nRuntimeError: unexpected offset value: 32768\n")
+    matches = utils.scan_log_tail(log, signatures)
+    assert [(match["error_id"], match["line"]) for match in matches] == [(4, 3), (7, 2)]
+
+
+def test_error_signatures_multiline(tmp_path):
+    known_errors = {r"Traceback[^\n]*\n(?:\s.*\n)*KeyError: 'event_id'": {"error_id": 9}}
+    signatures = utils.compile_error_signatures(known_errors)
+
+    log = tmp_path / "Run01807_51712368.err"
+    log.write_text(
+        "start\nTraceback (most recent call last):\n"
+        '  File "lstchain_data_r0_to_dl1", line 8, in <module>\n'
+        "KeyError: 'event_id'\n"
+    )
+    matches = utils.scan_log_tail(log, signatures)
+    assert [(match["error_id"], match["line"]) for match in matches] == [(9, 2)]
+    assert matches[0]["excerpt"].endswith("KeyError: 'event_id'")
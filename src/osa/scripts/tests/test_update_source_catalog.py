@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from astropy import units as u
+from astropy.table import Table
+from ctapipe.containers import EventType
+from lstchain.io.io import dl1_params_lstcam_key, write_dataframe
+from lstchain.reco.utils import add_delta_t_key, get_effective_time
+
+from osa.scripts.update_source_catalog import (
+    export_ecsv,
+    existing_run_ids,
+    get_start_and_elapsed,
+    open_catalog_db,
+    read_catalog,
+    upsert_catalog_rows,
+)
+
+
+def test_get_start_and_elapsed(tmp_path):
+    rng = np.random.default_rng(0)
+    n_events = 5000
+    dragon_time = 1.6e9 + np.cumsum(rng.exponential(1e-3, n_events))
+    # Simulate a DAQ stop in the middle of the run
+    dragon_time[2500:] += 5
+    event_type = np.full(n_events, EventType.SUBARRAY.value)
+    event_type[::50] = EventType.SKY_PEDESTAL.value
+    df = pd.DataFrame({"dragon_time": dragon_time, "event_type": event_type, "intensity": 1.0})
+
+    dl1_file = tmp_path / "dl1_LST-1.Run01807.h5"
+    write_dataframe(df, dl1_file, dl1_params_lstcam_key)
+
+    start_time, elapsed = get_start_and_elapsed(dl1_file, chunk_size=333)
+    _, expected_elapsed = get_effective_time(add_delta_t_key(df))
+
+    assert start_time.startswith("2020-09-13")
+    assert u.isclose(elapsed, expected_elapsed.to(u.min))
+
+
+def new_rows(run_ids, date_dir="2020-01-17"):
+    return pd.DataFrame(
+        {
+            "run_id": run_ids,
+            "source_name": "Crab",
+            "date_dir": date_dir,
+            "elapsed_min": 20.0,
+            "run_start": "2020-01-18 00:44:06.000",
+        }
+    )
+
+
+def test_catalog_store(tmp_path):
+    ecsv_file = tmp_path / "LST_source_catalog.ecsv"
+
+    with open_catalog_db(tmp_path / "LST_source_catalog.db") as connection:
+        rows = new_rows([1807, 1808])
+        upsert_catalog_rows(connection, rows)
+        export_ecsv(connection, ecsv_file, rows, replaced=False)
+
+        # New runs are appended to the existing ECSV file
+        rows = new_rows([1900], date_dir="2020-01-18")
+        upsert_catalog_rows(connection, rows)
+        export_ecsv(connection, ecsv_file, rows, replaced=False)
+        assert list(Table.read(ecsv_file)["Run ID"]) == [1807, 1808, 1900]
+
+        # Reprocessed runs replace the previous entries
+        rows = new_rows([1808], date_dir="2020-01-19")
+        assert existing_run_ids(connection, rows["run_id"]) == {1808}
+        upsert_catalog_rows(connection, rows)
+        export_ecsv(connection, ecsv_file, rows, replaced=True)
+
+        catalog = read_catalog(connection)
+
+    assert list(catalog["Run ID"]) == [1900, 1808, 1807]
+    table = Table.read(ecsv_file)
+    assert list(table["Run ID"]) == [1807, 1808, 1900]
+    assert table[table["Run ID"] == 1808]["Date directory"][0] == "2020-01-19"
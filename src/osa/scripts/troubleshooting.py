@@ -30,6 +30,12 @@ JOB_CATEGORIES_MAP = {
 
 REPORT_ORDER = ["GAIN_SEL", "SEQUENCER", "CAT_B", "CLOSER", "UNKNOWN"]
 
+HANDLER_MODULES = {
+    "GAIN_SEL": handlers_gainsel,
+    "SEQUENCER": handlers_sequencer,
+    "CAT_B": handlers_catB,
+}
+
 def log_msg(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}", flush=True)
@@ -52,12 +58,32 @@ def get_scontrol_details(job_id):
     except subprocess.CalledProcessError:
         return {'stdout': 'Unknown', 'command': 'Unknown', 'stderr': 'Unknown'}
 
-    details = {
-        'stdout': (re.search(r'StdOut=([^\s]+)', output) or [None, "No Log"])[1],
-        'stderr': (re.search(r'StdErr=([^\s]+)', output) or [None, "No Error Path"])[1],
-        'command': (re.search(r'Command=(.+)', output) or [None, "Unknown"])[1].split()[0]
+    return utils.parse_scontrol_details(output)
+
+def get_scontrol_details_batch(job_ids):
+    """
+    Retrieves StdOut, StdErr, and Command of several jobs with a single scontrol call.
+    Jobs no longer known by the controller are not included.
+    """
+    if not job_ids:
+        return {}
+    cmd = [SCONTROL_CMD, "show", "job", "--oneliner"]
+    try:
+        output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL, text=True)
+    except (subprocess.CalledProcessError, OSError):
+        return {}
+    return utils.parse_scontrol_jobs(output, job_ids)
+
+def expand_log_pattern(path, job):
+    """Replaces the filename patterns (%j, %x, %u, %A, %a) that sacct may leave in StdOut/StdErr."""
+    if not path or '%' not in path:
+        return path
+    array_job, _, array_task = job['id'].partition('_')
+    replacements = {
+        '%j': job['id'], '%x': job['name'], '%u': SLURM_USER,
+        '%A': array_job, '%a': array_task, '%%': '%',
     }
-    return details
+    return re.sub(r'%[jxuAa%]', lambda match: replacements[match.group(0)], path)
 
 def display_job_batch(title, jobs, icon="✅"):
     """Generic display for processed or skipped job lists."""
@@ -73,15 +99,24 @@ def display_job_batch(title, jobs, icon="✅"):
 # ---------------------------------------------------------
 
 def get_failed_slurm_jobs(start_date):
-    """Fetches jobs from sacct and filters for non-success states."""
-    cmd = [
+    """
+    Fetches jobs from sacct and filters for non-success states.
+    Their StdOut and StdErr are also taken from sacct when it provides them (Slurm >= 23.02).
+    """
+    base_cmd = [
         SACCT_CMD, '-X', f'--user={SLURM_USER}',
         f'--starttime={start_date}',# f'--endtime={end_date}',
-        '--format=JobID,JobName,State', '--noconvert', '-n', '-P'
+        '--noconvert', '-n', '-P'
     ]
-    try:
-        result = subprocess.check_output(cmd, stderr=subprocess.STDOUT, text=True)
-    except subprocess.CalledProcessError:
+    for fields in ('JobID,JobName,State,StdOut,StdErr', 'JobID,JobName,State'):
+        try:
+            result = subprocess.check_output(
+                base_cmd + [f'--format={fields}'], stderr=subprocess.STDOUT, text=True
+            )
+            break
+        except subprocess.CalledProcessError:
+            continue
+    else:
         return []
 
     failures = []
@@ -94,9 +129,27 @@ def get_failed_slurm_jobs(start_date):
         state = parts[2].split()[0].replace('+', '').upper()
 
         if state not in ignored_states:
-            failures.append({'id': parts[0], 'name': parts[1], 'state': state})
+            job = {'id': parts[0], 'name': parts[1], 'state': state}
+            if len(parts) >= 5:
+                job['stdout'] = expand_log_pattern(parts[3], job) or None
+                job['stderr'] = expand_log_pattern(parts[4], job) or None
+            failures.append(job)
     return failures
 
+def review_log_path(category, job):
+    """Log in which each handler looks for known errors."""
+    if category == "GAIN_SEL" or job['name'] == "lstchain_find_tailcuts":
+        return job['log_path']
+    return job['error_path']
+
+def prescan_logs(grouped_jobs):
+    """Scans the logs of all the failures for known errors in a thread pool."""
+    utils.clear_scanned_logs()
+    for category, module in HANDLER_MODULES.items():
+        paths = [review_log_path(category, job) for job in grouped_jobs.get(category, [])]
+        # Paths with array patterns (%4a) are resolved later by the handlers
+        utils.scan_logs([path for path in paths if path and '%' not in path], module.ERROR_SIGNATURES)
+
 def run_handler_routing(category, job, start_date, end_date, relaunched_commands):
     """Routes a single job to its specific troubleshooting module."""
     args = (job['id'], job['name'], job['state'], job['log_path'],
@@ -124,10 +177,19 @@ def process_jobs(start_date, end_date, more_days, no_show_processed):
     skipped_history = []
     relaunched_commands = []
 
+    # Registry and job details are fetched once for all the failures
+    utils.rotate_job_registry()
+    registry = utils.load_job_registry()
+    scontrol_details = get_scontrol_details_batch([job['id'] for job in raw_failures])
+
     for job in raw_failures:
         # Check history first
-        history_status = utils.is_job_already_processed_or_skipped(job['id'])
-        details = get_scontrol_details(job['id'])
+        history_status = registry.get(job['id'])
+        details = scontrol_details.get(job['id']) or {
+            'stdout': job.get('stdout') or 'Unknown',
+            'stderr': job.get('stderr') or 'Unknown',
+            'command': 'Unknown',
+        }
 
         summary_info = {
             'id': job['id'], 'name': job['name'],
@@ -154,6 +216,8 @@ def process_jobs(start_date, end_date, more_days, no_show_processed):
         })
         grouped_jobs[category].append(job)
 
+    prescan_logs(grouped_jobs)
+
     # Execution Phase
     for category in REPORT_ORDER:
         job_list = grouped_jobs.get(category, [])
@@ -1,4 +1,3 @@
-import os
 import re
 import troubleshooting_utils as utils
 from osa.configs.config import cfg
@@ -39,6 +38,8 @@ KNOWN_ERRORS = {
     }
 }
 
+ERROR_SIGNATURES = utils.compile_error_signatures(KNOWN_ERRORS)
+
 def finalize_action(job_id, success, logger_func, success_msg, fail_msg):
     """Logs results and saves job ID on success."""
     if success:
@@ -91,30 +92,29 @@ def handle_error(job_id, job_name, state, log_path, error_path, command, logger_
         success = utils.run_command(command)
         return command if finalize_action(job_id, success, logger_func, "Memory increased & relaunched.", "Relaunch failed.") else None
 
-    if not review_path or not os.path.exists(review_path):
+    if not utils.log_exists(review_path):
         logger_func("Job skipped, can't find the log file")
         utils.save_skipped_job_id(job_id)
         return False
 
     # --- Pattern Matching ---
     try:
-        with open(review_path, 'r', errors='ignore') as f:
-            content = f.read()
-            for pattern, details in KNOWN_ERRORS.items():
-                if re.search(pattern, content, re.IGNORECASE):
-                    logger_func(f"   |__ ❌ DETECTED: {details['tag']}")
-                    eid = details['error_id']
-                    if eid == 2:
-                        handle_ecsv_type_update(job_id, review_path, logger_func, 20, start_date)
-                    elif eid == 1 or eid == 3 or eid == 6:
-                        handle_log_cleanup(job_id, log_path, error_path, logger_func)
-                        success = utils.run_command(command)
-                        return command if finalize_action(job_id, success, logger_func, "Memory increased & relaunched.", "Relaunch failed.") else None
-                    elif eid == 4:
-                        handle_ecsv_type_update(job_id, review_path, logger_func, start_date)
-                    elif eid == 5:
-                        handle_pro_link(job_id, log_path, error_path, logger_func, 0, start_date)
-                    return None # Action taken
+        matches = utils.find_known_errors(review_path, ERROR_SIGNATURES) or []
+        if matches:
+            details = matches[0]['details']
+            logger_func(f"   |__ ❌ DETECTED: {details['tag']} (line {matches[0]['line']})")
+            eid = details['error_id']
+            if eid == 2:
+                handle_ecsv_type_update(job_id, review_path, logger_func, 20, start_date)
+            elif eid == 1 or eid == 3 or eid == 6:
+                handle_log_cleanup(job_id, log_path, error_path, logger_func)
+                success = utils.run_command(command)
+                return command if finalize_action(job_id, success, logger_func, "Memory increased & relaunched.", "Relaunch failed.") else None
+            elif eid == 4:
+                handle_ecsv_type_update(job_id, review_path, logger_func, start_date)
+            elif eid == 5:
+                handle_pro_link(job_id, log_path, error_path, logger_func, 0, start_date)
+            return None # Action taken
     except Exception as e:
         logger_func(f"   |__ ❌ EXCEPTION: {str(e)}")
 
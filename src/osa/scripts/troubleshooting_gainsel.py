@@ -1,4 +1,3 @@
-import os
 import re
 import troubleshooting_utils as utils
 from datetime import datetime, timedelta
@@ -28,6 +27,8 @@ KNOWN_ERRORS = {
         "error_id": 4
     }
 }
+ERROR_SIGNATURES = utils.compile_error_signatures(KNOWN_ERRORS)
+
 def extract_ids_and_paths(job_id, job_name, log_path, error_path):
     match = re.search(r'^(\d{8,9})_(\d{1,3})$', job_id) or \
             re.search(r'LST1_(\d{5,6})(?:_(\d+))?', job_name)
@@ -94,31 +95,30 @@ def handle_error(job_id, job_name, state, log_path, error_path, command, logger_
         logger_func("   |__ ❌ DIAGNOSIS: TIMEOUT. 💡 ACTION: Increase --mem.")
         return process_memory_relaunch(job_id, command, review_path, logger_func, handler)
 
-    if not review_path or not os.path.exists(review_path):
+    if not utils.log_exists(review_path):
         logger_func("Job skipped, can't find the log file")
         utils.save_skipped_job_id(job_id)
         return None
 
     try:
-        with open(review_path, 'r', errors='ignore') as f:
-            content = f.read()
-            for pattern, details in KNOWN_ERRORS.items():
-                if re.search(pattern, content, re.IGNORECASE):
-                    logger_func(f"   |__ ❌ DETECTED: {details['tag']}")
-                    logger_func(f"   |__ 💡 SOLUTION: {details['msg']}")
-                    err_id = details['error_id']
-                    if err_id == 1:
-                        process_ecsv_update(job_id, review_path, logger_func)
-                        return None
-                    if err_id in [2, 3]:
-                        return process_memory_relaunch(job_id, command, review_path, logger_func, handler)
-                    if err_id == 4:
-                        run_id, subrun_id, log_path, error_path = extract_ids_and_paths(job_id, job_name, log_path, error_path)
-                        yesterday = datetime.now() - timedelta(days=1)
-                        summary_date = yesterday.strftime('%Y%m%d')
-                        R0_DIR = Path(cfg.get("LST1", "R0_DIR"))
-                        utils.delete_path(f'{R0_DIR}/{summary_date}/LST-1.1.Run{run_id}.{subrun_id}.fits.fz')
-                        return process_memory_relaunch(job_id, command, review_path, logger_func, handler)
+        matches = utils.find_known_errors(review_path, ERROR_SIGNATURES) or []
+        if matches:
+            details = matches[0]['details']
+            logger_func(f"   |__ ❌ DETECTED: {details['tag']} (line {matches[0]['line']})")
+            logger_func(f"   |__ 💡 SOLUTION: {details['msg']}")
+            err_id = details['error_id']
+            if err_id == 1:
+                process_ecsv_update(job_id, review_path, logger_func)
+                return None
+            if err_id in [2, 3]:
+                return process_memory_relaunch(job_id, command, review_path, logger_func, handler)
+            if err_id == 4:
+                run_id, subrun_id, log_path, error_path = extract_ids_and_paths(job_id, job_name, log_path, error_path)
+                yesterday = datetime.now() - timedelta(days=1)
+                summary_date = yesterday.strftime('%Y%m%d')
+                R0_DIR = Path(cfg.get("LST1", "R0_DIR"))
+                utils.delete_path(f'{R0_DIR}/{summary_date}/LST-1.1.Run{run_id}.{subrun_id}.fits.fz')
+                return process_memory_relaunch(job_id, command, review_path, logger_func, handler)
 
     except Exception as e:
         logger_func(f"   |__ ❌ EXCEPTION: {str(e)}")
@@ -1,5 +1,3 @@
-import glob
-import os
 import re
 import troubleshooting_utils as utils
 from osa.configs.config import cfg
@@ -40,6 +38,8 @@ KNOWN_ERRORS = {
     }
 }
 
+ERROR_SIGNATURES = utils.compile_error_signatures(KNOWN_ERRORS)
+
 # --- HELPERS ---
 
 def log_and_save(job_id, success, logger_func, success_msg, fail_msg):
@@ -72,8 +72,8 @@ def extract_ids_and_paths(job_id, job_name, log_path, error_path):
         search_pattern_err = error_path.replace("%4a", subrun_fmt)
         search_pattern_log = log_path.replace("%4a", subrun_fmt)
 
-    found_err = glob.glob(search_pattern_err)
-    found_log = glob.glob(search_pattern_log)
+    found_err = utils.glob_logs(search_pattern_err)
+    found_log = utils.glob_logs(search_pattern_log)
     final_error_path = found_err[0] if found_err else search_pattern_err
     final_log_path = found_log[0] if found_log else search_pattern_log
 
@@ -126,18 +126,20 @@ def handle_error(job_id, job_name, state, log_path, error_path, command, logger_
     if state == "TIMEOUT":
         return perform_relaunch(job_id, command, logger_func, handler, "Timeout: memory increased")
 
-    if not os.path.exists(log_path):
+    if not utils.log_exists(log_path):
         logger_func("Job skipped, can't find the log file")
         utils.save_skipped_job_id(job_id)
         return None
 
     try:
-        with open(error_path, 'r', errors='ignore') as f:
-            content = f.read()
-            for pattern, details in KNOWN_ERRORS.items():
-                if re.search(pattern, content, re.IGNORECASE):
-                    logger_func(f"   |__ ❌ DETECTED: {details.get('tag', details.get('description'))}")
-                    return handle_case_actions(details['error_id'], job_id, run_id, subrun_id, command, logger_func, handler, start_date)
+        matches = utils.find_known_errors(error_path, ERROR_SIGNATURES)
+        if matches is None:
+            logger_func(f"   |__ ❌ EXCEPTION: Cannot read {error_path}")
+            return None
+        if matches:
+            details = matches[0]['details']
+            logger_func(f"   |__ ❌ DETECTED: {details.get('tag', details.get('description'))} (line {matches[0]['line']})")
+            return handle_case_actions(details['error_id'], job_id, run_id, subrun_id, command, logger_func, handler, start_date)
     except Exception as e:
         logger_func(f"   |__ ❌ EXCEPTION: {str(e)}")
         return None
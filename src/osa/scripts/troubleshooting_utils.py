@@ -1,31 +1,173 @@
 import glob
+import io
 import os
 import shutil
 import re
+import sqlite3
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from datetime import datetime, timedelta
 from osa.configs.config import cfg
+from osa.utils import logarchive
 from pathlib import Path
 
 # ==========================================
 # 1. LOGS & TEXT ANALYSIS
 # ==========================================
 
+def log_exists(log_path):
+    """Checks if a log file exists on disk or in the log archives of its directory."""
+    if not log_path:
+        return False
+    return os.path.exists(log_path) or logarchive.find_archived_log(log_path) is not None
+
+def read_log(log_path):
+    """
+    Returns the content of a log file. If it was already compressed by organize_def,
+    only that log is read from the archive. Returns None if the log is not found.
+    """
+    if not log_path:
+        return None
+    try:
+        if os.path.exists(log_path):
+            with open(log_path, 'r', errors='ignore') as f:
+                return f.read()
+        return logarchive.read_archived_log(log_path)
+    except Exception as e:
+        print(f"[UTILS ERROR] Failed to read log {log_path}: {e}")
+        return None
+
+def glob_logs(pattern):
+    """Returns the log files matching a glob pattern, looking also in the log archives."""
+    return glob.glob(pattern) or logarchive.glob_archived_logs(pattern)
+
 def log_contains_pattern(log_path, pattern):
     """
     Checks if a specific pattern (string or regex) exists in a log file.
     Returns: True if found, False otherwise.
     """
-    if not log_path or not os.path.exists(log_path):
+    content = read_log(log_path)
+    if content is None:
         return False
+    return re.search(pattern, content, re.IGNORECASE) is not None
+
+# Only the end of the logs is scanned for known errors: that is where the tracebacks are
+LOG_TAIL_BYTES = 4 * 1024 * 1024
+EXCERPT_LENGTH = 200
+
+# Scans of the logs already done in this sweep, by (log path, signatures)
+_scanned_logs = {}
+
+def clear_scanned_logs():
+    """Forgets the scans of the logs of a previous sweep, whose logs may have changed."""
+    _scanned_logs.clear()
+
+def compile_error_signatures(known_errors):
+    """
+    Compiles the patterns of a KNOWN_ERRORS dictionary into a single case-insensitive
+    alternation with one named group per pattern, so each log is scanned only once.
+
+    Returns the (regex, details) tuple, details being in the order of the patterns.
+    """
+    details = list(known_errors.values())
+    regex = re.compile(
+        "|".join(f"(?P<e{i}>{pattern})" for i, pattern in enumerate(known_errors)),
+        re.IGNORECASE,
+    )
+    return regex, details
+
+def _open_log_tail(log_path, tail_bytes):
+    """
+    Opens a log positioned at the first full line of its last tail_bytes.
+    Falls back to the log archives. Returns (binary file, offset) or (None, 0).
+    """
+    if os.path.exists(log_path):
+        f = open(log_path, 'rb')
+        size = f.seek(0, os.SEEK_END)
+    else:
+        content = logarchive.read_archived_log(log_path)
+        if content is None:
+            return None, 0
+        data = content.encode()
+        f = io.BytesIO(data)
+        size = len(data)
+
+    offset = max(0, size - tail_bytes)
+    f.seek(offset)
+    if offset > 0:
+        # Skip the partial first line
+        offset += len(f.readline())
+    return f, offset
+
+def scan_log_tail(log_path, signatures, tail_bytes=LOG_TAIL_BYTES):
+    """
+    Scans the last tail_bytes of a log looking for known error signatures, which
+    may span several lines.
+
+    Returns a list with the first match of each signature found, in the order of the
+    KNOWN_ERRORS patterns, as dicts with error_id, line (counted from the start of the
+    scanned tail, which is the whole log if it is smaller than tail_bytes), offset
+    (in bytes, from the start of the log), excerpt (the matching lines) and details.
+    Returns None if the log cannot be read.
+    """
+    regex, details = signatures
+    if not log_path:
+        return None
     try:
-        with open(log_path, 'r', errors='ignore') as f:
-            content = f.read()
-            if re.search(pattern, content, re.IGNORECASE):
-                return True
-    except Exception as e:
+        f, offset = _open_log_tail(log_path, tail_bytes)
+        if f is None:
+            return None
+        with f:
+            text = f.read().decode(errors='replace')
+    except OSError as e:
         print(f"[UTILS ERROR] Failed to read log {log_path}: {e}")
-    return False
+        return None
+
+    found = {}
+    for match in regex.finditer(text):
+        index = int(match.lastgroup[1:])
+        if index in found:
+            continue
+        line_start = text.rfind("\n", 0, match.start()) + 1
+        line_end = text.find("\n", match.end())
+        found[index] = {
+            'error_id': details[index]['error_id'],
+            'line': text.count("\n", 0, match.start()) + 1,
+            'offset': offset + len(text[:match.start()].encode()),
+            'excerpt': text[line_start:line_end if line_end >= 0 else None].strip()[:EXCERPT_LENGTH],
+            'details': details[index],
+        }
+        if len(found) == len(details):
+            break
+
+    return [found[index] for index in sorted(found)]
+
+def scan_logs(log_paths, signatures, max_workers=8, tail_bytes=LOG_TAIL_BYTES):
+    """
+    Scans several logs for known error signatures in a thread pool.
+    Returns the matches of each log, as given by scan_log_tail, and keeps them
+    for the later find_known_errors calls of the same sweep.
+    """
+    paths = [path for path in dict.fromkeys(log_paths) if path]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(
+            paths,
+            executor.map(lambda path: scan_log_tail(path, signatures, tail_bytes), paths),
+        ))
+    for path, matches in results.items():
+        _scanned_logs[(path, signatures[0].pattern)] = matches
+    return results
+
+def find_known_errors(log_path, signatures):
+    """
+    Returns the known errors found at the end of a log, the most relevant first,
+    reusing the result of a previous scan_logs of the log. None if the log cannot be read.
+    """
+    key = (log_path, signatures[0].pattern)
+    if key not in _scanned_logs:
+        _scanned_logs[key] = scan_log_tail(log_path, signatures)
+    return _scanned_logs[key]
 
 # ==========================================
 # 2. FILE SYSTEM OPERATIONS (CRUD)
@@ -254,6 +396,34 @@ def run_command(command_str):
         print("Command relaunch failed")
         return -1, str(e)
 
+def parse_scontrol_details(record):
+    """Extracts StdOut, StdErr and Command from the `scontrol show job` record of a job."""
+    return {
+        'stdout': (re.search(r'StdOut=([^\s]+)', record) or [None, "No Log"])[1],
+        'stderr': (re.search(r'StdErr=([^\s]+)', record) or [None, "No Error Path"])[1],
+        'command': (re.search(r'Command=(.+)', record) or [None, "Unknown"])[1].split()[0]
+    }
+
+def parse_scontrol_jobs(output, job_ids=None):
+    """
+    Splits the output of `scontrol show job --oneliner` into the details of each job.
+    Array tasks are indexed as ARRAYJOBID_TASKID, as listed by sacct.
+    If job_ids is given, only those jobs are returned.
+    """
+    wanted = None if job_ids is None else {str(job_id) for job_id in job_ids}
+    details = {}
+    for record in output.splitlines():
+        match = re.search(r'JobId=(\d+)', record)
+        if not match:
+            continue
+        job_id = match.group(1)
+        array = re.search(r'ArrayJobId=(\d+) ArrayTaskId=(\d+)\b', record)
+        if array:
+            job_id = f"{array.group(1)}_{array.group(2)}"
+        if wanted is None or job_id in wanted:
+            details[job_id] = parse_scontrol_details(record)
+    return details
+
 def increase_memory_and_relaunch(script_path, new_mem):
     """
     1. Reads a .sh/.slurm script.
@@ -345,76 +515,6 @@ def get_date_from_path(path):
 
     return None
 
-def save_processed_job_id(job_id):
-    """
-    Saves the job_id to a text file to keep a record.
-    Creates the file if it does not exist.
-    """
-    try:
-        yesterday = datetime.now() - timedelta(days=1)
-        main_date = yesterday.strftime('%Y%m%d')
-        # Ensure the directory exists
-        TROUBLESHOOTING_DIR = Path(cfg.get("LST1", "TROUBLESHOOTING_DIR"))
-        folder = os.path.dirname(TROUBLESHOOTING_DIR+main_date+'/')
-        if folder and not os.path.exists(folder):
-            os.makedirs(folder, exist_ok=True)
-
-        with open(folder+'/'+main_date+'_processed.txt', 'a') as f:
-            f.write(f"{job_id}\n")
-        return True
-    except Exception as e:
-        print(f"[UTILS ERROR] Could not save Job ID {job_id}: {e}")
-        return False
-
-def save_skipped_job_id(job_id):
-    """
-    Saves the job_id to a text file to keep a record of skipped jobs.
-    Creates the file if it does not exist.
-    """
-    try:
-        yesterday = datetime.now() - timedelta(days=1)
-        main_date = yesterday.strftime('%Y%m%d')
-        # Ensure the directory exists
-        TROUBLESHOOTING_DIR = Path(cfg.get("LST1", "TROUBLESHOOTING_DIR"))
-        folder = os.path.dirname(TROUBLESHOOTING_DIR+main_date+'/')
-        if folder and not os.path.exists(folder):
-            os.makedirs(folder, exist_ok=True)
-
-        with open(folder+'/'+main_date+'_skipped.txt', 'a') as f:
-            f.write(f"{job_id}\n")
-        return True
-    except Exception as e:
-        print(f"[UTILS ERROR] Could not save Job ID {job_id}: {e}")
-        return False
-
-def is_job_already_processed_or_skipped(job_id):
-    """
-    Checks if a job_id is already in the record files.
-    """
-    yesterday = datetime.now() - timedelta(days=1)
-    main_date = yesterday.strftime('%Y%m%d')
-    TROUBLESHOOTING_DIR = Path(cfg.get("LST1", "TROUBLESHOOTING_DIR"))
-    file_path_processed =TROUBLESHOOTING_DIR+main_date+'/'+main_date+'_processed.txt'
-    file_path_skipped =TROUBLESHOOTING_DIR+main_date+'/'+main_date+'_skipped.txt'
-
-    try:
-        if os.path.exists(file_path_processed):
-            with open(file_path_processed, 'r') as f:
-                processed_jobs = set(line.strip() for line in f)
-                if str(job_id) in processed_jobs:
-                    return 'PROCESSED'
-
-        if os.path.exists(file_path_skipped):
-            with open(file_path_skipped, 'r') as f:
-                skipped_jobs = set(line.strip() for line in f)
-                if str(job_id) in skipped_jobs:
-                    return 'SKIPPED'
-
-    except Exception:
-        return False
-
-    return False
-
 def is_yesterday_path(path):
     """
     Checks if a directory in the path represents 'yesterday's date'
@@ -453,3 +553,110 @@ def get_summary_info(target_date):
     RUN_SUMMARY_DIR = Path(cfg.get("LST1", "RUN_SUMMARY_DIR"))
     path = f'{RUN_SUMMARY_DIR}/RunSummary_{summary_date}.ecsv'
     return summary_date, path
+
+# ==========================================
+# 5. JOB REGISTRY
+# ==========================================
+
+REGISTRY_FILENAME = "troubleshooting_registry.db"
+# Days for which the processed and skipped jobs are remembered
+REGISTRY_KEEP_DAYS = 90
+
+def registry_path():
+    """Path of the sqlite registry of processed and skipped jobs."""
+    return Path(cfg.get("LST1", "TROUBLESHOOTING_DIR")) / REGISTRY_FILENAME
+
+def _import_text_records(connection, troubleshooting_dir):
+    """Imports the records of the former YYYYMMDD/YYYYMMDD_{processed,skipped}.txt files."""
+    cutoff = (datetime.now() - timedelta(days=REGISTRY_KEEP_DAYS)).strftime('%Y%m%d')
+    rows = []
+    for status in ('processed', 'skipped'):
+        for path in glob.glob(f"{troubleshooting_dir}/20??????/20??????_{status}.txt"):
+            main_date = os.path.basename(os.path.dirname(path))
+            if main_date < cutoff:
+                continue
+            with open(path, 'r') as f:
+                rows.extend(
+                    (line.strip(), status.upper(), main_date, main_date)
+                    for line in f if line.strip()
+                )
+    connection.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)", rows)
+
+def open_job_registry():
+    """
+    Opens the registry of processed and skipped jobs, creating it if needed.
+    Jobs are indexed by job ID and by the date of the night they belong to.
+    """
+    path = registry_path()
+    is_new = not path.exists()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs "
+            "(job_id TEXT PRIMARY KEY, status TEXT NOT NULL, date TEXT NOT NULL, recorded TEXT NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_date ON jobs (date)")
+        if is_new:
+            _import_text_records(connection, path.parent)
+    return connection
+
+def _register_job(job_id, status):
+    """Records the final status of a job in the registry."""
+    try:
+        main_date = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
+        recorded = datetime.now().isoformat(timespec='seconds')
+        with closing(open_job_registry()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)",
+                (str(job_id), status, main_date, recorded),
+            )
+        return True
+    except Exception as e:
+        print(f"[UTILS ERROR] Could not save Job ID {job_id}: {e}")
+        return False
+
+def save_processed_job_id(job_id):
+    """Records the job_id as processed in the job registry."""
+    return _register_job(job_id, 'PROCESSED')
+
+def save_skipped_job_id(job_id):
+    """Records the job_id as skipped in the job registry."""
+    return _register_job(job_id, 'SKIPPED')
+
+def load_job_registry():
+    """
+    Returns the status ('PROCESSED' or 'SKIPPED') of every job in the registry
+    with a single query, so that a sweep over many failures does not query it per job.
+    """
+    try:
+        with closing(open_job_registry()) as connection:
+            return dict(connection.execute("SELECT job_id, status FROM jobs"))
+    except Exception as e:
+        print(f"[UTILS ERROR] Could not read the job registry: {e}")
+        return {}
+
+def is_job_already_processed_or_skipped(job_id):
+    """
+    Checks if a job_id is already in the job registry.
+    Returns 'PROCESSED', 'SKIPPED' or False.
+    """
+    try:
+        with closing(open_job_registry()) as connection:
+            row = connection.execute(
+                "SELECT status FROM jobs WHERE job_id = ?", (str(job_id),)
+            ).fetchone()
+    except Exception:
+        return False
+
+    return row[0] if row else False
+
+def rotate_job_registry(keep_days=REGISTRY_KEEP_DAYS):
+    """Forgets the jobs of the nights older than keep_days. Returns the number of jobs removed."""
+    cutoff = (datetime.now() - timedelta(days=keep_days)).strftime('%Y%m%d')
+    try:
+        with closing(open_job_registry()) as connection, connection:
+            return connection.execute("DELETE FROM jobs WHERE date < ?", (cutoff,)).rowcount
+    except Exception as e:
+        print(f"[UTILS ERROR] Could not rotate the job registry: {e}")
+        return 0
@@ -1,20 +1,26 @@
+import csv
 import logging
-import subprocess as sp
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from textwrap import dedent
 import argparse
+import numpy as np
 import pandas as pd
+import tables
 
 from astropy import units as u
-from astropy.table import Table, join, unique, vstack
+from astropy.table import Table, join
 from astropy.time import Time
+from ctapipe.containers import EventType
 from lstchain.io.io import dl1_params_lstcam_key
-from lstchain.reco.utils import add_delta_t_key, get_effective_time
 
 from osa.configs.config import cfg
 from osa.utils.cliopts import valid_date
 from osa.paths import DEFAULT_CFG, get_major_version, get_dl1_prod_id
 from osa.utils.utils import get_lstchain_version, date_to_dir, date_to_iso
+from osa.webserver.utils import publish
 
 
 pd.set_option("display.float_format", "{:.1f}".format)
@@ -44,6 +50,31 @@ parser.add_argument(
         type=str,
         default=get_lstchain_version()
 )
+parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of processes used to read the merged DL1 files",
+)
+parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        default=False,
+        help="Recompute the entries of runs already present in the catalog",
+)
+
+# Catalog column names, as exported to the ECSV and HTML files
+CATALOG_COLUMNS = {
+    "run_id": "Run ID",
+    "source_name": "Source name",
+    "date_dir": "Date directory",
+    "elapsed_min": "Elapsed [min]",
+    "run_start": "Run start [UTC]",
+}
+
+# Number of rows read at once from the DL1 parameters table
+CHUNK_SIZE = 1_000_000
 
 def add_table_to_html(html_table):
     return dedent(
@@ -121,10 +152,72 @@ def add_query_table_to_html(html_table):
     )
 
 
-def add_start_and_elapsed(table: Table, datedir: str, version: str) -> None:
+def get_start_and_elapsed(dl1_file: Path, chunk_size: int = CHUNK_SIZE) -> tuple:
+    """Return the timestamp of the first event and the elapsed time of a run.
+
+    Only the ``dragon_time`` and ``event_type`` columns of the DL1 parameters
+    table are read, in chunks of ``chunk_size`` rows, so the memory footprint
+    does not depend on the size of the file. The elapsed time follows the
+    definition of `lstchain.reco.utils.get_effective_time`: sum of the time
+    differences below 0.01 s between consecutive physics-trigger events.
+
+    Parameters
+    ----------
+    dl1_file : pathlib.Path
+        Merged DL1 file of the run.
+    chunk_size : int
+        Number of rows read at once.
+
+    Returns
+    -------
+    start_time : str
+        Timestamp of the first event in ISO format (UTC).
+    elapsed_time : astropy.units.Quantity
+        Elapsed time of the run in minutes.
+    """
+    physics_trigger = EventType.SUBARRAY.value
+    start_time = None
+    last_timestamp = None
+    elapsed = 0.0
+
+    with tables.open_file(dl1_file, mode="r") as h5file:
+        params = h5file.get_node(dl1_params_lstcam_key)
+
+        for start in range(0, params.nrows, chunk_size):
+            stop = min(start + chunk_size, params.nrows)
+            dragon_time = params.read(start, stop, field="dragon_time")
+            event_type = params.read(start, stop, field="event_type")
+
+            if start_time is None:
+                start_time = Time(dragon_time[0], format="unix", scale="utc").utc.iso
+
+            timestamp = dragon_time[event_type == physics_trigger]
+            if len(timestamp) == 0:
+                continue
+            if last_timestamp is not None:
+                timestamp = np.insert(timestamp, 0, last_timestamp)
+
+            time_diff = np.diff(timestamp)
+            elapsed += time_diff[time_diff < 0.01].sum()
+            last_timestamp = timestamp[-1]
+
+    return start_time, (elapsed * u.s).to(u.min)
+
+
+def merged_dl1_file(run: int, datedir: str, version: str) -> Path:
+    """Return the path of the merged DL1 file of a given run."""
+    major_version = get_major_version(version)
+    dl1b_config_file = Path(cfg.get("LST1", "TAILCUTS_FINDER_DIR")) / f"dl1ab_Run{run:05d}.json"
+    dl1_prod_id = get_dl1_prod_id(dl1b_config_file)
+    dl1_dir = Path(cfg.get("LST1", "DL1_DIR"))
+    return dl1_dir / datedir / major_version / dl1_prod_id / f"dl1_LST-1.Run{run:05d}.h5"
+
+
+def add_start_and_elapsed(table: Table, datedir: str, version: str, n_jobs: int = 1) -> None:
     """Add columns with the timestamp of first events and elapsed time of the runs.
 
-    This information is taken from the merged DL1 files. Two new columns are added
+    This information is taken from the merged DL1 files, which are read
+    in parallel by a pool of ``n_jobs`` processes. Two new columns are added
     to the input table.
 
     Parameters
@@ -135,38 +228,127 @@ def add_start_and_elapsed(table: Table, datedir: str, version: str) -> None:
         Date directory in YYYYMMDD format.
     version : str
         Production version of the processing in the format 'vW.X.Y.Z'.
+    n_jobs : int
+        Number of processes used to read the DL1 files.
     """
     if "run_id" not in table.columns:
         raise KeyError("Run ID not present in given table. Please check its content.")
 
-    start_times = []
-    elapsed_times = []
-
-    for run in table["run_id"]:
-        major_version = get_major_version(version)
-        dl1b_config_file = Path(cfg.get("LST1", "TAILCUTS_FINDER_DIR")) / f"dl1ab_Run{run:05d}.json"
-        dl1_prod_id = get_dl1_prod_id(dl1b_config_file)
-        dl1_dir = Path(cfg.get("LST1", "DL1_DIR"))
-        file = dl1_dir / datedir / major_version / dl1_prod_id / f"dl1_LST-1.Run{run:05d}.h5"
-        df = pd.read_hdf(file, key=dl1_params_lstcam_key)
+    files = [merged_dl1_file(run, datedir, version) for run in table["run_id"]]
 
-        # Timestamp of the first event
-        first_time = Time(df["dragon_time"][0], format="unix", scale="utc")
-        start_times.append(first_time.utc.iso)
+    if n_jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(get_start_and_elapsed, files))
+    else:
+        results = [get_start_and_elapsed(file) for file in files]
 
-        # Elapsed time of the run
-        df_delta = add_delta_t_key(df)
-        _, elapsed_t = get_effective_time(df_delta)
-        elapsed_times.append(elapsed_t.to(u.min))
+    start_times = [start_time for start_time, _ in results]
+    elapsed_times = [elapsed_time for _, elapsed_time in results]
 
     # Modify the input table by adding two new columns
     table.add_column(elapsed_times, name="Elapsed [min]")
     table.add_column(start_times, name="Run start [UTC]")
 
 
+@contextmanager
+def open_catalog_db(db_file: Path):
+    """Open the source catalog database, creating its table if needed."""
+    connection = sqlite3.connect(db_file)
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS source_catalog (
+            run_id INTEGER PRIMARY KEY,
+            source_name TEXT,
+            date_dir TEXT,
+            elapsed_min REAL,
+            run_start TEXT
+        )"""
+    )
+    try:
+        yield connection
+    finally:
+        connection.commit()
+        connection.close()
+
+
+def import_ecsv_catalog(connection, ecsv_file: Path) -> None:
+    """Fill an empty catalog database with the content of the legacy ECSV catalog."""
+    if not ecsv_file.exists():
+        return
+    if connection.execute("SELECT COUNT(*) FROM source_catalog").fetchone()[0] > 0:
+        return
+
+    log.info(f"Importing existing catalog {ecsv_file}")
+    table = Table.read(ecsv_file)
+    df = table.to_pandas().rename(columns={v: k for k, v in CATALOG_COLUMNS.items()})
+    upsert_catalog_rows(connection, df)
+
+
+def existing_run_ids(connection, run_ids) -> set:
+    """Return the subset of run IDs already present in the catalog."""
+    run_ids = [int(run_id) for run_id in run_ids]
+    if not run_ids:
+        return set()
+    placeholders = ",".join("?" * len(run_ids))
+    query = f"SELECT run_id FROM source_catalog WHERE run_id IN ({placeholders})"
+    return {row[0] for row in connection.execute(query, run_ids)}
+
+
+def upsert_catalog_rows(connection, df: pd.DataFrame) -> None:
+    """Insert the new runs in the catalog, replacing those already present."""
+    rows = [
+        (
+            int(row.run_id),
+            str(row.source_name),
+            str(row.date_dir),
+            float(row.elapsed_min),
+            str(row.run_start),
+        )
+        for row in df.itertuples(index=False)
+    ]
+    connection.executemany(
+        "INSERT OR REPLACE INTO source_catalog "
+        "(run_id, source_name, date_dir, elapsed_min, run_start) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def read_catalog(connection) -> pd.DataFrame:
+    """Return the whole catalog, sorted by decreasing run ID, with the exported column names."""
+    df = pd.read_sql_query(
+        f"SELECT {', '.join(CATALOG_COLUMNS)} FROM source_catalog ORDER BY run_id DESC",
+        connection,
+    )
+    return df.rename(columns=CATALOG_COLUMNS)
+
+
+def export_ecsv(connection, ecsv_file: Path, new_rows: pd.DataFrame, replaced: bool) -> None:
+    """Export the catalog to ECSV.
+
+    When only new runs with a run ID above any run already in the catalog
+    are added, their rows are appended to the existing file. Otherwise, the
+    whole file is rewritten from the database.
+    """
+    if ecsv_file.exists() and not replaced and not new_rows.empty:
+        previous_max = connection.execute(
+            "SELECT MAX(run_id) FROM source_catalog WHERE run_id NOT IN "
+            f"({','.join('?' * len(new_rows))})",
+            [int(run_id) for run_id in new_rows["run_id"]],
+        ).fetchone()[0]
+
+        if previous_max is None or new_rows["run_id"].min() > previous_max:
+            rows = new_rows.sort_values("run_id")[list(CATALOG_COLUMNS)]
+            with open(ecsv_file, "a", newline="") as file:
+                csv.writer(file, lineterminator="\n").writerows(rows.itertuples(index=False))
+            return
+
+    table = Table.from_pandas(read_catalog(connection).sort_values("Run ID"))
+    table["Elapsed [min]"].unit = u.min
+    table.write(ecsv_file, delimiter=",", overwrite=True)
+
+
 def copy_to_webserver(html_file, csv_file):
-    sp.run(["scp", str(html_file), "datacheck:/home/www/html/datacheck/lstosa/."], check=True)
-    sp.run(["scp", str(csv_file), "datacheck:/home/www/html/datacheck/lstosa/."], check=True)
+    """Publish the HTML and ECSV catalogs to the lstosa directory of the webserver."""
+    publish({f"lstosa/{Path(file).name}": Path(file) for file in (html_file, csv_file)})
 
 
 def main():
@@ -178,10 +360,11 @@ def main():
     """
     args = parser.parse_args()
 
-    catalog_path = Path(cfg.get("LST1", "SOURCE_CATALOG")) / "LST_source_catalog.ecsv"
-    catalog_table = Table.read(catalog_path)
+    catalog_dir = Path(cfg.get("LST1", "SOURCE_CATALOG"))
+    catalog_path = catalog_dir / "LST_source_catalog.ecsv"
+    catalog_db = catalog_dir / "LST_source_catalog.db"
 
-    # Open table for given date and append its content to the table with entire catalog
+    # Open table for given date
     datedir = date_to_dir(args.date)
     run_catalog_dir = Path(cfg.get("LST1", "RUN_CATALOG")) 
     today_catalog = Table.read(run_catalog_dir / f"RunCatalog_{datedir}.ecsv")
@@ -193,24 +376,34 @@ def main():
     todays_info.add_column(date_to_iso(args.date), name="date_dir")
     todays_info.keep_columns(["run_id", "source_name", "date_dir"])
 
-    # Add start of run in iso format and elapsed time for each run
-    log.info("Getting run start and elapsed time")
-    add_start_and_elapsed(todays_info, datedir, args.version)
+    with open_catalog_db(catalog_db) as connection:
+        import_ecsv_catalog(connection, catalog_path)
+
+        already_in_catalog = existing_run_ids(connection, todays_info["run_id"])
+        if not args.overwrite:
+            mask = [run_id not in already_in_catalog for run_id in todays_info["run_id"]]
+            todays_info = todays_info[mask]
+
+        if len(todays_info) == 0:
+            log.info("All the runs of this date are already in the catalog. Nothing to do.")
+            return
+
+        # Add start of run in iso format and elapsed time for each run
+        log.info("Getting run start and elapsed time")
+        add_start_and_elapsed(todays_info, datedir, args.version, n_jobs=args.jobs)
 
-    # Change column names
-    todays_info.rename_column("run_id", "Run ID")
-    todays_info.rename_column("source_name", "Source name")
-    todays_info.rename_column("date_dir", "Date directory")
+        new_rows = todays_info.to_pandas().rename(
+            columns={"Elapsed [min]": "elapsed_min", "Run start [UTC]": "run_start"}
+        )
 
-    # Add new rows from given date to the whole catalog table
-    log.info("Adding new rows to table")
-    new_table = vstack([catalog_table, todays_info])
-    table_unique = unique(new_table, keys="Run ID", keep="last")
+        # Add new rows from given date to the catalog
+        log.info("Adding new rows to the catalog")
+        replaced = bool(already_in_catalog.intersection(new_rows["run_id"]))
+        upsert_catalog_rows(connection, new_rows)
 
-    # To pandas
-    log.info("Converting to pandas and HTML")
-    df = table_unique.to_pandas()
-    df = df.sort_values(by="Run ID", ascending=False)
+        log.info("Exporting the catalog to ECSV and HTML")
+        export_ecsv(connection, catalog_path, new_rows, replaced)
+        df = read_catalog(connection)
 
     # To HTML
     html_table = df.to_html(index=False, justify="left")
@@ -220,10 +413,9 @@ def main():
     )
     html_content = add_query_table_to_html(html_table)
 
-    # Save the HTML and ECSV files and copy them to the LST-1 webserver
-    html_file = Path(cfg.get("LST1", "SOURCE_CATALOG")) / "LST_source_catalog.html"
+    # Save the HTML file and copy it with the ECSV file to the LST-1 webserver
+    html_file = catalog_dir / "LST_source_catalog.html"
     html_file.write_text(html_content)
-    table_unique.write(catalog_path, delimiter=",", overwrite=True)
 
     copy_to_webserver(html_file, catalog_path)
 
@@ -0,0 +1,345 @@
+"""
+Disk usage accounting of the OSA products.
+
+The data trees configured in the [LST1] section are scanned night by night
+and the number of files and bytes per (night, prod_id, concept) are recorded
+in the OSA database. The scan is incremental: the content of a directory is
+only listed again if its modification time changed since the previous scan.
+A snapshot of the total usage is stored after every scan to forecast when
+the quota will be reached.
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from osa.configs.config import cfg
+from osa.utils.logging import myLogger
+
+log = myLogger(logging.getLogger(__name__))
+
+__all__ = [
+    "DATA_TREES",
+    "create_tables",
+    "classify_directory",
+    "scan_night",
+    "update_storage_usage",
+    "record_snapshot",
+    "read_snapshots",
+    "forecast_quota",
+]
+
+# Data level of each tree and the config option with its path
+DATA_TREES = {
+    "R0": "RAW_R0_DIR",
+    "R0G": "R0_DIR",
+    "DL1": "DL1_DIR",
+    "DL2": "DL2_DIR",
+    "DL3": "DL3_DIR",
+}
+
+# Concepts found in the subdirectories of a DL1 production
+DL1_SUBDIR_CONCEPTS = {
+    "muons": "MUON",
+    "interleaved": "INTERLEAVED",
+    "datacheck": "DATACHECK",
+}
+
+
+def create_tables(cursor) -> None:
+    """Create the disk usage tables in the OSA database if they do not exist."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS storage_usage
+        (date TEXT, prod_id TEXT, concept TEXT, n_files INTEGER, bytes INTEGER, updated TEXT,
+        PRIMARY KEY (date, prod_id, concept))"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS storage_dirs
+        (path TEXT PRIMARY KEY, mtime_ns INTEGER, n_files INTEGER, bytes INTEGER, subdirs TEXT)"""
+    )
+    cursor.execute("CREATE TABLE IF NOT EXISTS storage_snapshots (time TEXT, bytes INTEGER)")
+
+
+def classify_directory(tree: str, parts: tuple) -> tuple:
+    """
+    Return the production ID and concept of the files of a directory.
+
+    Parameters
+    ----------
+    tree: str
+        Data level of the tree, one of DATA_TREES.
+    parts: tuple
+        Components of the path of the directory relative to the night directory.
+    """
+    if tree in {"R0", "R0G"}:
+        return "", tree
+
+    prod_id = parts[0] if parts else ""
+
+    if tree != "DL1":
+        return prod_id, tree
+
+    for name, concept in DL1_SUBDIR_CONCEPTS.items():
+        if name in parts:
+            return prod_id, concept
+
+    # Files of the DL1 production itself or of its DL1ab (tailcut) subdirectories
+    return prod_id, "DL1AB" if len(parts) > 1 else "DL1"
+
+
+def _list_directory(path: str) -> tuple:
+    """Count the regular files of a directory, their bytes and list its subdirectories."""
+    n_files = 0
+    n_bytes = 0
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            # Symlinks are skipped so that linked products are not counted twice
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.is_file(follow_symlinks=False):
+                n_files += 1
+                n_bytes += entry.stat(follow_symlinks=False).st_size
+    return n_files, n_bytes, subdirs
+
+
+def scan_night(tree: str, night_dir: Path, cache: dict) -> tuple:
+    """
+    Walk the directories of a night, listing only those whose mtime changed.
+
+    Parameters
+    ----------
+    tree: str
+        Data level of the tree, one of DATA_TREES.
+    night_dir: pathlib.Path
+        Directory of the night in the tree.
+    cache: dict
+        Result of the previous scan of each directory: (mtime_ns, n_files, bytes, subdirs).
+
+    Returns
+    -------
+    usage: dict
+        [n_files, bytes] per (prod_id, concept).
+    dirs: dict
+        Updated cache entry of each directory of the night.
+    n_listed: int
+        Number of directories whose content was listed.
+    """
+    usage = {}
+    dirs = {}
+    n_listed = 0
+    pending = [()]
+
+    while pending:
+        parts = pending.pop()
+        path = str(night_dir.joinpath(*parts))
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            cached = cache.get(path)
+            if cached is not None and cached[0] == mtime_ns:
+                n_files, n_bytes, subdirs = cached[1:]
+            else:
+                n_files, n_bytes, subdirs = _list_directory(path)
+                n_listed += 1
+        except OSError as error:
+            log.debug(f"Cannot scan {path}: {error}")
+            continue
+
+        dirs[path] = (mtime_ns, n_files, n_bytes, subdirs)
+        pending.extend(parts + (name,) for name in subdirs)
+
+        if n_files:
+            counts = usage.setdefault(classify_directory(tree, parts), [0, 0])
+            counts[0] += n_files
+            counts[1] += n_bytes
+
+    return usage, dirs, n_listed
+
+
+def _night_dirs(tree_dir: Path, since: str = None) -> list:
+    """Return the night (YYYYMMDD) directories of a tree, optionally from a given night on."""
+    if not tree_dir.is_dir():
+        return []
+    with os.scandir(tree_dir) as entries:
+        return sorted(
+            Path(entry.path)
+            for entry in entries
+            if entry.is_dir()
+            and len(entry.name) == 8
+            and entry.name.isdigit()
+            and (since is None or entry.name >= since)
+        )
+
+
+def _load_cache(cursor) -> dict:
+    cursor.execute("SELECT path, mtime_ns, n_files, bytes, subdirs FROM storage_dirs")
+    return {
+        path: (mtime_ns, n_files, n_bytes, json.loads(subdirs))
+        for path, mtime_ns, n_files, n_bytes, subdirs in cursor.fetchall()
+    }
+
+
+def update_storage_usage(cursor, trees: dict = None, since: str = None, max_workers: int = 8):
+    """
+    Scan the data trees in parallel, one task per night, and record the
+    disk usage per (night, prod_id, concept) in the database.
+
+    Parameters
+    ----------
+    cursor: sqlite3.Cursor
+        Cursor of the OSA database.
+    trees: dict, optional
+        Path of each data tree. By default, those configured in DATA_TREES.
+    since: str, optional
+        Only scan the nights from this one (YYYYMMDD) on.
+    max_workers: int
+        Number of nights scanned at the same time.
+
+    Returns
+    -------
+    dict
+        Number of nights and directories scanned and directories listed.
+    """
+    create_tables(cursor)
+
+    if trees is None:
+        trees = {tree: Path(cfg.get("LST1", option)) for tree, option in DATA_TREES.items()}
+
+    # DL1AB_DIR may point to the same directory as DL1_DIR: scan each tree only once
+    tasks = []
+    scanned_trees = set()
+    for tree, tree_dir in trees.items():
+        tree_dir = Path(tree_dir)
+        if tree_dir.resolve() in scanned_trees:
+            continue
+        scanned_trees.add(tree_dir.resolve())
+        tasks.extend((tree, night_dir) for night_dir in _night_dirs(tree_dir, since))
+
+    cache = _load_cache(cursor)
+    now = datetime.now().isoformat(timespec="seconds")
+    stats = {"nights": 0, "dirs": 0, "listed": 0}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (tree, night_dir, executor.submit(scan_night, tree, night_dir, cache))
+            for tree, night_dir in tasks
+        ]
+
+        # The database is only written from this thread
+        for tree, night_dir, future in futures:
+            usage, dirs, n_listed = future.result()
+            concepts = {concept for _, concept in usage} | {tree}
+            if tree == "DL1":
+                concepts |= {"DL1AB", *DL1_SUBDIR_CONCEPTS.values()}
+
+            cursor.execute(
+                f"DELETE FROM storage_usage WHERE date = ? AND concept IN "
+                f"({', '.join('?' * len(concepts))})",
+                (night_dir.name, *concepts),
+            )
+            cursor.executemany(
+                "INSERT INTO storage_usage VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (night_dir.name, prod_id, concept, n_files, n_bytes, now)
+                    for (prod_id, concept), (n_files, n_bytes) in usage.items()
+                ],
+            )
+
+            # Forget the directories of the night that no longer exist
+            prefix = f"{night_dir}{os.sep}"
+            stale = [
+                (path,)
+                for path in cache
+                if (path == str(night_dir) or path.startswith(prefix)) and path not in dirs
+            ]
+            cursor.executemany("DELETE FROM storage_dirs WHERE path = ?", stale)
+            cursor.executemany(
+                "INSERT OR REPLACE INTO storage_dirs VALUES (?, ?, ?, ?, ?)",
+                [
+                    (path, mtime_ns, n_files, n_bytes, json.dumps(subdirs))
+                    for path, (mtime_ns, n_files, n_bytes, subdirs) in dirs.items()
+                    if cache.get(path) != (mtime_ns, n_files, n_bytes, subdirs)
+                ],
+            )
+
+            stats["nights"] += 1
+            stats["dirs"] += len(dirs)
+            stats["listed"] += n_listed
+
+    return stats
+
+
+def record_snapshot(cursor, timestamp: datetime = None) -> int:
+    """Store the current total disk usage recorded in the database and return it."""
+    create_tables(cursor)
+    cursor.execute("SELECT COALESCE(SUM(bytes), 0) FROM storage_usage")
+    total = cursor.fetchone()[0]
+    timestamp = timestamp or datetime.now()
+    cursor.execute(
+        "INSERT INTO storage_snapshots VALUES (?, ?)",
+        (timestamp.isoformat(timespec="seconds"), total),
+    )
+    return total
+
+
+def read_snapshots(cursor) -> list:
+    """Return the (datetime, bytes) snapshots of the total disk usage sorted by time."""
+    create_tables(cursor)
+    cursor.execute("SELECT time, bytes FROM storage_snapshots ORDER BY time")
+    return [(datetime.fromisoformat(time), n_bytes) for time, n_bytes in cursor.fetchall()]
+
+
+def forecast_quota(snapshots: list, quota_bytes: int, window_days: int = 30) -> dict:
+    """
+    Forecast when the quota will be reached from the growth rate of the disk
+    usage, fitted with a straight line to the snapshots of the last days.
+
+    Parameters
+    ----------
+    snapshots: list
+        (datetime, bytes) snapshots of the total disk usage sorted by time.
+    quota_bytes: int
+        Quota in bytes.
+    window_days: int
+        Number of days before the last snapshot used to fit the growth rate.
+
+    Returns
+    -------
+    dict
+        Current usage, growth rate in bytes per day and date at which the quota
+        is reached (None if the usage is not growing or there are not enough snapshots).
+    """
+    if not snapshots:
+        return {"bytes": 0, "bytes_per_day": 0.0, "quota_date": None}
+
+    last_time, last_bytes = snapshots[-1]
+    recent = [
+        (time, n_bytes)
+        for time, n_bytes in snapshots
+        if time >= last_time - timedelta(days=window_days)
+    ]
+    result = {"bytes": last_bytes, "bytes_per_day": 0.0, "quota_date": None}
+
+    if len(recent) < 2:
+        return result
+
+    days = [(time - recent[0][0]).total_seconds() / 86400 for time, _ in recent]
+    sizes = [n_bytes for _, n_bytes in recent]
+    mean_days = sum(days) / len(days)
+    mean_sizes = sum(sizes) / len(sizes)
+    variance = sum((day - mean_days) ** 2 for day in days)
+    if variance == 0:
+        return result
+
+    slope = sum((day - mean_days) * (size - mean_sizes) for day, size in zip(days, sizes)) / variance
+    result["bytes_per_day"] = slope
+
+    if last_bytes >= quota_bytes:
+        result["quota_date"] = last_time
+    elif slope > 0:
+        result["quota_date"] = last_time + timedelta(days=(quota_bytes - last_bytes) / slope)
+
+    return result
@@ -0,0 +1,650 @@
+"""
+Submit the datasequence job of every subrun as soon as its raw data is written.
+
+The online sequencer watches the raw directory of the night read by the data
+sequences (R0_DIR) and the run summary, which it produces again whenever R0
+files of runs not listed in it are closed. Once the R0 files of all the
+streams of a subrun are closed, and the run is a DATA run of the run summary,
+the job script of its sequence is submitted restricted to that subrun. The
+calibration sequence is submitted first if its products do not exist yet. The
+subruns with missing streams are not submitted, so their runs are left to the
+sequencer.
+
+The closing of the files is notified by inotify on Linux, and otherwise found
+by polling: a file is closed once it was not modified for SETTLE_TIME seconds.
+The raw directories on a network filesystem, such as the FEFS of the DAQ, are
+always polled since the files written by remote hosts raise no inotify events.
+Every streamed subrun is recorded in the OSA database with the time its R0
+files were closed and the time its DL1 file was ready, to follow the latency
+of the online processing. Once all the subruns of a run are submitted, the run
+is recorded as streamed so that the sequencer does not submit it again.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import struct
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.configs.settings import reload_config_if_changed
+from osa.job import prepare_jobs, submit_sequence_job
+from osa.nightsummary.extract import build_sequences
+from osa.nightsummary.nightsummary import produce_run_summary_file
+from osa.nightsummary.summary_store import read_run_summary_rows
+from osa.osadb import open_database
+from osa.processing_plan import build_processing_plan
+from osa.utils.logging import myLogger
+from osa.utils.utils import date_to_dir
+
+log = myLogger(logging.getLogger(__name__))
+
+__all__ = [
+    "R0_FILE_PATTERN",
+    "PollingWatcher",
+    "InotifyWatcher",
+    "is_network_filesystem",
+    "open_watcher",
+    "StreamedSubrun",
+    "OnlineSequencer",
+    "create_tables",
+    "record_subruns",
+    "record_streamed_run",
+    "streamed_runs",
+    "get_streamed_runs",
+    "latency_summary",
+]
+
+R0_FILE_PATTERN = re.compile(
+    r"LST-1\.(?P<stream>\d)\.Run(?P<run>\d{5})\.(?P<subrun>\d{4})\.fits\.fz"
+)
+
+# inotify events of a file opened for writing and closed, or moved into the directory
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# filesystems written by remote hosts, whose files raise no inotify events
+NETWORK_FILESYSTEMS = {"lustre", "nfs", "nfs4", "cifs", "smb3", "gpfs", "beegfs", "ceph", "sshfs"}
+
+
+class PollingWatcher:
+    """
+    Report the files of a directory not modified for `settle_time` seconds.
+
+    Parameters
+    ----------
+    directory: pathlib.Path
+        Directory watched. It does not need to exist yet.
+    settle_time: float
+        Seconds without modification after which a file is considered closed.
+    pattern: re.Pattern
+        Pattern of the names of the files reported.
+    """
+
+    def __init__(self, directory: Path, settle_time: float, pattern=R0_FILE_PATTERN):
+        self.directory = Path(directory)
+        self.settle_time = settle_time
+        self.pattern = pattern
+        self._reported = set()
+        self._scanned = False
+
+    def scan(self) -> List[Path]:
+        """Return the closed files not reported before, with a single scandir."""
+        now = time.time()
+        closed = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name in self._reported or not self.pattern.fullmatch(entry.name):
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if now - mtime >= self.settle_time:
+                        self._reported.add(entry.name)
+                        closed.append(Path(entry.path))
+        except FileNotFoundError:
+            log.debug(f"Directory {self.directory} not found")
+        return sorted(closed)
+
+    def wait(self, timeout: float) -> List[Path]:
+        """Return the files closed since the last call, scanning again after `timeout` seconds."""
+        if self._scanned:
+            time.sleep(timeout)
+        self._scanned = True
+        return self.scan()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class InotifyWatcher(PollingWatcher):
+    """
+    Report the files of a directory as they are closed after writing, using inotify.
+
+    The directory is also scanned as `PollingWatcher` does, right away and then
+    every `rescan_interval` seconds (`settle_time` by default), to find the files
+    closed before the watcher was created or written without inotify events, as
+    by remote hosts on a network filesystem. OSError is raised if inotify is not
+    available.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        settle_time: float,
+        pattern=R0_FILE_PATTERN,
+        rescan_interval: Optional[float] = None,
+    ):
+        super().__init__(directory, settle_time, pattern)
+        self.rescan_interval = settle_time if rescan_interval is None else rescan_interval
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_init1, inotify_add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError) as error:
+            raise OSError(f"inotify not available: {error}") from error
+
+        self._fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        if inotify_add_watch(self._fd, os.fsencode(self.directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), str(self.directory))
+        self._rescan_at = time.time() + self.rescan_interval
+
+    def _read_events(self) -> List[Path]:
+        closed = []
+        while True:
+            try:
+                buffer = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return closed
+            offset = 0
+            while offset < len(buffer):
+                _, _, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(buffer[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if name not in self._reported and self.pattern.fullmatch(name):
+                    self._reported.add(name)
+                    closed.append(self.directory / name)
+
+    def wait(self, timeout: float) -> List[Path]:
+        """Return the files closed since the last call, waiting up to `timeout` seconds."""
+        if not self._scanned:
+            self._scanned = True
+            return self.scan()
+        now = time.time()
+        if now >= self._rescan_at:
+            self._rescan_at = now + self.rescan_interval
+            return sorted(self._read_events() + self.scan())
+        timeout = min(timeout, self._rescan_at - now)
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        return sorted(self._read_events()) if readable else []
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def is_network_filesystem(path: Path) -> bool:
+    """Return True if the path is on a network filesystem, read from /proc/self/mounts."""
+    try:
+        mounts = Path("/proc/self/mounts").read_text().splitlines()
+    except OSError:
+        return False
+    path = os.path.realpath(path)
+    mount_point, fs_type = "", ""
+    for line in mounts:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        point = fields[1].replace("\\040", " ")
+        inside = path == point or path.startswith(point.rstrip("/") + "/")
+        if inside and len(point) >= len(mount_point):
+            mount_point, fs_type = point, fields[2]
+    return fs_type.split(".")[-1] in NETWORK_FILESYSTEMS
+
+
+def open_watcher(directory: Path, settle_time: float, backend: str = "auto", **kwargs):
+    """
+    Watch a directory with inotify, or by polling if inotify is not available.
+
+    Since the files written by remote hosts on a network filesystem raise no
+    inotify events, "auto" polls the directories of a network filesystem.
+
+    Parameters
+    ----------
+    directory: pathlib.Path
+    settle_time: float
+        Seconds without modification after which a file is considered closed when polling.
+    backend: str
+        "inotify", "polling" or "auto" (inotify if available and not on a network filesystem).
+    """
+    if backend not in {"auto", "inotify", "polling"}:
+        raise ValueError(f"Unknown watcher {backend}")
+    if backend == "auto" and is_network_filesystem(directory):
+        log.info(f"Polling {directory} since it is on a network filesystem")
+        backend = "polling"
+    if backend != "polling":
+        try:
+            return InotifyWatcher(directory, settle_time, **kwargs)
+        except OSError as error:
+            if backend == "inotify":
+                raise
+            log.info(f"Polling {directory} since inotify cannot be used: {error}")
+    return PollingWatcher(directory, settle_time, **kwargs)
+
+
+@dataclass
+class StreamedSubrun:
+    """Times (epoch seconds) of the online processing of a subrun."""
+
+    run: int
+    subrun: int
+    closed_at: float
+    job_id: Optional[str] = None
+    submitted_at: Optional[float] = None
+    dl1_ready_at: Optional[float] = None
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Seconds from the closing of the R0 files to the DL1 file being ready."""
+        if self.dl1_ready_at is None:
+            return None
+        return self.dl1_ready_at - self.closed_at
+
+
+def create_tables(cursor) -> None:
+    """Create the tables of the streamed subruns and runs in the OSA database if needed."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS streamed_subruns
+        (date TEXT, run INTEGER, subrun INTEGER, job_id TEXT, closed_at REAL,
+        submitted_at REAL, dl1_ready_at REAL, PRIMARY KEY (date, run, subrun))"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS streamed_runs
+        (date TEXT, run INTEGER, n_subruns INTEGER, PRIMARY KEY (date, run))"""
+    )
+
+
+def record_subruns(cursor, date: str, subruns: Iterable[StreamedSubrun]) -> None:
+    """Store the times of the online processing of the subruns of a date (YYYYMMDD)."""
+    create_tables(cursor)
+    cursor.executemany(
+        "INSERT OR REPLACE INTO streamed_subruns VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                date,
+                subrun.run,
+                subrun.subrun,
+                subrun.job_id,
+                subrun.closed_at,
+                subrun.submitted_at,
+                subrun.dl1_ready_at,
+            )
+            for subrun in subruns
+        ],
+    )
+
+
+def record_streamed_run(cursor, date: str, run: int, n_subruns: int) -> None:
+    """Record that the jobs of all the subruns of a run were submitted online."""
+    create_tables(cursor)
+    cursor.execute("INSERT OR REPLACE INTO streamed_runs VALUES (?, ?, ?)", (date, run, n_subruns))
+
+
+def streamed_runs(cursor, date: str) -> set:
+    """Runs of a date (YYYYMMDD) whose jobs were all submitted online."""
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'streamed_runs'"
+    )
+    if cursor.fetchone() is None:
+        return set()
+    cursor.execute("SELECT run FROM streamed_runs WHERE date = ?", (date,))
+    return {run for (run,) in cursor.fetchall()}
+
+
+def get_streamed_runs(date) -> set:
+    """Runs of the night of `date` whose jobs were submitted by the online sequencer."""
+    database = cfg.get("database", "path")
+    if not database or not Path(database).exists():
+        return set()
+    with open_database(database) as cursor:
+        return streamed_runs(cursor, date_to_dir(date))
+
+
+def latency_summary(subruns: Iterable[StreamedSubrun]) -> dict:
+    """Number, median, 90% quantile and maximum of the latencies (s) of the subruns."""
+    latencies = np.array([s.latency for s in subruns if s.latency is not None], dtype=float)
+    if latencies.size == 0:
+        return {"n": 0, "median": None, "p90": None, "max": None}
+    return {
+        "n": int(latencies.size),
+        "median": float(np.median(latencies)),
+        "p90": float(np.quantile(latencies, 0.9)),
+        "max": float(latencies.max()),
+    }
+
+
+def _produce_run_summary():
+    """Produce the run summary of the night again, with the runs started since the last time."""
+    produce_run_summary_file(options.date, overwrite=True)
+
+
+def _build_sequences() -> list:
+    """Build and write the job scripts of the sequences of the night."""
+    sequence_list = build_sequences(options.date)
+    prepare_jobs(sequence_list)
+    return sequence_list
+
+
+class OnlineSequencer:
+    """
+    Submit the datasequence job of each subrun once all its R0 files are closed.
+
+    Parameters
+    ----------
+    raw_dir: pathlib.Path
+        Directory of the R0 files of the night.
+    summary_file: pathlib.Path
+        Run summary of the night, read again whenever it changes.
+    poll_interval: float
+        Seconds between two checks of the directories.
+    settle_time: float
+        Seconds without modification after which a file is considered closed.
+    n_streams: int
+        Number of streams of the R0 files of a subrun.
+    watcher: str
+        "inotify", "polling" or "auto".
+    summary_interval: float
+        Minimum seconds between two productions of the run summary.
+    sequence_builder: callable, optional
+        Return the sequences of the night, with their job scripts written.
+    summary_producer: callable, optional
+        Produce the run summary of the night, as `osa.nightsummary.produce_run_summary_file`.
+    submit: callable, optional
+        Submit the job of a sequence, as `osa.job.submit_sequence_job`.
+    database: str, optional
+        OSA database in which the streamed subruns are recorded.
+    """
+
+    def __init__(
+        self,
+        raw_dir: Path,
+        summary_file: Path,
+        poll_interval: float,
+        settle_time: float,
+        n_streams: int = 4,
+        watcher: str = "auto",
+        summary_interval: float = 60,
+        sequence_builder: Callable[[], list] = None,
+        summary_producer: Callable[[], None] = None,
+        submit: Callable = None,
+        database: str = None,
+    ):
+        self.raw_dir = Path(raw_dir)
+        self.summary_file = Path(summary_file)
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.n_streams = n_streams
+        self.summary_interval = summary_interval
+        self.sequence_builder = _build_sequences if sequence_builder is None else sequence_builder
+        self.summary_producer = (
+            _produce_run_summary if summary_producer is None else summary_producer
+        )
+        self.submit = submit_sequence_job if submit is None else submit
+        self.database = cfg.get("database", "path") if database is None else database
+        self.watcher = open_watcher(self.raw_dir, settle_time, backend=watcher)
+        self.dl1_watcher = PollingWatcher(
+            options.directory,
+            settle_time,
+            pattern=re.compile(r"dl1_LST-1\.Run(?P<run>\d{5})\.(?P<subrun>\d{4})\.h5"),
+        )
+
+        self.sequences = {}
+        self.calibration = None
+        self.subruns: Dict[Tuple[int, int], StreamedSubrun] = {}
+        self.streamed = set()
+        self._streams = defaultdict(dict)
+        self._run_types = {}
+        self._n_subruns = {}
+        self._summary_stat = None
+        self._summary_produced_at = None
+        self._calibration_job = None
+        self._changed = set()
+
+    def _produce_run_summary(self):
+        """Produce the run summary if it is missing or lacks runs whose R0 files were closed."""
+        unlisted_runs = {run for run, _ in self._streams} - set(self._run_types)
+        if self.summary_file.exists() and not unlisted_runs:
+            return
+        now = time.time()
+        if (
+            self._summary_produced_at is not None
+            and now - self._summary_produced_at < self.summary_interval
+        ):
+            return
+        self._summary_produced_at = now
+        if options.simulate:
+            log.debug(f"Simulate producing the run summary {self.summary_file}")
+            return
+        log.info(f"Producing the run summary {self.summary_file}")
+        self.summary_producer()
+
+    def refresh_run_summary(self):
+        """
+        Produce the run summary if needed, read it again if it changed and build
+        the sequences of its new DATA runs.
+        """
+        self._produce_run_summary()
+        try:
+            stat = os.stat(self.summary_file)
+        except FileNotFoundError:
+            return
+        if (stat.st_mtime_ns, stat.st_size) == self._summary_stat:
+            return
+        self._summary_stat = (stat.st_mtime_ns, stat.st_size)
+
+        rows = read_run_summary_rows(self.summary_file)
+        self._run_types = {run_id: run_type for run_id, _, run_type, _ in rows}
+        self._n_subruns = {run_id: n_subruns for run_id, n_subruns, _, _ in rows}
+        new_runs = [
+            run_id
+            for run_id, run_type in self._run_types.items()
+            if run_type == "DATA" and run_id not in self.sequences
+        ]
+        if not new_runs:
+            return
+
+        log.info(f"New DATA runs in the run summary: {new_runs}")
+        for sequence in self.sequence_builder():
+            if sequence.type == "PEDCALIB":
+                self.calibration = sequence
+            elif sequence.type == "DATA":
+                self.sequences.setdefault(sequence.run, sequence)
+
+    def _taking_finished(self, run: int) -> bool:
+        """A later run was started, so no more subruns of this run will be written."""
+        return any(other > run for other in self._run_types)
+
+    def _ready_subruns(self) -> List[Tuple[int, int]]:
+        """Subruns of the DATA runs not submitted yet whose files of all the streams are closed."""
+        return [
+            key
+            for key, streams in sorted(self._streams.items())
+            if key not in self.subruns
+            and key[0] in self.sequences
+            and len(streams) >= self.n_streams
+        ]
+
+    def _calibration_dependency(self) -> Optional[str]:
+        """Submit the calibration sequence if its products are missing, and return its job ID."""
+        if options.no_calib or not build_processing_plan(options.input_state).needs_calibration:
+            return None
+        if self._calibration_job is None:
+            calibration_files = [
+                getattr(sequence, "calibration_file", None) for sequence in self.sequences.values()
+            ]
+            if self.calibration is None or all(
+                file is not None and Path(file).exists() for file in calibration_files
+            ):
+                self._calibration_job = ""
+            else:
+                log.info(f"Submitting the calibration sequence {self.calibration.jobname}")
+                self._calibration_job = self.submit(self.calibration) or ""
+        return self._calibration_job or None
+
+    def submit_ready_subruns(self) -> int:
+        """Submit the jobs of the subruns ready to be processed."""
+        ready = self._ready_subruns()
+        if not ready:
+            return 0
+        dependency = self._calibration_dependency()
+        for key in ready:
+            run, subrun = key
+            streamed = StreamedSubrun(run, subrun, closed_at=max(self._streams[key].values()))
+            streamed.job_id = self.submit(self.sequences[run], subrun=subrun, dependency=dependency)
+            streamed.submitted_at = time.time()
+            self.subruns[key] = streamed
+            self._changed.add(key)
+            log.info(f"Subrun {run:05d}.{subrun:04d} submitted (job {streamed.job_id})")
+        return len(ready)
+
+    def check_dl1(self):
+        """Set the time at which the DL1 file of the streamed subruns was ready."""
+        for path in self.dl1_watcher.scan():
+            match = self.dl1_watcher.pattern.fullmatch(path.name)
+            key = int(match["run"]), int(match["subrun"])
+            subrun = self.subruns.get(key)
+            if subrun is None or subrun.dl1_ready_at is not None:
+                continue
+            try:
+                subrun.dl1_ready_at = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            self._changed.add(key)
+            log.info(f"DL1 of subrun {key[0]:05d}.{key[1]:04d} ready after {subrun.latency:.0f} s")
+
+    def finish_runs(self, flush: bool = False) -> list:
+        """Record the runs whose subruns were all submitted, once their taking finished."""
+        finished = []
+        for run in self.sequences:
+            if run in self.streamed or not (flush or self._taking_finished(run)):
+                continue
+            submitted = {subrun for (other, subrun) in self.subruns if other == run}
+            n_subruns = max(self._n_subruns.get(run, 0), max(submitted, default=-1) + 1)
+            if len(submitted) == n_subruns and n_subruns > 0:
+                self.streamed.add(run)
+                finished.append((run, n_subruns))
+                log.info(f"Run {run:05d} streamed: {n_subruns} subruns submitted")
+            elif flush:
+                missing = sorted(set(range(n_subruns)) - submitted)
+                incomplete = [
+                    subrun
+                    for subrun in missing
+                    if 0 < len(self._streams.get((run, subrun), {})) < self.n_streams
+                ]
+                log.warning(
+                    f"Run {run:05d} not streamed completely, missing subruns {missing} "
+                    f"({len(incomplete)} with missing streams), left to the sequencer"
+                )
+        return finished
+
+    def _record(self, finished_runs: list):
+        if options.simulate or not (self._changed or finished_runs):
+            return
+        with open_database(self.database) as cursor:
+            if cursor is None:
+                return
+            date = date_to_dir(options.date)
+            record_subruns(cursor, date, [self.subruns[key] for key in sorted(self._changed)])
+            for run, n_subruns in finished_runs:
+                record_streamed_run(cursor, date, run, n_subruns)
+        self._changed.clear()
+
+    def step(self, timeout: float = None) -> int:
+        """
+        Wait for closed R0 files up to `timeout` seconds (by default, the poll interval),
+        submit the subruns ready and update their bookkeeping.
+
+        Returns
+        -------
+        int
+            Number of R0 files closed.
+        """
+        closed = self.watcher.wait(self.poll_interval if timeout is None else timeout)
+        for path in closed:
+            match = R0_FILE_PATTERN.fullmatch(path.name)
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            key = int(match["run"]), int(match["subrun"])
+            self._streams[key][int(match["stream"])] = mtime
+
+        self.refresh_run_summary()
+        self.submit_ready_subruns()
+        self.check_dl1()
+        self._record(self.finish_runs())
+        return len(closed)
+
+    def finish(self, dl1_timeout: float = 0):
+        """
+        Submit the last subruns ready and record the runs streamed, then wait up
+        to `dl1_timeout` seconds for the DL1 files of the subruns submitted.
+        """
+        self.refresh_run_summary()
+        self.submit_ready_subruns()
+        self.check_dl1()
+        self._record(self.finish_runs(flush=True))
+        self.watcher.close()
+
+        deadline = time.time() + dl1_timeout
+        while time.time() < deadline and any(
+            subrun.dl1_ready_at is None for subrun in self.subruns.values()
+        ):
+            time.sleep(self.poll_interval)
+            self.check_dl1()
+            self._record([])
+
+    def run(self, idle_timeout: float, max_time: float = None):
+        """
+        Process the subruns as they are written until no R0 file is closed for
+        `idle_timeout` seconds, or for at most `max_time` seconds. The DL1 files of
+        the subruns submitted are then waited for up to `idle_timeout` seconds.
+        The configuration files are read again whenever they are modified.
+        """
+        start = last_file = time.time()
+        while True:
+            reload_config_if_changed()
+            if self.step():
+                last_file = time.time()
+            now = time.time()
+            if now - last_file >= idle_timeout:
+                log.info(f"No new R0 files for {idle_timeout:.0f} s")
+                break
+            if max_time is not None and now - start >= max_time:
+                break
+        self.finish(dl1_timeout=idle_timeout)
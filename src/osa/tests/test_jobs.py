@@ -6,6 +6,7 @@ import pytest
 
 from osa.configs import options
 from osa.configs.config import cfg, DEFAULT_CFG
+from osa.utils.jit_cache import numba_cache_base
 
 extra_files = Path(os.getenv("OSA_TEST_DATA", "extra"))
 datasequence_history_file = extra_files / "history_files/sequence_LST1_04185.0010.history"
@@ -175,26 +176,25 @@ def test_create_job_template_scheduler(
     os.environ['MPLCONFIGDIR'] = '/fefs/aswg/lstanalyzer/.cache/matplotlib'
     subruns = int(os.getenv('SLURM_ARRAY_TASK_ID'))
 
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        os.environ['NUMBA_CACHE_DIR'] = tmpdirname
-        proc = subprocess.run([
-            'datasequence',
-            '--input-state=legacy_raw',
-            '--config',
-            '{DEFAULT_CFG}',
-            '--date=2020-01-17',
-            '--prod-id=v0.1.0',
-            '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
-            '--run-summary={run_summary_file}',
-            '--drs4-pedestal-file={drs4_baseline_file}',
-            '--pedcal-file={calibration_file}',
-            '--time-calib-file={drs4_time_calibration_files[0]}',
-            '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
-            '--dl1b-config={dl1b_config_files[0]}',
-            '--dl1-prod-id=tailcut84',
-            f'01807.{{subruns:04d}}',
-            'LST1'
-        ])
+    os.environ['NUMBA_CACHE_DIR'] = os.path.join('{numba_cache_base()}', os.uname().machine)
+    proc = subprocess.run([
+        'datasequence',
+        '--input-state=legacy_raw',
+        '--config',
+        '{DEFAULT_CFG}',
+        '--date=2020-01-17',
+        '--prod-id=v0.1.0',
+        '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
+        '--run-summary={run_summary_file}',
+        '--drs4-pedestal-file={drs4_baseline_file}',
+        '--pedcal-file={calibration_file}',
+        '--time-calib-file={drs4_time_calibration_files[0]}',
+        '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
+        '--dl1b-config={dl1b_config_files[0]}',
+        '--dl1-prod-id=tailcut84',
+        f'01807.{{subruns:04d}}',
+        'LST1'
+    ])
 
     sys.exit(proc.returncode)"""
     )
@@ -224,27 +224,26 @@ def test_create_job_template_scheduler(
         os.environ['MPLCONFIGDIR'] = '/fefs/aswg/lstanalyzer/.cache/matplotlib'
         subruns = int(os.getenv('SLURM_ARRAY_TASK_ID'))
 
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            os.environ['NUMBA_CACHE_DIR'] = tmpdirname
-            proc = subprocess.run([
-                'datasequence',
-                '--input-state=legacy_raw',
-                '--config',
-                '{DEFAULT_CFG}',
-                '--date=2020-01-17',
-                '--prod-id=v0.1.0',
-                '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
-                '--run-summary={run_summary_file}',
-                '--drs4-pedestal-file={drs4_baseline_file}',
-                '--pedcal-file={calibration_file}',
-                '--time-calib-file={drs4_time_calibration_files[0]}',
-                '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
-                '--dl1b-config={dl1b_config_files[1]}',
-                '--dl1-prod-id=tailcut84',
-                f'--pedestal-ids-file={Path.cwd()}/test_osa/test_files0/auxiliary/PedestalFinder/20200117/pedestal_ids_Run01808.{{subruns:04d}}.h5',
-                f'01808.{{subruns:04d}}',
-                'LST1'
-            ])
+        os.environ['NUMBA_CACHE_DIR'] = os.path.join('{numba_cache_base()}', os.uname().machine)
+        proc = subprocess.run([
+            'datasequence',
+            '--input-state=legacy_raw',
+            '--config',
+            '{DEFAULT_CFG}',
+            '--date=2020-01-17',
+            '--prod-id=v0.1.0',
+            '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
+            '--run-summary={run_summary_file}',
+            '--drs4-pedestal-file={drs4_baseline_file}',
+            '--pedcal-file={calibration_file}',
+            '--time-calib-file={drs4_time_calibration_files[0]}',
+            '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
+            '--dl1b-config={dl1b_config_files[1]}',
+            '--dl1-prod-id=tailcut84',
+            f'--pedestal-ids-file={Path.cwd()}/test_osa/test_files0/auxiliary/PedestalFinder/20200117/pedestal_ids_Run01808.{{subruns:04d}}.h5',
+            f'01808.{{subruns:04d}}',
+            'LST1'
+        ])
 
         sys.exit(proc.returncode)"""
     )
@@ -295,26 +294,25 @@ def test_create_job_template_local(
 
     subruns = 0
 
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        os.environ['NUMBA_CACHE_DIR'] = tmpdirname
-        proc = subprocess.run([
-            'datasequence',
-            '--input-state=legacy_raw',
-            '--config',
-            '{DEFAULT_CFG}',
-            '--date=2020-01-17',
-            '--prod-id=v0.1.0',
-            '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
-            '--run-summary={run_summary_file}',
-            '--drs4-pedestal-file={drs4_baseline_file}',
-            '--pedcal-file={calibration_file}',
-            '--time-calib-file={drs4_time_calibration_files[0]}',
-            '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
-            '--dl1b-config={dl1b_config_files[0]}',
-            '--dl1-prod-id=tailcut84',
-            f'01807.{{subruns:04d}}',
-            'LST1'
-        ])
+    os.environ['NUMBA_CACHE_DIR'] = os.path.join('{numba_cache_base()}', os.uname().machine)
+    proc = subprocess.run([
+        'datasequence',
+        '--input-state=legacy_raw',
+        '--config',
+        '{DEFAULT_CFG}',
+        '--date=2020-01-17',
+        '--prod-id=v0.1.0',
+        '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
+        '--run-summary={run_summary_file}',
+        '--drs4-pedestal-file={drs4_baseline_file}',
+        '--pedcal-file={calibration_file}',
+        '--time-calib-file={drs4_time_calibration_files[0]}',
+        '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
+        '--dl1b-config={dl1b_config_files[0]}',
+        '--dl1-prod-id=tailcut84',
+        f'01807.{{subruns:04d}}',
+        'LST1'
+    ])
 
     sys.exit(proc.returncode)"""
     )
@@ -331,27 +329,26 @@ def test_create_job_template_local(
 
         subruns = 0
 
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            os.environ['NUMBA_CACHE_DIR'] = tmpdirname
-            proc = subprocess.run([
-                'datasequence',
-                '--input-state=legacy_raw',
-                '--config',
-                '{DEFAULT_CFG}',
-                '--date=2020-01-17',
-                '--prod-id=v0.1.0',
-                '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
-                '--run-summary={run_summary_file}',
-                '--drs4-pedestal-file={drs4_baseline_file}',
-                '--pedcal-file={calibration_file}',
-                '--time-calib-file={drs4_time_calibration_files[0]}',
-                '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
-                '--dl1b-config={dl1b_config_files[1]}',
-                '--dl1-prod-id=tailcut84',
-                f'--pedestal-ids-file={Path.cwd()}/test_osa/test_files0/auxiliary/PedestalFinder/20200117/pedestal_ids_Run01808.{{subruns:04d}}.h5',
-                f'01808.{{subruns:04d}}',
-                'LST1'
-            ])
+        os.environ['NUMBA_CACHE_DIR'] = os.path.join('{numba_cache_base()}', os.uname().machine)
+        proc = subprocess.run([
+            'datasequence',
+            '--input-state=legacy_raw',
+            '--config',
+            '{DEFAULT_CFG}',
+            '--date=2020-01-17',
+            '--prod-id=v0.1.0',
+            '--drive-file={Path.cwd()}/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
+            '--run-summary={run_summary_file}',
+            '--drs4-pedestal-file={drs4_baseline_file}',
+            '--pedcal-file={calibration_file}',
+            '--time-calib-file={drs4_time_calibration_files[0]}',
+            '--systematic-correction-file={Path.cwd()}/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
+            '--dl1b-config={dl1b_config_files[1]}',
+            '--dl1-prod-id=tailcut84',
+            f'--pedestal-ids-file={Path.cwd()}/test_osa/test_files0/auxiliary/PedestalFinder/20200117/pedestal_ids_Run01808.{{subruns:04d}}.h5',
+            f'01808.{{subruns:04d}}',
+            'LST1'
+        ])
 
         sys.exit(proc.returncode)"""
     )
@@ -380,17 +377,16 @@ def test_create_job_scheduler_calibration(sequence_list):
 
     subruns = 0
 
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        os.environ['NUMBA_CACHE_DIR'] = tmpdirname
-        proc = subprocess.run([
-            'calibration_pipeline',
-            '--config',
-            '{DEFAULT_CFG}',
-            '--date=2020-01-17',
-            '--drs4-pedestal-run=01804',
-            '--pedcal-run=01809',
-            'LST1'
-        ])
+    os.environ['NUMBA_CACHE_DIR'] = os.path.join('{numba_cache_base()}', os.uname().machine)
+    proc = subprocess.run([
+        'calibration_pipeline',
+        '--config',
+        '{DEFAULT_CFG}',
+        '--date=2020-01-17',
+        '--drs4-pedestal-run=01804',
+        '--pedcal-run=01809',
+        'LST1'
+    ])
 
     sys.exit(proc.returncode)"""
     )
@@ -478,3 +474,62 @@ def test_plot_job_statistics(sacct_output, running_analysis_dir):
     plot_job_statistics(sacct_output, log_dir)
     plot_file = log_dir / "job_statistics.pdf"
     assert plot_file.exists()
+
+
+def test_numba_cache_dir_setup():
+    from osa.job import numba_cache_dir_setup
+
+    content, indent = numba_cache_dir_setup()
+    assert content == (
+        f"os.environ['NUMBA_CACHE_DIR'] = os.path.join('{numba_cache_base()}', os.uname().machine)\n"
+    )
+    assert indent == ""
+
+    # Without a persistent cache, every job compiles the kernels in a temporary directory
+    content, indent = numba_cache_dir_setup(persistent=False)
+    assert content == (
+        "with tempfile.TemporaryDirectory() as tmpdirname:\n"
+        "    os.environ['NUMBA_CACHE_DIR'] = tmpdirname\n"
+    )
+    assert indent == "    "
+
+
+def test_fused_dl1_stages(sequence_list):
+    from osa.job import data_sequence_job_template, fused_dl1_stages
+
+    options.test = True
+    options.simulate = False
+    sequence = sequence_list[1]
+    assert not fused_dl1_stages(sequence)
+    assert "--fused-dl1" not in data_sequence_job_template(sequence)
+
+    sequence.fused_dl1 = True
+    try:
+        assert "    '--fused-dl1',\n" in data_sequence_job_template(sequence)
+    finally:
+        sequence.fused_dl1 = None
+        options.simulate = True
+
+
+def test_fused_and_subprocess_sequences(sequence_list):
+    from osa.job import data_sequence_job_template
+    from osa.nightsummary.extract import build_sequences
+
+    options.test = True
+    options.simulate = False
+    previous = cfg.get("lstchain", "fused_dl1_sources")
+    cfg.set("lstchain", "fused_dl1_sources", "Crab, Mrk421")
+    try:
+        sequences = {sequence.run: sequence for sequence in build_sequences(options.date)}
+        # Set when the sequences are built, from their source
+        assert sequences[1807].source_name == "Crab"
+        assert sequences[1807].fused_dl1 is True
+        assert sequences[1808].fused_dl1 is False
+        assert sequences[1809].fused_dl1 is None
+
+        # The jobs of the same night run the DL1 steps in process or in a subprocess
+        assert "    '--fused-dl1',\n" in data_sequence_job_template(sequences[1807])
+        assert "--fused-dl1" not in data_sequence_job_template(sequences[1808])
+    finally:
+        cfg.set("lstchain", "fused_dl1_sources", previous)
+        options.simulate = True
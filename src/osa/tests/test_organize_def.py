@@ -212,3 +212,76 @@ def test_compress_gainsel_simulate(tmp_path):
 
     assert log.exists()
     assert not list(tmp_path.glob("normal_logs_*.tar.gz"))
+
+
+# =========================================================
+# compression engine
+# =========================================================
+def test_parallel_gzip_writer_roundtrip():
+    import gzip
+    import io
+    from concurrent.futures import ThreadPoolExecutor
+
+    from osa.scripts.organize_def import ParallelGzipWriter
+
+    data = os.urandom(1000) * 300
+    raw = io.BytesIO()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        writer = ParallelGzipWriter(raw, executor, threads=2, chunk_size=10_000)
+        for start in range(0, len(data), 7_000):
+            writer.write(data[start:start + 7_000])
+        writer.close()
+
+    assert gzip.decompress(raw.getvalue()) == data
+
+
+def test_archive_files(tmp_path):
+    import tarfile
+
+    from osa.scripts.organize_def import archive_files
+
+    files = []
+    for i in range(10):
+        file = tmp_path / f"job_{i}.out"
+        file.write_text(f"line {i}\n" * 1000)
+        files.append(file)
+
+    big_file = tmp_path / "big.out"
+    big_file.write_bytes(b"x" * (2 * 1024 * 1024))
+    files.append(big_file)
+
+    tar_path = tmp_path / "logs.tar.gz"
+    stats = archive_files(files, tar_path, "OUT", threads=2)
+
+    assert stats["files"] == 11
+    assert stats["archive_bytes"] < stats["input_bytes"]
+    assert not any(f.exists() for f in files)
+
+    with tarfile.open(tar_path, "r:gz") as tar:
+        assert sorted(tar.getnames()) == sorted(f.name for f in files)
+        assert tar.extractfile("job_3.out").read() == b"line 3\n" * 1000
+
+
+def test_verify_archive_corrupted(tmp_path):
+    from osa.scripts.organize_def import verify_archive
+
+    tar_path = tmp_path / "logs.tar.gz"
+    tar_path.write_bytes(b"not a gzip file")
+
+    assert verify_archive(tar_path, {"a.out": 1}) is False
+
+
+def test_archive_files_keeps_files_if_verification_fails(tmp_path, monkeypatch):
+    from osa.scripts import organize_def
+
+    file = tmp_path / "a.err"
+    file.write_text("error")
+
+    monkeypatch.setattr(organize_def, "verify_archive", lambda *args: False)
+
+    with pytest.raises(RuntimeError):
+        organize_def.archive_files([file], tmp_path / "logs.tar.gz", "ERR")
+
+    assert file.exists()
+    assert not list(tmp_path.glob("logs.tar.gz*"))
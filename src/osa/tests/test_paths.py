@@ -1,5 +1,7 @@
+import os
 from datetime import datetime
 from pathlib import Path
+from unittest import mock
 
 from osa.configs import options
 from osa.configs.config import cfg
@@ -101,3 +103,94 @@ def test_get_run_date(merged_run_summary):
     assert get_run_date(1808) == datetime(2020,1,17)
 
     assert get_run_date(1200) == datetime(2020,1,17)
+
+
+def test_reconcile_symlinks(tmp_path):
+    from osa.paths import reconcile_symlinks
+
+    targets = tmp_path / "targets"
+    targets.mkdir()
+    for name in ["a.h5", "b.h5", "c.h5", "d.h5"]:
+        (targets / name).touch()
+    links_dir = tmp_path / "links"
+    links = {links_dir / name: targets / name for name in ["a.h5", "b.h5", "c.h5", "d.h5"]}
+
+    options.simulate = False
+    assert reconcile_symlinks(links) == {"created": 4, "updated": 0, "unchanged": 0, "failed": 0}
+    assert all(os.readlink(link) == str(target) for link, target in links.items())
+    assert reconcile_symlinks(links) == {"created": 0, "updated": 0, "unchanged": 4}
+
+    # Stale links and files in place of the links are replaced
+    (links_dir / "a.h5").unlink()
+    (links_dir / "a.h5").symlink_to(targets / "old.h5")
+    (links_dir / "b.h5").unlink()
+    (links_dir / "b.h5").write_text("not a link")
+    (links_dir / "c.h5").unlink()
+    counts = reconcile_symlinks(links, max_workers=2)
+    assert counts == {"created": 1, "updated": 2, "unchanged": 1, "failed": 0}
+    assert all(os.readlink(link) == str(target) for link, target in links.items())
+    assert sorted(path.name for path in links_dir.iterdir()) == ["a.h5", "b.h5", "c.h5", "d.h5"]
+
+    # Nothing is changed in simulate mode
+    options.simulate = True
+    try:
+        (links_dir / "d.h5").unlink()
+        assert reconcile_symlinks(links) == {"created": 1, "updated": 0, "unchanged": 3}
+        assert not (links_dir / "d.h5").is_symlink()
+    finally:
+        options.simulate = False
+
+
+def test_create_datacheck_symlinks(tmp_path):
+    from osa.paths import create_datacheck_symlinks, create_longterm_symlink
+
+    nightdir = date_to_dir(options.date)
+    base = cfg.get("LST1", "BASE")
+    cfg.set("LST1", "BASE", str(tmp_path))
+    try:
+        dl1_dir = tmp_path / "DL1" / nightdir / options.prod_id
+        datacheck_files = [
+            dl1_dir / "tailcut84" / "datacheck" / "datacheck_dl1_LST-1.Run01807.h5",
+            dl1_dir / "tailcut84" / "datacheck" / "datacheck_dl1_LST-1.Run01807.pdf",
+            dl1_dir / "tailcut84" / "datacheck" / "datacheck_dl1_LST-1.Run01807.0000.log",
+            dl1_dir / "tailcut84" / "dl1_LST-1.Run01807.h5",
+        ]
+        muon_files = [
+            dl1_dir / "muons" / "muons_LST-1.Run01807.0000.fits",
+            dl1_dir / "muons" / "muons_LST-1.Run01807.0001.fits",
+        ]
+        for file in datacheck_files + muon_files:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.touch()
+
+        # No jobs to wait for
+        counts = create_datacheck_symlinks([])
+        assert counts == {"created": 4, "updated": 0, "unchanged": 0, "failed": 0}
+        datacheck_dir = tmp_path / "DL1" / "datacheck_files" / nightdir
+        assert sorted(path.name for path in datacheck_dir.iterdir()) == [
+            "datacheck_dl1_LST-1.Run01807.h5",
+            "datacheck_dl1_LST-1.Run01807.pdf",
+            "muons",
+        ]
+        assert (datacheck_dir / "muons" / muon_files[0].name).resolve() == muon_files[0]
+        assert create_datacheck_symlinks([]) == {"created": 0, "updated": 0, "unchanged": 4}
+
+        # Nothing partial is linked if the merging jobs did not complete
+        (datacheck_dir / "datacheck_dl1_LST-1.Run01807.h5").unlink()
+        with mock.patch("osa.paths.wait_for_jobs", return_value=False) as wait:
+            assert create_datacheck_symlinks(["1234"]) is None
+        assert wait.call_args.args[0] == ["1234"]
+        assert not (datacheck_dir / "datacheck_dl1_LST-1.Run01807.h5").exists()
+        create_datacheck_symlinks([])
+
+        # The daily datacheck files of the latest version are linked
+        longterm_dir = tmp_path / "DL1" / "datacheck_files" / "night_wise"
+        for version in ["v0.9.2", "v0.10.5"]:
+            (longterm_dir / version / nightdir).mkdir(parents=True)
+            (longterm_dir / version / nightdir / f"DL1_datacheck_{nightdir}.h5").touch()
+        counts = create_longterm_symlink()
+        assert counts == {"created": 1, "updated": 0, "unchanged": 0, "failed": 0}
+        link = longterm_dir / f"DL1_datacheck_{nightdir}.h5"
+        assert link.resolve() == longterm_dir / "v0.10.5" / nightdir / link.name
+    finally:
+        cfg.set("LST1", "BASE", base)
@@ -0,0 +1,280 @@
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from osa.resources import (
+    ResourceModel,
+    ResourceRequest,
+    evaluate_sizing,
+    memory_to_gb,
+    parse_sacct_records,
+    r0_subrun_sizes,
+    read_samples,
+    record_accounting,
+    record_features,
+)
+
+
+@pytest.fixture
+def cursor(tmp_path):
+    connection = sqlite3.connect(tmp_path / "osa.db")
+    yield connection.cursor()
+    connection.close()
+
+
+def make_samples(n_jobs, date="20240117", source="Crab", size_gb=3.2, seed=0, **columns):
+    rng = np.random.default_rng(seed)
+    samples = pd.DataFrame(
+        {
+            "job_id": [f"1000_{i}" for i in range(n_jobs)],
+            "jobname": "LST1_01807",
+            "date": date,
+            "job_type": "DATA",
+            "source": source,
+            "nsb_level": 0.14,
+            "subrun_size_gb": size_gb,
+            "state": "COMPLETED",
+            "max_rss_gb": rng.uniform(2, 3, n_jobs),
+            "elapsed_s": rng.uniform(1200, 1800, n_jobs),
+        }
+    )
+    return samples.assign(**columns)
+
+
+def test_memory_to_gb():
+    # Binary units as reported by sacct
+    assert memory_to_gb("3.01G") == pytest.approx(3.01 * 1.073741824)
+    assert memory_to_gb("850M") == pytest.approx(0.85 * 1.048576)
+    assert memory_to_gb("1024K") == pytest.approx(1.048576e-3)
+    assert memory_to_gb("2000000000") == 2
+    assert np.isnan(memory_to_gb(""))
+
+
+def test_parse_sacct_records():
+    records = parse_sacct_records(Path("./extra/sacct_output.csv"))
+    records = records.set_index("job_id")
+    # One record per job or array task, with the MaxRSS of its batch step
+    assert len(records) == 9
+    assert records.loc["12927824_3"].tolist() == [
+        "LST1_01807",
+        "FAILED",
+        pytest.approx(5.32 * 1.073741824),
+        1863,
+    ]
+    assert records.loc["12927823"].tolist() == [
+        "LST1_01809",
+        "COMPLETED",
+        pytest.approx(3.05 * 1.073741824),
+        4990,
+    ]
+    assert np.isnan(records.loc["12951086", "max_rss_gb"])
+
+
+def test_r0_subrun_sizes(tmp_path):
+    for subrun in range(2):
+        for stream in range(1, 5):
+            file = tmp_path / f"LST-1.{stream}.Run01807.{subrun:04d}.fits.fz"
+            file.write_bytes(b"x" * 1000)
+    (tmp_path / "LST-1.1.Run01808.0000.fits.fz").write_bytes(b"x" * 500)
+    (tmp_path / "README").touch()
+    assert r0_subrun_sizes(tmp_path) == {1807: 4e-6, 1808: 5e-7}
+    assert r0_subrun_sizes(tmp_path / "missing") == {}
+
+
+def test_resource_model():
+    samples = pd.concat(
+        [
+            make_samples(30, source="Crab", seed=1),
+            make_samples(10, source="Mrk421", seed=2, max_rss_gb=10.0),
+            # Only completed jobs are used
+            make_samples(30, source="Crab", seed=3, state="OUT_OF_MEMORY", max_rss_gb=50.0),
+        ]
+    )
+    model = ResourceModel(samples, quantile=0.9, margin=1.0, min_samples=20)
+    assert model.n_samples == 40
+
+    features = {"job_type": "DATA", "source": "Crab", "nsb_level": 0.14, "subrun_size_gb": 3.4}
+    request = model.estimate(features)
+    crab = samples.iloc[:30]
+    assert request.grouping == ("job_type", "source", "nsb_level", "size_bin")
+    assert request.n_samples == 30
+    assert request.mem_gb == np.ceil(crab["max_rss_gb"].quantile(0.9))
+    assert request.time_s == 60 * np.ceil(crab["elapsed_s"].quantile(0.9) / 60)
+
+    # Too few jobs of the source: all the sources with the same NSB and size
+    request = model.estimate({**features, "source": "Mrk421"})
+    assert request.grouping == ("job_type", "nsb_level", "size_bin")
+    assert request.n_samples == 40
+    assert request.mem_gb == 10
+
+    # Unknown features fall back to the job type
+    request = model.estimate({"job_type": "DATA", "source": None, "nsb_level": None})
+    assert request.grouping == ("job_type",)
+    assert model.estimate({"job_type": "PEDCALIB"}) is None
+
+
+def test_resource_request_time():
+    assert ResourceRequest(mem_gb=3, time_s=4500, n_samples=1, grouping=()).time == "1:15:00"
+    assert ResourceRequest(mem_gb=3, time_s=90061, n_samples=1, grouping=()).time == "1-1:01:01"
+
+
+def test_record_and_size_from_database(cursor, running_analysis_dir):
+    from osa.configs import options
+    from osa.configs.datamodel import Sequence
+    from osa.job import scheduler_env_variables
+
+    options.directory = running_analysis_dir
+    sequence = Sequence()
+    sequence.jobname = "LST1_01807"
+    sequence.run = 1807
+    sequence.type = "DATA"
+    sequence.subruns = 5
+    sequence.source_name = "Crab"
+    features = {
+        "jobname": sequence.jobname,
+        "job_type": sequence.type,
+        "source": sequence.source_name,
+        "nsb_level": 0.14,
+        "subrun_size_gb": 3.2,
+    }
+    record_features(cursor, [features], "20200117")
+    records = parse_sacct_records(Path("./extra/sacct_output.csv"))
+    record_accounting(cursor, records, "20200117")
+    # Recorded again, e.g. by the closer of the next night
+    record_accounting(cursor, records, "20200118")
+
+    samples = read_samples(cursor)
+    assert len(samples) == 5
+    assert set(samples["jobname"]) == {sequence.jobname}
+    assert set(samples["date"]) == {"20200117"}
+
+    # Only the completed task 12927824_0 is used: 2.38 GiB (2.56 GB) and 00:30:55
+    model = ResourceModel.from_database(cursor, quantile=1.0, margin=1.0, min_samples=1)
+    sequence.resources = model.estimate(features)
+    assert sequence.resources == ResourceRequest(
+        mem_gb=3,
+        time_s=1860,
+        n_samples=1,
+        grouping=("job_type", "source", "nsb_level", "size_bin"),
+    )
+    env_variables = scheduler_env_variables(sequence)
+    assert "#SBATCH --time=0:31:00" in env_variables
+    assert "#SBATCH --mem=3GB" in env_variables
+    assert not any("--mem-per-cpu" in line for line in env_variables)
+
+
+def test_read_samples_same_jobname(cursor):
+    features = {
+        "jobname": "LST1_01807",
+        "job_type": "DATA",
+        "source": "Crab",
+        "nsb_level": 0.14,
+        "subrun_size_gb": 3.2,
+    }
+    records = parse_sacct_records(Path("./extra/sacct_output.csv"))
+    # The run processed again on another night, with other features and jobs
+    record_features(cursor, [features], "20200117")
+    record_accounting(cursor, records, "20200117")
+    record_features(cursor, [dict(features, source="MadeUpSource")], "20200118")
+    record_accounting(cursor, records.assign(job_id=records["job_id"] + "9"), "20200118")
+
+    samples = read_samples(cursor)
+    assert len(samples) == 2 * 5
+    assert samples.groupby("date")["source"].unique().map(list).to_dict() == {
+        "20200117": ["Crab"],
+        "20200118": ["MadeUpSource"],
+    }
+
+
+def test_job_accounting_without_date(cursor):
+    # Tables of a database recorded before the night of the jobs was stored
+    cursor.execute(
+        """CREATE TABLE job_features
+        (jobname TEXT, date TEXT, job_type TEXT, source TEXT, nsb_level REAL,
+        subrun_size_gb REAL, PRIMARY KEY (jobname, date))"""
+    )
+    cursor.execute(
+        """CREATE TABLE job_accounting
+        (job_id TEXT PRIMARY KEY, jobname TEXT, state TEXT, max_rss_gb REAL, elapsed_s INTEGER)"""
+    )
+    cursor.execute(
+        "INSERT INTO job_features VALUES ('LST1_01807', '20200117', 'DATA', 'Crab', 0.14, 3.2)"
+    )
+    cursor.execute("INSERT INTO job_accounting VALUES ('1', 'LST1_01807', 'COMPLETED', 2.5, 60)")
+
+    samples = read_samples(cursor)
+    assert samples[["job_id", "date"]].values.tolist() == [["1", "20200117"]]
+
+
+def test_evaluate_sizing():
+    samples = pd.concat(
+        [
+            make_samples(50, date="20240115", seed=1),
+            make_samples(50, date="20240116", seed=2),
+            make_samples(50, date="20240117", seed=3, max_rss_gb=5.5),
+        ]
+    )
+    results = evaluate_sizing(
+        samples,
+        default_mem_gb=6,
+        default_time_s=4500,
+        quantile=0.95,
+        margin=1.2,
+        min_samples=20,
+    )
+    fixed, adaptive = results["fixed"], results["adaptive"]
+    assert fixed["jobs"] == adaptive["jobs"] == 150
+    # The first night has no history
+    assert fixed["sized"] == 0
+    assert adaptive["sized"] == 100
+    assert fixed["out_of_memory"] == fixed["timeout"] == adaptive["timeout"] == 0
+    # The jobs of the last night use more memory than those of the previous nights
+    assert adaptive["out_of_memory"] == 50
+    assert adaptive["reserved_gb_h"] < fixed["reserved_gb_h"]
+    assert adaptive["efficiency"] > fixed["efficiency"]
+
+
+def test_accounting_recorded_without_adaptive_resources(tmp_path, monkeypatch):
+    from datetime import datetime
+    from io import StringIO
+    from unittest import mock
+
+    from osa.configs import options
+    from osa.configs.config import cfg
+    from osa.configs.datamodel import Sequence
+    from osa.resources import record_job_accounting, size_job_resources
+
+    database = tmp_path / "osa.db"
+    sqlite3.connect(database).close()
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "date", datetime(2020, 1, 17))
+
+    sequence = Sequence()
+    sequence.jobname = "LST1_01807"
+    sequence.run = 1807
+    sequence.type = "PEDCALIB"
+    sequence.source_name = None
+
+    sacct_output = StringIO(Path("./extra/sacct_output.csv").read_text())
+    with (
+        mock.patch.object(cfg, "get", side_effect=lambda *args, **kwargs: str(database)),
+        mock.patch("osa.resources.get_raw_dir", return_value=tmp_path / "R0"),
+        mock.patch("osa.resources.run_sacct", return_value=sacct_output) as run_sacct,
+        mock.patch("osa.resources._adaptive_resources_enabled", return_value=False),
+    ):
+        size_job_resources([sequence])
+        record_job_accounting()
+
+    # The jobs of the night started before midnight are also fetched
+    run_sacct.assert_called_once_with(starttime=datetime(2020, 1, 17))
+    assert sequence.resources is None
+    with sqlite3.connect(database) as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT jobname, date, job_type FROM job_features")
+        assert cursor.fetchall() == [("LST1_01807", "20200117", "PEDCALIB")]
+        cursor.execute("SELECT COUNT(*) FROM job_accounting")
+        assert cursor.fetchone() == (9,)
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from osa.storage import (
+    classify_directory,
+    forecast_quota,
+    read_snapshots,
+    record_snapshot,
+    update_storage_usage,
+)
+
+
+@pytest.fixture
+def data_trees(tmp_path):
+    dl1 = tmp_path / "DL1" / "20240110" / "v0.10"
+    for subdir, n_files in [("", 2), ("tailcut84", 3), ("muons", 4), ("interleaved", 1)]:
+        directory = dl1 / subdir
+        directory.mkdir(parents=True, exist_ok=True)
+        for i in range(n_files):
+            (directory / f"file_{i}.h5").write_bytes(b"x" * 100)
+    # Symlinks are not counted
+    (dl1 / "tailcut84" / "link.h5").symlink_to(dl1 / "file_0.h5")
+
+    r0 = tmp_path / "R0" / "20240110"
+    r0.mkdir(parents=True)
+    (r0 / "LST-1.1.Run01234.0000.fits.fz").write_bytes(b"x" * 1000)
+    return {"R0": tmp_path / "R0", "DL1": tmp_path / "DL1", "DL2": tmp_path / "DL2"}
+
+
+@pytest.fixture
+def cursor(tmp_path):
+    connection = sqlite3.connect(tmp_path / "osa.db")
+    yield connection.cursor()
+    connection.close()
+
+
+def usage(cursor):
+    cursor.execute("SELECT prod_id, concept, n_files, bytes FROM storage_usage")
+    return {(prod_id, concept): (n, b) for prod_id, concept, n, b in cursor.fetchall()}
+
+
+def test_classify_directory():
+    assert classify_directory("R0G", ()) == ("", "R0G")
+    assert classify_directory("DL1", ("v0.10",)) == ("v0.10", "DL1")
+    assert classify_directory("DL1", ("v0.10", "tailcut84")) == ("v0.10", "DL1AB")
+    assert classify_directory("DL1", ("v0.10", "tailcut84", "datacheck")) == ("v0.10", "DATACHECK")
+    assert classify_directory("DL1", ("v0.10", "muons")) == ("v0.10", "MUON")
+    assert classify_directory("DL2", ("v0.10", "tailcut84")) == ("v0.10", "DL2")
+
+
+def test_update_storage_usage(data_trees, cursor):
+    stats = update_storage_usage(cursor, trees=data_trees, max_workers=2)
+    assert stats["nights"] == 2
+    assert stats["listed"] == stats["dirs"] == 6
+
+    assert usage(cursor) == {
+        ("", "R0"): (1, 1000),
+        ("v0.10", "DL1"): (2, 200),
+        ("v0.10", "DL1AB"): (3, 300),
+        ("v0.10", "MUON"): (4, 400),
+        ("v0.10", "INTERLEAVED"): (1, 100),
+    }
+
+    # Nothing changed: no directory is listed again
+    stats = update_storage_usage(cursor, trees=data_trees)
+    assert stats["listed"] == 0
+
+    # Only the modified directory is listed again
+    muons = data_trees["DL1"] / "20240110" / "v0.10" / "muons"
+    (muons / "file_0.h5").unlink()
+    stat = muons.stat()
+    os.utime(muons, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    stats = update_storage_usage(cursor, trees=data_trees)
+    assert stats["listed"] == 1
+    assert usage(cursor)[("v0.10", "MUON")] == (3, 300)
+
+    assert record_snapshot(cursor) == 1000 + 200 + 300 + 300 + 100
+
+
+def test_forecast_quota(cursor):
+    start = datetime(2024, 1, 1)
+    for day in range(10):
+        record_snapshot(cursor, start + timedelta(days=day))
+        cursor.execute(
+            "INSERT OR REPLACE INTO storage_usage VALUES ('20240101', 'v1', 'DL1', 1, ?, '')",
+            ((day + 1) * 100,),
+        )
+
+    snapshots = read_snapshots(cursor)
+    assert snapshots[1] == (start + timedelta(days=1), 100)
+
+    forecast = forecast_quota(snapshots, quota_bytes=2000)
+    assert forecast["bytes"] == 900
+    assert forecast["bytes_per_day"] == pytest.approx(100)
+    assert forecast["quota_date"] == start + timedelta(days=20)
+
+    assert forecast_quota(snapshots, quota_bytes=2000, window_days=0)["quota_date"] is None
+    assert forecast_quota([], quota_bytes=2000)["bytes"] == 0
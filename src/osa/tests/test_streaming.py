@@ -0,0 +1,283 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from osa.configs import options
+from osa.streaming import (
+    OnlineSequencer,
+    PollingWatcher,
+    StreamedSubrun,
+    is_network_filesystem,
+    latency_summary,
+    open_watcher,
+    streamed_runs,
+)
+
+RUN_SUMMARY_HEADER = """\
+# %ECSV 1.0
+# ---
+# datatype:
+# - {name: run_id, datatype: int64}
+# - {name: n_subruns, datatype: int64}
+# - {name: run_type, datatype: string}
+# - {name: run_start, datatype: int64}
+run_id n_subruns run_type run_start
+"""
+RUN_SUMMARY_ROWS = {
+    1805: "1805 1 PEDCALIB 1579304000000000000\n",
+    1807: "1807 4 DATA 1579305000000000000\n",
+}
+
+
+def produce_run_summary(raw_dir, summary_file):
+    """Write the run summary with the runs of the R0 files written so far, as lstchain does."""
+    runs = sorted({int(path.name.split(".")[2][3:]) for path in raw_dir.glob("LST-1.*.fits.fz")})
+    if runs:
+        summary_file.write_text(RUN_SUMMARY_HEADER + "".join(RUN_SUMMARY_ROWS[run] for run in runs))
+
+
+def write_r0_file(directory, run, subrun, stream, chunks=3):
+    """Write an R0 file in a few chunks, as the DAQ does while the subrun is taken."""
+    with open(directory / f"LST-1.{stream}.Run{run:05d}.{subrun:04d}.fits.fz", "wb") as file:
+        for _ in range(chunks):
+            file.write(b"x" * 1000)
+            file.flush()
+            time.sleep(0.01)
+
+
+def fake_producer(raw_dir):
+    """Take a calibration run and a DATA run of four subruns, the last with two streams."""
+    for stream in range(1, 5):
+        write_r0_file(raw_dir, 1805, 0, stream)
+    for subrun in range(4):
+        time.sleep(0.2)
+        for stream in range(1, 5 if subrun < 3 else 3):
+            write_r0_file(raw_dir, 1807, subrun, stream)
+
+
+@pytest.fixture
+def online_options(tmp_path, monkeypatch):
+    monkeypatch.setattr(options, "date", datetime.fromisoformat("2020-01-17"))
+    monkeypatch.setattr(options, "directory", tmp_path / "running_analysis")
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "no_calib", False)
+    monkeypatch.setattr(options, "input_state", "legacy_raw")
+    options.directory.mkdir()
+    return options
+
+
+def test_polling_watcher(tmp_path):
+    watcher = PollingWatcher(tmp_path / "R0G", settle_time=0.2)
+    # The directory does not exist yet
+    assert watcher.wait(0) == []
+
+    raw_dir = tmp_path / "R0G"
+    raw_dir.mkdir()
+    write_r0_file(raw_dir, 1807, 0, 1)
+    (raw_dir / "LST-1.1.Run01807.0000.fits.fz.tmp").touch()
+    assert watcher.scan() == []
+    time.sleep(0.2)
+    assert watcher.wait(0) == [raw_dir / "LST-1.1.Run01807.0000.fits.fz"]
+    # Each file is reported once
+    assert watcher.wait(0) == []
+
+
+def test_inotify_watcher(tmp_path):
+    try:
+        watcher = open_watcher(tmp_path, settle_time=60, backend="inotify")
+    except OSError as error:
+        pytest.skip(f"inotify not available: {error}")
+
+    with watcher:
+        assert watcher.wait(0) == []
+        write_r0_file(tmp_path, 1807, 0, 1)
+        (tmp_path / "README").write_text("not a raw file")
+        # Notified when the file is closed, without waiting for the settle time
+        assert watcher.wait(1) == [tmp_path / "LST-1.1.Run01807.0000.fits.fz"]
+        assert watcher.wait(0.1) == []
+
+
+def test_inotify_watcher_rescan(tmp_path):
+    try:
+        watcher = open_watcher(tmp_path, settle_time=0, backend="inotify", rescan_interval=0.2)
+    except OSError as error:
+        pytest.skip(f"inotify not available: {error}")
+
+    other_dir = tmp_path / "remote"
+    other_dir.mkdir()
+    write_r0_file(other_dir, 1807, 0, 1)
+    with watcher:
+        assert watcher.wait(0) == []
+        # A hard link raises no close event, as the files written by remote hosts
+        (tmp_path / "LST-1.1.Run01807.0000.fits.fz").hardlink_to(
+            other_dir / "LST-1.1.Run01807.0000.fits.fz"
+        )
+        closed = []
+        for _ in range(5):
+            closed += watcher.wait(0.5)
+        assert closed == [tmp_path / "LST-1.1.Run01807.0000.fits.fz"]
+
+
+def test_open_watcher(tmp_path):
+    assert type(open_watcher(tmp_path, settle_time=1, backend="polling")) is PollingWatcher
+    with pytest.raises(ValueError):
+        open_watcher(tmp_path, settle_time=1, backend="fanotify")
+
+    mounts = "/dev/sda1 / ext4 rw 0 0\n10.0.0.1@tcp:/fefs /fefs lustre rw 0 0\n"
+    with mock.patch("osa.streaming.Path.read_text", return_value=mounts):
+        assert is_network_filesystem("/fefs/onsite/data/R0G/20200117")
+        assert not is_network_filesystem("/fefsother/data")
+        assert not is_network_filesystem("/home/osa")
+        watcher = open_watcher("/fefs/onsite/data/R0G/20200117", settle_time=1)
+        assert type(watcher) is PollingWatcher
+
+
+def test_latency_summary():
+    subruns = [
+        StreamedSubrun(1807, subrun, closed_at=100.0, dl1_ready_at=100.0 + latency)
+        for subrun, latency in enumerate([300, 400, 500])
+    ]
+    subruns.append(StreamedSubrun(1807, 3, closed_at=100.0))
+    assert latency_summary(subruns) == {"n": 3, "median": 400, "p90": 480, "max": 500}
+    assert latency_summary([])["n"] == 0
+
+
+@pytest.mark.parametrize("watcher", ["polling", "auto"])
+def test_online_sequencer(tmp_path, online_options, watcher):
+    raw_dir = tmp_path / "R0G" / "20200117"
+    raw_dir.mkdir(parents=True)
+    summary_file = tmp_path / "RunSummary_20200117.ecsv"
+    database = tmp_path / "osa.db"
+    sqlite3.connect(database).close()
+
+    calibration = SimpleNamespace(type="PEDCALIB", run=1805, jobname="LST1_01805")
+    data = SimpleNamespace(
+        type="DATA",
+        run=1807,
+        jobname="LST1_01807",
+        calibration_file=tmp_path / "calibration_filters_52.Run01805.0000.h5",
+    )
+    n_builds = []
+
+    def build_sequences():
+        n_builds.append(1)
+        return [calibration, data]
+
+    submitted = []
+
+    def submit(sequence, subrun=None, dependency=None):
+        submitted.append((sequence.jobname, subrun, dependency))
+        if subrun is not None:
+            # The job writes the DL1 file of the subrun right away
+            (options.directory / f"dl1_LST-1.Run{sequence.run:05d}.{subrun:04d}.h5").touch()
+        return str(1000 + len(submitted))
+
+    n_summaries = []
+
+    def summary_producer():
+        n_summaries.append(1)
+        produce_run_summary(raw_dir, summary_file)
+
+    sequencer = OnlineSequencer(
+        raw_dir,
+        summary_file,
+        poll_interval=0.05,
+        settle_time=0.1,
+        watcher=watcher,
+        summary_interval=0.1,
+        sequence_builder=build_sequences,
+        summary_producer=summary_producer,
+        submit=submit,
+        database=str(database),
+    )
+    producer = threading.Thread(target=fake_producer, args=(raw_dir,))
+    producer.start()
+    with mock.patch("osa.streaming.reload_config_if_changed") as reload_config:
+        sequencer.run(idle_timeout=1, max_time=20)
+    producer.join()
+    # The configuration is checked for changes at every step
+    assert reload_config.call_count >= 2
+
+    # The run summary is produced by the online sequencer, again once the DATA run started
+    assert len(n_summaries) >= 2
+    assert summary_file.read_text().endswith(RUN_SUMMARY_ROWS[1807])
+    # The calibration sequence is submitted first since its products are missing
+    assert submitted == [
+        ("LST1_01805", None, None),
+        *[("LST1_01807", subrun, "1001") for subrun in range(3)],
+    ]
+    assert len(n_builds) == 1
+    # The last subrun, with missing streams, is not submitted, so the run is left to the sequencer
+    assert (1807, 3) not in sequencer.subruns
+    assert sequencer.streamed == set()
+    for subrun in range(3):
+        streamed = sequencer.subruns[(1807, subrun)]
+        assert streamed.job_id == str(1002 + subrun)
+        assert streamed.closed_at <= streamed.submitted_at
+        assert streamed.latency is not None and streamed.latency >= 0
+
+    with sqlite3.connect(database) as connection:
+        cursor = connection.cursor()
+        assert streamed_runs(cursor, "20200117") == set()
+        cursor.execute(
+            "SELECT subrun, job_id FROM streamed_subruns WHERE dl1_ready_at IS NOT NULL"
+        )
+        assert sorted(cursor.fetchall()) == [(subrun, str(1002 + subrun)) for subrun in range(3)]
+    assert latency_summary(sequencer.subruns.values())["n"] == 3
+
+
+def test_online_sequencer_complete_streams(tmp_path, online_options):
+    raw_dir = tmp_path / "R0G" / "20200117"
+    raw_dir.mkdir(parents=True)
+    summary_file = tmp_path / "RunSummary_20200117.ecsv"
+    data = SimpleNamespace(type="DATA", run=1807, jobname="LST1_01807", calibration_file=None)
+    submitted = []
+    n_summaries = []
+
+    def summary_producer():
+        n_summaries.append(1)
+        produce_run_summary(raw_dir, summary_file)
+
+    sequencer = OnlineSequencer(
+        raw_dir,
+        summary_file,
+        poll_interval=0,
+        settle_time=0,
+        watcher="polling",
+        summary_interval=3600,
+        sequence_builder=lambda: [data],
+        summary_producer=summary_producer,
+        submit=lambda sequence, subrun=None, dependency=None: submitted.append(subrun),
+        database=str(tmp_path / "missing.db"),
+    )
+    # No R0 file yet: the missing run summary is produced, but it is still empty
+    sequencer.step()
+    assert len(n_summaries) == 1
+    assert not summary_file.exists()
+
+    # Three of the four streams of the first subrun are closed
+    for stream in range(1, 4):
+        write_r0_file(raw_dir, 1807, 0, stream, chunks=1)
+    sequencer.step()
+    # Not produced again before the summary interval
+    assert len(n_summaries) == 1
+    sequencer._summary_produced_at -= 3600
+    sequencer.step()
+    assert len(n_summaries) == 2
+    assert sequencer.sequences == {1807: data}
+    assert submitted == []
+
+    # The last stream is closed
+    write_r0_file(raw_dir, 1807, 0, 4, chunks=1)
+    sequencer.step()
+    assert submitted == [0]
+    # The run summary lists the run, it is not produced again
+    sequencer._summary_produced_at -= 3600
+    sequencer.step()
+    assert len(n_summaries) == 2
+    assert submitted == [0]
@@ -16,6 +16,24 @@ def test_failed_history():
     assert bad_history_failed is True
 
 
+def test_failed_history_attempts(tmp_path):
+    from osa.veto import failed_history
+
+    # Two attempts of the same step differ in their date and timing
+    history_file = tmp_path / "sequence_LST1_01807.history"
+    history_file.write_text(
+        "01807.0001 lstchain_dl1ab tailcut84 2024-01-17 22:10 None None "
+        "attempt=1 time=612.4s error=io 1\n"
+        "01807.0001 lstchain_dl1ab tailcut84 2024-01-17 22:21 None None "
+        "attempt=2 time=598.0s error=io 1\n"
+    )
+    assert failed_history(history_file) is True
+
+    with history_file.open("a") as f:
+        f.write("01807.0001 lstchain_dl1ab tailcut84 2024-01-17 22:32 None None attempt=3 time=1.0s 0\n")
+    assert failed_history(history_file) is False
+
+
 def test_get_veto_list(sequence_list):
     from osa.veto import get_veto_list
 
@@ -30,3 +48,49 @@ def test_get_closed_list(sequence_list):
     seq_list = ["LST1_01807", "LST1_01808", "LST1_01809"]
     for sequence in seq_list:
         assert sequence in closed_list
+
+
+def test_sequence_state_index(tmp_path):
+    import sqlite3
+    from types import SimpleNamespace
+
+    from osa.veto import (
+        get_closed_list,
+        get_veto_list,
+        read_sequence_states,
+        sequence_state_index,
+        store_sequence_states,
+    )
+
+    failed = Path("./extra/history_files/sequence_LST1_04183_failed.history").read_text()
+    (tmp_path / "sequence_LST1_01807.closed").touch()
+    (tmp_path / "sequence_LST1_01808.history").write_text(failed)
+    (tmp_path / "sequence_LST1_01809.0001.history").write_text(failed)
+    (tmp_path / "catB_00003.closed").touch()
+
+    sequences = [
+        SimpleNamespace(
+            jobname=f"LST1_0180{i}",
+            seq=i,
+            action=None,
+            veto=tmp_path / f"sequence_LST1_0180{i}.veto",
+            history=tmp_path / f"sequence_LST1_0180{i}.history",
+        )
+        for i in (7, 8, 9)
+    ]
+    index = sequence_state_index(tmp_path)
+    assert index["LST1_01807"] == {".closed"}
+    assert "catB_00003" not in index
+
+    assert get_veto_list(sequences, index) == ["LST1_01808"]
+    assert sequences[1].veto.exists()
+    assert get_closed_list(sequences, index) == ["LST1_01807"]
+    assert [sequence.action for sequence in sequences] == ["Closed", "Veto", None]
+
+    cursor = sqlite3.connect(":memory:").cursor()
+    assert read_sequence_states(cursor, "20200117") == {}
+    store_sequence_states(cursor, "20200117", index)
+    assert read_sequence_states(cursor, "20200117") == {
+        "LST1_01807": {"veto": False, "closed": True},
+        "LST1_01808": {"veto": True, "closed": False},
+    }
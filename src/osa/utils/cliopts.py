@@ -23,6 +23,8 @@ __all__ = [
     "provprocessparsing",
     "sequencer_argparser",
     "sequencer_cli_parsing",
+    "online_sequencer_argparser",
+    "online_sequencer_cli_parsing",
     "set_default_date_if_needed",
     "simprocparsing",
     "sequencer_webmaker_argparser",
@@ -204,6 +206,12 @@ def data_sequence_argparser():
         default=False,
         help="Do not launch the script lstchain_dl1ab (default False)",
     )
+    parser.add_argument(
+        "--fused-dl1",
+        action="store_true",
+        default=False,
+        help="Run the DL1 steps in the process of the job instead of one subprocess each",
+    )
     parser.add_argument("--pedcal-file", type=Path, help="Path of the calibration file")
     parser.add_argument("--drs4-pedestal-file", type=Path, help="Path of the DRS4 pedestal file")
     parser.add_argument("--time-calib-file", type=Path, help="Path of the time calibration file")
@@ -254,6 +262,7 @@ def data_sequence_cli_parsing():
     options.simulate = opts.simulate
     options.prod_id = opts.prod_id
     options.no_dl1ab = opts.no_dl1ab
+    options.fused_dl1 = opts.fused_dl1
     options.tel_id = opts.tel_id
     options.input_state = opts.input_state
 
@@ -354,6 +363,67 @@ def sequencer_cli_parsing():
     options.directory = analysis_path(options.tel_id)
 
 
+def online_sequencer_argparser():
+    """Argument parser for the online sequencer script."""
+    parser = ArgumentParser(
+        description="Submit the job of every subrun as soon as its R0 files are closed",
+        parents=[common_parser],
+    )
+    parser.add_argument(
+        "--input-state",
+        choices=["legacy_raw", "gain_selected", "catA_calibrated"],
+        default="legacy_raw",
+        help="Declared preprocessing state of input data",
+    )
+    parser.add_argument(
+        "--no-calib",
+        action="store_true",
+        default=False,
+        help="Skip calibration sequence. Run data sequences assuming "
+        "calibration products already produced (default False)",
+    )
+    parser.add_argument(
+        "--watcher",
+        choices=["auto", "inotify", "polling"],
+        default=None,
+        help="Watcher of the R0 directory [default WATCHER of the [ONLINE] section]",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="Seconds without new R0 files after which to stop "
+        "[default IDLE_TIMEOUT of the [ONLINE] section]",
+    )
+    parser.add_argument(
+        "tel_id",
+        choices=["LST1"],
+        help="telescope identifier LST1.",
+    )
+
+    return parser
+
+
+def online_sequencer_cli_parsing():
+    """Parse the command line of the online sequencer and set the options."""
+    opts = online_sequencer_argparser().parse_args()
+
+    set_common_globals(opts)
+    options.no_calib = opts.no_calib
+    options.input_state = opts.input_state
+    # The DL1b stage needs the Cat-B calibration of the whole run, so it is
+    # left to the sequencer once the run is over
+    options.no_dl1ab = True
+
+    log.debug(f"the options are {opts}")
+
+    options.prod_id = get_prod_id()
+    options.date = set_default_date_if_needed()
+    options.directory = analysis_path(options.tel_id)
+
+    return opts
+
+
 def provprocess_argparser():
     parser = ArgumentParser()
     parser.add_argument(
@@ -2,6 +2,7 @@
 
 import filecmp
 import logging
+import os
 import pathlib
 from os import remove, rename
 
@@ -13,6 +14,8 @@ log = myLogger(logging.getLogger(__name__))
 __all__ = [
     "write_to_file",
     "append_to_file",
+    "read_last_lines",
+    "read_last_line",
 ]
 
 
@@ -67,3 +70,59 @@ def append_to_file(file: pathlib.Path, content: str) -> None:
                     log.exception(f"{e.strerror} {e.filename}")
     else:
         write_to_file(file, content)
+
+
+def read_last_lines(file: pathlib.Path, n_lines: int = 1, block_size: int = 1024) -> list:
+    """
+    Return the last lines of a file reading it backwards from the end,
+    so that only its tail is read no matter how long the file is.
+
+    Parameters
+    ----------
+    file: pathlib.Path
+        The file to read.
+    n_lines: int
+        Number of lines to return.
+    block_size: int
+        Number of bytes read at a time.
+
+    Returns
+    -------
+    lines: list
+        Up to n_lines last lines, ignoring the trailing whitespace of the file.
+    """
+    with open(file, "rb") as file_handle:
+        position = file_handle.seek(0, os.SEEK_END)
+        data = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            file_handle.seek(position)
+            data = file_handle.read(size) + data
+            if data.rstrip().count(b"\n") >= n_lines:
+                break
+
+    data = data.rstrip()
+    if not data:
+        return []
+    return [line.decode(errors="replace") for line in data.split(b"\n")[-n_lines:]]
+
+
+def read_last_line(file: pathlib.Path, block_size: int = 1024) -> str:
+    """
+    Return the last non-empty line of a file reading only its tail.
+
+    Parameters
+    ----------
+    file: pathlib.Path
+        The file to read.
+    block_size: int
+        Number of bytes read at a time.
+
+    Returns
+    -------
+    line: str
+        The last line without the trailing whitespace. Empty if the file is empty.
+    """
+    lines = read_last_lines(file, block_size=block_size)
+    return lines[-1] if lines else ""
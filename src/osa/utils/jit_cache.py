@@ -0,0 +1,184 @@
+"""
+Persistent cache of the numba kernels compiled by the jobs.
+
+Instead of compiling the numba kernels of lstchain and ctapipe in a temporary
+directory in every job, the jobs share a cache directory below the
+NUMBA_CACHE_DIR of the [CACHE] section, keyed by the lstchain, numba and
+python versions and by the CPU architecture of the node running the job.
+
+The cache is warmed up by running NUMBA_WARMUP_COMMAND in a staging
+directory, whose files are then moved one by one into the cache, so that a
+job never reads a partially written file. numba itself writes its cache
+files atomically, so the jobs can also fill the cache concurrently.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import platform
+import shlex
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from osa.configs.config import cfg
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "jit_cache_key",
+    "numba_cache_base",
+    "numba_cache_dir",
+    "is_cache_warm",
+    "prewarm_numba_cache",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+WARM_MARKER = ".warm"
+
+
+def _package_version(package: str) -> str:
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def jit_cache_key() -> str:
+    """Key of the cache for the lstchain, numba and python versions of the environment."""
+    return (
+        f"lstchain-{_package_version('lstchain')}"
+        f"_numba-{_package_version('numba')}"
+        f"_py{sys.version_info.major}.{sys.version_info.minor}"
+    )
+
+
+def numba_cache_base():
+    """
+    Directory of the numba cache for the current versions, without the CPU architecture.
+
+    Returns
+    -------
+    pathlib.Path or None
+        None if no NUMBA_CACHE_DIR is configured, in which case every job
+        compiles the kernels in a temporary directory.
+    """
+    base = cfg.get("CACHE", "NUMBA_CACHE_DIR", fallback=None)
+    if not base:
+        return None
+    return Path(base) / jit_cache_key()
+
+
+def numba_cache_dir(machine: str = None):
+    """Directory of the numba cache for the current versions and the CPU architecture."""
+    base = numba_cache_base()
+    if base is None:
+        return None
+    return base / (machine or platform.machine())
+
+
+def is_cache_warm(cache_dir: Path) -> bool:
+    """Check whether the warm-up of a cache directory was completed."""
+    return (Path(cache_dir) / WARM_MARKER).exists()
+
+
+def _move_into_cache(staging_dir: Path, cache_dir: Path) -> int:
+    """Move the files of the staging directory into the cache, keeping the existing ones."""
+    n_files = 0
+    for file in sorted(staging_dir.rglob("*")):
+        if not file.is_file():
+            continue
+        target = cache_dir / file.relative_to(staging_dir)
+        if target.exists():
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Same filesystem, so that each file appears in the cache at once
+        os.replace(file, target)
+        n_files += 1
+    return n_files
+
+
+def prewarm_numba_cache(cache_dir: Path = None, command: str = None, force: bool = False) -> bool:
+    """
+    Compile the numba kernels of the jobs into the persistent cache.
+
+    Only one warm-up runs at a time for a given cache directory, and it is
+    skipped if the cache was already warmed up.
+
+    Parameters
+    ----------
+    cache_dir: pathlib.Path, optional
+        Cache directory. By default, the one of the current versions and
+        CPU architecture below NUMBA_CACHE_DIR.
+    command: str, optional
+        Command compiling the kernels. By default, NUMBA_WARMUP_COMMAND.
+    force: bool
+        Run the warm-up even if the cache was already warmed up.
+
+    Returns
+    -------
+    bool
+        True if the cache is warm, False if no cache is configured or the warm-up failed.
+    """
+    cache_dir = numba_cache_dir() if cache_dir is None else Path(cache_dir)
+    if cache_dir is None:
+        log.debug("No NUMBA_CACHE_DIR configured, nothing to warm up")
+        return False
+
+    if command is None:
+        command = cfg.get("CACHE", "NUMBA_WARMUP_COMMAND")
+
+    if not force and is_cache_warm(cache_dir):
+        log.debug(f"numba cache {cache_dir} already warm")
+        return True
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as error:
+        log.warning(f"Cannot create the numba cache {cache_dir}: {error}")
+        return False
+
+    with open(cache_dir.parent / f".{cache_dir.name}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        # Another warm-up may have completed while waiting for the lock
+        if not force and is_cache_warm(cache_dir):
+            return True
+
+        log.info(f"Warming up the numba cache {cache_dir}")
+        staging_dir = Path(tempfile.mkdtemp(prefix=".staging_", dir=cache_dir.parent))
+        try:
+            start = time.perf_counter()
+            result = sp.run(
+                shlex.split(command),
+                env=dict(os.environ, NUMBA_CACHE_DIR=str(staging_dir)),
+                stdout=sp.PIPE,
+                stderr=sp.STDOUT,
+                text=True,
+            )
+            if result.returncode != 0:
+                log.warning(f"numba cache warm-up failed: {result.stdout[-1000:]}")
+                return False
+
+            n_files = _move_into_cache(staging_dir, cache_dir)
+            marker = {
+                "key": jit_cache_key(),
+                "machine": cache_dir.name,
+                "files": n_files,
+                "seconds": round(time.perf_counter() - start, 1),
+                "date": datetime.now().isoformat(timespec="seconds"),
+            }
+            tmp_marker = cache_dir / f"{WARM_MARKER}.tmp"
+            tmp_marker.write_text(json.dumps(marker))
+            tmp_marker.replace(cache_dir / WARM_MARKER)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    log.info(f"{n_files} files added to the numba cache {cache_dir}")
+    return True
@@ -0,0 +1,183 @@
+"""
+Random access to the log archives written by organize_def.
+
+The archives are standard tar.gz files made of independent gzip members
+(frames). A sidecar JSON index stores the position of each frame in the
+compressed archive and the position of the data of each tar member in the
+uncompressed stream, so that a single log can be read by decompressing only
+the frames that contain it.
+"""
+
+import fnmatch
+import gzip
+import json
+import logging
+import re
+import tarfile
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "INDEX_SUFFIX",
+    "index_path",
+    "write_index",
+    "load_index",
+    "list_archives",
+    "read_member",
+    "grep_member",
+    "find_archived_log",
+    "glob_archived_logs",
+    "read_archived_log",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+
+
+def index_path(archive: Path) -> Path:
+    """Return the path of the sidecar index of an archive."""
+    archive = Path(archive)
+    return archive.with_name(f"{archive.name}{INDEX_SUFFIX}")
+
+
+def write_index(archive: Path, frames: list, members: dict) -> Path:
+    """
+    Atomically write the sidecar index of an archive.
+
+    Parameters
+    ----------
+    archive: pathlib.Path
+        Path of the tar.gz archive.
+    frames: list
+        One [uncompressed_start, uncompressed_size, compressed_offset,
+        compressed_size] entry per gzip member, sorted by position.
+    members: dict
+        Offset of the data in the uncompressed stream and size of each member.
+    """
+    index_file = index_path(archive)
+    content = {
+        "version": INDEX_VERSION,
+        "archive": Path(archive).name,
+        "frames": frames,
+        "members": members,
+    }
+    tmp_file = index_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(content))
+    tmp_file.replace(index_file)
+    return index_file
+
+
+def load_index(archive: Path) -> dict:
+    """Return the index of an archive or None if it does not have one."""
+    index_file = index_path(archive)
+    if not index_file.is_file():
+        return None
+    return _load_index(index_file, index_file.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=64)
+def _load_index(index_file: Path, mtime_ns: int) -> dict:
+    return json.loads(index_file.read_text())
+
+
+def list_archives(directory: Path) -> list:
+    """Return the log archives found in a directory, the most recent first."""
+    return sorted(Path(directory).glob("*.tar.gz"), reverse=True)
+
+
+def read_member(archive: Path, name: str) -> bytes:
+    """
+    Return the content of a member of an archive, decompressing only the
+    frames that contain it. Archives without an index are read sequentially.
+
+    Raises
+    ------
+    KeyError
+        If the archive does not contain the member.
+    """
+    index = load_index(archive)
+    if index is None:
+        log.debug(f"No index found for {archive}, reading it sequentially")
+        with tarfile.open(archive, "r:gz") as tar:
+            try:
+                return tar.extractfile(name).read()
+            except KeyError:
+                raise KeyError(f"{name} not found in {archive}") from None
+
+    try:
+        offset, size = index["members"][name]
+    except KeyError:
+        raise KeyError(f"{name} not found in {archive}") from None
+
+    frames = index["frames"]
+    first = bisect_right([frame[0] for frame in frames], offset) - 1
+
+    data = bytearray()
+    with open(archive, "rb") as file:
+        for start, _, compressed_offset, compressed_size in frames[first:]:
+            if start >= offset + size:
+                break
+            file.seek(compressed_offset)
+            data += gzip.decompress(file.read(compressed_size))
+
+    skip = offset - frames[first][0]
+    return bytes(data[skip : skip + size])
+
+
+def grep_member(archive: Path, name: str, pattern: str, flags=re.IGNORECASE) -> list:
+    """Return the lines of an archived log matching a regular expression."""
+    regex = re.compile(pattern, flags)
+    content = read_member(archive, name).decode(errors="ignore")
+    return [line for line in content.splitlines() if regex.search(line)]
+
+
+def _archive_members(archive: Path) -> list:
+    index = load_index(archive)
+    if index is not None:
+        return list(index["members"])
+    with tarfile.open(archive, "r:gz") as tar:
+        return tar.getnames()
+
+
+def glob_archived_logs(pattern: str) -> list:
+    """
+    Return the paths of the archived logs matching a glob pattern.
+
+    The archives are looked for in the directory of the pattern, where
+    organize_def leaves them, and the returned paths are those the logs
+    had before being archived.
+    """
+    pattern = Path(pattern)
+    matches = []
+    for archive in list_archives(pattern.parent):
+        matches.extend(
+            str(pattern.parent / name)
+            for name in fnmatch.filter(_archive_members(archive), pattern.name)
+        )
+    return sorted(set(matches))
+
+
+def find_archived_log(log_path: str) -> tuple:
+    """
+    Return the archive containing a log that no longer exists on disk
+    and its member name, or None if it was not archived.
+    """
+    log_path = Path(log_path)
+    for archive in list_archives(log_path.parent):
+        if log_path.name in _archive_members(archive):
+            return archive, log_path.name
+    return None
+
+
+def read_archived_log(log_path: str) -> str:
+    """Return the content of an archived log or None if it was not archived."""
+    found = find_archived_log(log_path)
+    if found is None:
+        return None
+    archive, name = found
+    return read_member(archive, name).decode(errors="ignore")
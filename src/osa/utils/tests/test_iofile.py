@@ -9,3 +9,32 @@ def test_write_and_append_to_file(txt_file_test):
     append_to_file(txt_file_test, "\nAnother line")
     options.simulate = True
     assert txt_file_test.read_text() == "This is a test\nAnother line"
+
+
+def test_read_last_line(tmp_path):
+    from osa.utils.iofile import read_last_line
+
+    file = tmp_path / "test.history"
+    file.touch()
+    assert read_last_line(file) == ""
+
+    lines = [f"2024-01-01 00:00:00 | 01234.{i:04d} gain_selection 1" for i in range(100)]
+    file.write_text("\n".join(lines) + "\n0\n\n")
+    assert read_last_line(file) == "0"
+    assert read_last_line(file, block_size=3) == "0"
+
+    file.write_text("\n".join(lines))
+    assert read_last_line(file, block_size=16) == lines[-1]
+
+
+def test_read_last_lines(tmp_path):
+    from osa.utils.iofile import read_last_lines
+
+    file = tmp_path / "test.history"
+    lines = [f"line {i}" for i in range(100)]
+    file.write_text("\n".join(lines) + "\n")
+    assert read_last_lines(file, n_lines=2, block_size=5) == lines[-2:]
+    assert read_last_lines(file, n_lines=200) == lines
+
+    file.write_text("single line")
+    assert read_last_lines(file, n_lines=2) == ["single line"]
@@ -0,0 +1,71 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from osa.configs.config import cfg
+
+
+@pytest.fixture
+def numba_cache_config(tmp_path):
+    previous = cfg.get("CACHE", "NUMBA_CACHE_DIR")
+    cfg.set("CACHE", "NUMBA_CACHE_DIR", str(tmp_path / "numba"))
+    yield tmp_path / "numba"
+    cfg.set("CACHE", "NUMBA_CACHE_DIR", previous)
+
+
+def warmup_command(tmp_path):
+    """Command writing a cache file in NUMBA_CACHE_DIR and counting its runs."""
+    script = tmp_path / "warmup.py"
+    script.write_text(
+        "import os, pathlib\n"
+        "cache = pathlib.Path(os.environ['NUMBA_CACHE_DIR']) / 'module_abc'\n"
+        "cache.mkdir(parents=True)\n"
+        "(cache / 'kernel-1.py311.nbi').write_text('index')\n"
+        f"with open({str(tmp_path / 'runs.txt')!r}, 'a') as f:\n"
+        "    f.write('run\\n')\n"
+    )
+    return f"{sys.executable} {script}"
+
+
+def test_numba_cache_dir(numba_cache_config):
+    from osa.utils.jit_cache import jit_cache_key, numba_cache_base, numba_cache_dir
+
+    key = jit_cache_key()
+    assert key.startswith("lstchain-")
+    assert f"_py{sys.version_info.major}.{sys.version_info.minor}" in key
+    assert numba_cache_base() == numba_cache_config / key
+    assert numba_cache_dir("x86_64") == numba_cache_config / key / "x86_64"
+
+    cfg.set("CACHE", "NUMBA_CACHE_DIR", "")
+    assert numba_cache_dir() is None
+
+
+def test_prewarm_numba_cache(numba_cache_config, tmp_path):
+    from osa.utils.jit_cache import is_cache_warm, prewarm_numba_cache
+
+    cache_dir = numba_cache_config / "key" / "x86_64"
+    command = warmup_command(tmp_path)
+    assert not is_cache_warm(cache_dir)
+
+    # Concurrent warm-ups of the same cache run the command only once
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        warm = list(executor.map(lambda _: prewarm_numba_cache(cache_dir, command), range(4)))
+
+    assert all(warm)
+    assert is_cache_warm(cache_dir)
+    assert (cache_dir / "module_abc" / "kernel-1.py311.nbi").read_text() == "index"
+    assert json.loads((cache_dir / ".warm").read_text())["files"] == 1
+    assert (tmp_path / "runs.txt").read_text().count("run") == 1
+    # No staging directory is left behind
+    assert sorted(p.name for p in cache_dir.parent.iterdir()) == [".x86_64.lock", "x86_64"]
+
+    # Files written by the jobs meanwhile are kept when forcing a new warm-up
+    (cache_dir / "module_abc" / "kernel-1.py311.nbi").write_text("written by a job")
+    assert prewarm_numba_cache(cache_dir, command, force=True)
+    assert (cache_dir / "module_abc" / "kernel-1.py311.nbi").read_text() == "written by a job"
+
+    failed_dir = numba_cache_config / "key" / "aarch64"
+    assert not prewarm_numba_cache(failed_dir, f"{sys.executable} -c 'exit(1)'")
+    assert not is_cache_warm(failed_dir)
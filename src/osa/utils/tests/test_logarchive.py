@@ -0,0 +1,76 @@
+import tarfile
+
+import pytest
+
+from osa.utils import logarchive
+
+
+@pytest.fixture
+def log_archive(tmp_path):
+    from osa.scripts.organize_def import archive_files
+
+    log_dir = tmp_path / "log"
+    log_dir.mkdir()
+    files = []
+    for subrun in range(50):
+        file = log_dir / f"sequence_LST1_01807.{subrun:04d}_1234.err"
+        file.write_text(f"Processing subrun {subrun}\n" * 2000)
+        files.append(file)
+
+    failed = log_dir / "sequence_LST1_01807.0050_1234.err"
+    failed.write_text("Traceback\nerror message = 'Resource temporarily unavailable'\n")
+    files.append(failed)
+
+    tar_path = log_dir / "logs_err_2024-01-01_000000.tar.gz"
+    archive_files(files, tar_path, "ERR", threads=2)
+    return tar_path
+
+
+def test_index_written(log_archive):
+    index = logarchive.load_index(log_archive)
+    assert len(index["members"]) == 51
+    assert len(index["frames"]) > 1
+    assert logarchive.index_path(log_archive).name.endswith(".tar.gz.index.json")
+
+
+def test_read_member(log_archive):
+    content = logarchive.read_member(log_archive, "sequence_LST1_01807.0042_1234.err")
+    assert content == b"Processing subrun 42\n" * 2000
+
+    with tarfile.open(log_archive, "r:gz") as tar:
+        for name in logarchive.load_index(log_archive)["members"]:
+            assert logarchive.read_member(log_archive, name) == tar.extractfile(name).read()
+
+    with pytest.raises(KeyError):
+        logarchive.read_member(log_archive, "missing.err")
+
+
+def test_read_member_without_index(log_archive):
+    logarchive.index_path(log_archive).unlink()
+    content = logarchive.read_member(log_archive, "sequence_LST1_01807.0001_1234.err")
+    assert content == b"Processing subrun 1\n" * 2000
+
+
+def test_grep_and_find_archived_logs(log_archive):
+    log_dir = log_archive.parent
+    failed_log = log_dir / "sequence_LST1_01807.0050_1234.err"
+
+    assert not failed_log.exists()
+    assert logarchive.grep_member(log_archive, failed_log.name, "temporarily") == [
+        "error message = 'Resource temporarily unavailable'"
+    ]
+    assert logarchive.find_archived_log(failed_log) == (log_archive, failed_log.name)
+    assert logarchive.find_archived_log(log_dir / "other.err") is None
+    assert logarchive.glob_archived_logs(str(log_dir / "sequence_LST1_01807.005*_*.err")) == [
+        str(failed_log)
+    ]
+    assert "Traceback" in logarchive.read_archived_log(failed_log)
+
+
+def test_troubleshooting_falls_back_to_archive(log_archive):
+    from osa.scripts import troubleshooting_utils
+
+    failed_log = str(log_archive.parent / "sequence_LST1_01807.0050_1234.err")
+    assert troubleshooting_utils.log_exists(failed_log)
+    assert troubleshooting_utils.log_contains_pattern(failed_log, "Resource temporarily")
+    assert not troubleshooting_utils.log_contains_pattern(failed_log, "Segmentation fault")
@@ -9,6 +9,7 @@ import json
 import time
 import numpy as np
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from socket import gethostname
 import subprocess as sp
@@ -20,6 +21,7 @@ from lstchain.onsite import find_filter_wheels
 import osa.paths
 from osa.configs import options
 from osa.configs.config import cfg
+from osa.configs.settings import get_settings
 from osa.utils.iofile import write_to_file
 from osa.utils.logging import myLogger
 
@@ -81,10 +83,7 @@ def get_prod_id():
     prod_id: string
     """
     if not options.prod_id:
-        if cfg.get("LST1", "PROD_ID") is not None:
-            options.prod_id = cfg.get("LST1", "PROD_ID")
-        else:
-            options.prod_id = get_lstchain_version()
+        options.prod_id = get_settings().telescope("LST1").prod_id
 
     log.debug(f"Getting prod ID for the running analysis directory: {options.prod_id}")
 
@@ -411,8 +410,14 @@ def get_lstcam_calib_version(env_path: Path) -> str:
     """Get the version of the lstcam_calib package installed in the given environment."""
     if options.test or options.simulate:
         return "0.1.1"
-    python_exe = f"{str(env_path)}/bin/python"
-    cmd = [python_exe, "-m", "pip", "show", "lstcam_calib"]
+    return _installed_version(str(env_path), "lstcam_calib")
+
+
+@lru_cache(maxsize=None)
+def _installed_version(env_path: str, package: str) -> str:
+    """Version of a package installed in an environment, asked to pip once per process."""
+    python_exe = f"{env_path}/bin/python"
+    cmd = [python_exe, "-m", "pip", "show", package]
     result = sp.run(cmd, capture_output=True, text=True, check=True)
     for line in result.stdout.split('\n'):
         if line.startswith('Version:'):
@@ -1,56 +1,111 @@
-"""Handle the list of closed and vetoed sequences."""
+"""
+Handle the list of closed and vetoed sequences.
+
+The veto, closed and history files of the analysis directory are indexed
+by job name with a single scandir, and the resulting state of each sequence
+is stored in the OSA database so that other tools can query it without
+touching the filesystem.
+"""
 
 import logging
 import os
+from datetime import datetime
 from pathlib import Path
 
 from osa.configs import options
+from osa.configs.config import cfg
+from osa.osadb import open_database
+from osa.utils.iofile import read_last_lines
 from osa.utils.logging import myLogger
+from osa.utils.utils import date_to_dir
 
 __all__ = [
     "failed_history",
+    "sequence_state_index",
     "get_veto_list",
     "get_closed_list",
     "set_veto_action",
     "set_closed_action",
     "update_vetoes",
     "set_closed_sequence",
+    "store_sequence_states",
+    "read_sequence_states",
+    "record_sequence_states",
 ]
 
 log = myLogger(logging.getLogger(__name__))
 
+SEQUENCE_STATE_SUFFIXES = {".veto", ".closed", ".history"}
+
+
+def sequence_state_index(analysis_dir: Path = None) -> dict:
+    """
+    Index the veto, closed and history files of the analysis directory.
 
-def get_veto_list(sequence_list):
+    Parameters
+    ----------
+    analysis_dir: pathlib.Path, optional
+        Directory with the sequence files. By default, options.directory.
+
+    Returns
+    -------
+    dict
+        Set of suffixes (.veto, .closed, .history) of the files of each job name.
+    """
+    analysis_dir = Path(options.directory) if analysis_dir is None else Path(analysis_dir)
+    index = {}
+    try:
+        with os.scandir(analysis_dir) as entries:
+            for entry in entries:
+                stem, suffix = os.path.splitext(entry.name)
+                if suffix not in SEQUENCE_STATE_SUFFIXES:
+                    continue
+                if suffix != ".veto" and not stem.startswith("sequence_"):
+                    continue
+                index.setdefault(stem.removeprefix("sequence_"), set()).add(suffix)
+    except FileNotFoundError:
+        log.debug(f"Analysis directory {analysis_dir} not found")
+    return index
+
+
+def get_veto_list(sequence_list, index: dict = None):
     """Get a list of vetoed sequences."""
-    update_vetoes(sequence_list)
-    analysis_dir = Path(options.directory)
-    veto_ls = analysis_dir.glob("*.veto")
-    veto_list = []
-    for file in veto_ls:
-        # Extract the job name
-        name = file.stem.strip("sequence_")
-        veto_list.append(name)
-        set_veto_action(name, sequence_list)
+    if index is None:
+        index = sequence_state_index()
+    update_vetoes(sequence_list, index)
+    sequences = {sequence.jobname: sequence for sequence in sequence_list}
+    veto_list = sorted(name for name, suffixes in index.items() if ".veto" in suffixes)
+    for name in veto_list:
+        _set_action(sequences.get(name), "Veto")
     return veto_list
 
 
+def _set_action(sequence, action: str):
+    if sequence is not None:
+        sequence.action = action
+        log.debug(f"Attributes of sequence {sequence.seq} updated")
+
+
 def set_veto_action(name, sequence_list):
     """Set the action for a given sequence to veto."""
     for sequence in sequence_list:
         if sequence.jobname == name:
-            sequence.action = "Veto"
-            log.debug(f"Attributes of sequence {sequence.seq} updated")
+            _set_action(sequence, "Veto")
 
 
-def update_vetoes(sequence_list):
+def update_vetoes(sequence_list, index: dict = None):
     """Create a .veto file for a given sequence if reached maximum number of trials."""
+    if index is None:
+        index = sequence_state_index()
     for sequence in sequence_list:
+        suffixes = index.setdefault(sequence.jobname, set())
         if (
-            not os.path.exists(sequence.veto)
-            and os.path.exists(sequence.history)
+            ".veto" not in suffixes
+            and ".history" in suffixes
             and failed_history(sequence.history)
         ):
             Path(sequence.veto).touch()
+            suffixes.add(".veto")
             log.debug(f"Created veto file {sequence.veto}")
 
 
@@ -58,18 +113,21 @@ def failed_history(history_file: Path) -> bool:
     """
     Check if a processing step has failed twice in a given history file.
 
-    Return True if the last line of the history file contains a non-zero exit
-    status and is repeated twice, meaning that a given step has failed twice.
+    Return True if the last two lines of the history file are of the same
+    run, program and prod ID with the same non-zero exit status, meaning that
+    a given step has failed twice. The date and the timing of the attempts
+    may differ. Only the tail of the history file is read.
     """
-    history_lines = history_file.read_text().splitlines()
+    history_lines = read_last_lines(history_file, n_lines=2)
 
     # Check if history file has at least two trials
     if len(history_lines) < 2:
         return False
 
-    # Check if the last line of the history file is repeated twice
-    # and the exit status is non-zero
-    return history_lines[-1] == history_lines[-2] and history_lines[-1].split()[-1] != "0"
+    previous, last = (line.split() for line in history_lines)
+    if not previous or not last:
+        return False
+    return previous[:3] == last[:3] and previous[-1] == last[-1] != "0"
 
 
 def set_closed_sequence(sequence):
@@ -78,16 +136,14 @@ def set_closed_sequence(sequence):
     sequence.closed.touch()
 
 
-def get_closed_list(sequence_list) -> list:
+def get_closed_list(sequence_list, index: dict = None) -> list:
     """Get the list of closed sequences."""
-    analysis_dir = Path(options.directory)
-    closed_ls = analysis_dir.glob("sequence_*.closed")
-    closed_list = []
-    for file in closed_ls:
-        # Extract the job name: LST1_XXXXX
-        name = file.stem.strip("sequence_")
-        closed_list.append(name)
-        set_closed_action(name, sequence_list)
+    if index is None:
+        index = sequence_state_index()
+    sequences = {sequence.jobname: sequence for sequence in sequence_list}
+    closed_list = sorted(name for name, suffixes in index.items() if ".closed" in suffixes)
+    for name in closed_list:
+        _set_action(sequences.get(name), "Closed")
     return closed_list
 
 
@@ -95,5 +151,63 @@ def set_closed_action(name: str, sequence_list):
     """Set the action of a closed sequence object."""
     for sequence in sequence_list:
         if sequence.jobname == name:
-            sequence.action = "Closed"
-            log.debug(f"Attributes of sequence {sequence.seq} updated")
+            _set_action(sequence, "Closed")
+
+
+def store_sequence_states(cursor, date: str, index: dict) -> None:
+    """
+    Store the veto and closed state of the sequences of a date in the OSA database.
+
+    Parameters
+    ----------
+    cursor: sqlite3.Cursor
+        Cursor of the OSA database.
+    date: str
+        Date in the format YYYYMMDD.
+    index: dict
+        Sequence state index, as returned by `sequence_state_index`.
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS sequence_states
+        (date TEXT, jobname TEXT, veto INTEGER, closed INTEGER, updated TEXT,
+        PRIMARY KEY (date, jobname))"""
+    )
+    now = datetime.now().isoformat(timespec="seconds")
+    cursor.execute("DELETE FROM sequence_states WHERE date = ?", (date,))
+    cursor.executemany(
+        "INSERT INTO sequence_states VALUES (?, ?, ?, ?, ?)",
+        [
+            (date, name, ".veto" in suffixes, ".closed" in suffixes, now)
+            for name, suffixes in sorted(index.items())
+            if ".veto" in suffixes or ".closed" in suffixes
+        ],
+    )
+
+
+def read_sequence_states(cursor, date: str) -> dict:
+    """Return the {"veto": bool, "closed": bool} state of each vetoed or closed sequence of a date."""
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sequence_states'"
+    )
+    if cursor.fetchone() is None:
+        return {}
+    cursor.execute("SELECT jobname, veto, closed FROM sequence_states WHERE date = ?", (date,))
+    return {
+        name: {"veto": bool(veto), "closed": bool(closed)}
+        for name, veto, closed in cursor.fetchall()
+    }
+
+
+def record_sequence_states(index: dict, simulate: bool = None) -> None:
+    """Store the state of the sequences of options.date in the OSA database.
+
+    Nothing is stored in test mode or when simulating, by default as given in the options.
+    """
+    if simulate is None:
+        simulate = options.simulate
+    if options.test or simulate:
+        return
+
+    with open_database(cfg.get("database", "path")) as cursor:
+        if cursor is not None:
+            store_sequence_states(cursor, date_to_dir(options.date), index)
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess as sp
+
+import pytest
+
+from osa.configs.config import cfg
+from osa.webserver.utils import datacheck_batch, load_manifest, publish
+
+
+@pytest.fixture
+def local_webserver(tmp_path):
+    """Publish to a local directory instead of the datacheck webserver."""
+    webserver = tmp_path / "webserver"
+    webserver.mkdir()
+    previous = {
+        option: cfg.get("WEBSERVER", option) for option in ("DATACHECK", "SYNC_COMMAND")
+    }
+    cfg.set("WEBSERVER", "DATACHECK", str(webserver))
+    cfg.set("WEBSERVER", "SYNC_COMMAND", "cp -rL {source}/. {destination}")
+    yield webserver
+    for option, value in previous.items():
+        cfg.set("WEBSERVER", option, value)
+
+
+def test_datacheck_batch(tmp_path):
+    files = [tmp_path / "drs4_baseline.Run01805.0000.pdf"]
+    assert datacheck_batch(files, "PEDESTAL", "20200117", "v0.1.0") == {
+        "drs4/v0.1.0/20200117/drs4_baseline.Run01805.0000.pdf": files[0]
+    }
+
+
+def test_publish(local_webserver, tmp_path):
+    manifest_file = tmp_path / "published.json"
+    pdf_files = []
+    for run_id in (1, 2):
+        pdf_file = tmp_path / f"datacheck_dl1_LST-1.Run{run_id:05d}.pdf"
+        pdf_file.write_text(f"plot {run_id}")
+        pdf_files.append(pdf_file)
+
+    batch = datacheck_batch(pdf_files, "DATACHECK", "20200117", "v0.1.0")
+    assert publish(batch, manifest_file) == sorted(batch)
+    for remote_path, file in batch.items():
+        assert (local_webserver / remote_path).read_text() == file.read_text()
+        assert not (local_webserver / remote_path).is_symlink()
+    assert set(load_manifest(manifest_file)) == set(batch)
+
+    # Nothing changed: nothing is transferred
+    assert publish(batch, manifest_file) == []
+
+    # Rewritten with the same content: only the mtime is updated in the manifest
+    stat = os.stat(pdf_files[0])
+    os.utime(pdf_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert publish(batch, manifest_file) == []
+    remote_path = next(iter(batch))
+    assert json.loads(manifest_file.read_text())[remote_path][1] == stat.st_mtime_ns + 10**9
+
+    # Only the changed file is transferred
+    pdf_files[1].write_text("new plot 2")
+    assert publish(batch, manifest_file) == [sorted(batch)[1]]
+    assert (local_webserver / sorted(batch)[1]).read_text() == "new plot 2"
+
+
+def test_publish_failed_transfer(local_webserver, tmp_path):
+    manifest_file = tmp_path / "published.json"
+    pdf_file = tmp_path / "calibration_filters_52.Run01809.0000.pdf"
+    pdf_file.write_text("plot")
+    cfg.set("WEBSERVER", "SYNC_COMMAND", "false")
+
+    with pytest.raises(sp.CalledProcessError):
+        publish(datacheck_batch([pdf_file], "CALIB", "20200117", "v0.1.0"), manifest_file)
+
+    # The files are published again in the next attempt
+    assert not manifest_file.exists()
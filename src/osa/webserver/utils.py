@@ -1,19 +1,63 @@
-"""Utility functions for dealing with the copy of datacheck files to webserver."""
+"""
+Utility functions for dealing with the copy of datacheck files to webserver.
 
+The files are published in batches: all the files of a batch are transferred
+through a single connection with the SYNC_COMMAND of the [WEBSERVER] section
+and those unchanged since they were last published are skipped, looking them
+up in a local manifest with their size, modification time and checksum.
+"""
+
+import hashlib
+import json
 import logging
+import os
+import shlex
 import subprocess as sp
+import tempfile
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from osa.configs.config import cfg
 from osa.paths import DATACHECK_WEB_BASEDIR
 from osa.utils.logging import myLogger
 
-__all__ = ["directory_in_webserver", "copy_to_webserver"]
+__all__ = [
+    "webserver_directory",
+    "directory_in_webserver",
+    "datacheck_batch",
+    "file_signature",
+    "load_manifest",
+    "changed_files",
+    "publish",
+    "copy_to_webserver",
+]
 
 log = myLogger(logging.getLogger(__name__))
 
 
+def webserver_directory(datacheck_type: str, date: str, prod_id: str) -> Path:
+    """
+    Directory of a type of datacheck product relative to the webserver base directory.
+
+    Parameters
+    ----------
+    datacheck_type : str
+        Type of datacheck product (PEDESTAL, CALIB, DATACHECK, LONGTERM, HIGH_LEVEL)
+    date : str
+        Date in the format YYYYMMDD
+    prod_id : str
+        Production ID
+    """
+    DATACHECK_WEB_DIRS = {
+        "PEDESTAL": f"drs4/{prod_id}/{date}",
+        "CALIB": f"enf_calibration/{prod_id}/{date}",
+        "DATACHECK": f"dl1/{date}/pdf",
+        "LONGTERM": f"dl1/{date}",
+        "HIGH_LEVEL": f"high_level/{prod_id}/{date}",
+    }
+    return Path(DATACHECK_WEB_DIRS[datacheck_type])
+
+
 def directory_in_webserver(host: str, datacheck_type: str, date: str, prod_id: str) -> Path:
     """
     Create directories in the datacheck web server.
@@ -34,15 +78,7 @@ def directory_in_webserver(host: str, datacheck_type: str, date: str, prod_id: s
     Path
         Path to the directory in the web server
     """
-    DATACHECK_WEB_DIRS = {
-        "PEDESTAL": f"drs4/{prod_id}/{date}",
-        "CALIB": f"enf_calibration/{prod_id}/{date}",
-        "DATACHECK": f"dl1/{date}/pdf",
-        "LONGTERM": f"dl1/{date}",
-        "HIGH_LEVEL": f"high_level/{prod_id}/{date}",
-    }
-
-    destination_dir = DATACHECK_WEB_BASEDIR / DATACHECK_WEB_DIRS[datacheck_type]
+    destination_dir = DATACHECK_WEB_BASEDIR / webserver_directory(datacheck_type, date, prod_id)
 
     remote_mkdir = ["ssh", host, "mkdir", "-p", destination_dir]
     sp.run(remote_mkdir, check=True)
@@ -50,6 +86,129 @@ def directory_in_webserver(host: str, datacheck_type: str, date: str, prod_id: s
     return destination_dir
 
 
+def datacheck_batch(files: List[Path], datacheck_type: str, date: str, prod_id: str) -> dict:
+    """Map the path of each file in the webserver, relative to its base directory, to the file."""
+    directory = webserver_directory(datacheck_type, date, prod_id)
+    return {str(directory / Path(file).name): Path(file) for file in files}
+
+
+def file_signature(file: Path, previous: list = None) -> list:
+    """
+    Return the [size, mtime_ns, sha256] signature of a file.
+
+    The checksum of the previous signature is reused if the size and
+    modification time did not change, so unchanged files are not read.
+    """
+    stat = os.stat(file)
+    if previous is not None and previous[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return previous
+
+    sha256 = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return [stat.st_size, stat.st_mtime_ns, sha256.hexdigest()]
+
+
+def load_manifest(manifest_file: Path) -> dict:
+    """Return the signature of each published file, empty if there is no manifest yet."""
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest_file: Path, manifest: dict) -> None:
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = manifest_file.with_suffix(".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    tmp_file.replace(manifest_file)
+
+
+def changed_files(batch: Dict[str, Path], manifest: dict) -> dict:
+    """
+    Return the signature of the files of a batch changed since they were published.
+
+    A file whose modification time changed but with the same size and
+    checksum (e.g. rewritten with the same content) is not published again.
+    """
+    signatures = {}
+    for remote_path, file in batch.items():
+        previous = manifest.get(remote_path)
+        signature = file_signature(file, previous)
+        if previous is None or previous[0] != signature[0] or previous[2] != signature[2]:
+            signatures[remote_path] = signature
+        elif previous != signature:
+            # Same content, only remember the new modification time
+            manifest[remote_path] = signature
+    return signatures
+
+
+def _run_sync_command(source: Path, files_from: Path) -> None:
+    """Transfer the content of source to the webserver with the configured SYNC_COMMAND."""
+    values = {
+        "source": source,
+        "files_from": files_from,
+        "host": cfg.get("WEBSERVER", "HOST"),
+        "destination": cfg.get("WEBSERVER", "DATACHECK"),
+    }
+    command = [arg.format(**values) for arg in shlex.split(cfg.get("WEBSERVER", "SYNC_COMMAND"))]
+    sp.run(command, check=True, capture_output=True)
+
+
+def publish(batch: Dict[str, Path], manifest_file: Path = None) -> List[str]:
+    """
+    Publish a batch of files to the webserver through a single connection.
+
+    The changed files are linked into a temporary directory mirroring the
+    webserver tree, which is transferred with the SYNC_COMMAND of the
+    [WEBSERVER] section. The manifest is only updated once the transfer
+    succeeded.
+
+    Parameters
+    ----------
+    batch : dict
+        File to publish for each path in the webserver relative to its base directory.
+    manifest_file : Path, optional
+        Manifest of the published files. By default, WEBSERVER_MANIFEST.
+
+    Returns
+    -------
+    list
+        Paths in the webserver of the files transferred.
+    """
+    if manifest_file is None:
+        manifest_file = Path(cfg.get("LST1", "WEBSERVER_MANIFEST"))
+
+    manifest = load_manifest(manifest_file)
+    published = dict(manifest)
+    signatures = changed_files(batch, manifest)
+
+    if signatures:
+        with tempfile.TemporaryDirectory(prefix="osa_webserver_") as tmp_dir:
+            source = Path(tmp_dir) / "batch"
+            for remote_path in signatures:
+                link = source / remote_path
+                link.parent.mkdir(parents=True, exist_ok=True)
+                link.symlink_to(Path(batch[remote_path]).resolve())
+                log.info(f"Publishing {batch[remote_path]}")
+
+            files_from = Path(tmp_dir) / "files_from.txt"
+            files_from.write_text("".join(f"{remote_path}\n" for remote_path in signatures))
+            _run_sync_command(source, files_from)
+
+        manifest.update(signatures)
+
+    log.debug(f"{len(batch) - len(signatures)} files unchanged since they were published")
+
+    if manifest != published:
+        _write_manifest(manifest_file, manifest)
+
+    return sorted(signatures)
+
+
 def copy_to_webserver(files: List[Path], datacheck_type: str, date: str, prod_id: str) -> None:
     """
     Copy files to the webserver in host.
@@ -65,10 +224,4 @@ def copy_to_webserver(files: List[Path], datacheck_type: str, date: str, prod_id
     prod_id : str
         Production ID
     """
-    host = cfg.get("WEBSERVER", "HOST")
-    destination_dir = directory_in_webserver(host, datacheck_type, date, prod_id)
-
-    for file in files:
-        log.info(f"Copying {file}")
-        copy_file = ["scp", file, f"{host}:{destination_dir}/."]
-        sp.run(copy_file, check=True, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    publish(datacheck_batch(files, datacheck_type, date, prod_id))
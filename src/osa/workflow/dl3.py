@@ -9,8 +9,16 @@ It uses the lstchain Tools:
  - lstchain_create_dl3_index_files
 """
 
+import fcntl
+import hashlib
+import json
 import logging
+import shlex
+import shutil
 import subprocess as sp
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -20,19 +28,31 @@ from astropy.utils import iers
 from osa.configs import options
 from osa.configs.config import cfg
 from osa.nightsummary.extract import build_sequences, get_source_list
-from osa.paths import destination_dir, DEFAULT_CFG, create_source_directories, analysis_path
+from osa.paths import (
+    DEFAULT_CFG,
+    SLURM_FINISHED_STATES,
+    analysis_path,
+    create_source_directories,
+    destination_dir,
+)
 from osa.utils.cliopts import get_prod_id
 from osa.utils.logging import myLogger
-from osa.utils.utils import stringify, YESTERDAY
+from osa.utils.utils import stringify, YESTERDAY, get_lstchain_version
 
 iers.conf.auto_download = False
 
 __all__ = [
     "batch_cmd_create_irf",
     "batch_cmd_create_dl3",
+    "batch_cmd_create_dl3_array",
     "batch_cmd_create_index_dl3",
+    "partial_irf_file",
+    "irf_registry_key",
+    "irf_registry_dir",
     "get_irf_file",
     "create_irf",
+    "dl3_task_list",
+    "run_local_tasks",
     "produce_dl3_files",
     "setup_global_options",
     "cuts_subdirectory",
@@ -41,9 +61,45 @@ __all__ = [
 
 log = myLogger(logging.getLogger(__name__))
 
+DL3_TASK_FILE = "dl3_tasks.txt"
+
+# Files of an IRF of the registry: the IRF itself, the file it is written to before
+# the job succeeds, the ID of the job producing it and the lock of the registry entry
+IRF_FILENAME = "irf.fits.gz"
+IRF_PARTIAL_PREFIX = "partial_"
+IRF_PENDING_FILENAME = "irf.pending"
+IRF_LOCK_FILENAME = ".irf.lock"
+
+
+def cmd_create_irf(mc_gamma, mc_proton, mc_electron, output_irf_file, dl3_config):
+    """Build the lstchain command to create the IRF file."""
+    return [
+        "lstchain_create_irf_files",
+        "--point-like",
+        f"--input-gamma-dl2={mc_gamma}",
+        f"--input-proton-dl2={mc_proton}",
+        f"--input-electron-dl2={mc_electron}",
+        f"--output-irf-file={output_irf_file}",
+        f"--config={dl3_config}",
+        "--overwrite",
+    ]
+
+
+def partial_irf_file(irf_file: Path) -> Path:
+    """Return the file an IRF is written to before being moved to `irf_file` on success."""
+    irf_file = Path(irf_file)
+    return irf_file.with_name(f"{IRF_PARTIAL_PREFIX}{irf_file.name}")
+
 
 def batch_cmd_create_irf(cwd, mc_gamma, mc_proton, mc_electron, output_irf_file, dl3_config):
-    """Create batch command to create IRF file with sbatch."""
+    """
+    Create batch command to create IRF file with sbatch.
+
+    The IRF is written to a partial file which is only renamed to
+    `output_irf_file` if lstchain_create_irf_files succeeds.
+    """
+    partial_file = partial_irf_file(output_irf_file)
+    irf_cmd = cmd_create_irf(mc_gamma, mc_proton, mc_electron, partial_file, dl3_config)
     return [
         "sbatch",
         "--parsable",
@@ -53,15 +109,28 @@ def batch_cmd_create_irf(cwd, mc_gamma, mc_proton, mc_electron, output_irf_file,
         cwd,
         "-o",
         "log/create_irf_%j.log",
-        "lstchain_create_irf_files",
-        "--point-like",
-        f"--input-gamma-dl2={mc_gamma}",
-        f"--input-proton-dl2={mc_proton}",
-        f"--input-electron-dl2={mc_electron}",
-        f"--output-irf-file={output_irf_file}",
-        f"--config={dl3_config}",
+        "--wrap",
+        f"{shlex.join([str(arg) for arg in irf_cmd])} && "
+        f"mv {shlex.quote(str(partial_file))} {shlex.quote(str(output_irf_file))}",
+    ]
+
+
+def cmd_create_dl3(dl2_file, dl3_dir, source_name, source_ra, source_dec, irf, dl3_config):
+    """Build the lstchain command to create the DL3 file of a given run."""
+    dl3_cmd = [
+        "lstchain_create_dl3_file",
+        f"-d={dl2_file}",
+        f"-o={dl3_dir}",
+        f"--input-irf={irf}",
+        f"--source-name={source_name}",
+        f"--source-ra={source_ra}deg",
+        f"--source-dec={source_dec}deg",
         "--overwrite",
     ]
+    if dl3_config:
+        dl3_cmd.append(f"--config={dl3_config}")
+
+    return dl3_cmd
 
 
 def batch_cmd_create_dl3(
@@ -84,20 +153,50 @@ def batch_cmd_create_dl3(
     if job_irf is not None:
         sbatch_cmd.append(f"--dependency=afterok:{job_irf}")
 
-    dl3_cmd = [
-        "lstchain_create_dl3_file",
-        f"-d={dl2_file}",
+    dl3_cmd = cmd_create_dl3(dl2_file, dl3_dir, source_name, source_ra, source_dec, irf, dl3_config)
+
+    return sbatch_cmd + dl3_cmd
+
+
+def batch_cmd_create_dl3_array(cuts_dir: Path, task_file: Path, n_tasks: int, job_irf=None):
+    """
+    Create batch command to create the DL3 files of a whole night as a single job array.
+
+    Each array task executes the line of the task file matching its index,
+    so one array element corresponds to one DATA run.
+    """
+    log_dir = cuts_dir / "log"
+    log_dir.mkdir(exist_ok=True, parents=True)
+    log_file = log_dir / "dl2_to_dl3_%A_%a.log"
+    sbatch_cmd = [
+        "sbatch",
+        "--parsable",
+        "--mem=10GB",
+        "--job-name=dl2dl3",
+        f"--array=0-{n_tasks - 1}",
+        "-D",
+        cuts_dir,
+        "-o",
+        log_file,
+    ]
+    if job_irf is not None:
+        sbatch_cmd.append(f"--dependency=afterok:{job_irf}")
+
+    sbatch_cmd.extend(
+        ["--wrap", f'eval "$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {task_file})"']
+    )
+    return sbatch_cmd
+
+
+def cmd_create_index_dl3(dl3_dir):
+    """Build the lstchain command to create the observations index."""
+    return [
+        "lstchain_create_dl3_index_files",
+        f"-d={dl3_dir}",
         f"-o={dl3_dir}",
-        f"--input-irf={irf}",
-        f"--source-name={source_name}",
-        f"--source-ra={source_ra}deg",
-        f"--source-dec={source_dec}deg",
+        "-p=dl3*.fits.gz",
         "--overwrite",
     ]
-    if dl3_config:
-        dl3_cmd.append(f"--config={dl3_config}")
-
-    return sbatch_cmd + dl3_cmd
 
 
 def batch_cmd_create_index_dl3(dl3_dir, parent_job_list):
@@ -117,60 +216,252 @@ def batch_cmd_create_index_dl3(dl3_dir, parent_job_list):
         dl3_dir,
         "-o",
         log_file,
-        "lstchain_create_dl3_index_files",
-        f"-d={dl3_dir}",
-        f"-o={dl3_dir}",
-        "-p=dl3*.fits.gz",
-        "--overwrite",
-    ]
+    ] + cmd_create_index_dl3(dl3_dir)
+
+
+def _file_signature(file) -> str:
+    """Return a cheap signature (path, size, mtime) of a possibly big input file."""
+    path = Path(file).resolve()
+    if not path.exists():
+        return str(path)
+    stat = path.stat()
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def irf_registry_key(
+    mc_gamma, mc_proton, mc_electron, dl3_config, lstchain_version: str = None
+) -> str:
+    """
+    Return the key identifying an IRF in the registry.
+
+    It is the hash of the MC gamma, proton and electron DL2 files, the content
+    of the DL3 config file and the lstchain version, so an IRF is only
+    regenerated when any of its inputs changes.
+    """
+    if lstchain_version is None:
+        lstchain_version = get_lstchain_version()
+
+    digest = hashlib.sha256()
+    for mc_file in (mc_gamma, mc_proton, mc_electron):
+        digest.update(_file_signature(mc_file).encode())
+
+    dl3_config = Path(dl3_config)
+    if dl3_config.is_file():
+        digest.update(dl3_config.read_bytes())
+    else:
+        digest.update(str(dl3_config).encode())
+
+    digest.update(lstchain_version.encode())
+    return digest.hexdigest()[:16]
+
+
+def irf_registry_dir(dl3_config: Path, simulate: bool = False) -> Path:
+    """Return the registry directory holding the IRF produced with the current MC and config."""
+    mc_gamma = cfg.get("MC", "gamma")
+    mc_proton = cfg.get("MC", "proton")
+    mc_electron = cfg.get("MC", "electron")
+    lstchain_version = get_lstchain_version()
+    key = irf_registry_key(mc_gamma, mc_proton, mc_electron, dl3_config, lstchain_version)
+
+    registry_base = cfg.get(
+        options.tel_id, "IRF_DIR", fallback=f"{cfg.get(options.tel_id, 'DL3_DIR')}/IRF"
+    )
+    directory = Path(registry_base) / key
+
+    if not simulate:
+        (directory / "log").mkdir(parents=True, exist_ok=True)
+        inputs_file = directory / "irf_inputs.json"
+        if not inputs_file.exists():
+            inputs = {
+                "gamma": mc_gamma,
+                "proton": mc_proton,
+                "electron": mc_electron,
+                "dl3_config": str(dl3_config),
+                "lstchain_version": lstchain_version,
+            }
+            inputs_file.write_text(json.dumps(inputs, indent=2))
+
+    return directory
+
+
+def _is_job_active(job_id: str) -> bool:
+    """Return True if the SLURM job `job_id` is still pending or running according to sacct."""
+    if shutil.which("sacct") is None:
+        log.warning("sacct is not available, the state of the IRF job cannot be checked")
+        return False
+    output = sp.run(
+        ["sacct", "-n", "-X", "--parsable2", "--format=State", f"--jobs={job_id}"],
+        capture_output=True,
+        text=True,
+    )
+    # e.g. "CANCELLED by 1234"
+    states = {line.split()[0] for line in output.stdout.splitlines() if line.strip()}
+    return bool(states) and not states <= SLURM_FINISHED_STATES
+
 
+def get_irf_file(simulate: bool = False, local: bool = False):
+    """
+    Return the irf file.
 
-def get_irf_file(directory: Path, simulate: bool = False):
-    """Return the irf file. Create it if not existing."""
+    If no IRF file is given in the configuration, look it up in the IRF
+    registry and only create it if no IRF was produced before with the
+    same MC files, DL3 config and lstchain version. If the job creating it
+    is still pending or running, its ID is returned instead of submitting
+    another one. The registry is locked while it is looked up and updated.
+    """
     if cfg.get("MC", "IRF_file") is not None:
         irf_file = Path(cfg.get("MC", "IRF_file"))
         log.info(f"Using existing IRF file:\n{irf_file}")
-        dl3_config = None  # Uses default settings
-        job_id_irf = None
-    else:
-        dl3_config = Path(cfg.get("lstchain", "DL3_CONFIG"))
-        irf_file, job_id_irf = create_irf(directory, dl3_config, simulate)
+        return irf_file, None, None
+
+    dl3_config = Path(cfg.get("lstchain", "DL3_CONFIG"))
+    directory = irf_registry_dir(dl3_config, simulate)
+    irf_file = directory / IRF_FILENAME
+    if irf_file.exists():
+        log.info(f"Reusing IRF file from the registry:\n{irf_file}")
+        return irf_file, dl3_config, None
+
+    if simulate:
+        irf_file, job_id_irf = create_irf(directory, dl3_config, simulate, local)
+        return irf_file, dl3_config, job_id_irf
+
+    pending_file = directory / IRF_PENDING_FILENAME
+    with open(directory / IRF_LOCK_FILENAME, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        # Another process may have created or submitted it while waiting for the lock
+        if irf_file.exists():
+            log.info(f"Reusing IRF file from the registry:\n{irf_file}")
+            return irf_file, dl3_config, None
+
+        if pending_file.exists():
+            job_id_irf = pending_file.read_text().strip()
+            if job_id_irf and _is_job_active(job_id_irf):
+                log.info(f"IRF job {job_id_irf} still in progress, waiting for it")
+                return irf_file, dl3_config, job_id_irf
+            log.warning(f"IRF job {job_id_irf} finished without producing {irf_file}")
+            pending_file.unlink()
+
+        irf_file, job_id_irf = create_irf(directory, dl3_config, simulate, local)
+        if job_id_irf:
+            pending_file.write_text(f"{job_id_irf}\n")
 
     return irf_file, dl3_config, job_id_irf
 
 
-def create_irf(directory: Path, config: Path, simulate: bool = False):
+def create_irf(directory: Path, config: Path, simulate: bool = False, local: bool = False):
     """Create the IRF file for a given set of selection cuts."""
     log.info("Creating the IRFs.")
 
     mc_gamma = cfg.get("MC", "gamma")
     mc_proton = cfg.get("MC", "proton")
     mc_electron = cfg.get("MC", "electron")
-    irf_file = directory / "irf.fits.gz"
-
-    cmd1 = batch_cmd_create_irf(
-        cwd=directory,
-        mc_gamma=mc_gamma,
-        mc_proton=mc_proton,
-        mc_electron=mc_electron,
-        output_irf_file=irf_file,
-        dl3_config=config,
-    )
+    irf_file = directory / IRF_FILENAME
+
+    if local:
+        cmd1 = cmd_create_irf(
+            mc_gamma=mc_gamma,
+            mc_proton=mc_proton,
+            mc_electron=mc_electron,
+            output_irf_file=partial_irf_file(irf_file),
+            dl3_config=config,
+        )
+    else:
+        cmd1 = batch_cmd_create_irf(
+            cwd=directory,
+            mc_gamma=mc_gamma,
+            mc_proton=mc_proton,
+            mc_electron=mc_electron,
+            output_irf_file=irf_file,
+            dl3_config=config,
+        )
 
     if simulate:
-        return None
+        log.debug(f"Simulate executing {stringify(cmd1)}")
+        return irf_file, None
 
-    log.info("Submitting the IRF job.")
     log.debug(stringify(cmd1))
+
+    if local:
+        log.info("Running the IRF creation locally.")
+        if run_local_tasks([cmd1], max_workers=1) != [0]:
+            raise RuntimeError(f"IRF creation failed, {irf_file} not produced")
+        partial_irf_file(irf_file).replace(irf_file)
+        return irf_file, None
+
+    log.info("Submitting the IRF job.")
     job_irf = sp.run(
         cmd1,
         encoding="utf-8",
         capture_output=True,
         text=True,
     )
+    if job_irf.returncode != 0:
+        raise RuntimeError(f"IRF job submission failed: {job_irf.stderr.strip()}")
     return irf_file, job_irf.stdout.strip()
 
 
+def dl3_task_list(
+    sequence_list, irf_file: Path, dl2_dir: Path, cuts_dir: Path, dl3_config: Path
+) -> list:
+    """Return the DL3 creation command of each DATA run of the night, sorted by run."""
+    tasks = []
+    for sequence in sorted(sequence_list, key=lambda seq: seq.run):
+        if sequence.type != "DATA":
+            continue
+
+        tasks.append(
+            cmd_create_dl3(
+                dl2_file=dl2_dir / f"dl2_LST-1.Run{sequence.run:05d}.h5",
+                dl3_dir=cuts_dir / f"{sequence.source_name}",
+                source_name=sequence.source_name,
+                source_ra=sequence.source_ra,
+                source_dec=sequence.source_dec,
+                irf=irf_file,
+                dl3_config=dl3_config,
+            )
+        )
+
+    return tasks
+
+
+def run_local_tasks(commands: list, max_workers: int = 4) -> list:
+    """
+    Execute a list of commands in a pool of local worker threads
+    without going through the job scheduler.
+
+    Returns
+    -------
+    return_codes: list
+        Exit code of each command, in the same order as the input list.
+    """
+    if not commands:
+        return []
+
+    def _run(cmd):
+        result = sp.run([str(arg) for arg in cmd], capture_output=True, text=True)
+        if result.returncode != 0:
+            log.error(
+                f"{stringify(cmd)} failed with exit code {result.returncode}:\n"
+                f"{result.stderr.strip()}"
+            )
+        elif result.stdout.strip():
+            log.debug(result.stdout.strip())
+        return result.returncode
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return_codes = list(executor.map(_run, commands))
+    elapsed = time.perf_counter() - t_start
+
+    n_failed = sum(rc != 0 for rc in return_codes)
+    log.info(
+        f"Executed {len(commands)} tasks locally in {elapsed:.1f} s "
+        f"({elapsed / len(commands):.2f} s/task, {n_failed} failed)"
+    )
+    return return_codes
+
+
 def produce_dl3_files(
     sequence_list,
     irf_file: Path,
@@ -179,53 +470,97 @@ def produce_dl3_files(
     dl3_config: Path,
     job_id_irf: int,
     simulate: bool = False,
+    local: bool = False,
+    max_workers: int = 4,
 ):
-    """Produce the DL3 files for a given list of sequences."""
+    """
+    Produce the DL3 files for a given list of sequences.
+
+    All the runs of the night are submitted as a single job array indexed
+    by run. In local mode they are executed in a pool of worker threads.
+
+    Returns
+    -------
+    list_of_job_id: list
+        ID of the submitted job array.
+    failed_sources: set
+        Sources of the runs whose DL3 file could not be produced in local mode.
+    """
     list_of_job_id = []
+    failed_sources = set()
 
-    log.info("Looping over the runs to produce the DL3 files.")
-    for sequence in sequence_list:
-
-        if sequence.type == "DATA":
-
-            dl2_file = dl2_dir / f"dl2_LST-1.Run{sequence.run:05d}.h5"
-            dl3_subdir = cuts_dir / f"{sequence.source_name}"
-
-            cmd2 = batch_cmd_create_dl3(
-                dl2_file=dl2_file,
-                dl3_dir=dl3_subdir,
-                run=sequence.run,
-                source_name=sequence.source_name,
-                source_ra=sequence.source_ra,
-                source_dec=sequence.source_dec,
-                irf=irf_file,
-                dl3_config=dl3_config,
-                job_irf=job_id_irf,
-            )
+    log.info("Producing the DL3 files of all the runs of the night.")
+    tasks = dl3_task_list(sequence_list, irf_file, dl2_dir, cuts_dir, dl3_config)
 
-            if not simulate:
-                log.info(f"Producing DL3 file for run {sequence.run:05d}")
-                job_id = sp.run(
-                    cmd2,
-                    encoding="utf-8",
-                    capture_output=True,
-                    text=True,
-                )
+    if not tasks:
+        log.warning("No DATA runs found to produce DL3 files.")
+        return list_of_job_id, failed_sources
 
-                list_of_job_id.append(job_id.stdout.strip())
+    if local:
+        if simulate:
+            log.debug("Simulate running the DL3 tasks locally")
+            return list_of_job_id, failed_sources
+        return_codes = run_local_tasks(tasks, max_workers=max_workers)
+        data_sequences = [
+            sequence
+            for sequence in sorted(sequence_list, key=lambda seq: seq.run)
+            if sequence.type == "DATA"
+        ]
+        for sequence, rc in zip(data_sequences, return_codes):
+            if rc != 0:
+                log.error(f"DL3 file of run {sequence.run:05d} not produced")
+                failed_sources.add(sequence.source_name)
+        return list_of_job_id, failed_sources
+
+    task_file = cuts_dir / DL3_TASK_FILE
+    cmd2 = batch_cmd_create_dl3_array(cuts_dir, task_file, len(tasks), job_id_irf)
+
+    if not simulate:
+        task_file.write_text(
+            "\n".join(shlex.join([str(arg) for arg in task]) for task in tasks) + "\n"
+        )
+        log.info(f"Submitting DL3 job array with {len(tasks)} runs")
+        job_id = sp.run(
+            cmd2,
+            encoding="utf-8",
+            capture_output=True,
+            text=True,
+        )
+        list_of_job_id.append(job_id.stdout.strip())
 
-            else:
-                log.debug("Simulate launching scripts")
+    else:
+        log.debug("Simulate launching scripts")
 
-            log.debug(f"Executing {stringify(cmd2)}")
+    log.debug(f"Executing {stringify(cmd2)}")
 
-    return list_of_job_id
+    return list_of_job_id, failed_sources
 
 
-def create_obs_index(source_list: list, cuts_dir: Path, parent_jobs: list, simulate: bool = False):
-    """Creating observation index for each source."""
+def create_obs_index(
+    source_list: list,
+    cuts_dir: Path,
+    parent_jobs: list,
+    simulate: bool = False,
+    local: bool = False,
+):
+    """
+    Creating observation index for each source.
+
+    Returns
+    -------
+    failed_sources: list
+        Sources whose index could not be created in local mode.
+    """
     log.info("Creating observation index for each source.")
 
+    if local:
+        commands = [cmd_create_index_dl3(cuts_dir / source) for source in source_list]
+        if simulate:
+            log.debug("Simulate creating DL3 index")
+            return []
+        return_codes = run_local_tasks(commands)
+        return [source for source, rc in zip(source_list, return_codes) if rc != 0]
+
     for source in source_list:
         dl3_subdir = cuts_dir / source
 
@@ -244,6 +579,8 @@ def create_obs_index(source_list: list, cuts_dir: Path, parent_jobs: list, simul
 
         log.debug(f"Executing {stringify(cmd3)}")
 
+    return []
+
 
 def setup_global_options(date_obs, telescope):
     """Set up the global options arguments."""
@@ -276,7 +613,15 @@ def cuts_subdirectory() -> Path:
     help="Read option defaults from the specified cfg file",
 )
 @click.option("-v", "--verbose", is_flag=True)
-@click.option("--local", is_flag=True)
+@click.option("--local", is_flag=True, help="Run the DL3 stage locally without SLURM")
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of parallel workers used in local mode",
+)
 @click.option("-s", "--simulate", is_flag=True)
 def main(
     date_obs: datetime = YESTERDAY,
@@ -284,6 +629,7 @@ def main(
     verbose: bool = False,
     simulate: bool = False,
     local: bool = False,
+    jobs: int = 4,
     config: Path = DEFAULT_CFG,
 ):
     """Produce the IRF and DL3 files tool in a run basis."""
@@ -303,6 +649,8 @@ def main(
         options.simulate = True
         log.info("Simulation mode enabled: no jobs will be submitted.")
 
+    t_start = time.perf_counter()
+
     # Set up the global options
     setup_global_options(date_obs, telescope)
     dl2_dir = destination_dir("DL2", create_dir=False)
@@ -320,10 +668,10 @@ def main(
     create_source_directories(source_list, std_cuts_dir)
 
     # Get IRF file
-    irf_file, dl3_config, job_id_irf = get_irf_file(directory=std_cuts_dir, simulate=simulate)
+    irf_file, dl3_config, job_id_irf = get_irf_file(simulate=simulate, local=local)
 
     # Create the DL3 files
-    list_of_job_id = produce_dl3_files(
+    list_of_job_id, failed_sources = produce_dl3_files(
         sequence_list=sequence_list,
         irf_file=irf_file,
         dl2_dir=dl2_dir,
@@ -331,16 +679,30 @@ def main(
         dl3_config=dl3_config,
         job_id_irf=job_id_irf,
         simulate=simulate,
+        local=local,
+        max_workers=jobs,
     )
 
-    # Creating an observation file index for each source
-    create_obs_index(
-        source_list=source_list,
-        cuts_dir=std_cuts_dir,
-        parent_jobs=list_of_job_id,
-        simulate=simulate,
+    # Creating an observation file index for each source, skipping the ones with failed runs
+    if failed_sources:
+        log.warning(f"No DL3 index created for {', '.join(sorted(failed_sources))}")
+    failed_sources.update(
+        create_obs_index(
+            source_list=[source for source in source_list if source not in failed_sources],
+            cuts_dir=std_cuts_dir,
+            parent_jobs=list_of_job_id,
+            simulate=simulate,
+            local=local,
+        )
     )
 
+    if local:
+        log.info(f"DL3 stage finished in {time.perf_counter() - t_start:.1f} s")
+
+    if failed_sources:
+        log.error(f"DL3 stage failed for {', '.join(sorted(failed_sources))}")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
@@ -3,14 +3,32 @@ Manage the stages of the analysis workflow.
 
 Build lstchain commands, run them, clean up their output of a given step and
 retry in case of failure, and keep track of the history of the stages.
+
+The failures are classified by `classify_error` from the exit code and the
+output of the command, and retried following `RETRY_POLICIES`: a bad input
+is not retried, an I/O error is retried after an exponential backoff and a
+transient failure of the node immediately. The commands listed in the
+``resumable_commands`` option of the [lstchain] section get the path of a
+progress marker in the ``OSA_CHECKPOINT_FILE`` environment variable: if they
+leave it behind when failing, their partial output is kept for the next
+attempt to resume from it, and the marker is removed once they succeed.
 """
 
+import io
 import logging
+import os
+import re
 import subprocess as sp
+import sys
+import time
+import traceback
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from functools import lru_cache
+from importlib.metadata import entry_points
 from pathlib import Path
 from typing import List, Union
 
-from tenacity import retry, stop_after_attempt
+from tenacity import retry, wait_none
 import lstchain
 
 from osa.configs import options
@@ -20,8 +38,102 @@ from osa.utils.logging import myLogger
 from osa.utils.utils import stringify, date_to_dir
 from osa.paths import get_run_date, get_dl1_prod_id_and_config
 
+__all__ = [
+    "AnalysisStage",
+    "InProcessStage",
+    "DRS4PedestalStage",
+    "ChargeCalibrationStage",
+    "classify_error",
+    "ERROR_PATTERNS",
+    "RETRY_POLICIES",
+    "CHECKPOINT_ENV_VAR",
+]
+
 log = myLogger(logging.getLogger(__name__))
 
+# Environment variable with the path of the progress marker of a resumable command
+CHECKPOINT_ENV_VAR = "OSA_CHECKPOINT_FILE"
+
+# Patterns of the last lines of the output of a failed command for each error class,
+# checked in order
+ERROR_PATTERNS = {
+    "transient": re.compile(
+        r"Bus error|Resource temporarily unavailable|Connection reset|node fail",
+        re.IGNORECASE,
+    ),
+    "bad_input": re.compile(
+        r"No such file or directory|FileNotFoundError|\bnot found\b",
+        re.IGNORECASE,
+    ),
+    "io": re.compile(
+        r"OSError|IOError|Input/output error|HDF5ExtError|Stale file handle|Disk quota",
+        re.IGNORECASE,
+    ),
+}
+
+# Number of last lines of the output searched for the error, so that the messages
+# logged before the failure (e.g. a harmless "not found") do not classify it
+ERROR_TAIL_LINES = 3
+
+# Exit codes of the processes killed by SIGBUS, SIGKILL or SIGTERM (e.g. node failure)
+TRANSIENT_EXIT_CODES = {135, 137, 143}
+
+# Retry policy of each error class: none, backoff or immediate
+RETRY_POLICIES = {
+    "bad_input": "none",
+    "io": "backoff",
+    "transient": "immediate",
+    "unknown": "immediate",
+}
+
+
+def classify_error(rc: int, output: str) -> str:
+    """
+    Classify the failure of a command from its exit code and output.
+
+    Only the last `ERROR_TAIL_LINES` non-empty lines of the output are searched,
+    i.e. the exception raised or the last error messages of the command.
+
+    Returns
+    -------
+    str
+        One of transient, bad_input, io or unknown.
+    """
+    lines = [line for line in output.splitlines() if line.strip()]
+    tail = "\n".join(lines[-ERROR_TAIL_LINES:])
+    if rc < 0 or rc in TRANSIENT_EXIT_CODES or ERROR_PATTERNS["transient"].search(tail):
+        return "transient"
+    # Exit code of argparse for wrong command line arguments
+    if rc == 2 or ERROR_PATTERNS["bad_input"].search(tail):
+        return "bad_input"
+    if ERROR_PATTERNS["io"].search(tail):
+        return "io"
+    return "unknown"
+
+
+def _stop_after_max_tries(retry_state) -> bool:
+    """Stop retrying a stage after the max_tries option of the [lstchain] section."""
+    return retry_state.attempt_number >= cfg.getint("lstchain", "max_tries")
+
+
+def _should_retry(retry_state) -> bool:
+    """Retry a failed stage unless the policy of its error class says otherwise."""
+    if not retry_state.outcome.failed:
+        return False
+    stage = retry_state.args[0]
+    return RETRY_POLICIES.get(stage.error_class, "immediate") != "none"
+
+
+def _wait_before_retry(retry_state) -> float:
+    """Seconds to wait before the next attempt of a stage, after an exponential backoff."""
+    stage = retry_state.args[0]
+    if RETRY_POLICIES.get(stage.error_class) != "backoff":
+        return wait_none()(retry_state)
+    backoff = cfg.getfloat("lstchain", "retry_backoff", fallback=30)
+    seconds = backoff * 2 ** (retry_state.attempt_number - 1)
+    log.info(f"Waiting {seconds:.0f} s before retrying {stage.command} ({stage.error_class})")
+    return seconds
+
 
 class AnalysisStage:
     """Run a given analysis stage keeping track of checkpoints in a history file.
@@ -47,22 +159,85 @@ class AnalysisStage:
         self.config_file = config_file
         self.command = self.command_args[0]
         self.rc = None
+        self.attempt = 0
+        self.duration = None
+        self.error_class = None
         self.history_file = (
             Path(options.directory) / f"sequence_{options.tel_id}_{self.run}.history"
         )
 
-    @retry(stop=stop_after_attempt(int(cfg.get("lstchain", "max_tries"))))
+    @retry(
+        stop=_stop_after_max_tries,
+        retry=_should_retry,
+        wait=_wait_before_retry,
+    )
     def execute(self):
-        """Run the program and retry if it fails."""
-        log.info(f"Executing {stringify(self.command_args)}")
-        output = sp.run(self.command_args, stdout=sp.PIPE, stderr=sp.STDOUT, encoding="utf-8")
-        self.rc = output.returncode
+        """Run the program and retry if it fails, depending on the class of error."""
+        self.attempt += 1
+        log.info(f"Executing {stringify(self.command_args)} (attempt {self.attempt})")
+        progress_file = self.progress_file
+        if progress_file is not None and progress_file.exists():
+            log.info(f"Resuming {self.command} from {progress_file}")
+
+        start = time.perf_counter()
+        with self._checkpoint_env():
+            self.rc, output = self._run()
+        self.duration = time.perf_counter() - start
+        self.error_class = classify_error(self.rc, output) if self.rc != 0 else None
         self._write_checkpoint()
 
-        # If fails, remove products from the directory for subsequent trials
-        if self.rc != 0:
+        if self.rc == 0:
+            if progress_file is not None:
+                progress_file.unlink(missing_ok=True)
+            return
+
+        # If fails, remove products from the directory for subsequent trials,
+        # unless the command left a progress marker to resume from them
+        if progress_file is not None and progress_file.exists():
+            log.info(f"Keeping the partial output of {self.command} to resume from it")
+        else:
             self._clean_up()
-            raise ValueError(f"{self.command} failed with output: \n {output.stdout}")
+        raise ValueError(f"{self.command} failed ({self.error_class}) with output: \n {output}")
+
+    @property
+    def progress_file(self) -> Union[Path, None]:
+        """Progress marker of the command if it is resumable, None otherwise."""
+        resumable = cfg.get("lstchain", "resumable_commands", fallback="") or ""
+        names = {Path(command).name for command in re.split(r"[,\s]+", resumable) if command}
+        if Path(self.command).name not in names:
+            return None
+        name = f"{self.history_file.stem}.{Path(self.command).name}.progress"
+        return self.history_file.parent / name
+
+    @contextmanager
+    def _checkpoint_env(self):
+        """Export the path of the progress marker of a resumable command while it runs."""
+        progress_file = self.progress_file
+        if progress_file is None:
+            yield
+            return
+        previous = os.environ.get(CHECKPOINT_ENV_VAR)
+        os.environ[CHECKPOINT_ENV_VAR] = str(progress_file)
+        try:
+            yield
+        finally:
+            if previous is None:
+                os.environ.pop(CHECKPOINT_ENV_VAR, None)
+            else:
+                os.environ[CHECKPOINT_ENV_VAR] = previous
+
+    def _attempt_info(self) -> dict:
+        """Attempt number, duration and error class to be written in the history file."""
+        return {
+            "attempt": self.attempt,
+            "duration": self.duration,
+            "error_class": self.error_class,
+        }
+
+    def _run(self):
+        """Run the command in a subprocess and return its exit code and output."""
+        output = sp.run(self.command_args, stdout=sp.PIPE, stderr=sp.STDOUT, encoding="utf-8")
+        return output.returncode, output.stdout
 
     def show_command(self):
         """Show the command to be executed."""
@@ -122,6 +297,7 @@ class AnalysisStage:
 
     def _write_checkpoint(self):
         """Write the checkpoint in the history file."""
+        prod_id = options.prod_id
         if self.command==cfg.get("lstchain", "r0_to_dl1"):
             prod_id = options.prod_id
         elif self.command==cfg.get("lstchain", "dl1ab"):
@@ -140,9 +316,68 @@ class AnalysisStage:
             return_code=self.rc,
             history_file=self.history_file,
             config_file=self.config_file,
+            **self._attempt_info(),
         )
 
 
+@lru_cache(maxsize=None)
+def _console_script(command: str):
+    """Entry point of the console script installed as `command`, None if there is none."""
+    scripts = entry_points(group="console_scripts", name=command)
+    return next(iter(scripts), None)
+
+
+def _exit_code(code) -> int:
+    """Exit code of the process if it had exited with sys.exit(code)."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code % 256
+    print(code, file=sys.stderr)
+    return 1
+
+
+class InProcessStage(AnalysisStage):
+    """
+    Run a given analysis stage in the current process, through the entry point of its command.
+
+    The stages of a sequence run one after the other this way share the imports of
+    lstchain and ctapipe, and the data files just written by the previous stage are
+    still in the page cache of the node. The exit code is the one the command
+    would have had in a subprocess, and the history file is written in the same way.
+    Commands which are not console scripts of the environment run in a subprocess.
+    """
+
+    def _run(self):
+        """Run the entry point of the command and return its exit code and output."""
+        script = _console_script(self.command)
+        if script is None:
+            log.debug(f"{self.command} is not a console script, running it in a subprocess")
+            return super()._run()
+
+        output = io.StringIO()
+        # The messages logged by the command are part of its output too, as in a subprocess
+        handler = logging.StreamHandler(output)
+        logging.getLogger().addHandler(handler)
+        argv = sys.argv
+        sys.argv = [str(arg) for arg in self.command_args]
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                try:
+                    result = script.load()()
+                    rc = _exit_code(result if isinstance(result, int) else None)
+                except SystemExit as exit_request:
+                    rc = _exit_code(exit_request.code)
+                except Exception:
+                    traceback.print_exc()
+                    rc = 1
+        finally:
+            sys.argv = argv
+            logging.getLogger().removeHandler(handler)
+
+        return rc, output.getvalue()
+
+
 class DRS4PedestalStage(AnalysisStage):
     """
     Class inheriting from AnalysisStage for the first part of the calibration procedure,
@@ -175,6 +410,7 @@ class DRS4PedestalStage(AnalysisStage):
             stage=self.command,
             return_code=self.rc,
             history_file=self.history_file,
+            **self._attempt_info(),
         )
 
 
@@ -200,4 +436,5 @@ class ChargeCalibrationStage(AnalysisStage):
             stage=self.command,
             return_code=self.rc,
             history_file=self.history_file,
+            **self._attempt_info(),
         )
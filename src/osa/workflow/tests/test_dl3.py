@@ -1,6 +1,10 @@
 import subprocess as sp
+from unittest import mock
+
 import pytest
 
+from osa.configs.config import cfg
+
 @pytest.mark.skip(reason="Currently the DL3 production is not working")
 def test_dl3_stage():
     output = sp.run(
@@ -8,3 +12,130 @@ def test_dl3_stage():
     )
     assert output.returncode == 0
     assert "Creating observation index for each source." in output.stderr.splitlines()[-1]
+
+
+def test_irf_registry_key(tmp_path):
+    from osa.workflow.dl3 import irf_registry_key
+
+    config = tmp_path / "dl3_config.json"
+    config.write_text('{"EventSelector": {"filters": {"intensity": [50, Infinity]}}}')
+    mc_files = ("gamma.h5", "proton.h5", "electron.h5")
+
+    key = irf_registry_key(*mc_files, config, "v0.10.0")
+    assert key == irf_registry_key(*mc_files, config, "v0.10.0")
+    assert key != irf_registry_key(*mc_files, config, "v0.11.0")
+
+    config.write_text('{"EventSelector": {"filters": {"intensity": [100, Infinity]}}}')
+    assert key != irf_registry_key(*mc_files, config, "v0.10.0")
+
+
+def test_batch_cmd_create_dl3_array(tmp_path):
+    from osa.workflow.dl3 import batch_cmd_create_dl3_array
+
+    task_file = tmp_path / "dl3_tasks.txt"
+    cmd = batch_cmd_create_dl3_array(tmp_path, task_file, n_tasks=3, job_irf="12345")
+    assert "--array=0-2" in cmd
+    assert "--dependency=afterok:12345" in cmd
+    assert cmd[-2] == "--wrap"
+    assert str(task_file) in cmd[-1]
+    assert (tmp_path / "log").exists()
+
+
+def test_run_local_tasks():
+    from osa.workflow.dl3 import run_local_tasks
+
+    assert run_local_tasks([["true"], ["false"], ["true"]], max_workers=2) == [0, 1, 0]
+    assert run_local_tasks([]) == []
+
+
+def test_batch_cmd_create_irf(tmp_path):
+    from osa.workflow.dl3 import batch_cmd_create_irf
+
+    irf_file = tmp_path / "irf.fits.gz"
+    cmd = batch_cmd_create_irf(tmp_path, "g.h5", "p.h5", "e.h5", irf_file, "config.json")
+    assert cmd[-2] == "--wrap"
+    # Written to a partial file, only renamed if the IRF creation succeeds
+    assert f"--output-irf-file={tmp_path / 'partial_irf.fits.gz'}" in cmd[-1]
+    assert cmd[-1].endswith(f"&& mv {tmp_path / 'partial_irf.fits.gz'} {irf_file}")
+
+
+def test_create_irf_local(tmp_path):
+    from osa.workflow.dl3 import create_irf
+
+    def write_irf(output_irf_file, **kwargs):
+        return ["sh", "-c", f"echo irf > {output_irf_file}"]
+
+    with mock.patch("osa.workflow.dl3.cmd_create_irf", side_effect=write_irf):
+        assert create_irf(tmp_path, "config.json", local=True) == (tmp_path / "irf.fits.gz", None)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["irf.fits.gz"]
+
+    def fail_irf(output_irf_file, **kwargs):
+        return ["sh", "-c", f"echo broken > {output_irf_file}; echo no MC file >&2; exit 1"]
+
+    with mock.patch("osa.workflow.dl3.cmd_create_irf", side_effect=fail_irf):
+        with pytest.raises(RuntimeError, match="IRF creation failed"):
+            create_irf(tmp_path / "new", "config.json", local=True)
+    assert not (tmp_path / "new" / "irf.fits.gz").exists()
+
+
+def test_get_irf_file_registry(tmp_path):
+    from osa.workflow import dl3
+
+    get = cfg.get
+
+    def get_without_irf(section, option, **kwargs):
+        return None if (section, option) == ("MC", "IRF_file") else get(section, option, **kwargs)
+
+    submitted = []
+
+    def create_irf(directory, config, simulate, local):
+        submitted.append(directory)
+        return directory / "irf.fits.gz", str(1000 + len(submitted))
+
+    with (
+        mock.patch.object(cfg, "get", side_effect=get_without_irf),
+        mock.patch("osa.workflow.dl3.irf_registry_dir", return_value=tmp_path),
+        mock.patch("osa.workflow.dl3.create_irf", side_effect=create_irf),
+        mock.patch("osa.workflow.dl3._is_job_active", return_value=True) as is_job_active,
+    ):
+        irf_file, _, job_id = dl3.get_irf_file()
+        assert (irf_file, job_id) == (tmp_path / "irf.fits.gz", "1001")
+        assert (tmp_path / "irf.pending").read_text() == "1001\n"
+
+        # The job still pending is waited for instead of submitting another one
+        assert dl3.get_irf_file()[2] == "1001"
+        is_job_active.assert_called_with("1001")
+        assert len(submitted) == 1
+
+        # The job failed without producing the IRF
+        is_job_active.return_value = False
+        assert dl3.get_irf_file()[2] == "1002"
+        assert len(submitted) == 2
+
+        # The IRF produced is reused
+        irf_file.touch()
+        assert dl3.get_irf_file()[2] is None
+        assert len(submitted) == 2
+
+
+def test_dl3_local_failures(tmp_path):
+    from types import SimpleNamespace
+
+    from osa.workflow.dl3 import create_obs_index, produce_dl3_files
+
+    sequences = [
+        SimpleNamespace(type="DATA", run=run, source_name=source, source_ra=83.6, source_dec=22.0)
+        for run, source in [(1808, "MadeUpSource"), (1807, "Crab")]
+    ]
+    sequences.append(SimpleNamespace(type="PEDCALIB", run=1805))
+
+    with mock.patch("osa.workflow.dl3.run_local_tasks", return_value=[0, 1]) as run:
+        list_of_job_id, failed_sources = produce_dl3_files(
+            sequences, tmp_path / "irf.fits.gz", tmp_path, tmp_path, None, None, local=True
+        )
+    assert "-d=" + str(tmp_path / "dl2_LST-1.Run01807.h5") in run.call_args.args[0][0]
+    assert list_of_job_id == []
+    assert failed_sources == {"MadeUpSource"}
+
+    with mock.patch("osa.workflow.dl3.run_local_tasks", return_value=[1, 0]):
+        assert create_obs_index(["Crab", "Other"], tmp_path, [], local=True) == ["Crab"]
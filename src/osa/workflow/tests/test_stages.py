@@ -1,7 +1,13 @@
+import os
+import re
+import sys
+from unittest import mock
+
 import pytest
 import tenacity
 
 from osa.configs import options
+from osa.configs.config import cfg
 
 
 def test_analysis_stage(
@@ -29,13 +35,16 @@ def test_analysis_stage(
     stage = AnalysisStage(run="01807.0001", command_args=cmd)
     assert stage.rc is None
     assert stage.show_command() == " ".join(cmd)
-    with pytest.raises(tenacity.RetryError):
+    # Wrong arguments are a bad input, which is not retried
+    with pytest.raises(ValueError):
         stage.execute()
     assert stage.rc == 2
+    assert stage.attempt == 1
+    assert stage.error_class == "bad_input"
     # Check that the stage is marked as failed in the history file
     with open(stage.history_file, "r") as f:
         lines = f.readlines()
-        assert len(lines) >= 3
+        assert len(lines) >= 1
     # Check that the last element in the last line is the rc 2
     assert lines[-1].split(" ")[0] == stage.run
     assert lines[-1].split(" ")[1] == cmd[0]
@@ -50,13 +59,14 @@ def test_analysis_stage(
     stage = AnalysisStage(run="01807.0001", command_args=cmd)
     assert stage.rc is None
     assert stage.show_command() == " ".join(cmd)
-    with pytest.raises(tenacity.RetryError):
+    with pytest.raises(ValueError):
         stage.execute()
     assert stage.rc == 1
+    assert stage.error_class == "bad_input"
     # Check that the stage is marked as failed in the history file
     with open(stage.history_file, "r") as f:
         lines = f.readlines()
-        assert len(lines) >= 6
+        assert len(lines) >= 2
     # Check that the last element in the last line is the step rc
     assert lines[-1].split(" ")[0] == stage.run
     assert lines[-1].split(" ")[1] == cmd[0]
@@ -67,19 +77,35 @@ def test_analysis_stage(
     stage = AnalysisStage(run="01807.0001", command_args=cmd)
     assert stage.rc is None
     assert stage.show_command() == " ".join(cmd)
-    with pytest.raises(tenacity.RetryError):
+    with pytest.raises(ValueError):
         stage.execute()
     assert stage.rc == 255
+    assert stage.error_class == "bad_input"
     # Check that the stage is marked as failed in the history file
     with open(stage.history_file, "r") as f:
         lines = f.readlines()
-        assert len(lines) >= 9
+        assert len(lines) >= 3
     # Check that the last element in the last line is the step rc
     assert lines[-1].split(" ")[0] == stage.run
     assert lines[-1].split(" ")[1] == cmd[0]
     assert lines[-1].split(" ")[-1] == "255\n"
 
-def test_calibration_steps(running_analysis_dir):
+# Output of onsite_create_calibration_file when the database of the filter wheels is unreachable
+DB_TIMEOUT_OUTPUT = (
+    "pymongo.errors.ServerSelectionTimeoutError: lst101-int:27018: "
+    "[Errno 104] Connection reset by peer, Timeout: 30s"
+)
+
+
+@pytest.fixture
+def two_tries():
+    previous = cfg.get("lstchain", "max_tries")
+    cfg.set("lstchain", "max_tries", "2")
+    yield
+    cfg.set("lstchain", "max_tries", previous)
+
+
+def test_calibration_steps(running_analysis_dir, merged_run_summary, two_tries):
     from osa.workflow.stages import DRS4PedestalStage, ChargeCalibrationStage
     from osa.scripts.calibration_pipeline import drs4_pedestal_command, calibration_file_command
 
@@ -91,17 +117,24 @@ def test_calibration_steps(running_analysis_dir):
     step1 = DRS4PedestalStage(run="00998", run_pedcal="00999", command_args=cmd1)
     step2 = ChargeCalibrationStage(run="00999", command_args=cmd2)
 
-    with pytest.raises(tenacity.RetryError):
+    # The input files are not found, so the first step is not retried
+    with pytest.raises(ValueError, match="bad_input"):
         step1.execute()
+    assert step1.attempt == 1
 
-    with pytest.raises(tenacity.RetryError):
-        step2.execute()
+    # The database of the filter wheels cannot be reached, which is a
+    # transient error retried until the maximum number of tries
+    with mock.patch.object(step2, "_run", return_value=(1, DB_TIMEOUT_OUTPUT)) as run:
+        with pytest.raises(tenacity.RetryError):
+            step2.execute()
+    assert run.call_count == step2.attempt == 2
+    assert step2.error_class == "transient"
 
     assert step1.history_file == step2.history_file
     # Check that the error is in the history file
     with open(step1.history_file, "r") as f:
         lines = f.readlines()
-        assert len(lines) == 6
+        assert len(lines) == 3
     # Check that the last element in the last line is the rc
     assert lines[0].split(" ")[0] == step1.run
     assert lines[-1].split(" ")[0] == step2.run
@@ -109,3 +142,220 @@ def test_calibration_steps(running_analysis_dir):
     assert lines[-1].split(" ")[1] == cmd2[0]
     assert lines[0].split(" ")[-1] == "1\n"
     assert lines[-1].split(" ")[-1] == "1\n"
+
+
+def test_in_process_stage(running_analysis_dir, dl1b_config_files):
+    from osa.workflow.stages import InProcessStage
+
+    options.simulate = False
+    options.directory = running_analysis_dir
+
+    # Same exit codes as the commands run in a subprocess (see test_analysis_stage)
+    commands = {
+        2: ["lstchain_data_r0_to_dl1", "--input-file=input_r0.fits", "--drive-file=drive.txt"],
+        1: ["lstchain_dl1ab", "--input-file=dl1a_file.h5", "--output-file=dl1b_file.h5"],
+        255: ["lstchain_check_dl1", "--input-file=dl1_file.h5", "--batch"],
+    }
+    for rc, cmd in commands.items():
+        stage = InProcessStage(run="01807.0002", command_args=cmd)
+        with pytest.raises(ValueError):
+            stage.execute()
+        assert stage.rc == rc
+        assert stage.error_class == "bad_input"
+
+    # The history file is written as for the stages run in a subprocess
+    with open(stage.history_file, "r") as f:
+        lines = f.readlines()
+    assert [line.split(" ")[1] for line in lines] == [cmd[0] for cmd in commands.values()]
+    assert [line.split(" ")[-1] for line in lines] == ["2\n", "1\n", "255\n"]
+
+    # Commands which are not console scripts run in a subprocess
+    assert InProcessStage(run="01807.0002", command_args=["true"])._run() == (0, "")
+
+
+# Fake command failing in a different way at each attempt, counted in a file
+FAKE_COMMAND = """\
+#!{python}
+import os
+import signal
+import sys
+from pathlib import Path
+
+counter = Path(sys.argv[1])
+attempt = int(counter.read_text()) + 1 if counter.exists() else 1
+counter.write_text(str(attempt))
+failures = sys.argv[2].split(",")
+if attempt > len(failures):
+    sys.exit(0)
+failure = failures[attempt - 1]
+if failure == "io":
+    sys.exit("OSError: [Errno 5] Input/output error: 'dl1_LST-1.Run01807.0003.h5'")
+if failure == "transient":
+    os.kill(os.getpid(), signal.SIGKILL)
+if failure == "bad_input":
+    sys.exit("FileNotFoundError: No such file or directory: 'LST-1.1.Run01807.0003.fits.fz'")
+sys.exit(int(failure))
+"""
+
+# Fake resumable command writing an output file in two halves
+FAKE_RESUMABLE_COMMAND = """\
+#!{python}
+import os
+import signal
+import sys
+from pathlib import Path
+
+output_file = Path(sys.argv[1])
+progress_file = Path(os.environ["OSA_CHECKPOINT_FILE"])
+if not progress_file.exists():
+    output_file.write_text("first half\\n")
+    progress_file.write_text("events: 50")
+    os.kill(os.getpid(), signal.SIGKILL)
+assert progress_file.read_text() == "events: 50"
+with output_file.open("a") as f:
+    f.write("second half\\n")
+"""
+
+
+def write_fake_command(path, source):
+    path.write_text(source.format(python=sys.executable))
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def fast_backoff():
+    previous = cfg.get("lstchain", "retry_backoff")
+    cfg.set("lstchain", "retry_backoff", "0")
+    yield
+    cfg.set("lstchain", "retry_backoff", previous)
+
+
+def test_classify_error():
+    from osa.workflow.stages import classify_error
+
+    assert classify_error(-9, "") == "transient"
+    assert classify_error(137, "") == "transient"
+    assert classify_error(1, "srun: error: Node failure on cp01") == "transient"
+    assert classify_error(2, "usage: lstchain_dl1ab [-h]") == "bad_input"
+    assert classify_error(255, "Input files not found!") == "bad_input"
+    assert classify_error(1, "tables.exceptions.HDF5ExtError: Problems") == "io"
+    assert classify_error(1, "OSError: [Errno 116] Stale file handle") == "io"
+    assert classify_error(1, "ValueError: something else") == "unknown"
+    # Only the usage printed by argparse with its exit code is a bad input
+    assert classify_error(1, "usage: lstchain_dl1ab [-h]") == "unknown"
+
+
+def test_benign_not_found_retried(tmp_path):
+    from osa.workflow.stages import AnalysisStage, classify_error
+
+    options.simulate = False
+    options.directory = tmp_path
+    output = (
+        "INFO: Pointing not found in the drive log, interpolating it\n"
+        "INFO: Processing subrun 7\n"
+        "Traceback (most recent call last):\n"
+        '  File "lstchain_data_r0_to_dl1", line 8, in <module>\n'
+        "ConnectionResetError: [Errno 104] Connection reset by peer\n"
+    )
+    assert classify_error(1, output) == "transient"
+    assert classify_error(1, output.replace("Connection reset", "Broken pipe")) == "unknown"
+
+    stage = AnalysisStage(run="01807.0008", command_args=["lstchain_data_r0_to_dl1"])
+    with mock.patch.object(stage, "_run", side_effect=[(1, output), (0, "")]) as run:
+        stage.execute()
+    assert run.call_count == 2
+    assert stage.rc == 0
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        "Input files not found!",
+        "ERROR: R0 file LST-1.1.Run01807.0000.fits.fz not found",
+        "OSError: [Errno 2] No such file or directory: 'drs4_pedestal.Run01805.0000.h5'",
+    ],
+)
+def test_bad_input_not_retried(tmp_path, output):
+    from osa.workflow.stages import AnalysisStage, classify_error
+
+    options.simulate = False
+    options.directory = tmp_path
+    assert classify_error(1, output) == "bad_input"
+
+    stage = AnalysisStage(run="01807.0007", command_args=["lstchain_data_r0_to_dl1"])
+    with mock.patch.object(stage, "_run", return_value=(1, output)) as run:
+        with pytest.raises(ValueError, match="bad_input"):
+            stage.execute()
+    run.assert_called_once()
+    assert stage.attempt == 1
+
+
+def test_retry_policies(tmp_path, running_analysis_dir, fast_backoff):
+    from osa.workflow.stages import AnalysisStage
+
+    options.simulate = False
+    options.directory = tmp_path
+    command = write_fake_command(tmp_path / "fake_command", FAKE_COMMAND)
+
+    # I/O error retried after a backoff, then a killed process retried at once
+    counter = tmp_path / "counter_retried"
+    stage = AnalysisStage(run="01807.0003", command_args=[command, counter, "io,transient"])
+    stage.execute()
+    assert stage.rc == 0
+    assert stage.attempt == 3
+    assert stage.error_class is None
+
+    lines = [line.split() for line in stage.history_file.read_text().splitlines()]
+    assert [words[-1] for words in lines] == ["1", "-9", "0"]
+    attempts = [dict(word.split("=") for word in words if "=" in word) for words in lines]
+    assert [attempt["attempt"] for attempt in attempts] == ["1", "2", "3"]
+    assert [attempt.get("error") for attempt in attempts] == ["io", "transient", None]
+    assert all(re.fullmatch(r"\d+\.\ds", attempt["time"]) for attempt in attempts)
+
+    # A bad input is tried once
+    counter = tmp_path / "counter_bad_input"
+    stage = AnalysisStage(run="01807.0004", command_args=[command, counter, "bad_input"])
+    with pytest.raises(ValueError, match="bad_input"):
+        stage.execute()
+    assert counter.read_text() == "1"
+    assert stage.history_file.read_text().split()[-2:] == ["error=bad_input", "1"]
+
+    # Until the maximum number of tries
+    counter = tmp_path / "counter_exhausted"
+    stage = AnalysisStage(run="01807.0005", command_args=[command, counter, "3,3,3,3"])
+    with pytest.raises(tenacity.RetryError):
+        stage.execute()
+    assert counter.read_text() == cfg.get("lstchain", "max_tries")
+    assert stage.error_class == "unknown"
+
+
+def test_resumable_stage(tmp_path):
+    from osa.workflow.stages import AnalysisStage
+
+    options.simulate = False
+    options.directory = tmp_path
+    command = write_fake_command(tmp_path / "fake_r0_to_dl1", FAKE_RESUMABLE_COMMAND)
+    output_file = tmp_path / "dl1_LST-1.Run01807.0006.h5"
+
+    previous = {
+        option: cfg.get("lstchain", option) for option in ("r0_to_dl1", "resumable_commands")
+    }
+    cfg.set("lstchain", "r0_to_dl1", command)
+    cfg.set("lstchain", "resumable_commands", "lstchain_data_r0_to_dl1, fake_r0_to_dl1")
+    try:
+        stage = AnalysisStage(run="01807.0006", command_args=[command, output_file])
+        progress_file = stage.progress_file
+        assert progress_file == tmp_path / "sequence_LST1_01807.0006.fake_r0_to_dl1.progress"
+        stage.execute()
+    finally:
+        for option, value in previous.items():
+            cfg.set("lstchain", option, value)
+
+    # The partial output of the killed attempt was kept and completed
+    assert stage.attempt == 2
+    assert output_file.read_text() == "first half\nsecond half\n"
+    assert not progress_file.exists()
+    assert "OSA_CHECKPOINT_FILE" not in os.environ
+    lines = [line.split() for line in stage.history_file.read_text().splitlines()]
+    assert [words[-1] for words in lines] == ["-9", "0"]
@@ -0,0 +1,31 @@
+#!/bin/env python
+
+import os
+import subprocess
+import sys
+import tempfile
+
+subruns = 0
+
+os.environ['NUMBA_CACHE_DIR'] = os.path.join('/fefs/aswg/lstanalyzer/.cache/numba/lstchain-0.12.3_numba-0.68.0_py3.11', os.uname().machine)
+proc = subprocess.run([
+    'datasequence',
+    '--input-state=legacy_raw',
+    '--config',
+    '/root/package/src/osa/configs/sequencer.cfg',
+    '--date=2020-01-17',
+    '--prod-id=v0.1.0',
+    '--drive-file=/root/package/test_osa/test_files0/monitoring/DrivePositioning/DrivePosition_log_20200117.txt',
+    '--run-summary=/root/package/test_osa/test_files0/monitoring/RunSummary/RunSummary_20200117.ecsv',
+    '--drs4-pedestal-file=test_osa/test_files0/monitoring/PixelCalibration/Cat-A/drs4_baseline/20200117/v0.1.1/drs4_pedestal.Run01804.0000.h5',
+    '--pedcal-file=test_osa/test_files0/monitoring/PixelCalibration/Cat-A/calibration/20200117/v0.1.1/calibration_filters_52.Run01809.0000.h5',
+    '--time-calib-file=/root/package/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/drs4_time_sampling_from_FF/20191124/pro/time_calibration.Run01625.0000.h5',
+    '--systematic-correction-file=/root/package/test_osa/test_files0/monitoring/PixelCalibration/Cat-A/ffactor_systematics/20200725/pro/ffactor_systematics_20200725.h5',
+    '--dl1b-config=/root/package/test_osa/test_files0/auxiliary/TailCuts/dl1ab_Run01808.json',
+    '--dl1-prod-id=tailcut84',
+    f'--pedestal-ids-file=/root/package/test_osa/test_files0/auxiliary/PedestalFinder/20200117/pedestal_ids_Run01808.{subruns:04d}.h5',
+    f'01808.{subruns:04d}',
+    'LST1'
+])
+
+sys.exit(proc.returncode)
\ No newline at end of file
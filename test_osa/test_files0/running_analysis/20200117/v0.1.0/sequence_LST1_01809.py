@@ -0,0 +1,21 @@
+#!/bin/env python
+
+import os
+import subprocess
+import sys
+import tempfile
+
+subruns = 0
+
+os.environ['NUMBA_CACHE_DIR'] = os.path.join('/fefs/aswg/lstanalyzer/.cache/numba/lstchain-0.12.3_numba-0.68.0_py3.11', os.uname().machine)
+proc = subprocess.run([
+    'calibration_pipeline',
+    '--config',
+    '/root/package/src/osa/configs/sequencer.cfg',
+    '--date=2020-01-17',
+    '--drs4-pedestal-run=01804',
+    '--pedcal-run=01809',
+    'LST1'
+])
+
+sys.exit(proc.returncode)
\ No newline at end of file
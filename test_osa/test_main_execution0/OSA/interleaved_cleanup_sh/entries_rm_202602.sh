@@ -0,0 +1,2 @@
+#!/bin/bash
+# Total to be reclaimed: 0.00 GB
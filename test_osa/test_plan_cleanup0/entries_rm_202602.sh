@@ -0,0 +1,9 @@
+#!/bin/bash
+rm -f -- "/root/package/test_osa/test_plan_cleanup0/DL1/20260210/v0.10/tailcut84/interleaved"/interleaved_LST-1.Run00002.*.h5
+rm -f -- "/root/package/test_osa/test_plan_cleanup0/running_analysis/20260210/v0.10/tailcut84/interleaved"/interleaved_LST-1.Run00002.*.h5
+rm -f -- "/root/package/test_osa/test_plan_cleanup0/running_analysis/20260211/v0.10/tailcut84/interleaved"/interleaved_LST-1.Run*.h5
+rm -rf -- "/root/package/test_osa/test_plan_cleanup0/DL1/20260211/v0.10/tailcut84/interleaved"
+# 20260210 Mrk 421: 0.00 GB
+# 20260211 1ES 1959+650: 0.00 GB
+# 20260211 Mrk 421: 0.00 GB
+# Total to be reclaimed: 0.00 GB
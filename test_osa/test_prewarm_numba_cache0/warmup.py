@@ -0,0 +1,6 @@
+import os, pathlib
+cache = pathlib.Path(os.environ['NUMBA_CACHE_DIR']) / 'module_abc'
+cache.mkdir(parents=True)
+(cache / 'kernel-1.py311.nbi').write_text('index')
+with open('/root/package/test_osa/test_prewarm_numba_cache0/runs.txt', 'a') as f:
+    f.write('run\n')